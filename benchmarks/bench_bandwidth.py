@@ -0,0 +1,70 @@
+"""
+Checks how closely the bandwidth limit holds the aggregate throughput of concurrent
+downloads, on a local HTTP server.
+
+usage: python -m benchmarks.bench_bandwidth [--files 4] [--size-mb 8] [--limit 8M]
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from benchmarks.local_http_server import LocalHTTPServerProcess
+from dozent.bandwidth import BandwidthLimiter, BandwidthSchedule, parse_rate
+from dozent.download_scheduler import DownloadScheduler
+from dozent.engines import ENGINES, get_engine
+
+_MB = 1024 * 1024
+
+
+def _run_engine(engine_name: str, links, rate: float, args) -> float:
+    limiter = BandwidthLimiter(BandwidthSchedule([(datetime.time(0), rate)]))
+    with tempfile.TemporaryDirectory() as download_dir:
+        engine = get_engine(engine_name, limiter=limiter)
+        scheduler = DownloadScheduler(
+            download_dir=download_dir,
+            max_concurrent_files=args.max_concurrent_files,
+            max_connections=args.max_connections,
+            verbose=False,
+            download_function=engine.download,
+        )
+        started = time.perf_counter()
+        with engine:
+            scheduler.run(links)
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--limit", default="8M", help="Aggregate bandwidth limit")
+    parser.add_argument("--max-concurrent-files", type=int, default=4)
+    parser.add_argument("--max-connections", type=int, default=16)
+    parser.add_argument(
+        "--engines", nargs="+", default=sorted(ENGINES), choices=sorted(ENGINES)
+    )
+    args = parser.parse_args()
+
+    rate = parse_rate(args.limit)
+    content = os.urandom(args.size_mb * _MB)
+    files = {f"file_{index}.tar": content for index in range(args.files)}
+    total = len(files) * len(content)
+
+    with LocalHTTPServerProcess(files) as server:
+        links = [server.url(name) for name in files]
+        print(f"{args.files} file(s) of {args.size_mb} MB, limit {args.limit}/s")
+        print(f"{'engine':<12}{'seconds':>10}{'MB/s':>10}{'error':>10}")
+        for engine_name in args.engines:
+            elapsed = _run_engine(engine_name, links, rate, args)
+            achieved = total / elapsed
+            print(
+                f"{engine_name:<12}{elapsed:>10.2f}{achieved / _MB:>10.2f}"
+                f"{(achieved - rate) / rate:>10.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measures how fast `SeenIds` tells new tweet ids from seen ones: a first run over archives
+of fresh ids, a re-run over the same archives, and a run over archives overlapping the
+first ones by half. Ids are claimed in batches like the ingest does, one transaction per
+archive. Reports millions of ids per second and the size of the index.
+
+usage: python -m benchmarks.bench_dedup [--ids-millions 20] [--archive-millions 4] [--dir /mnt/disk]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from dozent.dedup import DEFAULT_CAPACITY, SeenIds
+
+_MB = 1024 * 1024
+
+
+def _snowflakes(count: int, seed: int) -> np.ndarray:
+    """
+    Ids like those of the stream: snowflakes growing with time, about 3000 tweets per
+    second of a 2^22 ids wide second, slightly out of order within a member
+    """
+    rng = np.random.default_rng(seed)
+    ids = 1_266_000_000_000_000_000 + np.cumsum(
+        rng.integers(1, 2 * (1 << 22) // 3000, count, dtype=np.uint64)
+    )
+    for start in range(0, count, 4096):
+        rng.shuffle(ids[start : start + 4096])
+    return ids
+
+
+def _run(seen: SeenIds, ids: np.ndarray, archive_size: int, batch_size: int):
+    """
+    :return: seconds taken and number of new ids
+    """
+    new = 0
+    started = time.perf_counter()
+    for start in range(0, len(ids), archive_size):
+        with seen.transaction() as transaction:
+            archive = ids[start : start + archive_size]
+            for offset in range(0, len(archive), batch_size):
+                new += int(
+                    np.count_nonzero(
+                        transaction.claim(archive[offset : offset + batch_size])
+                    )
+                )
+    return time.perf_counter() - started, new
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ids-millions", type=float, default=20)
+    parser.add_argument(
+        "--archive-millions",
+        type=float,
+        default=4,
+        help="Ids per archive, a day of the stream holds about 4 million tweets",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1024, help="Ids claimed at once"
+    )
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY)
+    parser.add_argument(
+        "--dir", default=None, help="Directory the index is written to, a temporary one"
+    )
+    args = parser.parse_args()
+
+    count = int(args.ids_millions * 1_000_000)
+    archive_size = int(args.archive_millions * 1_000_000)
+    first_run = _snowflakes(count, 0)
+    # The second half of the first run, and as many ids that come after it
+    overlapping = np.concatenate(
+        (first_run[count // 2 :], _snowflakes(count // 2, 1) + first_run.max())
+    )
+
+    print(
+        f"{count / 1e6:g}M ids in archives of {args.archive_millions:g}M, batches of "
+        f"{args.batch_size}, capacity {args.capacity / 1e6:g}M"
+    )
+    print(f"{'run':<24}{'M ids/s':>10}{'new':>12}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        with SeenIds(Path(directory) / "seen", capacity=args.capacity) as seen:
+            for name, run_ids in (
+                ("fresh ids", first_run),
+                ("re-run, all seen", first_run),
+                ("half overlapping", overlapping),
+            ):
+                seconds, new = _run(seen, run_ids, archive_size, args.batch_size)
+                print(f"{name:<24}{len(run_ids) / seconds / 1e6:>10.2f}{new:>12}")
+
+            files = list((Path(directory) / "seen").iterdir())
+            runs = sum(file.stat().st_size for file in files if file.suffix == ".ids")
+            bloom = sum(
+                file.stat().st_size for file in files if file.suffix == ".bloom"
+            )
+            print(
+                f"{len(seen) / 1e6:g}M ids: {runs / _MB:.0f} MB of sorted runs, "
+                f"{bloom / _MB:.0f} MB of bloom filter, both memory-mapped"
+            )
+
+
+if __name__ == "__main__":
+    main()
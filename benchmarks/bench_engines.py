@@ -0,0 +1,109 @@
+"""
+Compares the download engines on a local HTTP server that caps the bandwidth of every
+connection, the way archive.org datanodes do.
+
+usage: python -m benchmarks.bench_engines [--files 4] [--size-mb 16] [--bandwidth-mb 4]
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.local_http_server import LocalHTTPServerProcess
+from dozent.download_scheduler import DownloadScheduler
+from dozent.engines import ENGINES, get_engine
+
+_MB = 1024 * 1024
+
+
+def _run_engine(engine_name: str, links, max_concurrent_files, max_connections) -> dict:
+    peak_threads = threading.active_count()
+    running = threading.Event()
+    running.set()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while running.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    with tempfile.TemporaryDirectory() as download_dir:
+        engine = get_engine(engine_name)
+        scheduler = DownloadScheduler(
+            download_dir=download_dir,
+            max_concurrent_files=max_concurrent_files,
+            max_connections=max_connections,
+            verbose=False,
+            download_function=engine.download,
+        )
+        sampler.start()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        with engine:
+            scheduler.run(links)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        running.clear()
+        sampler.join()
+
+        downloaded = sum(
+            os.path.getsize(os.path.join(download_dir, name))
+            for name in os.listdir(download_dir)
+        )
+
+    return {
+        "engine": engine_name,
+        "seconds": elapsed,
+        "cpu_seconds": cpu,
+        "mb_per_second": downloaded / _MB / elapsed,
+        "bytes": downloaded,
+        # The sampler thread itself is not counted
+        "peak_threads": peak_threads - 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument(
+        "--bandwidth-mb",
+        type=float,
+        default=4,
+        help="Bandwidth cap of every connection in MB/s",
+    )
+    parser.add_argument("--max-concurrent-files", type=int, default=4)
+    parser.add_argument("--max-connections", type=int, default=16)
+    parser.add_argument(
+        "--engines", nargs="+", default=sorted(ENGINES), choices=sorted(ENGINES)
+    )
+    args = parser.parse_args()
+
+    content = os.urandom(args.size_mb * _MB)
+    files = {f"file_{index}.tar": content for index in range(args.files)}
+
+    with LocalHTTPServerProcess(
+        files, bandwidth=int(args.bandwidth_mb * _MB)
+    ) as server:
+        links = [server.url(name) for name in files]
+        print(
+            f"{args.files} file(s) of {args.size_mb} MB, {args.bandwidth_mb} MB/s per "
+            f"connection, {args.max_connections} connection(s)"
+        )
+        print(f"{'engine':<12}{'seconds':>10}{'MB/s':>10}{'cpu s':>10}{'threads':>10}")
+        for engine_name in args.engines:
+            result = _run_engine(
+                engine_name, links, args.max_concurrent_files, args.max_connections
+            )
+            print(
+                f"{result['engine']:<12}{result['seconds']:>10.2f}"
+                f"{result['mb_per_second']:>10.2f}{result['cpu_seconds']:>10.2f}"
+                f"{result['peak_threads']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compares the makespan of a run with the archives started in catalog order and largest
+first, on a local HTTP server that caps the bandwidth of every connection.
+
+usage: python -m benchmarks.bench_ordering [--small-files 12] [--small-mb 1] [--large-mb 8]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.local_http_server import LocalHTTPServerProcess
+from dozent.download_scheduler import DownloadScheduler
+from dozent.engines import AsyncioEngine
+from dozent.ordering import ORDERS, order_links
+
+_MB = 1024 * 1024
+
+
+def _run_order(order: str, links, sizes, args) -> float:
+    ordered = order_links(links, order, sizes.get)
+    with tempfile.TemporaryDirectory() as download_dir:
+        engine = AsyncioEngine(segments_per_file=args.segments)
+        scheduler = DownloadScheduler(
+            download_dir=download_dir,
+            max_concurrent_files=args.max_concurrent_files,
+            max_connections=args.max_concurrent_files * args.segments,
+            verbose=False,
+            download_function=engine.download,
+        )
+        started = time.perf_counter()
+        with engine:
+            results = scheduler.run(ordered)
+        elapsed = time.perf_counter() - started
+    if not results.ok:
+        raise RuntimeError(results.format())
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--small-files", type=int, default=12)
+    parser.add_argument("--small-mb", type=int, default=1)
+    parser.add_argument("--large-files", type=int, default=1)
+    parser.add_argument("--large-mb", type=int, default=8)
+    parser.add_argument(
+        "--bandwidth-mb", type=float, default=2, help="Cap of every connection"
+    )
+    parser.add_argument("--max-concurrent-files", type=int, default=3)
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=1,
+        help="Connections per file, 1 models a per-file cap like archive.org's",
+    )
+    parser.add_argument("--orders", nargs="+", default=list(ORDERS), choices=ORDERS)
+    args = parser.parse_args()
+
+    # Like a catalog mixing daily and monthly archives, the large ones are listed last
+    files = {
+        f"twitter_stream_2020_06_{index + 1:02d}.tar": os.urandom(args.small_mb * _MB)
+        for index in range(args.small_files)
+    }
+    files.update(
+        {
+            f"archiveteam-twitter-stream-2020-{index + 7:02d}.tar": os.urandom(
+                args.large_mb * _MB
+            )
+            for index in range(args.large_files)
+        }
+    )
+    total = sum(len(content) for content in files.values())
+    # A lower bound: every file slot busy until the end, and no file split across slots
+    bound = max(
+        total / args.max_concurrent_files, args.large_mb * _MB / args.segments
+    ) / (args.bandwidth_mb * _MB)
+
+    with LocalHTTPServerProcess(
+        files, bandwidth=int(args.bandwidth_mb * _MB)
+    ) as server:
+        links = [server.url(name) for name in files]
+        sizes = {server.url(name): len(content) for name, content in files.items()}
+        print(
+            f"{args.small_files} file(s) of {args.small_mb} MB and {args.large_files} "
+            f"of {args.large_mb} MB, {args.max_concurrent_files} at a time, "
+            f"{args.bandwidth_mb} MB/s per connection, lower bound {bound:.2f}s"
+        )
+        print(f"{'order':<16}{'seconds':>10}{'vs bound':>10}")
+        for order in args.orders:
+            elapsed = _run_order(order, links, sizes, args)
+            print(f"{order:<16}{elapsed:>10.2f}{elapsed / bound:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
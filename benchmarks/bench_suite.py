@@ -0,0 +1,339 @@
+"""
+Runs `Dozent.download_timeframe` against a local stand-in for archive.org at several
+concurrency levels and records throughput, CPU time, peak RSS and thread count as JSON.
+
+usage: python -m benchmarks.bench_suite [--files 8] [--size-mb 8] [--concurrency 1 4 8]
+    [--engines asyncio pysmartdl] [--bandwidth-mb 4] [--latency-ms 20] [--no-ranges]
+    [--fail-rate 0.05] [--output results.json] [--baseline previous.json]
+
+Every scenario runs in a fresh process, so that peak RSS and thread counts are not
+carried over from one scenario to the next, and a scenario that crashes is recorded as
+failed instead of ending the suite.
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is left out there
+    resource = None
+
+from benchmarks.local_http_server import LocalHTTPServerProcess
+from dozent.catalog import Catalog
+from dozent.dozent import LAST_DAY_OF_SUPPORT, Dozent
+from dozent.engines import ENGINES
+
+_MB = 1024 * 1024
+
+# Throughput drop, relative to the baseline, reported as a regression
+DEFAULT_TOLERANCE = 0.1
+
+# Seconds a scenario may run before it is counted as hanging
+_SCENARIO_TIMEOUT = 600
+
+
+def archive_dates(count: int) -> List[datetime.date]:
+    """
+    The last `count` supported days, the archives of the stand-in server are named after them
+    """
+    first = LAST_DAY_OF_SUPPORT - datetime.timedelta(days=count - 1)
+    return [first + datetime.timedelta(days=offset) for offset in range(count)]
+
+
+def archive_name(day: datetime.date) -> str:
+    return f"twitter_stream_{day:%Y_%m_%d}.tar"
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / _MB if sys.platform == "darwin" else peak / 1024
+
+
+def _run_scenario(
+    base_url: str, dates: List[datetime.date], scenario: dict, connection
+):
+    """
+    Downloads every archive with the settings of `scenario`, runs in a child process and
+    sends the measurements back over `connection`
+    """
+    # download_timeframe prints every queued archive
+    sys.stdout = open(os.devnull, "w")
+
+    catalog = Catalog(
+        [
+            {
+                "year": str(day.year),
+                "month": f"{day.month:02}",
+                "day": f"{day.day:02}",
+                "link": base_url + archive_name(day),
+            }
+            for day in dates
+        ]
+    )
+    dozent = Dozent(catalog=catalog)
+
+    peak_threads = threading.active_count()
+    running = threading.Event()
+    running.set()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while running.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    rss_before = _peak_rss_mb()
+    with tempfile.TemporaryDirectory() as download_dir:
+        sampler.start()
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        results = dozent.download_timeframe(
+            start_date=dates[0],
+            end_date=dates[-1],
+            verbose=False,
+            download_dir=download_dir,
+            max_concurrent_files=scenario["max_concurrent_files"],
+            max_connections=scenario["max_connections"],
+            engine=scenario["engine"],
+            min_free_space=0,
+        )
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        running.clear()
+        sampler.join()
+
+        downloaded = sum(
+            os.path.getsize(os.path.join(download_dir, name))
+            for name in os.listdir(download_dir)
+        )
+
+    connection.send(
+        {
+            "seconds": elapsed,
+            "bytes": downloaded,
+            "mb_per_second": downloaded / _MB / elapsed,
+            "cpu_seconds": cpu,
+            "rss_before_mb": rss_before,
+            "peak_rss_mb": _peak_rss_mb(),
+            # The sampler thread itself is not counted
+            "peak_threads": peak_threads - 1,
+            "failed_files": len(results.outcomes) - len(results.succeeded),
+        }
+    )
+
+
+def run_scenario(base_url: str, dates: List[datetime.date], scenario: dict) -> dict:
+    """
+    Runs a scenario in a fresh process
+    :return: the scenario with its measurements and a `status` of `ok` or `failed`
+    """
+    context = multiprocessing.get_context("spawn")
+    parent_connection, child_connection = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_run_scenario, args=(base_url, dates, scenario, child_connection)
+    )
+    process.start()
+    child_connection.close()
+
+    result = dict(scenario)
+    try:
+        if parent_connection.poll(_SCENARIO_TIMEOUT):
+            result.update(parent_connection.recv(), status="ok")
+            if result["failed_files"]:
+                result.update(
+                    status="failed", error=f"{result['failed_files']} file(s) failed"
+                )
+    except EOFError:
+        pass
+    process.join(5)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    if "status" not in result:
+        result.update(status="failed", error=f"exit code {process.exitcode}")
+    return result
+
+
+def compare(
+    results: List[dict], baseline: List[dict], tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """
+    Compares the throughput of every scenario with the same scenario of a baseline run
+    :param tolerance: relative throughput drop that is still accepted
+    :return: a description of every regression
+    """
+
+    def key(result: dict):
+        return (
+            result["engine"],
+            result["max_concurrent_files"],
+            result["max_connections"],
+        )
+
+    previous: Dict[tuple, dict] = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is None or before["status"] != "ok":
+            continue
+        name = "{} with {} file(s), {} connection(s)".format(*key(result))
+        if result["status"] != "ok":
+            regressions.append(f"{name} failed: {result.get('error')}")
+        elif result["mb_per_second"] < before["mb_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['mb_per_second']:.2f} MB/s, was "
+                f"{before['mb_per_second']:.2f} MB/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument(
+        "--size-mb",
+        type=float,
+        nargs="+",
+        default=[8],
+        help="File sizes in MB, cycled over the files",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 4, 8],
+        help="Numbers of files downloaded at the same time",
+    )
+    parser.add_argument(
+        "--connections-per-file",
+        type=int,
+        default=4,
+        help="Connections of every file, the connection budget is this times the "
+        "concurrency",
+    )
+    parser.add_argument(
+        "--engines", nargs="+", default=sorted(ENGINES), choices=sorted(ENGINES)
+    )
+    parser.add_argument(
+        "--bandwidth-mb",
+        type=float,
+        default=0,
+        help="Bandwidth cap of every connection in MB/s, 0 for none",
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=0, help="Delay before every response"
+    )
+    parser.add_argument(
+        "--no-ranges", action="store_true", help="Ignore Range requests"
+    )
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0,
+        help="Share of GET requests answered with 503",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    parser.add_argument(
+        "--baseline", help="Results of an earlier run to check for regressions"
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    dates = archive_dates(args.files)
+    contents = {size: os.urandom(int(size * _MB)) for size in set(args.size_mb)}
+    files = {
+        archive_name(day): contents[args.size_mb[index % len(args.size_mb)]]
+        for index, day in enumerate(dates)
+    }
+    server_options = dict(
+        bandwidth=int(args.bandwidth_mb * _MB),
+        latency=args.latency_ms / 1000,
+        support_ranges=not args.no_ranges,
+        fail_rate=args.fail_rate,
+        seed=args.seed,
+    )
+
+    results = []
+    print(
+        f"{'engine':<12}{'files':>6}{'conns':>7}{'seconds':>10}{'MB/s':>10}"
+        f"{'cpu s':>8}{'rss MB':>9}{'threads':>9}",
+        file=sys.stderr,
+    )
+    with LocalHTTPServerProcess(files, **server_options) as server:
+        for engine in args.engines:
+            for concurrency in args.concurrency:
+                result = run_scenario(
+                    server.url(""),
+                    dates,
+                    {
+                        "engine": engine,
+                        "max_concurrent_files": concurrency,
+                        "max_connections": concurrency * args.connections_per_file,
+                    },
+                )
+                results.append(result)
+                if result["status"] == "ok":
+                    print(
+                        f"{engine:<12}{concurrency:>6}{result['max_connections']:>7}"
+                        f"{result['seconds']:>10.2f}{result['mb_per_second']:>10.2f}"
+                        f"{result['cpu_seconds']:>8.2f}"
+                        f"{result['peak_rss_mb'] or 0:>9.1f}{result['peak_threads']:>9}",
+                        file=sys.stderr,
+                    )
+                else:
+                    print(
+                        f"{engine:<12}{concurrency:>6}{result['max_connections']:>7}  "
+                        f"failed: {result['error']}",
+                        file=sys.stderr,
+                    )
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "files": args.files,
+            "size_mb": args.size_mb,
+            "connections_per_file": args.connections_per_file,
+            **server_options,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
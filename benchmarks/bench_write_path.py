@@ -0,0 +1,152 @@
+"""
+Compares ways of writing a file downloaded in segments, without network: reads from
+the sockets are replayed from memory in the order the segments interleave. Reports the
+MB/s of the final file and the bytes written to disk, the copies the merge step of part
+files makes on top of the file itself.
+
+usage: python -m benchmarks.bench_write_path [--size-mb 512] [--segments 8] [--dir /mnt/disk]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from dozent.file_writer import FileWriter, WriteOptions
+
+_MB = 1024 * 1024
+
+# Size of a read from a socket, the asyncio engine's `_CHUNK_SIZE`
+_READ_SIZE = 256 * 1024
+
+
+def _reads(size: int, segments: int) -> List[Tuple[int, int, int]]:
+    """
+    The reads of a download as (segment, offset, length), round robin over the segments
+    like connections served at the same rate
+    """
+    bounds = [size * index // segments for index in range(segments + 1)]
+    positions = bounds[:-1]
+    reads = []
+    while any(position < end for position, end in zip(positions, bounds[1:])):
+        for segment in range(segments):
+            position, end = positions[segment], bounds[segment + 1]
+            if position < end:
+                length = min(_READ_SIZE, end - position)
+                reads.append((segment, position, length))
+                positions[segment] += length
+    return reads
+
+
+def _part_files(path: str, data: memoryview, reads, segments: int, fsync: bool) -> int:
+    """
+    Every segment goes to its own part file, which are concatenated once complete
+    """
+    parts = [open(f"{path}.{segment:03d}", "wb") for segment in range(segments)]
+    for segment, offset, length in reads:
+        parts[segment].write(data[offset : offset + length])
+    for part in parts:
+        part.close()
+    with open(path, "wb") as output:
+        for segment in range(segments):
+            with open(f"{path}.{segment:03d}", "rb") as part:
+                shutil.copyfileobj(part, output, 16 * _MB)
+            os.remove(f"{path}.{segment:03d}")
+        if fsync:
+            output.flush()
+            os.fsync(output.fileno())
+    return 2 * len(data)
+
+
+def _in_place(options: WriteOptions) -> Callable:
+    def write(path: str, data: memoryview, reads, segments: int, fsync: bool) -> int:
+        """
+        Every segment writes at its offset of the final file, through a buffer of
+        `options.buffer_size` bytes per segment
+        """
+        buffers = [bytearray() for _ in range(segments)]
+        starts: Dict[int, int] = {}
+        options_ = options._replace(fsync="end" if fsync else "none")
+        with FileWriter(path, len(data), options_) as writer:
+            for segment, offset, length in reads:
+                buffer = buffers[segment]
+                if not buffer:
+                    starts[segment] = offset
+                buffer += data[offset : offset + length]
+                if len(buffer) >= options.buffer_size:
+                    writer.write_at(buffer, starts[segment])
+                    buffer.clear()
+            for segment, buffer in enumerate(buffers):
+                if buffer:
+                    writer.write_at(buffer, starts[segment])
+        return len(data)
+
+    return write
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--segments", type=int, default=8)
+    parser.add_argument(
+        "--buffer-mb", type=float, default=1, help="Write buffer of the in-place writer"
+    )
+    parser.add_argument(
+        "--dir", default=None, help="Directory on the disk to measure, a temporary one"
+    )
+    parser.add_argument(
+        "--no-fsync",
+        action="store_true",
+        help="Don't force the file to disk before stopping the clock, which then mostly "
+        "measures the page cache",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    size = args.size_mb * _MB
+    data = memoryview(os.urandom(size))
+    reads = _reads(size, args.segments)
+    buffer_size = int(args.buffer_mb * _MB)
+    writers = {
+        "part files + merge": _part_files,
+        "in place, per read": _in_place(
+            WriteOptions(preallocate=False, buffer_size=_READ_SIZE)
+        ),
+        "in place, buffered": _in_place(
+            WriteOptions(preallocate=False, buffer_size=buffer_size)
+        ),
+        "preallocated, buffered": _in_place(
+            WriteOptions(preallocate=True, buffer_size=buffer_size)
+        ),
+    }
+
+    print(
+        f"{args.size_mb} MB in {args.segments} segments, reads of "
+        f"{_READ_SIZE // 1024} KB, {args.buffer_mb:g} MB write buffers, "
+        f"{'no fsync' if args.no_fsync else 'fsync at the end'}, best of {args.repeat}"
+    )
+    print(f"{'writer':<26}{'MB/s':>10}{'MB written':>12}{'extra copies':>14}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = os.path.join(directory, "archive.tar")
+        for name, write in writers.items():
+            best = None
+            for _ in range(args.repeat):
+                if os.path.exists(path):
+                    os.remove(path)
+                started = time.perf_counter()
+                written = write(path, data, reads, args.segments, not args.no_fsync)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            with open(path, "rb") as file:
+                if file.read(_MB) != data[:_MB]:
+                    raise RuntimeError(f"{name} wrote a corrupt file")
+            print(
+                f"{name:<26}{size / _MB / best:>10.0f}{written / _MB:>12.0f}"
+                f"{written / size - 1:>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import hashlib
+import multiprocessing
+import random
+import re
+import socket
+import socketserver
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List, Optional
+
+_RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _headers_for(self, content: bytes) -> Dict[str, str]:
+        return {
+            "ETag": '"' + hashlib.md5(content).hexdigest() + '"',
+            "Last-Modified": self.server.owner.last_modified,
+            "Accept-Ranges": "bytes",
+        }
+
+    def _send(self, status: int, headers: Dict[str, str]) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _not_modified(self, headers: Dict[str, str]) -> bool:
+        """
+        Answers a conditional request with 304 when the file didn't change
+        :return: whether the request was answered
+        """
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_none_match is not None:
+            not_modified = headers["ETag"] in (
+                tag.strip() for tag in if_none_match.split(",")
+            )
+        elif if_modified_since is not None:
+            try:
+                not_modified = parsedate_to_datetime(
+                    headers["Last-Modified"]
+                ) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                not_modified = False
+        else:
+            return False
+        if not_modified:
+            self._send(
+                304,
+                {"ETag": headers["ETag"], "Last-Modified": headers["Last-Modified"]},
+            )
+        return not_modified
+
+    def _lookup(self) -> Optional[bytes]:
+        owner = self.server.owner
+        if owner.latency:
+            time.sleep(owner.latency)
+        if self.command == "GET" and owner.should_fail():
+            self._send(owner.fail_status, {"Content-Length": "0"})
+            return None
+        name = self.path.lstrip("/")
+        target = self.server.owner.redirects.get(name)
+        if target is not None:
+            self._send(302, {"Location": "/" + target, "Content-Length": "0"})
+            return None
+        content = self.server.owner.files.get(name)
+        if content is None:
+            self._send(404, {"Content-Length": "0"})
+        return content
+
+    def do_HEAD(self):
+        owner = self.server.owner
+        owner.record(self)
+        content = self._lookup()
+        if content is None:
+            return
+        headers = self._headers_for(content)
+        if self._not_modified(headers):
+            return
+        headers["Content-Length"] = str(len(content))
+        self._send(200, headers)
+
+    def do_GET(self):
+        owner = self.server.owner
+        request_number = owner.record(self)
+        content = self._lookup()
+        if content is None:
+            return
+
+        headers = self._headers_for(content)
+        if self._not_modified(headers):
+            return
+        start, end = 0, len(content)
+        status = 200
+
+        match = _RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if_range_valid = if_range is None or if_range in (
+            headers["ETag"],
+            headers["Last-Modified"],
+        )
+        if match and owner.support_ranges and if_range_valid:
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(content)
+            end = min(end, len(content))
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(content)}"
+
+        headers["Content-Length"] = str(end - start)
+        self._send(status, headers)
+
+        body = content[start:end]
+        if request_number < owner.drop_first_requests:
+            # Send part of the body, then cut the connection
+            self._write_body(body[: owner.drop_after_bytes])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            self.close_connection = True
+            return
+        self._write_body(body)
+
+    def _write_body(self, body: bytes) -> None:
+        bandwidth = self.server.owner.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+
+        # Paces the body so that this connection never goes faster than `bandwidth`
+        block_size = max(1024, min(64 * 1024, bandwidth // 20))
+        started = time.monotonic()
+        for offset in range(0, len(body), block_size):
+            self.wfile.write(body[offset : offset + block_size])
+            ahead = (offset + block_size) / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer needs Python 3.7
+    daemon_threads = True
+    # The default backlog of 5 drops connections when many segments start at once
+    request_queue_size = 128
+    owner: "LocalHTTPServer"
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early is expected, e.g. PySmartDL after reading the headers
+        pass
+
+
+class LocalHTTPServer:
+    """
+    Small HTTP server serving in-memory files on localhost, with Range support, answers to
+    conditional requests and connections that can be dropped partway through a response
+
+    :param files: mapping of file name to content
+    :param support_ranges: if False, Range headers are ignored and the whole file is sent
+    :param drop_first_requests: number of GET requests whose connection is dropped
+    :param drop_after_bytes: number of body bytes sent before a connection is dropped
+    :param bandwidth: maximum bytes per second sent on each connection, 0 for no limit
+    :param redirects: mapping of file name to the name it redirects to
+    :param latency: seconds waited before answering every request
+    :param fail_rate: share of GET requests answered with `fail_status` instead of the file
+    :param fail_status: HTTP status of the failed requests
+    :param seed: seed of the random choice of failed requests
+    """
+
+    def __init__(
+        self,
+        files: Dict[str, bytes],
+        support_ranges: bool = True,
+        drop_first_requests: int = 0,
+        drop_after_bytes: int = 0,
+        bandwidth: int = 0,
+        redirects: Optional[Dict[str, str]] = None,
+        latency: float = 0.0,
+        fail_rate: float = 0.0,
+        fail_status: int = 503,
+        seed: Optional[int] = None,
+    ):
+        self.files = files
+        self.support_ranges = support_ranges
+        self.drop_first_requests = drop_first_requests
+        self.drop_after_bytes = drop_after_bytes
+        self.bandwidth = bandwidth
+        self.redirects = redirects or {}
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self._random = random.Random(seed)
+        self.last_modified = formatdate(usegmt=True)
+        self.requests: List[Dict[str, Optional[str]]] = []
+        self._get_requests = 0
+        self._lock = threading.Lock()
+
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    def record(self, handler: BaseHTTPRequestHandler) -> int:
+        """
+        Records a request
+        :return: number of GET requests received before this one
+        """
+        with self._lock:
+            self.requests.append(
+                {
+                    "method": handler.command,
+                    "path": handler.path,
+                    "range": handler.headers.get("Range"),
+                    "conditional": handler.headers.get("If-None-Match")
+                    or handler.headers.get("If-Modified-Since"),
+                }
+            )
+            if handler.command != "GET":
+                return -1
+            self._get_requests += 1
+            return self._get_requests - 1
+
+    def should_fail(self) -> bool:
+        """
+        Whether the current GET request is answered with an error, picked at `fail_rate`
+        """
+        if not self.fail_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.fail_rate
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/{name}"
+
+    def __enter__(self) -> "LocalHTTPServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _serve(files: Dict[str, bytes], options: dict, connection) -> None:
+    with LocalHTTPServer(files, **options) as server:
+        connection.send(server.url(""))
+        # Serve until the parent asks to stop
+        connection.recv()
+
+
+class LocalHTTPServerProcess:
+    """
+    Runs a `LocalHTTPServer` in a child process, so that serving doesn't compete with the
+    code being benchmarked for the GIL. Takes the same arguments as `LocalHTTPServer`
+    """
+
+    def __init__(self, files: Dict[str, bytes], **options):
+        self._parent_connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(files, options, child_connection)
+        )
+        self._process.daemon = True
+        self._base_url = ""
+
+    def url(self, name: str) -> str:
+        return self._base_url + name
+
+    def __enter__(self) -> "LocalHTTPServerProcess":
+        self._process.start()
+        self._base_url = self._parent_connection.recv()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._parent_connection.send(None)
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
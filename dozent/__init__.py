@@ -1,6 +1,4 @@
-from dozent.catch_thread_exceptions import install as _catch_thread_exceptions
 from dozent.dozent import Dozent
+from dozent.download_scheduler import DownloadOutcome, DownloadResults
 
-_catch_thread_exceptions()
-
-__all__ = ["Dozent"]
+__all__ = ["Dozent", "DownloadOutcome", "DownloadResults"]
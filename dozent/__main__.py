@@ -1,12 +1,63 @@
 import argparse
 import datetime
+import sys
 import time
+from contextlib import ExitStack
 from pathlib import Path
 
 try:
     from dozent.dozent import Dozent
+    from dozent.download_scheduler import (
+        DEFAULT_MAX_CONCURRENT_FILES,
+        DEFAULT_MAX_CONNECTIONS,
+    )
+    from dozent.columnar import COLUMN_TYPES, DEFAULT_FIELDS, ColumnarTable, ingest_path
+    from dozent.dedup import SeenIds
+    from dozent.disk_space import (
+        DEFAULT_MIN_FREE_SPACE,
+        DEFAULT_SPACE_POLICY,
+        SPACE_POLICIES,
+        parse_size,
+    )
+    from dozent.decompress import DEFAULT_CHUNK_SIZE, decompress
+    from dozent.engines import DEFAULT_ENGINE, ENGINES
+    from dozent.file_writer import (
+        DEFAULT_FSYNC_POLICY,
+        DEFAULT_WRITE_BUFFER_SIZE,
+        FSYNC_POLICIES,
+    )
+    from dozent.integrity import verify
+    from dozent.ordering import DEFAULT_ORDER, ORDERS
+    from dozent.retry import DEFAULT_MAX_RETRIES
+    from dozent.sampling import parse_sample
+    from dozent.sharding import DEFAULT_CLAIM_TTL, parse_shard
+    from dozent.sync import DEFAULT_MAX_CHECKS
+    from dozent.tar_index import index_paths
 except ModuleNotFoundError:
     from dozent import Dozent
+    from download_scheduler import DEFAULT_MAX_CONCURRENT_FILES, DEFAULT_MAX_CONNECTIONS
+    from columnar import COLUMN_TYPES, DEFAULT_FIELDS, ColumnarTable, ingest_path
+    from dedup import SeenIds
+    from disk_space import (
+        DEFAULT_MIN_FREE_SPACE,
+        DEFAULT_SPACE_POLICY,
+        SPACE_POLICIES,
+        parse_size,
+    )
+    from decompress import DEFAULT_CHUNK_SIZE, decompress
+    from engines import DEFAULT_ENGINE, ENGINES
+    from file_writer import (
+        DEFAULT_FSYNC_POLICY,
+        DEFAULT_WRITE_BUFFER_SIZE,
+        FSYNC_POLICIES,
+    )
+    from integrity import verify
+    from ordering import DEFAULT_ORDER, ORDERS
+    from retry import DEFAULT_MAX_RETRIES
+    from sampling import parse_sample
+    from sharding import DEFAULT_CLAIM_TTL, parse_shard
+    from sync import DEFAULT_MAX_CHECKS
+    from tar_index import index_paths
 
 CURRENT_FILE_PATH = Path(__file__)
 DEFAULT_DATA_DIRECTORY = CURRENT_FILE_PATH.parent.parent / "data"
@@ -46,6 +97,349 @@ parser.add_argument(
     help="Downloads 4 small files for testing purposes (<3 MB total)",
     action="store_true",
 )
+parser.add_argument(
+    "--max-concurrent-files",
+    help="Maximum number of files downloaded at the same time. "
+    f"Defaults to {DEFAULT_MAX_CONCURRENT_FILES}",
+    type=int,
+    default=DEFAULT_MAX_CONCURRENT_FILES,
+)
+parser.add_argument(
+    "--max-connections",
+    help="Maximum number of connections open across all files. "
+    f"Defaults to {DEFAULT_MAX_CONNECTIONS}",
+    type=int,
+    default=DEFAULT_MAX_CONNECTIONS,
+)
+parser.add_argument(
+    "--resume",
+    help="Continue interrupted downloads and skip files that are already complete",
+    action="store_true",
+)
+parser.add_argument(
+    "--engine",
+    help=f"Engine used to transfer the files. Defaults to {DEFAULT_ENGINE}",
+    choices=sorted(ENGINES),
+    default=DEFAULT_ENGINE,
+)
+parser.add_argument(
+    "--extract-on-the-fly",
+    help="Extract tar archives while they are downloaded instead of storing them",
+    action="store_true",
+)
+parser.add_argument(
+    "--sample",
+    help="Download only some members of every tar archive into <output>/<name>/, "
+    "walking the archive headers with small Range requests: first=N members, every=Kh "
+    "hour of the day, glob=PATTERN of the member names, or several of them separated by "
+    "commas, e.g. every=6h,first=120",
+    type=parse_sample,
+    default=None,
+)
+parser.add_argument(
+    "--decompress-dir",
+    help="Decompress the members of every archive into this directory on all cores "
+    "while the downloads go on",
+    default=None,
+)
+parser.add_argument(
+    "--columnar-dir",
+    help="Write the tweets of every archive to a columnar table in this directory as "
+    "soon as it is downloaded",
+    default=None,
+)
+parser.add_argument(
+    "--columnar-fields",
+    help="Fields projected into the columnar tables, as dotted paths optionally "
+    f"followed by :<type> with a type of {', '.join(COLUMN_TYPES)}. "
+    f"Defaults to {' '.join(DEFAULT_FIELDS)}",
+    nargs="+",
+    default=list(DEFAULT_FIELDS),
+)
+parser.add_argument(
+    "--dedup-dir",
+    help="With --columnar-dir, keep the ids of the ingested tweets in this directory "
+    "across runs and leave out of the tables the tweets already ingested",
+    default=None,
+)
+parser.add_argument(
+    "--index",
+    help="Index the members of every archive once it is downloaded, so that one hour "
+    "can be read without scanning the whole archive",
+    action="store_true",
+)
+parser.add_argument(
+    "--fetch-metadata",
+    help="Fetch the size and checksum of the archives that are not cached yet, with one "
+    "request per month, to show the total download size",
+    action="store_true",
+)
+parser.add_argument(
+    "--max-bandwidth",
+    help="Cap on the combined throughput of all downloads in bytes per second, e.g. "
+    "200M, or rates by time of day, e.g. 08:00=50M,20:00=500M",
+    default=None,
+)
+parser.add_argument(
+    "--bandwidth-control-file",
+    help="File holding a rate or schedule like --max-bandwidth. Editing it changes the "
+    "limit while the downloads run",
+    default=None,
+)
+parser.add_argument(
+    "--min-free-space",
+    help="Space always left free on the output volume, e.g. 20G. New files wait until "
+    "they fit. Defaults to 1G",
+    type=parse_size,
+    default=DEFAULT_MIN_FREE_SPACE,
+)
+parser.add_argument(
+    "--when-full",
+    help="What to do when the archives don't fit in the free space: refuse to start, "
+    "trim the archives that don't fit, or wait for space to be freed. "
+    f"Defaults to {DEFAULT_SPACE_POLICY}",
+    choices=SPACE_POLICIES,
+    default=DEFAULT_SPACE_POLICY,
+)
+parser.add_argument(
+    "--order",
+    help="Order the archives are started in: as listed in the catalog, the largest "
+    "first so that a big archive doesn't hold up the end of the run, or by date. "
+    f"Defaults to {DEFAULT_ORDER}",
+    choices=ORDERS,
+    default=DEFAULT_ORDER,
+)
+parser.add_argument(
+    "--no-preallocate",
+    help="Don't reserve the final size of every archive on disk before it is written. "
+    "Like the other write options, makes the pysmartdl engine download with its own "
+    "resumable writer, as PySmartDL doesn't take any",
+    action="store_true",
+)
+parser.add_argument(
+    "--write-buffer",
+    help="Bytes gathered from a connection before they are written with a single call, "
+    "e.g. 4M. Defaults to 1M. Other sizes make the pysmartdl engine download with its "
+    "own resumable writer",
+    type=parse_size,
+    default=DEFAULT_WRITE_BUFFER_SIZE,
+)
+parser.add_argument(
+    "--fsync",
+    help="When written bytes are forced to disk: never, at every checkpoint of the "
+    "resume state, or at the end of every archive. Other policies than the default make "
+    "the pysmartdl engine download with its own resumable writer. "
+    f"Defaults to {DEFAULT_FSYNC_POLICY}",
+    choices=FSYNC_POLICIES,
+    default=DEFAULT_FSYNC_POLICY,
+)
+parser.add_argument(
+    "--metrics-file",
+    help="JSON lines file the queue wait, time to first byte, duration, throughput, "
+    "retries and status of every archive are appended to, followed by a run summary",
+    default=None,
+)
+parser.add_argument(
+    "--prometheus-file",
+    help="File for node_exporter's textfile collector, rewritten while the downloads "
+    "run, e.g. /var/lib/node_exporter/dozent.prom",
+    default=None,
+)
+parser.add_argument(
+    "--max-retries",
+    help="Retries of a failed request before the archive is given up on. Only the "
+    "missing bytes of a failed range are requested again, after a jittered exponential "
+    f"backoff. Defaults to {DEFAULT_MAX_RETRIES}",
+    type=int,
+    default=DEFAULT_MAX_RETRIES,
+)
+parser.add_argument(
+    "--no-verify",
+    help="Don't check the archives against the MD5 and SHA-1 published by archive.org. "
+    "By default they are hashed while they are written and downloaded again on mismatch",
+    action="store_true",
+)
+parser.add_argument(
+    "--mirror",
+    help="Base URL of a mirror laid out like archive.org's download tree, "
+    "<base>/<item>/<file>. Can be given several times. Byte ranges of every archive "
+    "are fetched from archive.org and the mirrors at once, faster sources getting "
+    "more of them. Only used by the asyncio engine",
+    action="append",
+    default=[],
+)
+parser.add_argument(
+    "--shard",
+    help="Download only the i-th of N shards of the archives, e.g. 0/4 on the first of "
+    "four nodes run with the same dates",
+    type=parse_shard,
+    default=None,
+)
+parser.add_argument(
+    "--claim",
+    help="Share the archives with other nodes writing to the same output directory. "
+    "Every archive is claimed with a lock file before it starts, nodes that are done "
+    "take over the archives of dead nodes, and the run ends once every archive is "
+    "downloaded",
+    action="store_true",
+)
+parser.add_argument(
+    "--claim-ttl",
+    help="Seconds without a heartbeat after which the claims of a node are taken over. "
+    f"Defaults to {DEFAULT_CLAIM_TTL:.0f}",
+    type=float,
+    default=DEFAULT_CLAIM_TTL,
+)
+
+subparsers = parser.add_subparsers(dest="command", title="commands")
+decompress_parser = subparsers.add_parser(
+    "decompress",
+    help="Decompress downloaded archives on all cores",
+    description="Decompresses .bz2/.gz files, tar archives of them, or directories "
+    "of either with a pool of processes",
+)
+decompress_parser.add_argument("paths", nargs="+", help="Files or directories")
+decompress_parser.add_argument(
+    "-d",
+    "--decompress-output",
+    help="Directory the decompressed files are written to. "
+    "Defaults to the data/decompressed directory",
+    default=DEFAULT_DATA_DIRECTORY / "decompressed",
+)
+decompress_parser.add_argument(
+    "--workers",
+    help="Number of worker processes. Defaults to the number of cores",
+    type=int,
+    default=None,
+)
+decompress_parser.add_argument(
+    "--chunk-size",
+    help=f"Size of the blocks each worker reads and writes, in bytes. "
+    f"Defaults to {DEFAULT_CHUNK_SIZE}",
+    type=int,
+    default=DEFAULT_CHUNK_SIZE,
+)
+decompress_parser.add_argument(
+    "--max-in-flight",
+    help="Maximum number of files queued or being decompressed at once. "
+    "Defaults to twice the number of workers",
+    type=int,
+    default=None,
+)
+
+ingest_parser = subparsers.add_parser(
+    "ingest",
+    help="Turn downloaded archives into columnar tables",
+    description="Writes the projected fields of the tweets in every archive, directory "
+    "or JSON lines file to a memory-mappable columnar table",
+)
+ingest_parser.add_argument("paths", nargs="+", help="Files or directories")
+ingest_parser.add_argument(
+    "-d",
+    "--ingest-output",
+    help="Directory the tables are written to. Defaults to the data/columnar directory",
+    default=DEFAULT_DATA_DIRECTORY / "columnar",
+)
+ingest_parser.add_argument(
+    "--fields",
+    help=f"Projected fields. Defaults to {' '.join(DEFAULT_FIELDS)}",
+    nargs="+",
+    default=list(DEFAULT_FIELDS),
+)
+ingest_parser.add_argument(
+    "--dedup-dir",
+    help="Keep the ids of the ingested tweets in this directory across runs and leave "
+    "out of the tables the tweets already ingested",
+    dest="ingest_dedup_dir",
+    default=None,
+)
+
+verify_parser = subparsers.add_parser(
+    "verify",
+    help="Check downloaded archives against their published checksums on all cores",
+    description="Hashes the files, or the files in the directories, with a pool of "
+    "processes and compares them with the MD5 and SHA-1 in the metadata cache. Exits "
+    "with 1 when a file doesn't match",
+)
+verify_parser.add_argument("paths", nargs="+", help="Files or directories")
+verify_parser.add_argument(
+    "--workers",
+    help="Number of worker processes. Defaults to the number of cores",
+    type=int,
+    default=None,
+)
+
+index_parser = subparsers.add_parser(
+    "index",
+    help="Index the members of downloaded archives",
+    description="Writes <archive>.dozent-index next to every tar archive, with the "
+    "offset, size and minute of each member, reading only the tar headers",
+)
+index_parser.add_argument("paths", nargs="+", help="Files or directories")
+index_parser.add_argument(
+    "--rebuild",
+    help="Index the archives again even when their index is up to date",
+    action="store_true",
+)
+
+sync_parser = subparsers.add_parser(
+    "sync",
+    help="Download only the archives of the date range that are missing or changed",
+    description="Compares the archives from --start-date to --end-date with the files "
+    "in the output directory, checking the local ones with conditional requests, and "
+    "downloads only those that are missing, incomplete or changed. The download options "
+    "go before the command, e.g. python -m dozent -s 2020-05-01 -e 2020-05-31 sync",
+)
+sync_parser.add_argument(
+    "--max-checks",
+    help="Conditional requests sent at the same time. "
+    f"Defaults to {DEFAULT_MAX_CHECKS}",
+    type=int,
+    default=DEFAULT_MAX_CHECKS,
+)
+
+# Options of downloads by date that do nothing to the plain test files of --dry-run
+_DRY_RUN_IGNORED = (
+    ("extract_on_the_fly", "--extract-on-the-fly"),
+    ("sample", "--sample"),
+    ("decompress_dir", "--decompress-dir"),
+    ("columnar_dir", "--columnar-dir"),
+    ("columnar_fields", "--columnar-fields"),
+    ("dedup_dir", "--dedup-dir"),
+    ("index", "--index"),
+    ("fetch_metadata", "--fetch-metadata"),
+    ("no_verify", "--no-verify"),
+    ("mirror", "--mirror"),
+    ("shard", "--shard"),
+    ("claim", "--claim"),
+    ("claim_ttl", "--claim-ttl"),
+)
+
+
+# Options of downloads by date that sync doesn't take: it compares whole archives with the
+# files on disk, and the decompress and ingest commands process the archives it brings
+_SYNC_IGNORED = (
+    ("extract_on_the_fly", "--extract-on-the-fly"),
+    ("sample", "--sample"),
+    ("decompress_dir", "--decompress-dir"),
+    ("columnar_dir", "--columnar-dir"),
+    ("columnar_fields", "--columnar-fields"),
+    ("dedup_dir", "--dedup-dir"),
+    ("claim", "--claim"),
+    ("claim_ttl", "--claim-ttl"),
+)
+
+
+def reject_ignored_options(arguments: dict, ignored, reason: str) -> None:
+    """
+    Stops with a usage error when one of the `ignored` options, pairs of destination and
+    flag, isn't left at its default
+    """
+    for option, flag in ignored:
+        if arguments[option] != parser.get_default(option):
+            parser.error(f"{flag} {reason}")
+
+
 args = parser.parse_args()
 command_line_arguments = vars(args)
 
@@ -55,25 +449,176 @@ if __name__ == "__main__":
     verbose = not command_line_arguments["quiet"]
     _dozent_object = Dozent()
 
-    if command_line_arguments["start_date"] and command_line_arguments["end_date"]:
-        _dozent_object.download_timeframe(
+    if command_line_arguments["command"] == "decompress":
+        report = decompress(
+            paths=command_line_arguments["paths"],
+            output_dir=command_line_arguments["decompress_output"],
+            max_workers=command_line_arguments["workers"],
+            chunk_size=command_line_arguments["chunk_size"],
+            max_in_flight=command_line_arguments["max_in_flight"],
+        )
+        if verbose:
+            print(report.format())
+
+    elif command_line_arguments["command"] == "ingest":
+        with ExitStack() as stack:
+            seen = None
+            if command_line_arguments["ingest_dedup_dir"] is not None:
+                seen = stack.enter_context(
+                    SeenIds(command_line_arguments["ingest_dedup_dir"])
+                )
+            for path in command_line_arguments["paths"]:
+                table = ingest_path(
+                    path,
+                    output_dir=command_line_arguments["ingest_output"],
+                    fields=command_line_arguments["fields"],
+                    seen=seen,
+                )
+                if verbose:
+                    duplicates = ColumnarTable(table).duplicates
+                    print(
+                        f"Ingested {path} into {table}"
+                        + (
+                            f", {duplicates} duplicate(s) left out"
+                            if seen is not None
+                            else ""
+                        )
+                    )
+
+    elif command_line_arguments["command"] == "verify":
+        report = verify(
+            paths=command_line_arguments["paths"],
+            expected_of=_dozent_object.catalog.expected_checksums_of_name,
+            max_workers=command_line_arguments["workers"],
+        )
+        print(report.format())
+        if not report.ok:
+            sys.exit(1)
+
+    elif command_line_arguments["command"] == "index":
+        for index in index_paths(
+            command_line_arguments["paths"], rebuild=command_line_arguments["rebuild"]
+        ):
+            if verbose:
+                print(f"Indexed {len(index)} members of {index.archive}")
+
+    elif command_line_arguments["command"] == "sync":
+        if not (
+            command_line_arguments["start_date"] and command_line_arguments["end_date"]
+        ):
+            parser.error("sync needs --start-date and --end-date")
+        reject_ignored_options(
+            command_line_arguments, _SYNC_IGNORED, "isn't supported by sync"
+        )
+        report = _dozent_object.sync_timeframe(
+            start_date=command_line_arguments["start_date"],
+            end_date=command_line_arguments["end_date"],
+            verbose=verbose,
+            download_dir=command_line_arguments["output_directory"],
+            max_concurrent_files=command_line_arguments["max_concurrent_files"],
+            max_connections=command_line_arguments["max_connections"],
+            engine=command_line_arguments["engine"],
+            fetch_metadata=command_line_arguments["fetch_metadata"],
+            max_bandwidth=command_line_arguments["max_bandwidth"],
+            bandwidth_control_file=command_line_arguments["bandwidth_control_file"],
+            min_free_space=command_line_arguments["min_free_space"],
+            space_policy=command_line_arguments["when_full"],
+            order=command_line_arguments["order"],
+            metrics_file=command_line_arguments["metrics_file"],
+            prometheus_file=command_line_arguments["prometheus_file"],
+            max_retries=command_line_arguments["max_retries"],
+            verify=not command_line_arguments["no_verify"],
+            max_checks=command_line_arguments["max_checks"],
+            index=command_line_arguments["index"],
+            mirrors=command_line_arguments["mirror"],
+            shard=command_line_arguments["shard"],
+            preallocate=not command_line_arguments["no_preallocate"],
+            write_buffer_size=command_line_arguments["write_buffer"],
+            fsync=command_line_arguments["fsync"],
+        )
+
+        if command_line_arguments["timeit"]:
+            print(
+                f"\nSync Time: {datetime.timedelta(seconds=(time.time() - _start_time))}"
+            )
+        if not report.ok:
+            sys.exit(1)
+
+    elif command_line_arguments["start_date"] and command_line_arguments["end_date"]:
+        results = _dozent_object.download_timeframe(
             start_date=command_line_arguments["start_date"],
             end_date=command_line_arguments["end_date"],
             verbose=verbose,
+            download_dir=command_line_arguments["output_directory"],
+            max_concurrent_files=command_line_arguments["max_concurrent_files"],
+            max_connections=command_line_arguments["max_connections"],
+            resume=command_line_arguments["resume"],
+            engine=command_line_arguments["engine"],
+            extract_on_the_fly=command_line_arguments["extract_on_the_fly"],
+            sample=command_line_arguments["sample"],
+            decompress_dir=command_line_arguments["decompress_dir"],
+            columnar_dir=command_line_arguments["columnar_dir"],
+            columnar_fields=command_line_arguments["columnar_fields"],
+            dedup_dir=command_line_arguments["dedup_dir"],
+            index=command_line_arguments["index"],
+            fetch_metadata=command_line_arguments["fetch_metadata"],
+            max_bandwidth=command_line_arguments["max_bandwidth"],
+            bandwidth_control_file=command_line_arguments["bandwidth_control_file"],
+            min_free_space=command_line_arguments["min_free_space"],
+            space_policy=command_line_arguments["when_full"],
+            order=command_line_arguments["order"],
+            metrics_file=command_line_arguments["metrics_file"],
+            prometheus_file=command_line_arguments["prometheus_file"],
+            max_retries=command_line_arguments["max_retries"],
+            verify=not command_line_arguments["no_verify"],
+            mirrors=command_line_arguments["mirror"],
+            shard=command_line_arguments["shard"],
+            claim=command_line_arguments["claim"],
+            claim_ttl=command_line_arguments["claim_ttl"],
+            preallocate=not command_line_arguments["no_preallocate"],
+            write_buffer_size=command_line_arguments["write_buffer"],
+            fsync=command_line_arguments["fsync"],
         )
 
         if command_line_arguments["timeit"]:
             print(
                 f"\nDownload Time: {datetime.timedelta(seconds=(time.time() - _start_time))}"
             )
+        if not results.ok:
+            sys.exit(1)
 
     elif command_line_arguments["dry_run"]:
-        _dozent_object.download_test(verbose=verbose)
+        reject_ignored_options(
+            command_line_arguments,
+            _DRY_RUN_IGNORED,
+            "needs -s/-e, test files aren't tar archives of the catalog",
+        )
+        results = _dozent_object.download_test(
+            verbose=verbose,
+            download_dir=command_line_arguments["output_directory"],
+            max_concurrent_files=command_line_arguments["max_concurrent_files"],
+            max_connections=command_line_arguments["max_connections"],
+            resume=command_line_arguments["resume"],
+            engine=command_line_arguments["engine"],
+            max_bandwidth=command_line_arguments["max_bandwidth"],
+            bandwidth_control_file=command_line_arguments["bandwidth_control_file"],
+            min_free_space=command_line_arguments["min_free_space"],
+            space_policy=command_line_arguments["when_full"],
+            order=command_line_arguments["order"],
+            metrics_file=command_line_arguments["metrics_file"],
+            prometheus_file=command_line_arguments["prometheus_file"],
+            max_retries=command_line_arguments["max_retries"],
+            preallocate=not command_line_arguments["no_preallocate"],
+            write_buffer_size=command_line_arguments["write_buffer"],
+            fsync=command_line_arguments["fsync"],
+        )
 
         if command_line_arguments["timeit"]:
             print(
                 f"\n\nDownload Time: {datetime.timedelta(seconds=(time.time() - _start_time))}"
             )
+        if not results.ok:
+            sys.exit(1)
 
     else:
         parser.print_help()
@@ -0,0 +1,344 @@
+import asyncio
+import ssl
+import time
+import urllib.parse
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    from dozent.http_pool import (
+        DEFAULT_IDLE_TIMEOUT,
+        DEFAULT_MAX_IDLE_PER_HOST,
+        PoolStats,
+    )
+except ModuleNotFoundError:
+    from http_pool import DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_IDLE_PER_HOST, PoolStats
+
+_MAX_REDIRECTS = 10
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+_USER_AGENT = "dozent"
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, url: str):
+        Exception.__init__(self, f"HTTP {status} for {url}")
+        self.status = status
+        self.url = url
+
+
+class _HostKey(NamedTuple):
+    scheme: str
+    host: str
+    port: int
+
+
+def _host_key(url: str) -> Tuple[_HostKey, str]:
+    """
+    :return: the (scheme, host, port) a url is served from and the path to request
+    """
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https"):
+        raise ValueError(f"Unsupported url {url}")
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return _HostKey(scheme, parts.hostname, port), path
+
+
+class AsyncHTTPResponse:
+    """
+    Response to a request sent on an `AsyncHTTPConnection`. The body has to be read completely
+    before the connection can be reused for another request
+    """
+
+    def __init__(
+        self,
+        connection: "AsyncHTTPConnection",
+        status: int,
+        headers: Dict[str, str],
+        has_body: bool,
+    ):
+        self.connection = connection
+        self.url: Optional[str] = None
+        self.status = status
+        self.headers = headers
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        self._chunk_remaining = 0
+        if not has_body:
+            self._remaining: Optional[int] = 0
+        elif "content-length" in headers and not self._chunked:
+            self._remaining = int(headers["content-length"])
+        elif self._chunked:
+            self._remaining = None
+        else:
+            # Body ends when the server closes the connection
+            self._remaining = None
+            connection.reusable = False
+        self.complete = self._remaining == 0
+
+        if headers.get("connection", "").lower() == "close":
+            connection.reusable = False
+
+    @property
+    def content_length(self) -> Optional[int]:
+        value = self.headers.get("content-length")
+        return int(value) if value is not None else None
+
+    async def _read_chunk_size(self) -> int:
+        line = await self.connection.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed while reading a chunked body")
+        size = int(line.split(b";")[0].strip(), 16)
+        if size == 0:
+            # Skip trailers up to the empty line
+            while (await self.connection.reader.readline()) not in (
+                b"\r\n",
+                b"\n",
+                b"",
+            ):
+                pass
+        return size
+
+    async def read(self, size: int) -> bytes:
+        """
+        Reads up to `size` bytes of the body
+        :return: the bytes read, empty once the whole body was read
+        """
+        if self.complete:
+            return b""
+        reader = self.connection.reader
+
+        if self._chunked:
+            if self._chunk_remaining == 0:
+                self._chunk_remaining = await self._read_chunk_size()
+                if self._chunk_remaining == 0:
+                    self.complete = True
+                    return b""
+            data = await reader.read(min(size, self._chunk_remaining))
+            if not data:
+                raise ConnectionError("Connection closed while reading a chunked body")
+            self._chunk_remaining -= len(data)
+            if self._chunk_remaining == 0:
+                await reader.readexactly(2)
+            return data
+
+        if self._remaining is None:
+            data = await reader.read(size)
+            if not data:
+                self.complete = True
+            return data
+
+        data = await reader.read(min(size, self._remaining))
+        if not data:
+            self.connection.reusable = False
+            raise ConnectionError(
+                f"Connection closed with {self._remaining} bytes of the body left"
+            )
+        self._remaining -= len(data)
+        if self._remaining == 0:
+            self.complete = True
+        return data
+
+    async def drain(self) -> None:
+        """
+        Reads and discards the rest of the body
+        """
+        while await self.read(256 * 1024):
+            pass
+
+
+class AsyncHTTPConnection:
+    """
+    Single HTTP/1.1 keep-alive connection to a host
+    """
+
+    def __init__(
+        self,
+        key: _HostKey,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+        self.requests_sent = 0
+
+    @classmethod
+    async def open(
+        cls, key: _HostKey, ssl_context: Optional[ssl.SSLContext]
+    ) -> "AsyncHTTPConnection":
+        reader, writer = await asyncio.open_connection(
+            key.host,
+            key.port,
+            ssl=ssl_context if key.scheme == "https" else None,
+            limit=2**20,
+        )
+        return cls(key, reader, writer)
+
+    async def request(
+        self, method: str, path: str, headers: Optional[Dict[str, str]] = None
+    ) -> AsyncHTTPResponse:
+        host = self.key.host
+        if self.key.port not in (80, 443):
+            host = f"{host}:{self.key.port}"
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {host}",
+            f"User-Agent: {_USER_AGENT}",
+            "Accept-Encoding: identity",
+        ]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await self.writer.drain()
+        self.requests_sent += 1
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            self.reusable = False
+            raise ConnectionError(f"Connection closed before a response for {path}")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if version == "HTTP/1.0":
+            self.reusable = False
+
+        status = int(status)
+        has_body = method != "HEAD" and status not in (204, 304) and status >= 200
+        return AsyncHTTPResponse(self, status, response_headers, has_body)
+
+    def close(self) -> None:
+        self.reusable = False
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """
+    Keeps idle keep-alive connections per host so that they can be reused for later requests,
+    closing the ones idle for longer than `idle_timeout`. Like `HTTPConnectionPool`, it
+    remembers where links were redirected to
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        # Oldest first, with the time each connection became idle
+        self._idle: Dict[_HostKey, List[Tuple[float, AsyncHTTPConnection]]] = {}
+        self._redirects: Dict[str, str] = {}
+        self._ssl_context = ssl.create_default_context()
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.connections_evicted = 0
+        self.redirects_followed = 0
+        self.redirects_cached = 0
+
+    def stats(self) -> PoolStats:
+        return PoolStats(
+            opened=self.connections_opened,
+            reused=self.connections_reused,
+            redirects_followed=self.redirects_followed,
+            redirects_cached=self.redirects_cached,
+            evicted=self.connections_evicted,
+        )
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for idle in self._idle.values():
+            while idle and now - idle[0][0] > self.idle_timeout:
+                idle.pop(0)[1].close()
+                self.connections_evicted += 1
+
+    async def acquire(self, url: str) -> Tuple[AsyncHTTPConnection, str]:
+        """
+        :return: an open connection to the host serving `url` and the path to request
+        """
+        key, path = _host_key(url)
+        self._evict_expired()
+        idle = self._idle.get(key)
+        while idle:
+            _, connection = idle.pop()
+            if not connection.reader.at_eof():
+                self.connections_reused += 1
+                return connection, path
+            connection.close()
+
+        connection = await AsyncHTTPConnection.open(key, self._ssl_context)
+        self.connections_opened += 1
+        return connection, path
+
+    def release(self, connection: AsyncHTTPConnection) -> None:
+        """
+        Returns a connection to the pool, closing it when it can't be reused
+        """
+        self._evict_expired()
+        idle = self._idle.setdefault(connection.key, [])
+        if connection.reusable and len(idle) < self.max_idle_per_host:
+            idle.append((time.monotonic(), connection))
+        else:
+            connection.close()
+
+    async def request(
+        self, method: str, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> AsyncHTTPResponse:
+        """
+        Sends a request on a pooled connection, following redirects. The caller has to read
+        the body and release `response.connection` back to the pool
+        :return: the response, `response.url` is the url that answered
+        """
+        cached = self._redirects.get(url)
+        if cached is not None:
+            response = await self._request_once(method, cached, headers)
+            if response.status < 300:
+                self.redirects_cached += 1
+                response.url = cached
+                return response
+            # The link now answers differently, ask the original url again
+            await response.drain()
+            self.release(response.connection)
+            del self._redirects[url]
+
+        target = url
+        for _ in range(_MAX_REDIRECTS + 1):
+            response = await self._request_once(method, target, headers)
+            if response.status in _REDIRECT_STATUSES and "location" in response.headers:
+                await response.drain()
+                self.release(response.connection)
+                self.redirects_followed += 1
+                target = urllib.parse.urljoin(target, response.headers["location"])
+                continue
+
+            if target != url and response.status < 300:
+                self._redirects[url] = target
+            response.url = target
+            return response
+
+        raise ConnectionError(f"Too many redirects for {url}")
+
+    async def _request_once(
+        self, method: str, url: str, headers: Optional[Dict[str, str]]
+    ) -> AsyncHTTPResponse:
+        connection, path = await self.acquire(url)
+        try:
+            return await connection.request(method, path, headers)
+        except Exception:
+            connection.close()
+            raise
+
+    def close(self) -> None:
+        for idle in self._idle.values():
+            for _, connection in idle:
+                connection.close()
+        self._idle.clear()
@@ -0,0 +1,268 @@
+import asyncio
+import datetime
+import os
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+# Multipliers of the rate suffixes, like wget's --limit-rate
+_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+_UNLIMITED = ("", "0", "none", "unlimited")
+
+# Share of a second of traffic that may go out at once after an idle period
+_BURST_SECONDS = 0.1
+
+# How often the schedule and the control file are looked at, in seconds
+_REFRESH_INTERVAL = 1.0
+
+
+def parse_rate(text: str) -> Optional[float]:
+    """
+    Parses a rate in bytes per second such as `500K`, `200M` or `1.5G`
+    :return: the rate, None for `0`, `none` or `unlimited`
+    """
+    text = text.strip()
+    if text.lower() in _UNLIMITED:
+        return None
+    unit = text[-1].upper() if text[-1].isalpha() else ""
+    if unit not in _UNITS:
+        raise ValueError(f"Unknown rate unit in {text!r}, use K, M or G")
+    number = text[:-1] if unit else text
+    try:
+        rate = float(number) * _UNITS[unit]
+    except ValueError:
+        raise ValueError(f"Invalid rate {text!r}, expected e.g. 200M")
+    if rate < 0:
+        raise ValueError(f"Invalid rate {text!r}, it can't be negative")
+    return rate or None
+
+
+class BandwidthSchedule:
+    """
+    Rates by time of day. A rate applies from its start time until the next start time,
+    the last one wraps around midnight
+    """
+
+    def __init__(self, entries: List[Tuple[datetime.time, Optional[float]]]):
+        """
+        :param entries: start times and the rates in bytes per second from then on, None
+        meaning unlimited
+        """
+        if not entries:
+            raise ValueError("A schedule needs at least one rate")
+        self.entries = sorted(entries, key=lambda entry: entry[0])
+
+    @classmethod
+    def parse(cls, spec: str) -> "BandwidthSchedule":
+        """
+        Parses either a single rate, `200M`, or comma separated rates by time of day,
+        `08:00=50M,20:00=500M`
+        """
+        if "=" not in spec:
+            return cls([(datetime.time(0), parse_rate(spec))])
+
+        entries = []
+        for part in spec.split(","):
+            start, _, rate = part.partition("=")
+            try:
+                start_time = datetime.datetime.strptime(start.strip(), "%H:%M").time()
+            except ValueError:
+                raise ValueError(f"Invalid start time {start!r}, expected HH:MM")
+            entries.append((start_time, parse_rate(rate)))
+        return cls(entries)
+
+    def rate_at(self, moment: datetime.datetime) -> Optional[float]:
+        current = self.entries[-1][1]
+        for start_time, rate in self.entries:
+            if start_time > moment.time():
+                break
+            current = rate
+        return current
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Callers reserve the bytes they are about to transfer and wait
+    for the returned delay, so the bucket can go into debt and the aggregate rate stays
+    exact even with large reads
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param rate: bytes per second, None for unlimited
+        :param clock: monotonic clock in seconds
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rate: Optional[float] = None
+        self._tokens = 0.0
+        self._last = clock()
+        self.rate = rate
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate: Optional[float]) -> None:
+        with self._lock:
+            self._refill()
+            self._rate = rate or None
+            if self._rate is not None:
+                self._tokens = min(self._tokens, self._rate * _BURST_SECONDS)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        if self._rate is not None:
+            self._tokens = min(
+                self._rate * _BURST_SECONDS,
+                self._tokens + (now - self._last) * self._rate,
+            )
+        self._last = now
+
+    def reserve(self, amount: int) -> float:
+        """
+        Takes `amount` tokens
+        :return: seconds the caller has to wait before transferring them
+        """
+        with self._lock:
+            if self._rate is None:
+                return 0.0
+            self._refill()
+            self._tokens -= amount
+            return -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+
+class BandwidthLimiter:
+    """
+    Caps the aggregate throughput of every download sharing it. The rate follows a
+    `BandwidthSchedule` and can be changed at runtime by writing a new rate or schedule to
+    the control file, which is checked every second
+    """
+
+    def __init__(
+        self,
+        schedule: BandwidthSchedule,
+        control_file: Optional[Path] = None,
+        clock: Callable[[], float] = time.monotonic,
+        now: Callable[[], datetime.datetime] = datetime.datetime.now,
+    ):
+        """
+        :param schedule: rates by time of day
+        :param control_file: file holding a rate or schedule that replaces `schedule`
+        whenever it changes
+        :param clock: monotonic clock in seconds
+        :param now: wall clock the schedule is evaluated with
+        """
+        self.schedule = schedule
+        self.control_file = Path(control_file) if control_file is not None else None
+        self._clock = clock
+        self._now = now
+        self._control_mtime: Optional[float] = None
+        self._next_refresh = clock()
+        self._refresh_lock = threading.Lock()
+        self.bucket = TokenBucket(schedule.rate_at(now()), clock=clock)
+
+    @classmethod
+    def from_spec(
+        cls, spec: Optional[str], control_file: Optional[Path] = None
+    ) -> Optional["BandwidthLimiter"]:
+        """
+        :param spec: rate or schedule, see `BandwidthSchedule.parse`
+        :return: a limiter, or None when neither a limit nor a control file is given
+        """
+        if spec is None and control_file is None:
+            return None
+        return cls(BandwidthSchedule.parse(spec or "unlimited"), control_file)
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.bucket.rate
+
+    def _read_control_file(self) -> None:
+        try:
+            mtime = os.stat(self.control_file).st_mtime
+        except OSError:
+            return
+        if mtime == self._control_mtime:
+            return
+        self._control_mtime = mtime
+        try:
+            self.schedule = BandwidthSchedule.parse(self.control_file.read_text())
+        except (OSError, ValueError):
+            # A half written or invalid file keeps the current schedule
+            pass
+
+    def refresh(self) -> None:
+        """
+        Applies the rate of the schedule for the current time, re-reading the control file
+        """
+        if self.control_file is not None:
+            self._read_control_file()
+        rate = self.schedule.rate_at(self._now())
+        if rate != self.bucket.rate:
+            self.bucket.rate = rate
+
+    def reserve(self, amount: int) -> float:
+        """
+        Takes `amount` bytes from the budget
+        :return: seconds to wait before transferring them
+        """
+        if self._clock() >= self._next_refresh and self._refresh_lock.acquire(False):
+            try:
+                self._next_refresh = self._clock() + _REFRESH_INTERVAL
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+        return self.bucket.reserve(amount)
+
+    def consume(self, amount: int, cancel: Optional[threading.Event] = None) -> None:
+        """
+        Blocks until `amount` bytes may be transferred
+        :param cancel: event ending the wait early once set, a large read at a low rate
+        may otherwise wait for many seconds
+        """
+        delay = self.reserve(amount)
+        if delay <= 0:
+            return
+        if cancel is None:
+            time.sleep(delay)
+        else:
+            cancel.wait(delay)
+
+    async def consume_async(self, amount: int) -> None:
+        """
+        Waits until `amount` bytes may be transferred without blocking the event loop
+        """
+        delay = self.reserve(amount)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ThrottledReader:
+    """
+    Wraps a binary stream so that reads are paced by a `BandwidthLimiter`. The waits end
+    early once `cancel` is set
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        limiter: Optional[BandwidthLimiter],
+        cancel: Optional[threading.Event] = None,
+    ):
+        self.stream = stream
+        self.limiter = limiter
+        self.cancel = cancel
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        if self.limiter is not None:
+            self.limiter.consume(len(data), self.cancel)
+        return data
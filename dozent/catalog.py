@@ -0,0 +1,326 @@
+import calendar
+import datetime
+import json
+import os
+import urllib.request
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+
+try:
+    from dozent.integrity import Checksums
+except ModuleNotFoundError:
+    from integrity import Checksums
+
+CURRENT_FILE_PATH = Path(__file__)
+TWITTER_ARCHIVE_STREAM_LINKS_PATH = (
+    CURRENT_FILE_PATH.parent / "twitter-archive-stream-links.json"
+)
+DEFAULT_METADATA_CACHE_PATH = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "dozent"
+    / "archive-metadata.json"
+)
+
+ARCHIVE_METADATA_URL = "https://archive.org/metadata/{identifier}/files"
+
+# Version 2 added the SHA-1 of the archives, version 1 caches are still read
+_METADATA_CACHE_VERSION = 2
+_READABLE_CACHE_VERSIONS = (1, 2)
+_HTTP_TIMEOUT = 30
+
+# Sizes are -1 until they are known
+_UNKNOWN_SIZE = -1
+
+
+class CatalogEntry(NamedTuple):
+    """
+    An archive of the catalog. Monthly archives, whose day is 'NaN', cover every day of
+    their month
+    """
+
+    start: datetime.date
+    end: datetime.date
+    date_link: Dict[str, str]
+
+    @property
+    def link(self) -> str:
+        return self.date_link["link"]
+
+
+class FileMetadata(NamedTuple):
+    size: int
+    md5: Optional[str]
+    sha1: Optional[str] = None
+
+
+# Returns the metadata of every file of an archive.org item, keyed by file name
+MetadataFetcher = Callable[[str], Dict[str, FileMetadata]]
+
+
+def date_range_of(date_link: Dict[str, str]) -> Tuple[datetime.date, datetime.date]:
+    """
+    First and last day covered by an entry of `twitter-archive-stream-links.json`
+    """
+    year = int(date_link["year"])
+    month = int(date_link["month"])
+    if date_link["day"] == "NaN":
+        last_day = calendar.monthrange(year, month)[1]
+        return datetime.date(year, month, 1), datetime.date(year, month, last_day)
+    day = datetime.date(year, month, int(date_link["day"]))
+    return day, day
+
+
+def item_identifier(link: str) -> str:
+    """
+    archive.org item a download link belongs to, e.g. `archiveteam-twitter-stream-2020-06`
+    """
+    return link.split("/download/", 1)[1].split("/", 1)[0]
+
+
+def mirror_link(base: str, link: str) -> str:
+    """
+    Link of an archive on a mirror laid out like archive.org's download tree, e.g.
+    `https://cache.example.com/twitter/<item>/<file>` for a base of
+    `https://cache.example.com/twitter/`. Links outside of archive.org keep their file
+    name only
+    """
+    if "/download/" in link:
+        path = link.split("/download/", 1)[1]
+    else:
+        path = link.rsplit("/", 1)[-1]
+    return base.rstrip("/") + "/" + path
+
+
+def fetch_item_metadata(identifier: str) -> Dict[str, FileMetadata]:
+    """
+    Gets the size, MD5 and SHA-1 of every file of an archive.org item with a single
+    request
+    """
+    url = ARCHIVE_METADATA_URL.format(identifier=identifier)
+    with urllib.request.urlopen(url, timeout=_HTTP_TIMEOUT) as response:
+        files = json.loads(response.read())["result"]
+    return {
+        file["name"]: FileMetadata(
+            size=int(file["size"]), md5=file.get("md5"), sha1=file.get("sha1")
+        )
+        for file in files
+        if "size" in file
+    }
+
+
+class Catalog:
+    """
+    The archives of the Twitter stream sorted by date, answering date range queries with a
+    binary search. Carries the size and checksums of the archives that are in the metadata
+    cache, so the total size of a download is known without sending a request per archive
+    and every archive can be verified
+    """
+
+    def __init__(
+        self,
+        date_links: Iterable[Dict[str, str]],
+        metadata_cache_path: Optional[Path] = None,
+    ):
+        """
+        :param date_links: entries of `twitter-archive-stream-links.json`
+        :param metadata_cache_path: JSON file caching the size and checksums of archives
+        """
+        entries = sorted(
+            (
+                CatalogEntry(*date_range_of(date_link), date_link)
+                for date_link in date_links
+            ),
+            key=lambda entry: (entry.start, entry.end),
+        )
+        self.entries: List[CatalogEntry] = entries
+        self._starts = [entry.start for entry in entries]
+        # Running maximum of the last days, sorted even if entries overlap
+        self._ends = list(accumulate((entry.end for entry in entries), max))
+        self._index = {entry.link: index for index, entry in enumerate(entries)}
+        self._names = {
+            entry.link.rsplit("/", 1)[-1]: index for index, entry in enumerate(entries)
+        }
+
+        self.sizes = np.full(len(entries), _UNKNOWN_SIZE, dtype=np.int64)
+        self.checksums: List[Optional[str]] = [None] * len(entries)
+        self.sha1s: List[Optional[str]] = [None] * len(entries)
+        self.metadata_cache_path = metadata_cache_path
+        if metadata_cache_path is not None:
+            self.load_metadata(metadata_cache_path)
+
+    @classmethod
+    def load(
+        cls,
+        path: Path = TWITTER_ARCHIVE_STREAM_LINKS_PATH,
+        metadata_cache_path: Optional[Path] = DEFAULT_METADATA_CACHE_PATH,
+    ) -> "Catalog":
+        with open(path) as file:
+            return cls(json.load(file), metadata_cache_path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def first_day(self) -> Optional[datetime.date]:
+        """
+        First day covered by an archive, None when the catalog is empty
+        """
+        return self._starts[0] if self._starts else None
+
+    @property
+    def last_day(self) -> Optional[datetime.date]:
+        """
+        Last day covered by an archive, None when the catalog is empty
+        """
+        return self._ends[-1] if self._ends else None
+
+    def between(
+        self, start_date: datetime.date, end_date: datetime.date
+    ) -> List[CatalogEntry]:
+        """
+        :return: entries covering at least one day of [start_date, end_date], by date
+        """
+        first = bisect_left(self._ends, start_date)
+        last = bisect_right(self._starts, end_date)
+        return [entry for entry in self.entries[first:last] if entry.end >= start_date]
+
+    def metadata(self, link: str) -> Optional[FileMetadata]:
+        """
+        :return: size and checksums of the archive, None when it is not cached
+        """
+        index = self._index[link]
+        size = int(self.sizes[index])
+        if size == _UNKNOWN_SIZE:
+            return None
+        return FileMetadata(size, self.checksums[index], self.sha1s[index])
+
+    def expected_checksums(self, link: str) -> Optional[Checksums]:
+        """
+        :return: published checksums of the archive at `link`, None when they aren't cached
+        or it isn't an archive of the catalog
+        """
+        index = self._index.get(link)
+        if index is None or (
+            self.checksums[index] is None and self.sha1s[index] is None
+        ):
+            return None
+        return Checksums(md5=self.checksums[index], sha1=self.sha1s[index])
+
+    def expected_checksums_of_name(self, name: str) -> Optional[Checksums]:
+        """
+        Like `expected_checksums`, for the name a downloaded archive is saved as
+        """
+        index = self._names.get(name)
+        if index is None:
+            return None
+        return self.expected_checksums(self.entries[index].link)
+
+    def mirrors(self, link: str, bases: Sequence[str] = ()) -> List[str]:
+        """
+        Other links of the archive at `link`: the `mirrors` listed in its entry, then its
+        path on every mirror of `bases`, see `mirror_link`. The link itself stays the
+        primary source
+        """
+        index = self._index.get(link)
+        listed = (
+            self.entries[index].date_link.get("mirrors", [])
+            if index is not None
+            else []
+        )
+        links = list(listed) + [mirror_link(base, link) for base in bases]
+        return [mirror for mirror in dict.fromkeys(links) if mirror != link]
+
+    def total_size(self, links: Iterable[str]) -> Tuple[int, int]:
+        """
+        :return: total size in bytes of the archives whose size is known, and the number
+        of archives whose size is unknown
+        """
+        indices = np.fromiter((self._index[link] for link in links), dtype=np.int64)
+        sizes = self.sizes[indices]
+        known = sizes != _UNKNOWN_SIZE
+        return int(sizes[known].sum()), int((~known).sum())
+
+    def load_metadata(self, path: Path) -> None:
+        """
+        Reads the metadata cache, a missing or outdated cache is ignored
+        """
+        try:
+            with open(path) as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return
+        if cache.get("version") not in _READABLE_CACHE_VERSIONS:
+            return
+        for link, (size, md5, *sha1) in cache["files"].items():
+            index = self._index.get(link)
+            if index is not None:
+                self.sizes[index] = size
+                self.checksums[index] = md5
+                self.sha1s[index] = sha1[0] if sha1 else None
+
+    def save_metadata(self, path: Path) -> None:
+        """
+        Writes the known metadata to the cache, as `{link: [size, md5, sha1]}`
+        """
+        files = {
+            entry.link: [int(size), md5, sha1]
+            for entry, size, md5, sha1 in zip(
+                self.entries, self.sizes, self.checksums, self.sha1s
+            )
+            if size != _UNKNOWN_SIZE
+        }
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = path.with_name(path.name + ".part")
+        with open(partial_path, "w") as file:
+            json.dump(
+                {"version": _METADATA_CACHE_VERSION, "files": files},
+                file,
+                separators=(",", ":"),
+            )
+        os.replace(partial_path, path)
+
+    def refresh_metadata(
+        self,
+        links: Iterable[str],
+        fetch: MetadataFetcher = fetch_item_metadata,
+    ) -> int:
+        """
+        Fetches the metadata of the archives whose size is unknown, with one request per
+        archive.org item rather than one per archive, and updates the cache
+        :return: number of archives whose metadata was added
+        """
+        missing: Dict[str, List[int]] = {}
+        for link in links:
+            index = self._index[link]
+            if self.sizes[index] == _UNKNOWN_SIZE:
+                missing.setdefault(item_identifier(link), []).append(index)
+
+        added = 0
+        for identifier, indices in missing.items():
+            files = fetch(identifier)
+            for index in indices:
+                file_name = self.entries[index].link.rsplit("/", 1)[1]
+                metadata = files.get(file_name)
+                if metadata is not None:
+                    self.sizes[index] = metadata.size
+                    self.checksums[index] = metadata.md5
+                    self.sha1s[index] = metadata.sha1
+                    added += 1
+
+        if added and self.metadata_cache_path is not None:
+            self.save_metadata(self.metadata_cache_path)
+        return added
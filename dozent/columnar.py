@@ -0,0 +1,543 @@
+import bz2
+import calendar
+import gzip
+import json
+import os
+import shutil
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    from dozent.dedup import IdTransaction, SeenIds
+except ModuleNotFoundError:
+    from dedup import IdTransaction, SeenIds
+
+# Fields most analysis jobs read
+DEFAULT_FIELDS = ("id", "created_at", "user.id", "lang", "text")
+
+# Number of rows buffered per column before they are appended to disk
+DEFAULT_BATCH_SIZE = 64 * 1024
+
+# Parsed tweets whose ids are checked against the seen ids at once
+_DEDUP_BATCH_SIZE = 1024
+
+# Column types of well known tweet fields. Nested objects share the types of the top level
+# fields, e.g. `retweeted_status.id` is an int64. Other fields are stored as strings unless a
+# type is given with `<field>:<type>`
+FIELD_TYPES = {
+    "id": "int64",
+    "created_at": "timestamp",
+    "lang": "string",
+    "text": "string",
+    "source": "string",
+    "truncated": "bool",
+    "in_reply_to_status_id": "int64",
+    "in_reply_to_user_id": "int64",
+    "is_quote_status": "bool",
+    "quote_count": "int64",
+    "reply_count": "int64",
+    "retweet_count": "int64",
+    "favorite_count": "int64",
+    "timestamp_ms": "int64",
+    "user.id": "int64",
+    "user.screen_name": "string",
+    "user.created_at": "timestamp",
+    "user.verified": "bool",
+    "user.followers_count": "int64",
+    "user.friends_count": "int64",
+    "user.statuses_count": "int64",
+}
+
+# Timestamps are stored as seconds since the epoch
+_DTYPES = {
+    "int64": np.dtype("<i8"),
+    "float64": np.dtype("<f8"),
+    "bool": np.dtype("u1"),
+    "timestamp": np.dtype("<i8"),
+}
+_VIEW_DTYPES = {"bool": np.dtype(bool), "timestamp": np.dtype("datetime64[s]")}
+COLUMN_TYPES = tuple(_DTYPES) + ("string",)
+
+_META_FILE = "meta.json"
+_FORMAT_VERSION = 1
+
+_MONTHS = {
+    name: index
+    for index, name in enumerate(
+        ("Jan", "Feb", "Mar", "Apr", "May", "Jun")
+        + ("Jul", "Aug", "Sep", "Oct", "Nov", "Dec"),
+        start=1,
+    )
+}
+
+# Tweets of the same second share a `created_at` string, so parsed values are cached
+_TIMESTAMP_CACHE_SIZE = 4096
+_timestamp_cache: Dict[str, int] = {}
+
+_MISSING = object()
+
+
+def parse_twitter_timestamp(value: str) -> int:
+    """
+    Converts a Twitter timestamp like 'Mon Jun 01 15:14:00 +0000 2020' to seconds since the
+    epoch, much faster than `datetime.strptime`
+    """
+    seconds = _timestamp_cache.get(value)
+    if seconds is not None:
+        return seconds
+
+    _, month, day, clock, offset, year = value.split(" ")
+    hour, minute, second = clock.split(":")
+    seconds = calendar.timegm(
+        (int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second))
+    )
+    sign = -1 if offset[0] == "-" else 1
+    seconds -= sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+
+    if len(_timestamp_cache) >= _TIMESTAMP_CACHE_SIZE:
+        _timestamp_cache.clear()
+    _timestamp_cache[value] = seconds
+    return seconds
+
+
+def parse_field(field: str) -> Tuple[str, str]:
+    """
+    Splits a field specification `<field>` or `<field>:<type>` into the dotted field path
+    and its column type
+    """
+    name, _, column_type = field.partition(":")
+    if not column_type:
+        column_type = FIELD_TYPES.get(
+            name, FIELD_TYPES.get(name.rsplit(".", 1)[-1], "string")
+        )
+    if column_type not in COLUMN_TYPES:
+        raise ValueError(
+            f"Unknown column type {column_type!r} for {name!r}, "
+            f"choose one of {', '.join(COLUMN_TYPES)}"
+        )
+    return name, column_type
+
+
+def _lookup(tweet: dict, path: Tuple[str, ...]):
+    value = tweet
+    for key in path:
+        if not isinstance(value, dict):
+            return _MISSING
+        value = value.get(key, _MISSING)
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _to_string(value) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _to_timestamp(value) -> int:
+    return parse_twitter_timestamp(value) if isinstance(value, str) else int(value)
+
+
+_CONVERTERS = {
+    "int64": int,
+    "float64": float,
+    "bool": bool,
+    "timestamp": _to_timestamp,
+    "string": _to_string,
+}
+
+
+class _ColumnWriter:
+    """
+    Buffers the values of one column and appends them to its files in batches. A column is
+    `<name>.values`, raw little endian values, or for strings `<name>.data`, the UTF-8 bytes
+    of all values, and `<name>.offsets`, int64 offsets of every value into it. Missing values
+    are recorded in `<name>.valid`, which is removed when nothing is missing.
+    """
+
+    def __init__(self, directory: Path, name: str, column_type: str):
+        self.name = name
+        self.column_type = column_type
+        self.path = tuple(name.split("."))
+        self.convert = _CONVERTERS[column_type]
+        self.directory = directory
+        self.has_missing = False
+
+        self._values: List = []
+        self._valid: List[bool] = []
+        self._valid_file = open(directory / f"{name}.valid", "wb")
+        if column_type == "string":
+            self._offset = 0
+            self._data_file = open(directory / f"{name}.data", "wb")
+            self._offsets_file = open(directory / f"{name}.offsets", "wb")
+            np.zeros(1, dtype="<i8").tofile(self._offsets_file)
+        else:
+            self._values_file = open(directory / f"{name}.values", "wb")
+
+    def add(self, tweet: dict) -> None:
+        value = _lookup(tweet, self.path)
+        valid = value is not _MISSING and value is not None
+        if valid:
+            try:
+                value = self.convert(value)
+            except (TypeError, ValueError, KeyError):
+                valid = False
+        if not valid:
+            value = "" if self.column_type == "string" else 0
+            self.has_missing = True
+        self._values.append(value)
+        self._valid.append(valid)
+
+    def flush(self) -> None:
+        if not self._values:
+            return
+        if self.column_type == "string":
+            encoded = [value.encode("utf-8", "surrogatepass") for value in self._values]
+            lengths = np.fromiter(map(len, encoded), dtype="<i8", count=len(encoded))
+            offsets = np.cumsum(lengths) + self._offset
+            self._offset = int(offsets[-1])
+            self._data_file.write(b"".join(encoded))
+            offsets.tofile(self._offsets_file)
+        else:
+            np.asarray(self._values, dtype=_DTYPES[self.column_type]).tofile(
+                self._values_file
+            )
+        np.asarray(self._valid, dtype="u1").tofile(self._valid_file)
+        self._values = []
+        self._valid = []
+
+    def close(self) -> None:
+        self.flush()
+        self._valid_file.close()
+        if self.column_type == "string":
+            self._data_file.close()
+            self._offsets_file.close()
+        else:
+            self._values_file.close()
+        if not self.has_missing:
+            try:
+                (self.directory / f"{self.name}.valid").unlink()
+            except FileNotFoundError:
+                pass
+
+
+class ColumnarWriter:
+    """
+    Writes tweets into a directory of columnar files holding only the projected fields.
+    The table is written to `<output_dir>.part` and renamed to `output_dir` by `close`, so
+    a table that exists is always complete.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        fields: Iterable[str] = DEFAULT_FIELDS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        seen: Optional[SeenIds] = None,
+    ):
+        """
+        :param output_dir: directory of the table
+        :param fields: dotted paths of the projected fields, e.g. `user.id`, optionally
+        followed by `:<type>` with a type of `COLUMN_TYPES`
+        :param batch_size: number of rows buffered before they are written
+        :param seen: ids of the tweets already ingested, tweets with one of them are
+        dropped. The ids of the table are recorded once it is published
+        """
+        self.output_dir = Path(output_dir)
+        self.batch_size = batch_size
+        self.rows = 0
+        self.skipped = 0
+        # Tweets dropped because their id was seen
+        self.duplicates = 0
+
+        self._partial_dir = self.output_dir.with_name(self.output_dir.name + ".part")
+        shutil.rmtree(self._partial_dir, ignore_errors=True)
+        self._partial_dir.mkdir(parents=True)
+        self._columns = [
+            _ColumnWriter(self._partial_dir, *parse_field(field)) for field in fields
+        ]
+        self._pending = 0
+        self._transaction: Optional[IdTransaction] = (
+            seen.transaction() if seen is not None else None
+        )
+
+    def add(self, tweet: dict) -> bool:
+        """
+        Adds a tweet. Other records of the stream, e.g. deletions, and tweets that were
+        already seen are skipped
+        :return: whether the record was added
+        """
+        return self._add_tweets([tweet]) == 1
+
+    def _add_tweets(self, tweets: List[dict]) -> int:
+        """
+        :return: number of tweets added
+        """
+        count = len(tweets)
+        tweets = [tweet for tweet in tweets if "created_at" in tweet]
+        self.skipped += count - len(tweets)
+        if self._transaction is not None:
+            count = len(tweets)
+            tweets = self._transaction.new_tweets(tweets)
+            self.duplicates += count - len(tweets)
+        for tweet in tweets:
+            for column in self._columns:
+                column.add(tweet)
+            self.rows += 1
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.flush()
+        return len(tweets)
+
+    def add_lines(self, lines: Iterable[Union[bytes, str]]) -> None:
+        """
+        Adds every tweet of a stream of JSON lines, skipping blank and malformed lines
+        """
+        batch: List[dict] = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                tweet = json.loads(line)
+            except ValueError:
+                self.skipped += 1
+                continue
+            if not isinstance(tweet, dict):
+                self.skipped += 1
+            elif self._transaction is None:
+                self._add_tweets([tweet])
+            else:
+                batch.append(tweet)
+                if len(batch) >= _DEDUP_BATCH_SIZE:
+                    self._add_tweets(batch)
+                    batch = []
+        if batch:
+            self._add_tweets(batch)
+
+    def flush(self) -> None:
+        for column in self._columns:
+            column.flush()
+        self._pending = 0
+
+    def close(self) -> Path:
+        """
+        Writes the remaining rows and the table metadata, then publishes the table
+        :return: directory of the table
+        """
+        for column in self._columns:
+            column.close()
+        meta = {
+            "version": _FORMAT_VERSION,
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "duplicates": self.duplicates,
+            "columns": [
+                {
+                    "name": column.name,
+                    "type": column.column_type,
+                    "has_missing": column.has_missing,
+                }
+                for column in self._columns
+            ],
+        }
+        with open(self._partial_dir / _META_FILE, "w") as file:
+            json.dump(meta, file, indent=1)
+
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        os.replace(self._partial_dir, self.output_dir)
+        # A crash right before this leaves the ids unrecorded, and the tweets may be
+        # ingested again, rather than recorded without a table holding them
+        if self._transaction is not None:
+            self._transaction.commit()
+        return self.output_dir
+
+    def abort(self) -> None:
+        for column in self._columns:
+            column.close()
+        shutil.rmtree(self._partial_dir, ignore_errors=True)
+        if self._transaction is not None:
+            self._transaction.abort()
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _memmap(path: Path, dtype, count: int) -> np.ndarray:
+    # numpy refuses to map empty files
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class StringColumn:
+    """
+    Memory-mapped string column, values are decoded only when they are accessed
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode("utf-8", "surrogatepass")
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+class ColumnarTable:
+    """
+    Read access to a table written by `ColumnarWriter`. Columns are memory-mapped, so
+    loading a column costs nothing until its values are used
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / _META_FILE) as file:
+            meta = json.load(file)
+        self.rows: int = meta["rows"]
+        self.skipped: int = meta["skipped"]
+        self.duplicates: int = meta.get("duplicates", 0)
+        self.types: Dict[str, str] = {
+            column["name"]: column["type"] for column in meta["columns"]
+        }
+        self._has_missing = {
+            column["name"]: column["has_missing"] for column in meta["columns"]
+        }
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.types)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str) -> Union[np.ndarray, StringColumn]:
+        """
+        :return: a numpy array, with `datetime64[s]` values for timestamps, or a
+        `StringColumn`. Missing values are 0 or empty, see `valid`
+        """
+        column_type = self.types[name]
+        if column_type == "string":
+            offsets = _memmap(self.path / f"{name}.offsets", "<i8", self.rows + 1)
+            if self.rows == 0:
+                offsets = np.zeros(1, dtype="<i8")
+            data = _memmap(self.path / f"{name}.data", "u1", int(offsets[-1]))
+            return StringColumn(data, offsets)
+
+        values = _memmap(self.path / f"{name}.values", _DTYPES[column_type], self.rows)
+        view_dtype = _VIEW_DTYPES.get(column_type)
+        return values.view(view_dtype) if view_dtype is not None else values
+
+    def valid(self, name: str) -> Optional[np.ndarray]:
+        """
+        :return: boolean array telling which rows have a value for `name`, None when no
+        value is missing
+        """
+        if not self._has_missing[name]:
+            return None
+        return _memmap(self.path / f"{name}.valid", bool, self.rows)
+
+    def __getitem__(self, name: str) -> Union[np.ndarray, StringColumn]:
+        return self.column(name)
+
+
+def table_name(path: Path) -> str:
+    """
+    Name of the table ingested from `path`, its name without archive or compression suffixes
+    """
+    name = Path(path).name
+    for suffix in (".bz2", ".gz", ".tar", ".zip", ".json"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name
+
+
+def open_member(name: str, content: BinaryIO) -> Optional[BinaryIO]:
+    """
+    Wraps the content of a file holding JSON lines in a decompressor when needed, returns
+    None for files that don't hold tweets
+    """
+    if name.endswith(".json.bz2"):
+        return bz2.BZ2File(content)
+    if name.endswith(".json.gz"):
+        return gzip.GzipFile(fileobj=content)
+    if name.endswith(".json"):
+        return content
+    return None
+
+
+def _iter_json_files(path: Path) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Yields the name and an open binary stream of every JSON lines file in `path`, which is
+    a tar or zip archive, a directory or a single file. Every stream has to be consumed
+    before the next one is requested
+    """
+    if path.is_dir():
+        for child in sorted(path.rglob("*")):
+            if child.is_file():
+                yield from _iter_json_files(child)
+
+    elif path.name.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as content:
+                        yield info.filename, content
+
+    elif path.name.endswith(".tar"):
+        with tarfile.open(path, mode="r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
+
+    else:
+        with open(path, "rb") as content:
+            yield path.name, content
+
+
+def ingest_path(
+    path: Path,
+    output_dir: Path,
+    fields: Iterable[str] = DEFAULT_FIELDS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    seen: Optional[SeenIds] = None,
+) -> Path:
+    """
+    Turns the tweets of an archive, a directory of extracted members or a single JSON lines
+    file into a columnar table at `output_dir/<name>/`, see `table_name`
+    :param path: `.tar`/`.zip` archive, directory or `.json[.bz2|.gz]` file
+    :param output_dir: directory the table is written to
+    :param fields: projected fields, see `ColumnarWriter`
+    :param seen: ids of the tweets already ingested, see `ColumnarWriter`
+    :return: directory of the table
+    """
+    path = Path(path)
+    with ColumnarWriter(
+        Path(output_dir) / table_name(path), fields, batch_size, seen
+    ) as writer:
+        for name, content in _iter_json_files(path):
+            stream = open_member(name, content)
+            if stream is not None:
+                writer.add_lines(stream)
+    return writer.output_dir
@@ -0,0 +1,300 @@
+import bz2
+import gzip
+import os
+import shutil
+import tarfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+try:
+    from dozent.stream_extract import member_path
+except ModuleNotFoundError:
+    from stream_extract import member_path
+
+# Size of the blocks read and written by every worker, bounds the memory a job uses
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_COMPRESSED_SUFFIXES = {".bz2": "bz2", ".gz": "gz"}
+_TAR_SUFFIXES = (".tar",)
+
+_MB = 1024 * 1024
+
+
+class DecompressJob(NamedTuple):
+    """
+    A single compressed stream, either a whole file or a member of an uncompressed tar
+    """
+
+    source: str
+    offset: int
+    size: int
+    kind: str
+    output: str
+
+
+class _JobResult(NamedTuple):
+    pid: int
+    bytes_in: int
+    bytes_out: int
+    cpu_seconds: float
+
+
+class WorkerStats:
+    def __init__(self):
+        self.jobs = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        """
+        Decompressed MB produced per second of CPU time of this worker
+        """
+        return self.bytes_out / _MB / self.cpu_seconds if self.cpu_seconds else 0.0
+
+
+class DecompressReport:
+    def __init__(self):
+        self.jobs = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.wall_seconds = 0.0
+        self.workers: Dict[int, WorkerStats] = {}
+        self.failed: List[Tuple[str, str]] = []
+
+    def add(self, result: _JobResult) -> None:
+        self.jobs += 1
+        self.bytes_in += result.bytes_in
+        self.bytes_out += result.bytes_out
+        stats = self.workers.setdefault(result.pid, WorkerStats())
+        stats.jobs += 1
+        stats.bytes_in += result.bytes_in
+        stats.bytes_out += result.bytes_out
+        stats.cpu_seconds += result.cpu_seconds
+
+    @property
+    def mb_per_second(self) -> float:
+        """
+        Decompressed MB produced per second of wall clock time, over all workers
+        """
+        return self.bytes_out / _MB / self.wall_seconds if self.wall_seconds else 0.0
+
+    def format(self) -> str:
+        lines = [
+            f"Decompressed {self.jobs} stream(s), {self.bytes_in / _MB:.2f} MB -> "
+            f"{self.bytes_out / _MB:.2f} MB in {self.wall_seconds:.2f}s "
+            f"({self.mb_per_second:.2f} MB/s on {len(self.workers)} core(s))"
+        ]
+        for pid, stats in sorted(self.workers.items()):
+            lines.append(
+                f"  worker {pid}: {stats.jobs} stream(s), {stats.mb_per_second:.2f} MB/s"
+            )
+        for name, error in self.failed:
+            lines.append(f"  failed {name}: {error}")
+        return "\n".join(lines)
+
+
+class _WindowReader:
+    """
+    Read-only view of `size` bytes of a file starting at `offset`
+    """
+
+    def __init__(self, file, offset: int, size: int):
+        self._file = file
+        self._remaining = size
+        file.seek(offset)
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+
+def _strip_compression_suffix(name: str) -> Tuple[str, Optional[str]]:
+    for suffix, kind in _COMPRESSED_SUFFIXES.items():
+        if name.endswith(suffix):
+            return name[: -len(suffix)], kind
+    return name, None
+
+
+def find_jobs(path: Path, output_dir: Path) -> List[DecompressJob]:
+    """
+    Lists the compressed streams in `path`, reading only tar headers
+    :param path: a .bz2/.gz file, an uncompressed tar of such files, or a directory of them
+    :param output_dir: directory the decompressed files are written to. The members of
+    `<name>.tar` go to `output_dir/<name>/`
+    """
+    path = Path(path)
+    output_dir = Path(output_dir)
+    if path.is_dir():
+        jobs = []
+        for child in sorted(path.rglob("*")):
+            if child.is_file():
+                jobs.extend(
+                    find_jobs(child, output_dir / child.parent.relative_to(path))
+                )
+        return jobs
+
+    if path.name.endswith(_TAR_SUFFIXES):
+        jobs = []
+        archive_dir = output_dir / path.name[: -len(".tar")]
+        with tarfile.open(path, mode="r:") as archive:
+            for member in archive:
+                name, kind = _strip_compression_suffix(member.name)
+                if member.isfile() and kind is not None:
+                    jobs.append(
+                        DecompressJob(
+                            source=str(path),
+                            offset=member.offset_data,
+                            size=member.size,
+                            kind=kind,
+                            output=str(member_path(archive_dir, name)),
+                        )
+                    )
+        return jobs
+
+    name, kind = _strip_compression_suffix(path.name)
+    if kind is None:
+        return []
+    return [
+        DecompressJob(
+            source=str(path),
+            offset=0,
+            size=path.stat().st_size,
+            kind=kind,
+            output=str(output_dir / name),
+        )
+    ]
+
+
+def _run_job(job: DecompressJob, chunk_size: int) -> _JobResult:
+    """
+    Decompresses a single stream in blocks of `chunk_size`, runs in a worker process
+    """
+    cpu_started = time.process_time()
+    output = Path(job.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    partial_output = output.with_name(output.name + ".part")
+
+    with open(job.source, "rb") as source:
+        compressed = _WindowReader(source, job.offset, job.size)
+        if job.kind == "bz2":
+            decompressed = bz2.BZ2File(compressed)
+        else:
+            decompressed = gzip.GzipFile(fileobj=compressed)
+        try:
+            with decompressed, open(partial_output, "wb") as destination:
+                shutil.copyfileobj(decompressed, destination, chunk_size)
+                bytes_out = destination.tell()
+        except BaseException:
+            try:
+                partial_output.unlink()
+            except FileNotFoundError:
+                pass
+            raise
+    os.replace(partial_output, output)
+
+    return _JobResult(
+        pid=os.getpid(),
+        bytes_in=job.size,
+        bytes_out=bytes_out,
+        cpu_seconds=time.process_time() - cpu_started,
+    )
+
+
+class ParallelDecompressor:
+    """
+    Fans compressed streams out to a pool of processes, one per core by default. At most
+    `max_in_flight` streams are queued or running at once, which bounds memory use, and
+    `submit` blocks while the limit is reached. Can be fed while downloads are running.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        max_workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_in_flight: Optional[int] = None,
+    ):
+        """
+        :param output_dir: directory the decompressed files are written to
+        :param max_workers: number of worker processes, defaults to the number of cores
+        :param chunk_size: size of the blocks read and written by the workers
+        :param max_in_flight: maximum number of streams queued or being decompressed,
+        defaults to twice the number of workers
+        """
+        self.output_dir = Path(output_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.report = DecompressReport()
+
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._in_flight = threading.BoundedSemaphore(
+            max_in_flight or 2 * self.max_workers
+        )
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def _on_done(self, job: DecompressJob, future: Future) -> None:
+        self._in_flight.release()
+        with self._lock:
+            try:
+                self.report.add(future.result())
+            except Exception as error:
+                self.report.failed.append((job.output, repr(error)))
+
+    def submit(self, path: Path) -> int:
+        """
+        Queues every compressed stream found in `path`, see `find_jobs`
+        :return: number of streams queued
+        """
+        jobs = find_jobs(Path(path), self.output_dir)
+        for job in jobs:
+            self._in_flight.acquire()
+            future = self._executor.submit(_run_job, job, self.chunk_size)
+            future.add_done_callback(lambda done, job=job: self._on_done(job, done))
+        return len(jobs)
+
+    def wait(self) -> DecompressReport:
+        """
+        Waits for every queued stream and shuts the workers down
+        """
+        self._executor.shutdown(wait=True)
+        self.report.wall_seconds = time.perf_counter() - self._started
+        return self.report
+
+    def __enter__(self) -> "ParallelDecompressor":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.wait()
+
+
+def decompress(
+    paths: Iterable[Path],
+    output_dir: Path,
+    max_workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_in_flight: Optional[int] = None,
+) -> DecompressReport:
+    """
+    Decompresses every compressed stream in `paths` in parallel, see `ParallelDecompressor`
+    """
+    decompressor = ParallelDecompressor(
+        output_dir,
+        max_workers=max_workers,
+        chunk_size=chunk_size,
+        max_in_flight=max_in_flight,
+    )
+    with decompressor:
+        for path in paths:
+            decompressor.submit(path)
+    return decompressor.report
@@ -0,0 +1,507 @@
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Ids a new index is sized for. It grows past them, rebuilding its bloom filter
+DEFAULT_CAPACITY = 100_000_000
+
+# Share of new ids the bloom filter sends to the sorted runs at capacity
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+_META_FILE = "meta.json"
+_FORMAT_VERSION = 1
+
+_ID_DTYPE = np.dtype("<u8")
+_MAX_ID = 2**64 - 1
+
+# Hashes of the bloom filter, 6 bits each of a 64 bit hash
+_MAX_HASHES = 10
+
+# Ids read from every run at once when runs are merged
+_MERGE_CHUNK_SIZE = 1024 * 1024
+
+# Second hash of the bloom filter, derived from the first one
+_SALT = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    splitmix64 finalizer, spreads the bits of sequential ids over the whole word
+    """
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def _in_sorted(array: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """
+    :param ids: sorted ids
+    :return: which of `ids` are in the sorted `array`
+    """
+    if len(ids) == 0:
+        return np.zeros(0, dtype=bool)
+    # Tweet ids grow with time, so the ids of a batch only span a small slice of a run
+    # and the search touches a few pages of it
+    start, end = np.searchsorted(array, ids[[0, -1]])
+    window = array[start : end + 1]
+    if len(window) == 0:
+        return np.zeros(len(ids), dtype=bool)
+    index = np.minimum(np.searchsorted(window, ids), len(window) - 1)
+    return window[index] == ids
+
+
+def tweet_id(tweet: dict) -> Optional[int]:
+    """
+    :return: the id of a tweet, from `id` or `id_str`, None when it has none
+    """
+    value = tweet.get("id")
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= _MAX_ID:
+        return value
+    value = tweet.get("id_str")
+    if isinstance(value, str) and value.isdigit() and int(value) <= _MAX_ID:
+        return int(value)
+    return None
+
+
+class _BloomFilter:
+    """
+    Blocked bloom filter: the bits of an id are all set in a single 64 bit word, so that
+    a lookup touches one word. The words are memory-mapped from a file, only the pages
+    ids hash to are in RAM
+    """
+
+    def __init__(self, path: Path, bits: int, hashes: int):
+        self.path = path
+        self.words = -(-bits // 64)
+        self.hashes = hashes
+        with open(path, "ab") as file:
+            # Grown sparse, the blocks are only allocated once bits are set
+            if file.tell() != self.words * 8:
+                file.truncate(self.words * 8)
+        self.array = np.memmap(path, dtype=_ID_DTYPE, mode="r+", shape=(self.words,))
+
+    @staticmethod
+    def sized(capacity: int, false_positive_rate: float):
+        """
+        :return: bits and number of hashes of a filter holding `capacity` ids at about
+        `false_positive_rate`. Blocking costs a bit of accuracy, which the filter makes up
+        for with 50% more bits than a classic one
+        """
+        bits = math.ceil(
+            -1.5 * capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        )
+        hashes = min(_MAX_HASHES, max(1, round(bits / capacity * math.log(2))))
+        return max(64, bits), hashes
+
+    def positions(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: word index and bit mask of every id
+        """
+        index = (_mix(ids) % np.uint64(self.words)).astype(np.intp)
+        bits = _mix(ids ^ _SALT)
+        masks = np.zeros(len(ids), dtype=_ID_DTYPE)
+        bit = np.empty_like(bits)
+        for _ in range(self.hashes):
+            np.bitwise_and(bits, np.uint64(63), out=bit)
+            np.left_shift(np.uint64(1), bit, out=bit)
+            masks |= bit
+            bits >>= np.uint64(6)
+        return index, masks
+
+    def might_contain(self, positions: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """
+        :param positions: positions of ids, see `positions`
+        :return: False for the ids that were certainly never added
+        """
+        index, masks = positions
+        return (self.array[index] & masks) == masks
+
+    def add(self, positions: Tuple[np.ndarray, np.ndarray]) -> None:
+        index, masks = positions
+        # Ids hashing to the same word are combined, a fancy assignment would keep one
+        order = np.argsort(index)
+        index, masks = index[order], masks[order]
+        starts = np.flatnonzero(np.diff(index, prepend=-1))
+        self.array[index[starts]] |= np.bitwise_or.reduceat(masks, starts)
+
+    def flush(self) -> None:
+        self.array.flush()
+
+
+class _SortedArrays:
+    """
+    Sorted arrays of disjoint ids held in memory. An array is merged with the one before
+    it once it is at least half its size, so there are only a logarithmic number of them
+    """
+
+    def __init__(self):
+        self.arrays: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(map(len, self.arrays))
+
+    def add(self, ids: np.ndarray) -> None:
+        self.arrays.append(ids)
+        while len(self.arrays) > 1 and 2 * len(self.arrays[-1]) >= len(self.arrays[-2]):
+            newest = self.arrays.pop()
+            # Timsort merges the two sorted halves in linear time
+            self.arrays[-1] = np.sort(
+                np.concatenate((self.arrays[-1], newest)), kind="stable"
+            )
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(ids), dtype=bool)
+        for array in self.arrays:
+            found |= _in_sorted(array, ids)
+        return found
+
+    def merged(self) -> np.ndarray:
+        if len(self.arrays) == 1:
+            return self.arrays[0]
+        return np.sort(
+            np.concatenate(self.arrays or [np.empty(0, _ID_DTYPE)]), kind="stable"
+        )
+
+
+def _merge_runs(runs: Sequence[np.ndarray], output: BinaryIO) -> None:
+    """
+    Writes the sorted union of disjoint sorted runs, reading at most `_MERGE_CHUNK_SIZE`
+    ids of every run at once
+    """
+    positions = [0] * len(runs)
+    while True:
+        live = [index for index, run in enumerate(runs) if positions[index] < len(run)]
+        if not live:
+            return
+        # Every id up to the bound is in this chunk, the next chunk starts above it
+        bound = min(
+            runs[index][min(positions[index] + _MERGE_CHUNK_SIZE, len(runs[index])) - 1]
+            for index in live
+        )
+        pieces = []
+        for index in live:
+            end = int(np.searchsorted(runs[index], bound, side="right"))
+            pieces.append(np.asarray(runs[index][positions[index] : end]))
+            positions[index] = end
+        np.sort(np.concatenate(pieces), kind="stable").tofile(output)
+
+
+class IdTransaction:
+    """
+    Ids claimed by one ingest, e.g. one archive. Claimed ids count as seen for every
+    ingest right away, they are written to the index by `commit` and forgotten by `abort`,
+    so that a failed ingest doesn't hide its tweets from the next run
+    """
+
+    def __init__(self, seen: "SeenIds"):
+        self.seen = seen
+        self.pending = _SortedArrays()
+        # Ids that were already seen, in this transaction or before
+        self.duplicates = 0
+        self.closed = False
+
+    def claim(self, ids) -> np.ndarray:
+        """
+        :param ids: tweet ids, anything convertible to a uint64 array
+        :return: boolean array, True for the ids that weren't seen before. Of ids
+        repeated within `ids`, only the first one is new
+        """
+        if self.closed:
+            raise RuntimeError("The transaction is already committed or aborted")
+        new = self.seen._claim(self, np.asarray(ids, dtype=_ID_DTYPE))
+        self.duplicates += len(new) - int(np.count_nonzero(new))
+        return new
+
+    def new_tweets(self, tweets: Sequence[dict]) -> List[dict]:
+        """
+        Claims the ids of tweets
+        :return: the tweets that weren't seen before, in order. Tweets without an id are
+        all kept
+        """
+        ids = [tweet_id(tweet) for tweet in tweets]
+        with_id = [index for index, value in enumerate(ids) if value is not None]
+        new = self.claim([ids[index] for index in with_id])
+        keep = np.ones(len(tweets), dtype=bool)
+        keep[np.asarray(with_id, dtype=np.intp)[~new]] = False
+        return [tweet for tweet, kept in zip(tweets, keep) if kept]
+
+    def commit(self) -> None:
+        """
+        Writes the claimed ids to the index, they are kept by later runs
+        """
+        if not self.closed:
+            self.seen._commit(self)
+
+    def abort(self) -> None:
+        """
+        Forgets the claimed ids
+        """
+        if not self.closed:
+            self.seen._abort(self)
+
+    def __enter__(self) -> "IdTransaction":
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class SeenIds:
+    """
+    Persistent set of the tweet ids already ingested, to drop duplicate tweets while they
+    stream through: overlapping monthly and daily archives, and runs over archives that
+    were already ingested.
+
+    The ids live in a directory of sorted runs, raw little endian uint64 files, in front
+    of which sits a bloom filter. Both are memory-mapped, so RAM holds the pages in use,
+    plus the ids claimed by the open transactions. Most new ids are told apart by the
+    bloom filter alone, the others, and duplicates, with a binary search of every run.
+    Every commit writes a run, and runs of similar sizes are merged, so there are only a
+    logarithmic number of them. The filter is rebuilt twice as large once the index holds
+    more ids than it was sized for.
+
+    Ids are claimed through transactions, see `transaction`. The index is shared by the
+    threads of a process, but by a single process at a time
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        capacity: int = DEFAULT_CAPACITY,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+    ):
+        """
+        :param path: directory of the index, created when missing
+        :param capacity: ids a new index is sized for, an existing index keeps its own
+        :param false_positive_rate: share of new ids checked against the runs once the
+        index holds `capacity` ids
+        :raises ValueError: for a capacity below 1 or a rate outside ]0, 1[
+        """
+        if capacity < 1 or not 0 < false_positive_rate < 1:
+            raise ValueError(
+                "The capacity must be at least 1 and the false positive rate between 0 "
+                "and 1"
+            )
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._transactions: List[IdTransaction] = []
+
+        meta = self._load_meta()
+        if meta is None:
+            bits, hashes = _BloomFilter.sized(capacity, false_positive_rate)
+            meta = {
+                "version": _FORMAT_VERSION,
+                "capacity": capacity,
+                "false_positive_rate": false_positive_rate,
+                "bits": bits,
+                "hashes": hashes,
+                "bloom": "0.bloom",
+                "runs": [],
+                "next_file": 1,
+            }
+        self._meta = meta
+        self._remove_unused_files()
+        self._bloom = _BloomFilter(
+            self.path / meta["bloom"], meta["bits"], meta["hashes"]
+        )
+        self._runs: Dict[str, np.ndarray] = {
+            name: self._map_run(name) for name in meta["runs"]
+        }
+        self._save_meta()
+
+    def _load_meta(self) -> Optional[dict]:
+        try:
+            with open(self.path / _META_FILE) as file:
+                meta = json.load(file)
+        except FileNotFoundError:
+            return None
+        if meta.get("version") != _FORMAT_VERSION:
+            raise ValueError(
+                f"{self.path} holds an index of version {meta.get('version')}, "
+                f"expected {_FORMAT_VERSION}"
+            )
+        return meta
+
+    def _save_meta(self) -> None:
+        """
+        Atomically points the index at its current files
+        """
+        temporary_path = self.path / (_META_FILE + ".tmp")
+        with open(temporary_path, "w") as file:
+            json.dump(self._meta, file, indent=1)
+        os.replace(temporary_path, self.path / _META_FILE)
+
+    def _remove_unused_files(self) -> None:
+        """
+        Removes runs and filters a crash left behind before the metadata pointed at them
+        """
+        used = {_META_FILE, self._meta["bloom"], *self._meta["runs"]}
+        for path in self.path.iterdir():
+            if path.name not in used and path.suffix in (".ids", ".bloom", ".tmp"):
+                path.unlink()
+
+    def _map_run(self, name: str) -> np.ndarray:
+        path = self.path / name
+        return np.memmap(
+            path, dtype=_ID_DTYPE, mode="r", shape=(path.stat().st_size // 8,)
+        )
+
+    def _new_file(self, suffix: str) -> str:
+        name = f"{self._meta['next_file']}{suffix}"
+        self._meta["next_file"] += 1
+        return name
+
+    def __len__(self) -> int:
+        """
+        Number of committed ids
+        """
+        return sum(map(len, self._runs.values()))
+
+    @property
+    def capacity(self) -> int:
+        return self._meta["capacity"]
+
+    def __contains__(self, tweet_id: int) -> bool:
+        return bool(self.contains([tweet_id])[0])
+
+    def contains(self, ids) -> np.ndarray:
+        """
+        :return: which of `ids` are committed or claimed by an open transaction
+        """
+        unique, inverse = np.unique(
+            np.asarray(ids, dtype=_ID_DTYPE), return_inverse=True
+        )
+        with self._lock:
+            return self._seen(unique, self._bloom.positions(unique))[inverse]
+
+    def _seen(
+        self, ids: np.ndarray, positions: Tuple[np.ndarray, np.ndarray]
+    ) -> np.ndarray:
+        """
+        :param ids: sorted ids
+        :param positions: their positions in the bloom filter
+        """
+        seen = self._bloom.might_contain(positions)
+        candidates = np.flatnonzero(seen)
+        if len(candidates):
+            values = ids[candidates]
+            found = np.zeros(len(values), dtype=bool)
+            for run in self._runs.values():
+                found |= _in_sorted(run, values)
+            for transaction in self._transactions:
+                found |= transaction.pending.contains(values)
+            seen[candidates] = found
+        return seen
+
+    def transaction(self) -> IdTransaction:
+        """
+        Starts claiming ids, with `IdTransaction.claim` or `IdTransaction.new_tweets`.
+        Used as a context manager, it commits when the block succeeds and aborts otherwise
+        """
+        transaction = IdTransaction(self)
+        with self._lock:
+            self._transactions.append(transaction)
+        return transaction
+
+    def _claim(self, transaction: IdTransaction, ids: np.ndarray) -> np.ndarray:
+        new = np.zeros(len(ids), dtype=bool)
+        if len(ids) == 0:
+            return new
+        unique, first = np.unique(ids, return_index=True)
+        with self._lock:
+            index, masks = self._bloom.positions(unique)
+            unseen = ~self._seen(unique, (index, masks))
+            fresh = unique[unseen]
+            if len(fresh):
+                self._bloom.add((index[unseen], masks[unseen]))
+                transaction.pending.add(fresh)
+        new[first[unseen]] = True
+        return new
+
+    def _abort(self, transaction: IdTransaction) -> None:
+        with self._lock:
+            self._transactions.remove(transaction)
+            transaction.closed = True
+
+    def _commit(self, transaction: IdTransaction) -> None:
+        with self._lock:
+            ids = transaction.pending.merged()
+            removed: List[str] = []
+            if len(ids):
+                name = self._new_file(".ids")
+                with open(self.path / name, "wb") as file:
+                    ids.tofile(file)
+                self._runs[name] = self._map_run(name)
+                removed = self._compact()
+                if len(self) > self._meta["capacity"]:
+                    removed.append(self._grow())
+                self._bloom.flush()
+                self._meta["runs"] = list(self._runs)
+                self._save_meta()
+            self._transactions.remove(transaction)
+            transaction.closed = True
+            # Only now that the metadata no longer points at them
+            for name in removed:
+                (self.path / name).unlink()
+
+    def _compact(self) -> List[str]:
+        """
+        Merges the newest run with the one before it while it is at least half its size
+        :return: names of the merged runs
+        """
+        removed = []
+        while len(self._runs) > 1:
+            older, newer = list(self._runs)[-2:]
+            if 2 * len(self._runs[newer]) < len(self._runs[older]):
+                break
+            name = self._new_file(".ids")
+            with open(self.path / name, "wb") as file:
+                _merge_runs([self._runs[older], self._runs[newer]], file)
+            del self._runs[older], self._runs[newer]
+            self._runs[name] = self._map_run(name)
+            removed += [older, newer]
+        return removed
+
+    def _grow(self) -> str:
+        """
+        Rebuilds the bloom filter for twice the ids the index holds
+        :return: name of the previous filter
+        """
+        capacity = 2 * len(self)
+        bits, hashes = _BloomFilter.sized(capacity, self._meta["false_positive_rate"])
+        name = self._new_file(".bloom")
+        bloom = _BloomFilter(self.path / name, bits, hashes)
+        for run in self._runs.values():
+            for start in range(0, len(run), _MERGE_CHUNK_SIZE):
+                chunk = np.asarray(run[start : start + _MERGE_CHUNK_SIZE])
+                bloom.add(bloom.positions(chunk))
+        for transaction in self._transactions:
+            for array in transaction.pending.arrays:
+                bloom.add(bloom.positions(array))
+        previous = self._meta["bloom"]
+        self._bloom = bloom
+        self._meta.update(capacity=capacity, bits=bits, hashes=hashes, bloom=name)
+        return previous
+
+    def close(self) -> None:
+        """
+        Aborts the open transactions
+        """
+        for transaction in list(self._transactions):
+            transaction.abort()
+        self._bloom.flush()
+
+    def __enter__(self) -> "SeenIds":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,244 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from humanize import naturalsize
+
+try:
+    from dozent.downloader_tools import DownloaderTools
+    from dozent.http_pool import HTTPConnectionPool
+except ModuleNotFoundError:
+    from downloader_tools import DownloaderTools
+    from http_pool import HTTPConnectionPool
+
+# Space kept free on the output volume by default
+DEFAULT_MIN_FREE_SPACE = 1024**3
+
+# What happens when the planned downloads don't fit: raise before anything is downloaded,
+# drop the archives at the end of the plan that don't fit, or start anyway and wait for
+# space to be freed, e.g. by a post-download consumer
+SPACE_POLICIES = ("refuse", "trim", "wait")
+DEFAULT_SPACE_POLICY = "refuse"
+
+# How often blocked downloads look at the free space again, in seconds
+_RECHECK_INTERVAL = 1.0
+
+# Number of HEAD requests sent at once for archives of unknown size
+_SIZE_LOOKUP_THREADS = 8
+
+_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+class InsufficientSpaceError(RuntimeError):
+    """
+    Raised when downloads don't fit on the output volume
+    """
+
+
+class SpacePlan(NamedTuple):
+    links: List[str]
+    dropped: List[str]
+    total_size: int
+    unknown_sizes: int
+    available: int
+
+
+def parse_size(text: str) -> int:
+    """
+    Parses a size in bytes such as `500M`, `20G` or `1.5T`
+    """
+    text = text.strip()
+    unit = text[-1].upper() if text and text[-1].isalpha() else ""
+    if unit not in _UNITS:
+        raise ValueError(f"Unknown size unit in {text!r}, use K, M, G or T")
+    try:
+        size = float(text[:-1] if unit else text) * _UNITS[unit]
+    except ValueError:
+        raise ValueError(f"Invalid size {text!r}, expected e.g. 20G")
+    if size < 0:
+        raise ValueError(f"Invalid size {text!r}, it can't be negative")
+    return int(size)
+
+
+def remote_size(link: str, pool: Optional[HTTPConnectionPool] = None) -> Optional[int]:
+    """
+    Size of the file at `link` from a HEAD request, None when it can't be found out
+    :param pool: connection pool the request is sent with
+    """
+    try:
+        return DownloaderTools.get_remote_file_info(link, pool).size or None
+    except OSError:
+        return None
+
+
+def _allocated_bytes(path: Path) -> int:
+    """
+    Bytes the file takes up on disk. Preallocated sparse files only count what was written
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 0
+    blocks = getattr(stat, "st_blocks", None)
+    return stat.st_size if blocks is None else min(stat.st_size, blocks * 512)
+
+
+class DiskSpacePlanner:
+    """
+    Keeps downloads from filling the output volume. `plan` checks the expected size of all
+    archives against the free space before anything is queued, and `reserve` holds back
+    every new file until the bytes still to be written by the files in flight, plus its
+    own size, fit in the free space minus `min_free_space`. Blocked files start as soon
+    as enough space is freed.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        min_free_space: int = DEFAULT_MIN_FREE_SPACE,
+        size_of: Callable[[str], Optional[int]] = remote_size,
+        free_space: Optional[Callable[[], int]] = None,
+    ):
+        """
+        :param directory: directory the archives are downloaded to
+        :param min_free_space: bytes that are always left free on the volume
+        :param size_of: expected size of the archive at a link, None when unknown
+        :param free_space: free bytes on the volume, defaults to `shutil.disk_usage`
+        """
+        self.directory = Path(directory)
+        self.min_free_space = min_free_space
+        self.size_of = size_of
+        self.free_space = free_space or (lambda: shutil.disk_usage(self.directory).free)
+        self._sizes: Dict[str, Optional[int]] = {}
+        self._reservations: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def _path_of(self, link: str) -> Path:
+        return self.directory / DownloaderTools.get_file_name(link)
+
+    def size(self, link: str) -> Optional[int]:
+        """
+        Expected size of the archive at `link`, looked up once and cached
+        :return: the size, None when unknown
+        """
+        if link not in self._sizes:
+            self._sizes[link] = self.size_of(link)
+        return self._sizes[link]
+
+    def _outstanding(self) -> int:
+        """
+        Bytes the files in flight still have to write
+        """
+        return sum(
+            max(0, size - _allocated_bytes(self._path_of(link)))
+            for link, size in self._reservations.items()
+        )
+
+    def available(self) -> int:
+        """
+        Bytes that new files may use
+        """
+        with self._condition:
+            return self.free_space() - self.min_free_space - self._outstanding()
+
+    def plan(
+        self, links: Iterable[str], policy: str = DEFAULT_SPACE_POLICY
+    ) -> SpacePlan:
+        """
+        Checks whether the archives fit before they are queued
+        :param links: links in the order they will be downloaded
+        :param policy: one of `SPACE_POLICIES`
+        :return: the links to download
+        """
+        if policy not in SPACE_POLICIES:
+            raise ValueError(
+                f"Unknown policy {policy!r}, choose one of {', '.join(SPACE_POLICIES)}"
+            )
+        links = list(links)
+        unknown = [link for link in links if link not in self._sizes]
+        with ThreadPoolExecutor(max_workers=_SIZE_LOOKUP_THREADS) as executor:
+            for link, size in zip(unknown, executor.map(self.size_of, unknown)):
+                self._sizes[link] = size
+
+        available = self.available()
+        # Partial files of an earlier run already hold some of the bytes
+        needed = {
+            link: max(0, self._sizes[link] - _allocated_bytes(self._path_of(link)))
+            for link in links
+            if self._sizes[link] is not None
+        }
+        total_size = sum(needed.values())
+        unknown_sizes = len(links) - len(needed)
+
+        planned, dropped = links, []
+        if total_size > available:
+            message = (
+                f"The download needs {naturalsize(total_size, binary=True)} but only "
+                f"{naturalsize(max(0, available), binary=True)} can be used on "
+                f"{self.directory}, keeping "
+                f"{naturalsize(self.min_free_space, binary=True)} free"
+            )
+            if policy == "refuse":
+                raise InsufficientSpaceError(message)
+            if policy == "trim":
+                planned, used = [], 0
+                for index, link in enumerate(links):
+                    used += needed.get(link, 0)
+                    if used > available:
+                        dropped = links[index:]
+                        break
+                    planned.append(link)
+
+        return SpacePlan(planned, dropped, total_size, unknown_sizes, available)
+
+    def reserve(
+        self, link: str, on_wait: Optional[Callable[[str], None]] = None
+    ) -> None:
+        """
+        Blocks until the archive at `link` fits next to the files in flight
+        :param on_wait: called with a message when the file has to wait for space
+        :raises InsufficientSpaceError: when the archive can't fit even with nothing else
+        in flight
+        """
+        size = self.size(link) or 0
+        needed = max(0, size - _allocated_bytes(self._path_of(link)))
+        waiting = False
+        with self._condition:
+            while True:
+                available = (
+                    self.free_space() - self.min_free_space - self._outstanding()
+                )
+                if needed <= available:
+                    self._reservations[link] = size
+                    return
+                if not self._reservations:
+                    raise InsufficientSpaceError(
+                        f"{link} needs {naturalsize(needed, binary=True)} but only "
+                        f"{naturalsize(max(0, available), binary=True)} can be used on "
+                        f"{self.directory}"
+                    )
+                if not waiting and on_wait is not None:
+                    on_wait(
+                        f"Waiting for {naturalsize(needed, binary=True)} of free space "
+                        f"to start {link}"
+                    )
+                waiting = True
+                self._condition.wait(_RECHECK_INTERVAL)
+
+    def release(self, link: str) -> None:
+        """
+        Drops the reservation of a finished file and wakes up the blocked ones
+        """
+        with self._condition:
+            self._reservations.pop(link, None)
+            self._condition.notify_all()
+
+    def notify(self) -> None:
+        """
+        Makes blocked files look at the free space again, e.g. after files were deleted
+        """
+        with self._condition:
+            self._condition.notify_all()
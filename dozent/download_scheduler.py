@@ -0,0 +1,498 @@
+import threading
+from pathlib import Path
+from queue import Queue
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+try:
+    from dozent.disk_space import DiskSpacePlanner, InsufficientSpaceError
+    from dozent.downloader_tools import DownloadCancelled, DownloaderTools
+    from dozent.metrics import (
+        STATUS_ELSEWHERE,
+        STATUS_FAILED,
+        STATUS_INTERRUPTED,
+        STATUS_OK,
+        STATUS_SKIPPED,
+        MetricsRecorder,
+    )
+    from dozent.progress import ProgressAggregator, ProgressRenderer
+    from dozent.sharding import WorkClaims
+except ModuleNotFoundError:
+    from disk_space import DiskSpacePlanner, InsufficientSpaceError
+    from downloader_tools import DownloadCancelled, DownloaderTools
+    from metrics import (
+        STATUS_ELSEWHERE,
+        STATUS_FAILED,
+        STATUS_INTERRUPTED,
+        STATUS_OK,
+        STATUS_SKIPPED,
+        MetricsRecorder,
+    )
+    from progress import ProgressAggregator, ProgressRenderer
+    from sharding import WorkClaims
+
+DEFAULT_MAX_CONCURRENT_FILES = 4
+DEFAULT_MAX_CONNECTIONS = 16
+
+# Seconds between two looks at the links other nodes are downloading
+DEFAULT_CLAIM_POLL_INTERVAL = 10.0
+
+# Sentinel put on the queue once per worker so that idle workers exit
+_STOP = object()
+
+
+class ConnectionBudget:
+    """
+    Counting semaphore over the total number of HTTP connections that may be open at once,
+    shared by every file that is being downloaded
+    """
+
+    def __init__(self, max_connections: int):
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        self.max_connections = max_connections
+        self._available = max_connections
+        self._condition = threading.Condition()
+
+    @property
+    def in_use(self) -> int:
+        with self._condition:
+            return self.max_connections - self._available
+
+    def acquire(self, wanted: int) -> int:
+        """
+        Blocks until at least one connection is free, then grants up to `wanted` connections
+        :param wanted: number of connections the caller would like to open
+        :return: number of connections granted, always between 1 and `wanted`
+        """
+        wanted = max(1, wanted)
+        with self._condition:
+            while self._available == 0:
+                self._condition.wait()
+            granted = min(wanted, self._available)
+            self._available -= granted
+            return granted
+
+    def release(self, count: int) -> None:
+        """
+        Returns `count` connections to the budget and wakes up any waiting workers
+        """
+        with self._condition:
+            self._available = min(self.max_connections, self._available + count)
+            self._condition.notify_all()
+
+
+class DownloadOutcome(NamedTuple):
+    link: str
+    status: str
+    path: Optional[Path] = None
+    error: Optional[BaseException] = None
+
+
+class DownloadResults:
+    """
+    Outcome of every link of a run, in the order they finished. A failing link doesn't
+    stop the others, its error is kept here instead
+    """
+
+    def __init__(self):
+        self.outcomes: List[DownloadOutcome] = []
+        # Whether the run was stopped by `DownloadScheduler.shutdown`
+        self.interrupted = False
+        self._lock = threading.Lock()
+
+    def add(self, outcome: DownloadOutcome) -> None:
+        with self._lock:
+            self.outcomes.append(outcome)
+
+    def _with_status(self, status: str) -> List[DownloadOutcome]:
+        with self._lock:
+            return [outcome for outcome in self.outcomes if outcome.status == status]
+
+    @property
+    def succeeded(self) -> List[DownloadOutcome]:
+        return self._with_status(STATUS_OK)
+
+    @property
+    def failed(self) -> List[DownloadOutcome]:
+        return self._with_status(STATUS_FAILED)
+
+    @property
+    def skipped(self) -> List[DownloadOutcome]:
+        """
+        Links that couldn't fit on the output volume
+        """
+        return self._with_status(STATUS_SKIPPED)
+
+    @property
+    def elsewhere(self) -> List[DownloadOutcome]:
+        """
+        Links downloaded by other nodes sharing the output directory
+        """
+        return self._with_status(STATUS_ELSEWHERE)
+
+    @property
+    def not_finished(self) -> List[DownloadOutcome]:
+        """
+        Links a shutdown stopped, or kept from starting. Running again with resume
+        continues them
+        """
+        return self._with_status(STATUS_INTERRUPTED)
+
+    @property
+    def ok(self) -> bool:
+        """
+        Whether every link was downloaded, by this node or another one
+        """
+        with self._lock:
+            return all(
+                outcome.status in (STATUS_OK, STATUS_ELSEWHERE)
+                for outcome in self.outcomes
+            )
+
+    def format(self) -> str:
+        lines = [
+            f"{len(self.succeeded)} file(s) downloaded, {len(self.failed)} failed, "
+            f"{len(self.skipped)} skipped, {len(self.not_finished)} interrupted"
+            + (
+                f", {len(self.elsewhere)} downloaded by other nodes"
+                if self.elsewhere
+                else ""
+            )
+        ]
+        for outcome in self.failed:
+            lines.append(f"Failed {outcome.link}: {outcome.error!r}")
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}: {self.format().splitlines()[0]}>"
+
+
+class _DownloadWorker(threading.Thread):  # skip_tests
+    def __init__(self, scheduler: "DownloadScheduler", task_id: int):
+        threading.Thread.__init__(self)
+        self.scheduler = scheduler
+        self.task_id = task_id
+
+    def run(self):
+        queue = self.scheduler.queue
+        while True:
+            # Get the work from the queue and expand the tuple
+            link = queue.get()
+            try:
+                if link is _STOP:
+                    return
+                if self.scheduler.stopping:
+                    self.scheduler._interrupt(link)
+                else:
+                    self.scheduler._download(link)
+            except Exception as error:
+                # The worker outlives any error, so that the queue is always drained
+                self.scheduler._finish(link, STATUS_FAILED, error=error)
+            finally:
+                queue.task_done()
+
+
+class DownloadScheduler:
+    """
+    Bounded worker pool that downloads links with at most `max_concurrent_files` files and
+    `max_connections` HTTP connections in flight. New files are started as soon as a worker
+    and a connection become free. A file that fails is recorded in `results` and the
+    others go on. With `claims`, the links are shared with other nodes: a worker claims a
+    link before starting it, and links held by other nodes are looked at again until they
+    are done or their node died.
+    """
+
+    def __init__(
+        self,
+        download_dir: Path,
+        max_concurrent_files: int = DEFAULT_MAX_CONCURRENT_FILES,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        verbose: bool = True,
+        download_function: Optional[Callable] = None,
+        post_download: Optional[Callable[[Path], None]] = None,
+        space_planner: Optional[DiskSpacePlanner] = None,
+        metrics: Optional[MetricsRecorder] = None,
+        claims: Optional[WorkClaims] = None,
+        claim_poll_interval: float = DEFAULT_CLAIM_POLL_INTERVAL,
+    ):
+        """
+        :param download_dir: directory where the files will be stored
+        :param max_concurrent_files: maximum number of files downloaded at the same time
+        :param max_connections: maximum number of connections open across all files
+        :param verbose: Determines if download status is printed to console
+        :param download_function: callable with the signature of
+        `DownloaderTools.download_with_pysmartdl`
+        :param post_download: called from the worker with the path of every downloaded file,
+        after its connections were handed back
+        :param space_planner: holds back new files until they fit on the output volume.
+        Files that can't fit at all are skipped
+        :param metrics: records the timings and final status of every file, and is the
+        progress aggregator of the run
+        :param claims: claims shared with other nodes downloading the same links
+        :param claim_poll_interval: seconds between two looks at the links other nodes
+        are downloading
+        """
+        if max_concurrent_files < 1:
+            raise ValueError("max_concurrent_files must be at least 1")
+
+        self.download_dir = download_dir
+        self.max_concurrent_files = max_concurrent_files
+        self.budget = ConnectionBudget(max_connections)
+        self.verbose = verbose
+        self.download_function = (
+            download_function or DownloaderTools.download_with_pysmartdl
+        )
+        self.post_download = post_download
+        self.space_planner = space_planner
+        self.metrics = metrics
+        self.claims = claims
+        self.claim_poll_interval = claim_poll_interval
+        self.results = DownloadResults()
+        self._stopping = threading.Event()
+
+        # Spread the budget evenly so that a single file can't starve the others
+        self.connections_per_file = max(1, max_connections // max_concurrent_files)
+
+        self.queue = Queue()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._number_of_workers = 0
+        # Links of the current round that other nodes hold
+        self._deferred: List[str] = []
+
+        self.progress: Optional[ProgressAggregator] = None
+        self._renderer: Optional[ProgressRenderer] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of files that are waiting for a free worker or connection
+        """
+        with self._lock:
+            return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of files that are currently being downloaded
+        """
+        with self._lock:
+            return self._in_flight
+
+    @property
+    def skipped(self) -> List[str]:
+        """
+        Links that were skipped because they can't fit on the output volume
+        """
+        return [outcome.link for outcome in self.results.skipped]
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def shutdown(self) -> None:
+        """
+        Starts a graceful shutdown: queued files are no longer started and `run` returns
+        once the files in flight ended. Can be called from a signal handler, stopping the
+        files in flight early is up to the download function, e.g. `DownloadEngine.cancel`
+        """
+        self._stopping.set()
+        self.results.interrupted = True
+
+    def _record(self, outcome: DownloadOutcome) -> None:
+        if self.claims is not None:
+            if outcome.status == STATUS_OK:
+                self.claims.complete(outcome.link)
+            else:
+                self.claims.release(outcome.link)
+        self.results.add(outcome)
+
+    def _finish(
+        self,
+        link: str,
+        status: str,
+        path: Optional[Path] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        self._record(DownloadOutcome(link, status, path, error))
+        if self.metrics is not None:
+            self.metrics.finished(
+                link, status, repr(error) if error is not None else None
+            )
+
+    def _interrupt(self, link: str) -> None:
+        """
+        Records a queued file that isn't started because of a shutdown
+        """
+        with self._lock:
+            self._queued -= 1
+        self._finish(link, STATUS_INTERRUPTED)
+
+    def _log(self, message: str) -> None:
+        if not self.verbose:
+            return
+        if self._renderer is not None:
+            self._renderer.write_line(message)
+        else:
+            print(message)
+
+    def _download(self, link: str) -> None:
+        if self.claims is not None and not self.claims.claim(link):
+            with self._lock:
+                self._queued -= 1
+                self._deferred.append(link)
+            return
+
+        if self.space_planner is None:
+            self._transfer(link)
+            return
+
+        # Waiting for space happens before connections are taken from the budget
+        try:
+            self.space_planner.reserve(link, on_wait=self._log)
+        except InsufficientSpaceError as error:
+            if self.stopping:
+                # The space of the files in flight was freed by the shutdown
+                self._interrupt(link)
+                return
+            with self._lock:
+                self._queued -= 1
+            self._log(f"Skipping {link}: {error}")
+            self._finish(link, STATUS_SKIPPED, error=error)
+            return
+        try:
+            self._transfer(link)
+        finally:
+            self.space_planner.release(link)
+
+    def _transfer(self, link: str) -> None:
+        connections = self.budget.acquire(self.connections_per_file)
+        if self.stopping:
+            self.budget.release(connections)
+            self._interrupt(link)
+            return
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        if self.metrics is not None:
+            self.metrics.started(link)
+        try:
+            self._log(
+                f"Starting {link} with {connections} connection(s) "
+                f"[{self.queue_depth} queued, {self.in_flight} in flight]"
+            )
+            path = self.download_function(
+                link=link,
+                download_dir=str(self.download_dir),
+                # Engines only report their bytes to the metrics when verbose
+                verbose=self.verbose or self.metrics is not None,
+                connections=connections,
+                progress=self.progress,
+            )
+        except Exception as error:
+            if isinstance(error, DownloadCancelled) or self.stopping:
+                self._finish(link, STATUS_INTERRUPTED, error=error)
+            else:
+                self._log(f"Failed {link}: {error!r}")
+                self._finish(link, STATUS_FAILED, error=error)
+            return
+        else:
+            # The metrics time the transfer, post-processing isn't part of it
+            if self.metrics is not None:
+                self.metrics.transferred(link)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self.budget.release(connections)
+
+        path = Path(path) if path is not None else None
+        if self.post_download is not None and path is not None:
+            try:
+                self.post_download(path)
+            except Exception as error:
+                self._log(f"Processing {link} failed: {error!r}")
+                self._finish(link, STATUS_FAILED, path, error)
+                return
+        self._finish(link, STATUS_OK, path)
+
+    def _run_round(self, links: List[str]) -> None:
+        """
+        Downloads the links with a fresh set of workers, blocking until all of them are
+        finished or deferred
+        """
+        self._number_of_workers = min(self.max_concurrent_files, len(links))
+        for task_id in range(self._number_of_workers):
+            worker = _DownloadWorker(scheduler=self, task_id=task_id)
+            # Setting daemon to True will let the main thread exit even though the workers are blocking
+            worker.daemon = True
+            worker.start()
+
+        with self._lock:
+            self._queued += len(links)
+        for link in links:
+            self.queue.put(link)
+
+        for _ in range(self._number_of_workers):
+            self.queue.put(_STOP)
+
+        self._log(
+            f"Queued {len(links)} file(s) on {self._number_of_workers} worker(s), "
+            f"{self.budget.max_connections} connection(s) max"
+        )
+        self.queue.join()
+
+    def _wait_for_other_nodes(self) -> List[str]:
+        """
+        Sorts out the links other nodes held during the last round: those they finished
+        are recorded, the others are waited for
+        :return: links to try again, empty once there are none or on shutdown
+        """
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        waiting = []
+        for link in deferred:
+            if self.claims.is_done(link):
+                self._finish(link, STATUS_ELSEWHERE)
+            else:
+                waiting.append(link)
+        if waiting and not self.stopping:
+            self._log(f"Waiting for {len(waiting)} file(s) claimed by other nodes")
+            self._stopping.wait(self.claim_poll_interval)
+        if self.stopping:
+            for link in waiting:
+                self._finish(link, STATUS_INTERRUPTED)
+            return []
+        return waiting
+
+    def run(self, links: Iterable[str]) -> DownloadResults:
+        """
+        Downloads every link and blocks until all of them are finished, or until the files
+        in flight ended after a `shutdown`. With `claims`, blocks until every link was
+        downloaded by some node
+        :param links: links that need to be downloaded
+        :return: the outcome of every link
+        """
+        links = list(links)
+
+        if self.metrics is not None:
+            self.progress = self.metrics
+        elif self.verbose:
+            self.progress = ProgressAggregator()
+        if self.verbose:
+            self._renderer = ProgressRenderer(self.progress)
+
+        if self.metrics is not None:
+            for link in links:
+                self.metrics.queued(link)
+
+        if self._renderer is not None:
+            self._renderer.start()
+        try:
+            while links:
+                self._run_round(links)
+                links = self._wait_for_other_nodes() if self.claims is not None else []
+        finally:
+            if self._renderer is not None:
+                self._renderer.stop()
+        return self.results
@@ -0,0 +1,200 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+STATE_FILE_SUFFIX = ".dozent-state"
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Merges overlapping and adjacent half-open byte ranges
+    :param ranges: list of [start, end) byte ranges
+    :return: sorted list of disjoint ranges
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class DownloadState:
+    """
+    Sidecar state of a single download, stored next to the downloaded file as
+    `<file>.dozent-state`. Records which byte ranges of the file were written and the
+    validators of the remote file, so an interrupted download can be continued with
+    HTTP Range requests
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        url: str,
+        size: int,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        completed: Optional[List[Tuple[int, int]]] = None,
+        checksums: Optional[Dict[str, str]] = None,
+    ):
+        """
+        :param path: path of the downloaded file, the state is stored next to it
+        :param url: link the file is downloaded from
+        :param size: expected size of the file in bytes
+        :param etag: ETag header of the remote file
+        :param last_modified: Last-Modified header of the remote file
+        :param completed: [start, end) byte ranges that were already written
+        :param checksums: hex digests by algorithm the complete file was verified with, so
+        that a resumed run doesn't hash it again
+        """
+        self.path = Path(path)
+        self.url = url
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.completed = merge_ranges(completed or [])
+        self.checksums = dict(checksums or {})
+
+    @staticmethod
+    def state_path_for(path: Path) -> Path:
+        path = Path(path)
+        return path.with_name(path.name + STATE_FILE_SUFFIX)
+
+    @property
+    def state_path(self) -> Path:
+        return self.state_path_for(self.path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["DownloadState"]:
+        """
+        Loads the state stored next to `path`
+        :return: the state, or None when there is no state or it can't be read
+        """
+        try:
+            with open(cls.state_path_for(path)) as file:
+                data = json.load(file)
+            return cls(
+                path=path,
+                url=data["url"],
+                size=int(data["size"]),
+                etag=data.get("etag"),
+                last_modified=data.get("last_modified"),
+                completed=[tuple(item) for item in data.get("completed", [])],
+                checksums=data.get("checksums"),
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def open_for(
+        cls,
+        path: Path,
+        url: str,
+        size: int,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> "DownloadState":
+        """
+        Loads the state of an earlier download of the same remote file, or starts a new one
+        and truncates the file to its final size
+        :param path: path of the downloaded file
+        :param url: link the file is downloaded from
+        :param size: size of the remote file in bytes
+        :param etag: ETag header of the remote file
+        :param last_modified: Last-Modified header of the remote file
+        """
+        path = Path(path)
+        state = cls.load(path)
+        if (
+            state is not None
+            and path.exists()
+            and state.matches(url, size, etag, last_modified)
+        ):
+            return state
+
+        state = cls(
+            path=path, url=url, size=size, etag=etag, last_modified=last_modified
+        )
+        with open(path, "wb") as file:
+            file.truncate(size)
+        return state
+
+    def save(self) -> None:
+        """
+        Atomically writes the state next to the downloaded file
+        """
+        temporary_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(temporary_path, "w") as file:
+            json.dump(
+                {
+                    "url": self.url,
+                    "size": self.size,
+                    "etag": self.etag,
+                    "last_modified": self.last_modified,
+                    "completed": [list(item) for item in self.completed],
+                    "checksums": self.checksums,
+                },
+                file,
+            )
+        os.replace(temporary_path, self.state_path)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+
+    def matches(
+        self, url: str, size: int, etag: Optional[str], last_modified: Optional[str]
+    ) -> bool:
+        """
+        Checks that the state describes the same remote file. Validators the server didn't
+        send are not compared
+        """
+        if self.url != url or self.size != size:
+            return False
+        if etag and self.etag and etag != self.etag:
+            return False
+        if last_modified and self.last_modified and last_modified != self.last_modified:
+            return False
+        return bool(etag or last_modified)
+
+    def add_range(self, start: int, end: int) -> None:
+        """
+        Marks the half-open range [start, end) as written
+        """
+        self.completed = merge_ranges(self.completed + [(start, end)])
+
+    @property
+    def completed_bytes(self) -> int:
+        return sum(end - start for start, end in self.completed)
+
+    def missing_ranges(
+        self, lower: int = 0, upper: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        :param lower: first byte of the part of the file that is looked at
+        :param upper: end of the part of the file that is looked at, the end of the file
+        when None
+        :return: [start, end) byte ranges that still have to be downloaded
+        """
+        upper = self.size if upper is None else min(upper, self.size)
+        missing = []
+        position = lower
+        for start, end in self.completed:
+            if start > position:
+                missing.append((position, min(start, upper)))
+            position = max(position, end)
+            if position >= upper:
+                break
+        if position < upper:
+            missing.append((position, upper))
+        return [(start, end) for start, end in missing if start < end]
+
+    @property
+    def is_complete(self) -> bool:
+        return not self.missing_ranges() and self.path.exists()
@@ -1,31 +1,81 @@
-import random
-import sys
+import os
+import threading
 import time
-from threading import Lock
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
 
-import humanize
 from pySmartDL import SmartDL
 
-_TWO_DECIMALS = "%.2f"
-
-# Used for tracking and displaying download progress bars
-global global_progress_tracker
-global_progress_tracker = [[0, 0, 0, 0, 0]]
-
-global global_download_size
-global_download_size = 0
-
-global global_final_download_size
-global_final_download_size = 0
-
-global global_download_speed
-global_download_speed = 0
-
-global global_progress_percentage
-global_progress_percentage = 0
-
-global global_eta
-global_eta = 0
+try:
+    from dozent.bandwidth import BandwidthLimiter
+    from dozent.download_state import DownloadState
+    from dozent.file_writer import FileWriter, WriteOptions
+    from dozent.http_pool import HTTPConnectionPool, borrow
+    from dozent.integrity import StreamingHasher
+    from dozent.progress import ProgressAggregator, TaskProgress
+    from dozent.retry import NO_RETRY, RetryPolicy
+except ModuleNotFoundError:
+    from bandwidth import BandwidthLimiter
+    from download_state import DownloadState
+    from file_writer import FileWriter, WriteOptions
+    from http_pool import HTTPConnectionPool, borrow
+    from integrity import StreamingHasher
+    from progress import ProgressAggregator, TaskProgress
+    from retry import NO_RETRY, RetryPolicy
+
+# How often a running download reports its progress to the aggregator
+_POLL_INTERVAL = 0.25
+
+# Size of the blocks read from the socket by the resumable downloader
+_CHUNK_SIZE = 256 * 1024
+
+# How often the sidecar state of a resumable download is written to disk, in seconds
+_STATE_SAVE_INTERVAL = 1.0
+
+
+class RemoteFileInfo(NamedTuple):
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class RangeNotSupportedError(Exception):
+    """
+    Raised when the server answers a Range request with the whole file
+    """
+
+
+class DownloadCancelled(Exception):
+    """
+    Raised by a download that was stopped by a shutdown, its written bytes are recorded
+    """
+
+
+def check_cancelled(cancel: Optional[threading.Event], link: str) -> None:
+    if cancel is not None and cancel.is_set():
+        raise DownloadCancelled(link)
+
+
+def split_ranges(ranges: List[Tuple[int, int]], parts: int) -> List[Tuple[int, int]]:
+    """
+    Splits byte ranges so that there are at least `parts` of them, when possible, by halving
+    the largest range
+    :param ranges: [start, end) byte ranges
+    :param parts: number of ranges wanted
+    :return: [start, end) byte ranges covering the same bytes
+    """
+    ranges = list(ranges)
+    while ranges and len(ranges) < parts:
+        largest = max(ranges, key=lambda item: item[1] - item[0])
+        start, end = largest
+        if end - start < 2 * _CHUNK_SIZE:
+            break
+        middle = start + (end - start) // 2
+        ranges.remove(largest)
+        ranges.extend([(start, middle), (middle, end)])
+    return sorted(ranges)
 
 
 class DownloaderTools:
@@ -40,146 +90,399 @@ class DownloaderTools:
             )
 
     @staticmethod
-    def _get_individual_download_stats(
-        downloader_obj: SmartDL,
-    ) -> [int, int, str, float, str]:
-
-        download_size = downloader_obj.get_dl_size()
-        file_size = downloader_obj.get_final_filesize()
-        speed = downloader_obj.get_speed()
-        progress_percentage = downloader_obj.get_progress()
-        eta = downloader_obj.get_eta()
-        return [download_size, file_size, speed, progress_percentage, eta]
-
-    @staticmethod
-    def _update_global_download_size() -> None:
+    def download_with_pysmartdl(
+        link: str,
+        download_dir: str,
+        verbose: bool = True,
+        connections: int = 5,
+        progress: Optional[ProgressAggregator] = None,
+        pool: Optional[HTTPConnectionPool] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Path:
         """
-        Updates download progress for all downloads
+        Downloads file from link using PySmartDL
+        :param link: link that needs to be downloaded
+        :param download_dir: A relative path to the download directory
+        :param verbose: Determines if download status is reported to `progress`
+        :param connections: number of connections PySmartDL may open for this file
+        :param progress: aggregator that download progress is reported to
+        :param pool: connection pool resolving the redirects of the link once, so that
+        PySmartDL's connections go straight to the host serving the file
+        :param cancel: event stopping the download once set
+        :return: path of the downloaded file
         """
-        global global_download_size
-        updated_size = sum([index[0] for index in global_progress_tracker])
+        url = pool.resolve(link) if pool is not None else link
+        downloader_obj = SmartDL(
+            url, download_dir, progress_bar=False, threads=connections
+        )
+        downloader_obj.start(blocking=False)
 
-        # Prevents lagging threads from updating with lower values
-        if updated_size > global_download_size:
-            global_download_size = updated_size
+        task_progress = None
+        if verbose and progress is not None:
+            task_progress = progress.register(
+                link, total=downloader_obj.get_final_filesize()
+            )
+
+        reported_size = 0
+        while True:
+            finished = downloader_obj.isFinished()
+            if task_progress is not None:
+                # Only the bytes downloaded since the last poll are pushed
+                download_size = downloader_obj.get_dl_size()
+                task_progress.add(download_size - reported_size)
+                reported_size = download_size
+            if finished:
+                break
+            if cancel is None:
+                time.sleep(_POLL_INTERVAL)
+            elif cancel.wait(_POLL_INTERVAL):
+                downloader_obj.stop()
+                if task_progress is not None:
+                    task_progress.finish()
+                raise DownloadCancelled(link)
+
+        if task_progress is not None:
+            task_progress.finish()
+        if not downloader_obj.isSuccessful():
+            errors = downloader_obj.get_errors()
+            if errors:
+                raise errors[-1]
+            raise ConnectionError(f"Download of {link} failed")
+        return Path(downloader_obj.get_dest())
 
     @staticmethod
-    def _get_final_download_size() -> int:
+    def get_file_name(link: str) -> str:
         """
-        Retrieves the total download size for all downloads
-        :return: total download size in bytes
+        Name of the file a link is saved as, the last component of its path
         """
-        global_final_download_size = 0
-        for download in global_progress_tracker:
-            global_final_download_size += download[1]
-        return global_final_download_size
+        return urllib.parse.unquote(Path(urllib.parse.urlparse(link).path).name)
 
     @staticmethod
-    def _update_global_download_speed() -> None:
+    def get_remote_file_info(
+        link: str, pool: Optional[HTTPConnectionPool] = None
+    ) -> RemoteFileInfo:
         """
-        Updates global download speed for all downloads
+        Sends a HEAD request for the link
+        :param pool: connection pool the request is sent with
+        :return: size and validators of the remote file
         """
-        global global_download_speed
-
-        download_speeds = [int(index[2]) for index in global_progress_tracker]
-        global_download_speed = int(sum(download_speeds))
+        with borrow(pool) as pool, pool.request("HEAD", link) as response:
+            return RemoteFileInfo(
+                size=int(response.headers.get("Content-Length") or 0),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
 
     @staticmethod
-    def _update_global_progress_percentage() -> None:
+    def _download_range(
+        link: str,
+        state: DownloadState,
+        start: int,
+        end: int,
+        state_lock: threading.Lock,
+        task_progress: Optional[TaskProgress],
+        limiter: Optional[BandwidthLimiter],
+        pool: HTTPConnectionPool,
+        writer: FileWriter,
+        cancel: Optional[threading.Event] = None,
+        hasher: Optional[StreamingHasher] = None,
+    ) -> None:
         """
-        Updates global progress percentage for all downloads
+        Downloads the half-open byte range [start, end) of the link into `writer`,
+        recording written bytes in the state as it goes and passing them to `hasher`. The
+        response is read straight into a buffer reused for every write of the range
         """
-        global global_progress_percentage
-
-        updated_percentage = [
-            float(index[3]) for index in global_progress_tracker
-        ]
-        updated_percentage = round(
-            float(sum(updated_percentage) / len(updated_percentage) * 100), 2
-        )
-
-        # Prevents lagging threads from updating with lower values
-        if updated_percentage > global_progress_percentage:
-            global_progress_percentage = updated_percentage
+        headers = {"Range": f"bytes={start}-{end - 1}"}
+        # Makes the server send the whole file, which we refuse, if it changed meanwhile.
+        # If-Range only accepts strong ETags
+        if state.etag and not state.etag.startswith("W/"):
+            headers["If-Range"] = state.etag
+        elif state.last_modified:
+            headers["If-Range"] = state.last_modified
+
+        buffer = memoryview(bytearray(min(writer.options.buffer_size, end - start)))
+        position = start
+        last_save = time.monotonic()
+        try:
+            with pool.request("GET", link, headers) as response:
+                if response.status != 206:
+                    raise RangeNotSupportedError(link)
+                while position < end:
+                    check_cancelled(cancel, link)
+                    wanted = min(len(buffer), end - position)
+                    filled = 0
+                    try:
+                        while filled < wanted:
+                            count = response.readinto(
+                                buffer[filled : min(wanted, filled + _CHUNK_SIZE)]
+                            )
+                            if not count:
+                                raise ConnectionError(
+                                    f"Connection closed after "
+                                    f"{position + filled - start} of {end - start} "
+                                    f"bytes of {link}"
+                                )
+                            if limiter is not None:
+                                limiter.consume(count, cancel)
+                            filled += count
+                            if task_progress is not None:
+                                task_progress.add(count)
+                    finally:
+                        # What arrived before a failure is kept
+                        writer.write_at(buffer[:filled], position)
+                        if hasher is not None:
+                            hasher.update(position, buffer[:filled])
+                        position += filled
+
+                    if time.monotonic() - last_save >= _STATE_SAVE_INTERVAL:
+                        # The data has to reach the file before the state claims it
+                        writer.checkpoint()
+                        with state_lock:
+                            state.add_range(start, position)
+                            state.save()
+                        last_save = time.monotonic()
+        finally:
+            with state_lock:
+                state.add_range(start, position)
+                state.save()
 
-    @staticmethod
-    def _create_progress_bar(size: int) -> str:
+    @classmethod
+    def _download_segment(
+        cls,
+        link: str,
+        state: DownloadState,
+        start: int,
+        end: int,
+        state_lock: threading.Lock,
+        task_progress: Optional[TaskProgress],
+        limiter: Optional[BandwidthLimiter],
+        pool: HTTPConnectionPool,
+        retry: RetryPolicy,
+        writer: FileWriter,
+        cancel: Optional[threading.Event] = None,
+        hasher: Optional[StreamingHasher] = None,
+    ) -> None:
         """
-        Creates a progress bar
-        :param size: total length of progress bar
-        :return: Progress bar as a string
+        Downloads the byte range [start, end) of the link. A failed request is retried for
+        the bytes of the range that are still missing, the bytes written before the failure
+        are kept
         """
-        global global_progress_percentage
-        number_of_bars = int(global_progress_percentage * 0.01 * size)
-        number_of_dashes = size - number_of_bars
 
-        return f"[{'#' * number_of_bars}{'-' * number_of_dashes}]"
+        def attempt() -> None:
+            with state_lock:
+                missing = state.missing_ranges(start, end)
+            for missing_start, missing_end in missing:
+                cls._download_range(
+                    link,
+                    state,
+                    missing_start,
+                    missing_end,
+                    state_lock,
+                    task_progress,
+                    limiter,
+                    pool,
+                    writer,
+                    cancel,
+                    hasher,
+                )
+
+        retry.call(
+            link,
+            attempt,
+            on_retry=lambda error: cls._retried(task_progress),
+            cancel=cancel,
+        )
 
     @staticmethod
-    def _update_global_eta() -> None:
+    def _retried(task_progress: Optional[TaskProgress]) -> None:
+        if task_progress is not None:
+            task_progress.retry()
+
+    @classmethod
+    def _download_whole_file(
+        cls,
+        link: str,
+        state: DownloadState,
+        task_progress: Optional[TaskProgress],
+        limiter: Optional[BandwidthLimiter],
+        pool: HTTPConnectionPool,
+        write_options: WriteOptions = WriteOptions(),
+        cancel: Optional[threading.Event] = None,
+        hasher: Optional[StreamingHasher] = None,
+    ) -> None:
         """
-        Updates the global eta for total download
+        Downloads the link from the first byte, for servers that don't support Range requests
         """
-        global global_eta
-
-        updated_eta = [float(index[4]) for index in global_progress_tracker]
-        updated_eta = int(sum(updated_eta) / len(updated_eta))
-
-        global_eta = updated_eta
+        state.completed = []
+        state.checksums = {}
+        if hasher is not None:
+            hasher.reset()
+        position = 0
+        with pool.request("GET", link) as response, open(
+            state.path, "wb", buffering=write_options.buffer_size
+        ) as file:
+            while True:
+                check_cancelled(cancel, link)
+                chunk = response.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if limiter is not None:
+                    limiter.consume(len(chunk), cancel)
+                file.write(chunk)
+                if hasher is not None:
+                    hasher.update(position, chunk)
+                position += len(chunk)
+                if task_progress is not None:
+                    task_progress.add(len(chunk))
+            if write_options.fsync != "none":
+                file.flush()
+                os.fsync(file.fileno())
+        state.size = state.path.stat().st_size
+        state.add_range(0, state.size)
+        state.save()
 
     @classmethod
-    def download_with_pysmartdl(
+    def download_with_resume(
         cls,
         link: str,
         download_dir: str,
-        task_id: int,
-        number_of_dates: int,
-        verbose: str = True,
-    ) -> None:
+        verbose: bool = True,
+        connections: int = 1,
+        progress: Optional[ProgressAggregator] = None,
+        limiter: Optional[BandwidthLimiter] = None,
+        pool: Optional[HTTPConnectionPool] = None,
+        retry: Optional[RetryPolicy] = None,
+        cancel: Optional[threading.Event] = None,
+        hasher: Optional[StreamingHasher] = None,
+        write_options: WriteOptions = WriteOptions(),
+    ) -> Path:
         """
-        Downloads file from link using PySmartDL
+        Downloads file from link, continuing an earlier interrupted download of it when possible.
+        The progress is kept in a sidecar state file, and only the missing byte ranges are
+        requested from the server. Files that are complete and whose size and ETag/Last-Modified
+        still match the server are skipped after a single HEAD request.
         :param link: link that needs to be downloaded
         :param download_dir: A relative path to the download directory
-        :param task_id: ID of thread
-        :verbose: Determines if download status is printed to console
+        :param verbose: Determines if download status is reported to `progress`
+        :param connections: number of connections that may be used for this file
+        :param progress: aggregator that download progress is reported to
+        :param limiter: bandwidth limiter shared with the other downloads, every read
+        waits for its budget
+        :param pool: connection pool shared with the other downloads, the HEAD request and
+        every segment reuse its kept-alive connections
+        :param retry: policy retrying failed requests, a failed segment is asked again for
+        its missing bytes only. Errors are raised right away when None
+        :param cancel: event stopping the download once set, the bytes written so far are
+        recorded in the state file and `DownloadCancelled` is raised
+        :param hasher: hashes the bytes as they are written, bytes that were already on
+        disk are left for `StreamingHasher.finish` to read
+        :param write_options: preallocation, write buffer and fsync policy of the file.
+        Every segment writes in place at its offset, the file is never assembled from
+        parts
+        :return: path of the downloaded file
         """
-        global global_progress_tracker
-        if (len(global_progress_tracker) == 1) and (number_of_dates > 1):
-            global_progress_tracker = global_progress_tracker * number_of_dates
-        downloader_obj = SmartDL(link, download_dir, progress_bar=False)
-        downloader_obj.start(blocking=False)
-
-        global global_final_download_size
-        global_final_download_size += downloader_obj.get_final_filesize()
-
-        while not downloader_obj.isFinished():
-            if verbose:
-                lock = Lock()
-                lock.acquire()
+        with borrow(pool) as pool:
+            return cls._download_with_resume(
+                link,
+                download_dir,
+                verbose,
+                connections,
+                progress,
+                limiter,
+                pool,
+                retry or NO_RETRY,
+                cancel,
+                hasher,
+                write_options,
+            )
 
-                global_progress_tracker[
-                    task_id
-                ] = cls._get_individual_download_stats(downloader_obj)
+    @classmethod
+    def _download_with_resume(
+        cls,
+        link: str,
+        download_dir: str,
+        verbose: bool,
+        connections: int,
+        progress: Optional[ProgressAggregator],
+        limiter: Optional[BandwidthLimiter],
+        pool: HTTPConnectionPool,
+        retry: RetryPolicy,
+        cancel: Optional[threading.Event],
+        hasher: Optional[StreamingHasher],
+        write_options: WriteOptions,
+    ) -> Path:
+        path = Path(download_dir) / cls.get_file_name(link)
+        remote = retry.call(
+            link, lambda: cls.get_remote_file_info(link, pool), cancel=cancel
+        )
 
-                cls._update_global_download_size()
-                cls._update_global_download_speed()
-                cls._update_global_progress_percentage()
+        state = DownloadState.open_for(
+            path, link, remote.size, remote.etag, remote.last_modified
+        )
+        state.save()
 
-                # Prevents the time output from being constantly updated
-                # to the point of being unreadable
-                if random.randint(1, 10) <= 10:
-                    cls._update_global_eta()
+        if state.is_complete and path.stat().st_size == state.size:
+            return path
 
-                progress_bar = (
-                    f"> {humanize.naturalsize(global_download_size, binary=True, format=_TWO_DECIMALS)} / "
-                    f"{humanize.naturalsize(global_final_download_size, binary=True, format=_TWO_DECIMALS)} "
-                    f"@ {humanize.naturalsize(global_download_speed, binary=True)}/s {cls._create_progress_bar(size=20)} "
-                    f"[ {global_progress_percentage:.2f}% ] "
-                    f"{humanize.precisedelta(global_eta)} left    \r"
-                ).replace("i", "", 3)
+        task_progress = None
+        if verbose and progress is not None:
+            task_progress = progress.register(
+                link, total=state.size - state.completed_bytes
+            )
 
-                sys.stdout.write(progress_bar)
+        def download_whole_file() -> None:
+            # Without Range support every retry starts over from the first byte
+            retry.call(
+                link,
+                lambda: cls._download_whole_file(
+                    link,
+                    state,
+                    task_progress,
+                    limiter,
+                    pool,
+                    write_options,
+                    cancel,
+                    hasher,
+                ),
+                on_retry=lambda error: cls._retried(task_progress),
+                cancel=cancel,
+            )
 
-                sys.stdout.flush()
-                lock.release()
-            time.sleep(0.1)
+        try:
+            if state.size == 0:
+                download_whole_file()
+                return path
+
+            state_lock = threading.Lock()
+            segments = split_ranges(state.missing_ranges(), max(1, connections))
+            try:
+                with FileWriter(path, state.size, write_options) as writer:
+                    with ThreadPoolExecutor(
+                        max_workers=max(1, connections)
+                    ) as executor:
+                        futures = [
+                            executor.submit(
+                                cls._download_segment,
+                                link,
+                                state,
+                                start,
+                                end,
+                                state_lock,
+                                task_progress,
+                                limiter,
+                                pool,
+                                retry,
+                                writer,
+                                cancel,
+                                hasher,
+                            )
+                            for start, end in segments
+                        ]
+                        for future in futures:
+                            future.result()
+            except RangeNotSupportedError:
+                download_whole_file()
+        finally:
+            if task_progress is not None:
+                task_progress.finish()
+        return path
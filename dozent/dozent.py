@@ -1,70 +1,148 @@
 import datetime
-import json
 import os
 from pathlib import Path
-from queue import Queue
-from threading import Thread
-from typing import List, Dict
+from functools import partial
+from contextlib import ExitStack
+from typing import (
+    AsyncIterator,
+    Callable,
+    List,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from humanize import naturalsize
 
 try:
-    from dozent.downloader_tools import DownloaderTools
+    from dozent.bandwidth import BandwidthLimiter
+    from dozent.catalog import TWITTER_ARCHIVE_STREAM_LINKS_PATH, Catalog, date_range_of
+    from dozent.columnar import DEFAULT_FIELDS, ingest_path
+    from dozent.dedup import SeenIds
+    from dozent.decompress import ParallelDecompressor
+    from dozent.disk_space import (
+        DEFAULT_MIN_FREE_SPACE,
+        DEFAULT_SPACE_POLICY,
+        DiskSpacePlanner,
+        remote_size,
+    )
+    from dozent.download_scheduler import (
+        DEFAULT_MAX_CONCURRENT_FILES,
+        DEFAULT_MAX_CONNECTIONS,
+        DownloadResults,
+        DownloadScheduler,
+    )
+    from dozent.engines import (
+        DEFAULT_ENGINE,
+        ExtractOnTheFlyEngine,
+        SampleEngine,
+        get_engine,
+    )
+    from dozent.engines.base import ChecksumLookup, MirrorLookup
+    from dozent.file_writer import (
+        DEFAULT_FSYNC_POLICY,
+        DEFAULT_WRITE_BUFFER_SIZE,
+        WriteOptions,
+    )
+    from dozent.http_pool import HTTPConnectionPool
+    from dozent.metrics import MetricsRecorder
+    from dozent.ordering import DEFAULT_ORDER, order_links
+    from dozent.retry import DEFAULT_MAX_RETRIES, RetryPolicy
+    from dozent.sampling import MemberSample
+    from dozent.sharding import (
+        CLAIMS_DIRECTORY,
+        DEFAULT_CLAIM_TTL,
+        WorkClaims,
+        shard_links,
+    )
+    from dozent.shutdown import graceful_shutdown
+    from dozent.stream_extract import MemberCallback
+    from dozent.sync import DEFAULT_MAX_CHECKS, SyncReport, plan_sync
+    from dozent.tar_index import index_archive
+    from dozent.tweet_stream import DEFAULT_MAX_BUFFERED_BATCHES, Predicate, TweetStream
 except ModuleNotFoundError:
-    from downloader_tools import DownloaderTools
+    from bandwidth import BandwidthLimiter
+    from catalog import TWITTER_ARCHIVE_STREAM_LINKS_PATH, Catalog, date_range_of
+    from columnar import DEFAULT_FIELDS, ingest_path
+    from dedup import SeenIds
+    from decompress import ParallelDecompressor
+    from disk_space import (
+        DEFAULT_MIN_FREE_SPACE,
+        DEFAULT_SPACE_POLICY,
+        DiskSpacePlanner,
+        remote_size,
+    )
+    from download_scheduler import (
+        DEFAULT_MAX_CONCURRENT_FILES,
+        DEFAULT_MAX_CONNECTIONS,
+        DownloadResults,
+        DownloadScheduler,
+    )
+    from engines import (
+        DEFAULT_ENGINE,
+        ExtractOnTheFlyEngine,
+        SampleEngine,
+        get_engine,
+    )
+    from engines.base import ChecksumLookup, MirrorLookup
+    from file_writer import (
+        DEFAULT_FSYNC_POLICY,
+        DEFAULT_WRITE_BUFFER_SIZE,
+        WriteOptions,
+    )
+    from http_pool import HTTPConnectionPool
+    from metrics import MetricsRecorder
+    from ordering import DEFAULT_ORDER, order_links
+    from retry import DEFAULT_MAX_RETRIES, RetryPolicy
+    from sampling import MemberSample
+    from sharding import CLAIMS_DIRECTORY, DEFAULT_CLAIM_TTL, WorkClaims, shard_links
+    from shutdown import graceful_shutdown
+    from stream_extract import MemberCallback
+    from sync import DEFAULT_MAX_CHECKS, SyncReport, plan_sync
+    from tar_index import index_archive
+    from tweet_stream import DEFAULT_MAX_BUFFERED_BATCHES, Predicate, TweetStream
 
 CURRENT_FILE_PATH = Path(__file__)
 DEFAULT_DATA_DIRECTORY = CURRENT_FILE_PATH.parent.parent / "data"
-TWITTER_ARCHIVE_STREAM_LINKS_PATH = (
-    CURRENT_FILE_PATH.parent / "twitter-archive-stream-links.json"
-)
 
-FIRST_DAY_OF_SUPPORT = datetime.date(2017, 6, 1)
+# First and last days of the bundled catalog, the monthly archives start in September 2011
+FIRST_DAY_OF_SUPPORT = datetime.date(2011, 9, 1)
 LAST_DAY_OF_SUPPORT = datetime.date(2020, 6, 30)
 
 
-class _DownloadWorker(Thread):  # skip_tests
-    def __init__(
-        self,
-        queue: Queue,
-        download_dir: Path,
-        task_id: int,
-        number_of_dates: int,
-        verbose: bool,
-    ):
-        Thread.__init__(self)
-        self.queue = queue
-        self.download_dir = download_dir
-        self.task_id = task_id
-        self.number_of_dates = number_of_dates
-        self.verbose = verbose
-
-    def run(self):
-        while True:
-            # Get the work from the queue and expand the tuple
-            link = self.queue.get()
-            try:
-                DownloaderTools.download_with_pysmartdl(
-                    link=link,
-                    download_dir=str(self.download_dir),
-                    task_id=self.task_id,
-                    number_of_dates=self.number_of_dates,
-                    verbose=self.verbose,
-                )
-            finally:
-                self.queue.task_done()
-
-
 class Dozent:
     # TODO: Move start_date and end_date as optional arguments
     __instance__ = None
 
-    def __init__(self):
+    def __init__(self, catalog: Optional[Catalog] = None):
+        """
+        :param catalog: archives to download from, defaults to the archive.org Twitter
+        stream, loaded on first use
+        """
         if Dozent.__instance__ is None:
             Dozent.__instance__ = self
-            with open(TWITTER_ARCHIVE_STREAM_LINKS_PATH) as file:
-                self.date_links: List[Dict[str, str]] = json.loads(file.read())
+            self._catalog: Optional[Catalog] = catalog
 
         else:
-            raise RuntimeError('Multiple classes detected, this class might not be thread safe')
+            raise RuntimeError(
+                "Multiple classes detected, this class might not be thread safe"
+            )
+
+    @property
+    def catalog(self) -> Catalog:
+        """
+        Catalog of the archives, loaded on first use
+        """
+        if self._catalog is None:
+            self._catalog = Catalog.load(TWITTER_ARCHIVE_STREAM_LINKS_PATH)
+        return self._catalog
+
+    @property
+    def date_links(self) -> List[Dict[str, str]]:
+        return [entry.date_link for entry in self.catalog.entries]
 
     @staticmethod
     def _make_date_from_date_link(date_link: Dict[str, str]) -> datetime.date:
@@ -74,25 +152,22 @@ class Dozent:
         :param date_link: date dictionary from `data/test_sample_files.json`. This is used to convert to the date
         :return: date object for the associated month
         """
-        day = int(date_link["day"]) if date_link["day"] != "NaN" else 1
-        month = int(date_link["month"])
-        year = int(date_link["year"])
-
-        return datetime.date(year=year, month=month, day=day)
+        return date_range_of(date_link)[0]
 
     def get_links_for_days(
         self, start_date: datetime.date, end_date: datetime.date
     ) -> List:
         """
-        Function to get the links for the given start and end days
+        Function to get the links for the given start and end days. Monthly archives are
+        included when any of their days is in the range, which has to lie within the days
+        covered by the catalog
         :return: date dictionaries that are within self.start_date and self.end_dates
         """
-        links = []
-
-        if not FIRST_DAY_OF_SUPPORT >= start_date:
-            RuntimeError(
-                f'We currently only support the range {FIRST_DAY_OF_SUPPORT.strftime("%d, %b %Y")}, '
-                f'{LAST_DAY_OF_SUPPORT.strftime("%d, %b %Y")}'
+        first_day, last_day = self.catalog.first_day, self.catalog.last_day
+        if first_day is not None and (start_date < first_day or end_date > last_day):
+            raise RuntimeError(
+                f'We currently only support the range {first_day.strftime("%d, %b %Y")}, '
+                f'{last_day.strftime("%d, %b %Y")}'
                 f"\nWe're planning on adding support for it soon."
                 f"Need that data sooner? Add an issue to out GitHub repo and we'll "
                 f"walk you through the process"
@@ -100,23 +175,181 @@ class Dozent:
                 f"Issues: https://github.com/Twitter-Public-Analysis/Twitter-Public-Analysis/issues"
             )
 
-        elif not end_date <= end_date:
-            RuntimeError(
-                f'We currently only support the range {FIRST_DAY_OF_SUPPORT.strftime("%d, %b %Y")}, '
-                f'{LAST_DAY_OF_SUPPORT.strftime("%d, %b %Y")}'
-                f"\nWe're planning on adding support for it soon."
-                f"Need that data sooner? Add an issue to out GitHub repo and we'll "
-                f"walk you through the process"
-                f"Link to our GitHub "
-                f"Issues: https://github.com/Twitter-Public-Analysis/Twitter-Public-Analysis/issues"
+        return [entry.date_link for entry in self.catalog.between(start_date, end_date)]
+
+    @staticmethod
+    def _download_links(
+        links: List[str],
+        verbose: bool,
+        download_dir: Path,
+        max_concurrent_files: int,
+        max_connections: int,
+        resume: bool,
+        engine: str,
+        extract_on_the_fly: bool = False,
+        on_member: Optional[MemberCallback] = None,
+        sample: Optional[MemberSample] = None,
+        post_download: Optional[Callable[[Path], None]] = None,
+        decompress_dir: Optional[Path] = None,
+        columnar_dir: Optional[Path] = None,
+        columnar_fields: Iterable[str] = DEFAULT_FIELDS,
+        dedup_dir: Optional[Path] = None,
+        index: bool = False,
+        max_bandwidth: Optional[str] = None,
+        bandwidth_control_file: Optional[Path] = None,
+        min_free_space: int = DEFAULT_MIN_FREE_SPACE,
+        space_policy: str = DEFAULT_SPACE_POLICY,
+        order: str = DEFAULT_ORDER,
+        size_of: Callable[..., Optional[int]] = remote_size,
+        metrics_file: Optional[Path] = None,
+        prometheus_file: Optional[Path] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        checksums: Optional[ChecksumLookup] = None,
+        mirrors: Optional[MirrorLookup] = None,
+        claim: bool = False,
+        claim_ttl: float = DEFAULT_CLAIM_TTL,
+        write_options: WriteOptions = WriteOptions(),
+        http_pool: Optional[HTTPConnectionPool] = None,
+    ) -> DownloadResults:
+        """
+        Downloads the links with a bounded pool of workers, see `download_timeframe`
+        :param size_of: expected size of the archive at a link, None when unknown. Called
+        with the engine's connection pool as `pool`
+        :param checksums: expected checksums of the archive at a link, None when unknown
+        :param mirrors: other links the archive at a link can be downloaded from
+        :param write_options: preallocation, write buffer and fsync policy of the archives
+        :param http_pool: connection pool of the engine, one owned by the engine is
+        created when None
+        """
+        os.makedirs(download_dir, exist_ok=True)
+
+        limiter = BandwidthLimiter.from_spec(max_bandwidth, bandwidth_control_file)
+        download_engine = get_engine(
+            engine,
+            resume=resume,
+            limiter=limiter,
+            retry=RetryPolicy(max_retries=max_retries),
+            checksums=checksums,
+            mirrors=mirrors,
+            write_options=write_options,
+            http_pool=http_pool,
+        )
+        if sample is not None:
+            download_engine = SampleEngine(download_engine, sample)
+
+            # Only a few members are fetched, the size of the archives tells nothing
+            def size_of(link: str, pool: Optional[HTTPConnectionPool] = None) -> None:
+                return None
+
+        elif extract_on_the_fly or on_member is not None:
+            download_engine = ExtractOnTheFlyEngine(
+                download_engine, on_member=on_member
+            )
+
+        with ExitStack() as stack:
+            stack.enter_context(download_engine)
+            claims = None
+            if claim:
+                claims = stack.enter_context(
+                    WorkClaims(Path(download_dir) / CLAIMS_DIRECTORY, ttl=claim_ttl)
+                )
+            space_planner = DiskSpacePlanner(
+                download_dir,
+                min_free_space=min_free_space,
+                size_of=partial(size_of, pool=download_engine.http_pool),
+            )
+            plan = space_planner.plan(links, policy=space_policy)
+            # Sizes were looked up by the plan, ordering by them sends no more requests
+            links = order_links(plan.links, order, space_planner.size)
+            if verbose:
+                print(
+                    f"Total download size: {naturalsize(plan.total_size, binary=True)}, "
+                    f"{naturalsize(max(0, plan.available), binary=True)} available"
+                    + (
+                        f" ({plan.unknown_sizes} archive(s) of unknown size)"
+                        if plan.unknown_sizes
+                        else ""
+                    )
+                )
+                for link in plan.dropped:
+                    print(f"Not enough space, dropping {link}")
+
+            decompressor = None
+            if decompress_dir is not None:
+                decompressor = ParallelDecompressor(decompress_dir)
+                post_download = Dozent._chain_hooks(post_download, decompressor.submit)
+
+            if index:
+                post_download = Dozent._chain_hooks(post_download, index_archive)
+
+            if columnar_dir is not None:
+                seen = None
+                if dedup_dir is not None:
+                    seen = stack.enter_context(SeenIds(dedup_dir))
+                ingest = partial(
+                    ingest_path,
+                    output_dir=columnar_dir,
+                    fields=tuple(columnar_fields),
+                    seen=seen,
+                )
+                post_download = Dozent._chain_hooks(post_download, ingest)
+
+            metrics = None
+            if metrics_file is not None or prometheus_file is not None:
+                metrics = MetricsRecorder(metrics_file, prometheus_file)
+
+            scheduler = DownloadScheduler(
+                download_dir=download_dir,
+                max_concurrent_files=max_concurrent_files,
+                max_connections=max_connections,
+                verbose=verbose,
+                download_function=download_engine.download,
+                post_download=post_download,
+                space_planner=space_planner,
+                metrics=metrics,
+                claims=claims,
             )
 
-        for date_link in self.date_links:
-            date = Dozent._make_date_from_date_link(date_link)
-            if start_date <= date <= end_date:
-                links.append(date_link)
+            def shut_down() -> None:
+                if verbose:
+                    print(
+                        "\nStopping, the progress of the running downloads is kept. "
+                        "Press Ctrl+C again to quit right away"
+                    )
+                scheduler.shutdown()
+                download_engine.cancel()
 
-        return links
+            print("")
+            try:
+                with graceful_shutdown(shut_down):
+                    results = scheduler.run(links)
+            finally:
+                if metrics is not None:
+                    metrics.close()
+                if decompressor is not None:
+                    report = decompressor.wait()
+                    if verbose:
+                        print(report.format())
+                if verbose:
+                    print(download_engine.connection_stats().format())
+        if verbose:
+            print(results.format())
+        return results
+
+    @staticmethod
+    def _chain_hooks(
+        *hooks: Optional[Callable[[Path], None]]
+    ) -> Callable[[Path], None]:
+        """
+        Combines post-download hooks into one that calls each of them in order
+        """
+
+        def chained(path: Path) -> None:
+            for hook in hooks:
+                if hook is not None:
+                    hook(path)
+
+        return chained
 
     def download_timeframe(
         self,
@@ -124,50 +357,361 @@ class Dozent:
         end_date: datetime.date,
         verbose: bool = True,
         download_dir: Path = DEFAULT_DATA_DIRECTORY,
-    ):  # skip_tests
+        max_concurrent_files: int = DEFAULT_MAX_CONCURRENT_FILES,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        resume: bool = False,
+        engine: str = DEFAULT_ENGINE,
+        extract_on_the_fly: bool = False,
+        on_member: Optional[MemberCallback] = None,
+        sample: Optional[MemberSample] = None,
+        post_download: Optional[Callable[[Path], None]] = None,
+        decompress_dir: Optional[Path] = None,
+        columnar_dir: Optional[Path] = None,
+        columnar_fields: Iterable[str] = DEFAULT_FIELDS,
+        dedup_dir: Optional[Path] = None,
+        index: bool = False,
+        fetch_metadata: bool = False,
+        max_bandwidth: Optional[str] = None,
+        bandwidth_control_file: Optional[Path] = None,
+        min_free_space: int = DEFAULT_MIN_FREE_SPACE,
+        space_policy: str = DEFAULT_SPACE_POLICY,
+        order: str = DEFAULT_ORDER,
+        metrics_file: Optional[Path] = None,
+        prometheus_file: Optional[Path] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        verify: bool = True,
+        mirrors: Sequence[str] = (),
+        shard: Optional[Tuple[int, int]] = None,
+        claim: bool = False,
+        claim_ttl: float = DEFAULT_CLAIM_TTL,
+        preallocate: bool = True,
+        write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+        fsync: str = DEFAULT_FSYNC_POLICY,
+    ) -> DownloadResults:  # skip_tests
         """
         Download all tweet archives from self.start_date to self.end_date
-        :return: None
+        :param max_concurrent_files: maximum number of archives downloaded at the same time
+        :param max_connections: maximum number of connections open across all archives
+        :param resume: continue interrupted downloads and skip complete ones instead of
+        downloading every archive from scratch
+        :param engine: name of the download engine, `pysmartdl` or `asyncio`
+        :param extract_on_the_fly: extract tar archives while they are downloaded instead of
+        storing them, the members of `<name>.tar` are written to `download_dir/<name>/`
+        :param on_member: callback receiving the name and a file object of every tar member
+        as soon as it arrives, instead of writing it to disk. Implies `extract_on_the_fly`
+        :param sample: download only these members of every tar archive, into
+        `download_dir/<name>/`. The headers of the archives are walked with small Range
+        requests, so the rest of an archive is never transferred, see `dozent.sampling`.
+        Samples aren't verified against the checksums of the whole archives
+        :param post_download: called with the path of every archive once it is downloaded
+        :param decompress_dir: when given, the compressed members of every archive are
+        decompressed into this directory by a pool of processes while the downloads go on
+        :param columnar_dir: when given, the tweets of every archive are written to a
+        columnar table at `columnar_dir/<name>/` as soon as the archive is downloaded,
+        see `dozent.columnar`
+        :param columnar_fields: fields projected into the columnar tables
+        :param dedup_dir: with `columnar_dir`, index of the tweet ids already ingested,
+        kept across runs. Tweets whose id it holds are left out of the tables, see
+        `dozent.dedup`
+        :param index: index the members of every tar archive once it is downloaded, so
+        that one of them can be read without scanning the archive, see
+        `dozent.tar_index`
+        :param fetch_metadata: fetch the size and checksum of archives missing from the
+        metadata cache, with one request per month
+        :param max_bandwidth: cap on the aggregate throughput of all downloads, a rate
+        such as `200M` or rates by time of day such as `08:00=50M,20:00=500M`
+        :param bandwidth_control_file: file holding a rate or schedule that replaces
+        `max_bandwidth` whenever it is changed, while the downloads run
+        :param min_free_space: bytes that are always left free on the output volume. New
+        archives wait until they fit next to the ones being downloaded
+        :param space_policy: what happens when the archives don't fit in the free space up
+        front: `refuse` raises `InsufficientSpaceError`, `trim` drops the last archives
+        that don't fit and `wait` downloads them as space is freed
+        :param order: order the archives are started in: `catalog`, `largest-first` to
+        start the biggest archives while there are small ones left to fill the other
+        slots, which shortens runs mixing monthly and daily archives, or `date`
+        :param metrics_file: JSON lines file the timings, throughput and status of every
+        archive are appended to as it finishes, followed by a summary of the run
+        :param prometheus_file: file for node_exporter's textfile collector, rewritten as
+        archives start and finish
+        :param max_retries: retries of a failed request, with jittered exponential backoff.
+        A failed byte range is asked again for its missing bytes only, and a host that
+        keeps failing is paused by a circuit breaker shared by every download
+        :param verify: check the archives against the MD5 and SHA-1 published by
+        archive.org, hashing them while they are written. An archive that doesn't match is
+        downloaded once more before it is reported as failed. Only archives whose checksums
+        are in the metadata cache are checked, see `fetch_metadata`
+        :param mirrors: base URLs of mirrors laid out like archive.org's download tree,
+        `<base>/<item>/<file>`. Archives are fetched from archive.org, these mirrors and
+        the `mirrors` of their catalog entry at once, in byte ranges shared out by the
+        measured speed of every source. Only used by the `asyncio` engine
+        :param shard: `(i, N)` to download the i-th of N shards of the archives, counting
+        from 0. Every node must be given the same dates
+        :param claim: share the archives with other nodes writing to the same
+        `download_dir`: every archive is claimed with a lock file before it is started,
+        so that no two nodes download it, and nodes that are done with their work take
+        over the archives of nodes that died. The run returns once every archive was
+        downloaded by some node
+        :param claim_ttl: seconds without a heartbeat after which the claims of a node are
+        taken over by the others
+        :param preallocate: reserve the final size of every archive on disk before its
+        segments are written in place
+        :param write_buffer_size: bytes gathered from a connection before they are written
+        with a single call
+        :param fsync: when written bytes are forced to disk: `none`, `checkpoint` before
+        every save of the resume state, or `end` once an archive is complete
+        :return: the archives that were downloaded, failed, skipped for lack of space, or
+        interrupted. A failing archive doesn't stop the others, and a SIGINT or SIGTERM
+        stops the run gracefully, recording the progress of the running downloads so that
+        the run can be resumed with `resume`
         """
 
-        # Create a queue to communicate with the worker threads
-        queue = Queue()
-
-        os.makedirs(download_dir, exist_ok=True)
-
-        number_of_dates = (end_date - start_date).days + 1
-
-        task_id = 0
-
-        for x in range(number_of_dates):
-            worker = _DownloadWorker(
-                queue=queue,
-                download_dir=download_dir,
-                task_id=task_id,
-                number_of_dates=number_of_dates,
-                verbose=verbose,
-            )
-            task_id += 1
-            # Setting daemon to True will let the main thread exit even though the workers are blocking
-            worker.daemon = True
-            worker.start()
-
+        links = []
         for sample_date in self.get_links_for_days(
             start_date=start_date, end_date=end_date
         ):
             print(
                 f"Queueing tweets download for {sample_date['day']}-{sample_date['month']}-{sample_date['year']}"
             )
-            queue.put(sample_date["link"])
+            links.append(sample_date["link"])
+
+        if shard is not None:
+            links = shard_links(links, *shard)
+
+        if fetch_metadata:
+            self.catalog.refresh_metadata(links)
+
+        return Dozent._download_links(
+            links,
+            verbose=verbose,
+            download_dir=download_dir,
+            max_concurrent_files=max_concurrent_files,
+            max_connections=max_connections,
+            resume=resume,
+            engine=engine,
+            extract_on_the_fly=extract_on_the_fly,
+            on_member=on_member,
+            sample=sample,
+            post_download=post_download,
+            decompress_dir=decompress_dir,
+            columnar_dir=columnar_dir,
+            columnar_fields=columnar_fields,
+            dedup_dir=dedup_dir,
+            index=index,
+            max_bandwidth=max_bandwidth,
+            bandwidth_control_file=bandwidth_control_file,
+            min_free_space=min_free_space,
+            space_policy=space_policy,
+            order=order,
+            size_of=self._archive_size,
+            metrics_file=metrics_file,
+            prometheus_file=prometheus_file,
+            max_retries=max_retries,
+            checksums=self.catalog.expected_checksums if verify else None,
+            mirrors=lambda link: self.catalog.mirrors(link, mirrors),
+            claim=claim,
+            claim_ttl=claim_ttl,
+            write_options=WriteOptions(preallocate, write_buffer_size, fsync),
+        )
+
+    def sync_timeframe(
+        self,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        verbose: bool = True,
+        download_dir: Path = DEFAULT_DATA_DIRECTORY,
+        max_concurrent_files: int = DEFAULT_MAX_CONCURRENT_FILES,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        engine: str = DEFAULT_ENGINE,
+        fetch_metadata: bool = False,
+        max_bandwidth: Optional[str] = None,
+        bandwidth_control_file: Optional[Path] = None,
+        min_free_space: int = DEFAULT_MIN_FREE_SPACE,
+        space_policy: str = DEFAULT_SPACE_POLICY,
+        order: str = DEFAULT_ORDER,
+        metrics_file: Optional[Path] = None,
+        prometheus_file: Optional[Path] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        verify: bool = True,
+        max_checks: int = DEFAULT_MAX_CHECKS,
+        index: bool = False,
+        mirrors: Sequence[str] = (),
+        shard: Optional[Tuple[int, int]] = None,
+        preallocate: bool = True,
+        write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+        fsync: str = DEFAULT_FSYNC_POLICY,
+    ) -> SyncReport:  # skip_tests
+        """
+        Brings `download_dir` up to date with the archives from start_date to end_date,
+        downloading only those that are missing, incomplete or changed upstream. Local
+        archives are checked with conditional HEAD requests, sent `max_checks` at a time
+        over the connections the downloads use afterwards, so a sync where nothing changed
+        takes a few seconds. The archives are always downloaded with resume, so that
+        their state files keep the validators the next sync sends. See
+        `download_timeframe` for the other parameters
+        :param max_checks: conditional requests sent at the same time
+        :return: the comparison of the local archives with the remote ones, and the
+        outcome of the downloads
+        """
+        links = [
+            date_link["link"]
+            for date_link in self.get_links_for_days(start_date, end_date)
+        ]
+        if shard is not None:
+            links = shard_links(links, *shard)
+        if fetch_metadata:
+            self.catalog.refresh_metadata(links)
+
+        def catalog_size(link: str) -> Optional[int]:
+            metadata = self.catalog.metadata(link)
+            return metadata.size if metadata is not None else None
+
+        with HTTPConnectionPool() as pool:
+            plan = plan_sync(
+                links, download_dir, pool, size_of=catalog_size, max_checks=max_checks
+            )
+            if verbose:
+                print(plan.format())
+            if not plan.to_download:
+                report = SyncReport(plan, DownloadResults())
+                if verbose:
+                    print(report.format())
+            else:
+                report = SyncReport(
+                    plan,
+                    Dozent._download_links(
+                        plan.to_download,
+                        verbose=verbose,
+                        download_dir=download_dir,
+                        max_concurrent_files=max_concurrent_files,
+                        max_connections=max_connections,
+                        resume=True,
+                        engine=engine,
+                        index=index,
+                        max_bandwidth=max_bandwidth,
+                        bandwidth_control_file=bandwidth_control_file,
+                        min_free_space=min_free_space,
+                        space_policy=space_policy,
+                        order=order,
+                        size_of=self._archive_size,
+                        metrics_file=metrics_file,
+                        prometheus_file=prometheus_file,
+                        max_retries=max_retries,
+                        checksums=self.catalog.expected_checksums if verify else None,
+                        mirrors=lambda link: self.catalog.mirrors(link, mirrors),
+                        write_options=WriteOptions(
+                            preallocate, write_buffer_size, fsync
+                        ),
+                        http_pool=pool,
+                    ),
+                )
+        return report
+
+    def tweet_stream(
+        self,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        fields: Optional[Sequence[str]] = None,
+        predicate: Optional[Predicate] = None,
+        max_bandwidth: Optional[str] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        max_buffered_batches: int = DEFAULT_MAX_BUFFERED_BATCHES,
+        seen: Optional[SeenIds] = None,
+    ) -> TweetStream:
+        """
+        Tweets from start_date to end_date, streamed from archive.org without writing
+        anything to disk. The archives are read one after the other while the tweets are
+        consumed, at most `max_buffered_batches` batches ahead, see `TweetStream`
+        :param fields: dotted paths such as `user.id` every tweet is projected on, into a
+        flat dictionary. Whole tweets are yielded when None
+        :param predicate: called with every whole tweet, only those it returns True for
+        are yielded
+        :param max_bandwidth: cap on the throughput, see `download_timeframe`
+        :param max_retries: retries of a failed archive, it continues where it stopped
+        :param seen: ids of the tweets already consumed, tweets with one of them are left
+        out, see `dozent.dedup`
+        :return: an iterable, and async iterable, of the tweets. `close` stops it early
+        """
+        links = [
+            date_link["link"]
+            for date_link in self.get_links_for_days(start_date, end_date)
+        ]
+        return TweetStream(
+            links,
+            fields=fields,
+            predicate=predicate,
+            retry=RetryPolicy(max_retries=max_retries),
+            limiter=BandwidthLimiter.from_spec(max_bandwidth),
+            max_buffered_batches=max_buffered_batches,
+            seen=seen,
+        )
+
+    def iter_tweets(
+        self,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        fields: Optional[Sequence[str]] = None,
+        predicate: Optional[Predicate] = None,
+        **options,
+    ) -> Iterator[dict]:
+        """
+        Iterates over the tweets from start_date to end_date without storing the archives,
+        see `tweet_stream` for the parameters
+        """
+        return iter(
+            self.tweet_stream(start_date, end_date, fields, predicate, **options)
+        )
 
-        print("")
-        queue.join()
+    def aiter_tweets(
+        self,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        fields: Optional[Sequence[str]] = None,
+        predicate: Optional[Predicate] = None,
+        **options,
+    ) -> AsyncIterator[dict]:
+        """
+        Like `iter_tweets`, for `async for`. The archives are read and parsed by a thread,
+        the event loop only waits for batches of tweets
+        """
+        return self.tweet_stream(
+            start_date, end_date, fields, predicate, **options
+        ).__aiter__()
+
+    def _archive_size(
+        self, link: str, pool: Optional[HTTPConnectionPool] = None
+    ) -> Optional[int]:
+        """
+        Size of an archive from the catalog's metadata, or from a HEAD request when it isn't
+        cached
+        """
+        metadata = self.catalog.metadata(link)
+        return metadata.size if metadata is not None else remote_size(link, pool)
 
     def download_test(
-        self, verbose: bool = True, download_dir: Path = DEFAULT_DATA_DIRECTORY
-    ):  # skip_tests
+        self,
+        verbose: bool = True,
+        download_dir: Path = DEFAULT_DATA_DIRECTORY,
+        max_concurrent_files: int = DEFAULT_MAX_CONCURRENT_FILES,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        resume: bool = False,
+        engine: str = DEFAULT_ENGINE,
+        max_bandwidth: Optional[str] = None,
+        bandwidth_control_file: Optional[Path] = None,
+        min_free_space: int = DEFAULT_MIN_FREE_SPACE,
+        space_policy: str = DEFAULT_SPACE_POLICY,
+        order: str = DEFAULT_ORDER,
+        metrics_file: Optional[Path] = None,
+        prometheus_file: Optional[Path] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        preallocate: bool = True,
+        write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+        fsync: str = DEFAULT_FSYNC_POLICY,
+    ) -> DownloadResults:  # skip_tests
         """
-        Downloads four small test files from S3 for testing purposes
+        Downloads four small test files from S3 for testing purposes. The test files
+        aren't tar archives of the catalog, so only the options of the transfer itself
+        are taken, see `download_timeframe`
         """
 
         # Stores download links for sample data
@@ -178,32 +722,24 @@ class Dozent:
             "https://dozent-tests.s3.amazonaws.com/test_650K.txt",
         ]
 
-        # Create a queue to communicate with the worker threads
-        queue = Queue()
-
-        os.makedirs(download_dir, exist_ok=True)
-
-        task_id = 0
-
-        number_of_links = len(test_download_links)
-
-        for x in range(number_of_links):
-            worker = _DownloadWorker(
-                queue=queue,
-                download_dir=download_dir,
-                task_id=task_id,
-                number_of_dates=number_of_links,
-                verbose=verbose,
-            )
-
-            task_id += 1
-            # Setting daemon to True will let the main thread exit even though the workers are blocking
-            worker.daemon = True
-            worker.start()
-
         for link in test_download_links:
             print(f"Queueing Link {link}")
-            queue.put(link)
 
-        print("")
-        queue.join()
+        return Dozent._download_links(
+            test_download_links,
+            verbose=verbose,
+            download_dir=download_dir,
+            max_concurrent_files=max_concurrent_files,
+            max_connections=max_connections,
+            resume=resume,
+            engine=engine,
+            max_bandwidth=max_bandwidth,
+            bandwidth_control_file=bandwidth_control_file,
+            min_free_space=min_free_space,
+            space_policy=space_policy,
+            order=order,
+            metrics_file=metrics_file,
+            prometheus_file=prometheus_file,
+            max_retries=max_retries,
+            write_options=WriteOptions(preallocate, write_buffer_size, fsync),
+        )
@@ -0,0 +1,43 @@
+try:
+    from dozent.engines.asyncio_engine import AsyncioEngine
+    from dozent.engines.base import DownloadEngine
+    from dozent.engines.extract_engine import ExtractOnTheFlyEngine
+    from dozent.engines.pysmartdl_engine import PySmartDLEngine
+    from dozent.engines.sample_engine import SampleEngine
+except ModuleNotFoundError:
+    from engines.asyncio_engine import AsyncioEngine
+    from engines.base import DownloadEngine
+    from engines.extract_engine import ExtractOnTheFlyEngine
+    from engines.pysmartdl_engine import PySmartDLEngine
+    from engines.sample_engine import SampleEngine
+
+DEFAULT_ENGINE = PySmartDLEngine.name
+
+ENGINES = {engine.name: engine for engine in (PySmartDLEngine, AsyncioEngine)}
+
+
+def get_engine(name: str = DEFAULT_ENGINE, **kwargs) -> DownloadEngine:
+    """
+    Creates the download engine called `name`
+    :param name: one of the keys of `ENGINES`
+    :param kwargs: arguments passed on to the engine
+    """
+    try:
+        engine_class = ENGINES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown engine {name!r}, choose one of {', '.join(sorted(ENGINES))}"
+        )
+    return engine_class(**kwargs)
+
+
+__all__ = [
+    "AsyncioEngine",
+    "DEFAULT_ENGINE",
+    "DownloadEngine",
+    "ENGINES",
+    "ExtractOnTheFlyEngine",
+    "PySmartDLEngine",
+    "SampleEngine",
+    "get_engine",
+]
@@ -0,0 +1,741 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, Optional, Set, Tuple
+
+try:
+    from dozent.bandwidth import BandwidthLimiter
+    from dozent.async_http import AsyncConnectionPool, HTTPError
+    from dozent.download_state import DownloadState
+    from dozent.downloader_tools import (
+        DownloadCancelled,
+        DownloaderTools,
+        RangeNotSupportedError,
+        split_ranges,
+    )
+    from dozent.engines.base import ChecksumLookup, DownloadEngine, MirrorLookup
+    from dozent.file_writer import FileWriter, WriteOptions
+    from dozent.http_pool import HTTPConnectionPool, PoolStats
+    from dozent.integrity import StreamingHasher
+    from dozent.progress import ProgressAggregator, TaskProgress
+    from dozent.retry import RetryPolicy, host_of, is_retryable
+except ModuleNotFoundError:
+    from bandwidth import BandwidthLimiter
+    from async_http import AsyncConnectionPool, HTTPError
+    from download_state import DownloadState
+    from downloader_tools import (
+        DownloadCancelled,
+        DownloaderTools,
+        RangeNotSupportedError,
+        split_ranges,
+    )
+    from engines.base import ChecksumLookup, DownloadEngine, MirrorLookup
+    from file_writer import FileWriter, WriteOptions
+    from http_pool import HTTPConnectionPool, PoolStats
+    from integrity import StreamingHasher
+    from progress import ProgressAggregator, TaskProgress
+    from retry import RetryPolicy, host_of, is_retryable
+
+DEFAULT_SEGMENTS_PER_FILE = 8
+
+# Size of the blocks read from the socket, they are gathered into larger writes
+_CHUNK_SIZE = 256 * 1024
+
+# How often the sidecar state of a resumable download is written to disk, in seconds
+_STATE_SAVE_INTERVAL = 1.0
+
+# Segments in flight are only split for an idle connection when both halves are at least
+# this large
+_MIN_STEAL_SIZE = _CHUNK_SIZE
+
+# Weight of the last segment in the measured throughput of a source
+_RATE_SMOOTHING = 0.5
+
+# Seconds a segment has to run before its own throughput is trusted over its source's
+_MIN_RATE_WINDOW = 0.5
+
+
+async def _run_all(coroutines) -> None:
+    """
+    Runs the coroutines concurrently. When one of them fails the others are cancelled and
+    the exception is raised
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in done:
+        task.result()
+
+
+def _current_task() -> "asyncio.Task":
+    # asyncio.current_task was added in Python 3.7, Task.current_task removed in 3.9
+    if hasattr(asyncio, "current_task"):
+        return asyncio.current_task()
+    return asyncio.Task.current_task()
+
+
+class _Source:
+    """
+    A server a file is downloaded from, with the validators of its copy and the measured
+    throughput of a single connection to it
+    """
+
+    def __init__(
+        self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        # Bytes per second of one connection, None until a segment was measured
+        self.rate: Optional[float] = None
+        self.connections = 0
+        self.bytes = 0
+        # Consecutive failures, the source isn't used before `retry_at` after one
+        self.failures = 0
+        self.retry_at = 0.0
+        # Set once the source is dropped
+        self.error: Optional[BaseException] = None
+
+    @property
+    def active(self) -> bool:
+        return self.error is None
+
+    def if_range(self) -> Optional[str]:
+        # If-Range only accepts strong ETags
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    def observe(self, size: int, seconds: float) -> None:
+        if seconds <= 0 or size <= 0:
+            return
+        sample = size / seconds
+        self.rate = (
+            sample
+            if self.rate is None
+            else self.rate + _RATE_SMOOTHING * (sample - self.rate)
+        )
+
+
+class _Segment:
+    """
+    A byte range being downloaded. Its end moves back when an idle connection takes over
+    the second half of what is left
+    """
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.position = start
+        self.end = end
+        self.source: Optional[_Source] = None
+        self.started = 0.0
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.position
+
+    def rate(self, now: float) -> Optional[float]:
+        """
+        Bytes per second received so far, or those of the source for a segment that just
+        started
+        """
+        elapsed = now - self.started
+        if elapsed < _MIN_RATE_WINDOW:
+            return self.source.rate if self.source is not None else None
+        return (self.position - self.start) / elapsed
+
+
+class _FileTransfer:
+    """
+    State of a single file being downloaded by the `AsyncioEngine`
+    """
+
+    def __init__(
+        self,
+        url: str,
+        state: DownloadState,
+        persist_state: bool,
+        task_progress: Optional[TaskProgress],
+        hasher: Optional[StreamingHasher] = None,
+    ):
+        self.url = url
+        self.state = state
+        self.persist_state = persist_state
+        self.task_progress = task_progress
+        self.hasher = hasher
+        self.writer: Optional[FileWriter] = None
+        self._last_save = time.monotonic()
+        self.primary = _Source(url, state.etag, state.last_modified)
+
+    def retried(self, error: BaseException) -> None:
+        if self.task_progress is not None:
+            self.task_progress.retry()
+
+    def record(self, start: int, end: int, force: bool = False) -> None:
+        """
+        Marks [start, end) as written, saving the state when it is persisted and due
+        """
+        self.state.add_range(start, end)
+        if not self.persist_state:
+            return
+        now = time.monotonic()
+        if force or now - self._last_save >= _STATE_SAVE_INTERVAL:
+            if self.writer is not None:
+                self.writer.checkpoint()
+            self.state.save()
+            self._last_save = now
+
+
+class AsyncioEngine(DownloadEngine):
+    """
+    Downloads files with a native asyncio HTTP client. Every file is split into byte range
+    segments that are fetched over a few keep-alive connections and written directly at
+    their offset. All segments of all files run on a single event loop thread. Files with
+    mirrors are fetched from all of them at once, see `_download_from_sources`
+    """
+
+    name = "asyncio"
+
+    def __init__(
+        self,
+        resume: bool = False,
+        segments_per_file: int = DEFAULT_SEGMENTS_PER_FILE,
+        limiter: Optional[BandwidthLimiter] = None,
+        http_pool: Optional[HTTPConnectionPool] = None,
+        retry: Optional[RetryPolicy] = None,
+        checksums: Optional[ChecksumLookup] = None,
+        mirrors: Optional[MirrorLookup] = None,
+        write_options: WriteOptions = WriteOptions(),
+    ):
+        """
+        :param resume: continue interrupted downloads and skip complete ones
+        :param segments_per_file: number of byte range segments each file is split into,
+        per source when it has mirrors
+        :param limiter: bandwidth limiter shared by every segment of every file
+        :param http_pool: pool for blocking requests made outside the event loop, the
+        downloads themselves use the engine's `AsyncConnectionPool`
+        :param retry: policy retrying failed requests, a failed segment is asked again for
+        its missing bytes only
+        :param checksums: expected checksums of the file at a link, the bytes are hashed as
+        the segments write them
+        :param mirrors: other links the file at a link can be downloaded from at the same
+        time
+        :param write_options: preallocation, write buffer and fsync policy of the files
+        """
+        DownloadEngine.__init__(
+            self,
+            resume=resume,
+            limiter=limiter,
+            http_pool=http_pool,
+            retry=retry,
+            checksums=checksums,
+            mirrors=mirrors,
+            write_options=write_options,
+        )
+        self.segments_per_file = max(1, segments_per_file)
+        self.pool: Optional[AsyncConnectionPool] = None
+        self._closed_pool_stats = PoolStats()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Downloads running on the event loop, only touched from the loop's thread
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="dozent-asyncio-engine"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+            return self._loop
+
+    def _download(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool,
+        connections: int,
+        progress: Optional[ProgressAggregator],
+        hasher: Optional[StreamingHasher],
+    ) -> Path:
+        future = asyncio.run_coroutine_threadsafe(
+            self._cancellable(
+                link,
+                self.download_async(
+                    link, download_dir, verbose, connections, progress, hasher
+                ),
+            ),
+            self._get_loop(),
+        )
+        return future.result()
+
+    async def _cancellable(self, link: str, coroutine) -> Path:
+        """
+        Runs a download as a task that `cancel` can stop
+        """
+        if self.cancelled.is_set():
+            coroutine.close()
+            raise DownloadCancelled(link)
+        task = _current_task()
+        self._tasks.add(task)
+        try:
+            return await coroutine
+        except asyncio.CancelledError:
+            if self.cancelled.is_set():
+                raise DownloadCancelled(link)
+            raise
+        finally:
+            self._tasks.discard(task)
+
+    def _cancel_tasks(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    def cancel(self) -> None:
+        """
+        Cancels the tasks of the running downloads, which record the bytes they wrote as
+        they unwind
+        """
+        DownloadEngine.cancel(self)
+        with self._lock:
+            loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._cancel_tasks)
+
+    async def download_async(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool = True,
+        connections: int = 1,
+        progress: Optional[ProgressAggregator] = None,
+        hasher: Optional[StreamingHasher] = None,
+    ) -> Path:
+        """
+        Coroutine doing the work of `download`, has to run on the engine's event loop
+        :param hasher: hashes the bytes as they are written
+        """
+        if self.pool is None:
+            self.pool = AsyncConnectionPool()
+
+        path = Path(download_dir) / DownloaderTools.get_file_name(link)
+
+        response = await self.retry.call_async(link, lambda: self._head(link))
+        url = response.url
+        size = response.content_length or 0
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+
+        if self.resume:
+            state = DownloadState.open_for(path, link, size, etag, last_modified)
+            if state.is_complete and path.stat().st_size == state.size:
+                return path
+            state.save()
+        else:
+            state = DownloadState(path, link, size, etag, last_modified)
+            with open(path, "wb") as file:
+                file.truncate(size)
+
+        task_progress = None
+        if verbose and progress is not None:
+            task_progress = progress.register(
+                link, total=state.size - state.completed_bytes
+            )
+
+        transfer = _FileTransfer(url, state, self.resume, task_progress, hasher)
+        try:
+            if size == 0:
+                await self._retry_whole_file(transfer)
+                return path
+
+            mirrors = await self._probe_mirrors(link, size)
+            sources = [transfer.primary] + mirrors
+            segments = deque(
+                split_ranges(
+                    state.missing_ranges(), self.segments_per_file * len(sources)
+                )
+            )
+            transfer.writer = FileWriter(path, size, self.write_options)
+            try:
+                if mirrors:
+                    await self._download_from_sources(
+                        transfer, sources, segments, connections
+                    )
+                else:
+                    sockets = max(1, min(connections, len(segments)))
+                    await _run_all(
+                        self._segment_worker(transfer, segments) for _ in range(sockets)
+                    )
+            except RangeNotSupportedError:
+                transfer.writer.close(complete=False)
+                transfer.writer = None
+                await self._retry_whole_file(transfer)
+            else:
+                transfer.writer.close()
+        finally:
+            if transfer.writer is not None:
+                transfer.writer.close(complete=False)
+            if self.resume:
+                state.save()
+            if task_progress is not None:
+                task_progress.finish()
+        return path
+
+    async def _head(self, link: str):
+        response = await self.pool.request("HEAD", link)
+        self.pool.release(response.connection)
+        if response.status >= 400:
+            raise HTTPError(response.status, link)
+        return response
+
+    async def _probe_mirrors(self, link: str, size: int) -> List[_Source]:
+        """
+        Asks every mirror of `link` for its copy of the file at once
+        :return: the mirrors serving a file of `size` bytes, mirrors that fail or serve
+        another size are left out
+        """
+        if self.mirrors is None or not size:
+            return []
+        links = [mirror for mirror in self.mirrors(link) if mirror != link]
+
+        async def probe(mirror: str) -> Optional[_Source]:
+            try:
+                response = await self._head(mirror)
+            except Exception:
+                # A mirror that can't be asked is left out, the others are enough
+                return None
+            if response.content_length != size:
+                return None
+            return _Source(
+                response.url,
+                response.headers.get("etag"),
+                response.headers.get("last-modified"),
+            )
+
+        probed = await asyncio.gather(*(probe(mirror) for mirror in links))
+        return [source for source in probed if source is not None]
+
+    async def _download_from_sources(
+        self,
+        transfer: _FileTransfer,
+        sources: List[_Source],
+        segments: Deque[Tuple[int, int]],
+        connections: int,
+    ) -> None:
+        """
+        Downloads the segments from every source at once, with at least one connection
+        per source. Each segment goes to the source where one more connection adds the
+        most measured throughput, so slow sources end up with fewer connections. A
+        failing source is backed off from and dropped after `max_retries` failures in a
+        row, its segment going back to the queue. Once the queue is empty, idle
+        connections take over the second half of the segments in flight that would
+        finish last, so a slow source can't hold up the end of the file
+        :raises RangeNotSupportedError: when no source serves byte ranges
+        """
+        in_flight: Set[_Segment] = set()
+        workers = max(connections, len(sources))
+        await _run_all(
+            self._source_worker(transfer, sources, segments, in_flight)
+            for _ in range(workers)
+        )
+
+        if not transfer.state.missing_ranges():
+            return
+        errors = [source.error for source in sources if source.error is not None]
+        if errors and all(
+            isinstance(error, RangeNotSupportedError) for error in errors
+        ):
+            raise RangeNotSupportedError(transfer.url)
+        raise transfer.primary.error or errors[-1]
+
+    async def _source_worker(
+        self,
+        transfer: _FileTransfer,
+        sources: List[_Source],
+        segments: Deque[Tuple[int, int]],
+        in_flight: Set[_Segment],
+    ) -> None:
+        """
+        Downloads segments from the best source for each, until there is nothing left to
+        download or no source left to download from
+        """
+        while True:
+            now = time.monotonic()
+            active = [source for source in sources if source.active]
+            if not active:
+                return
+            ready = [source for source in active if source.retry_at <= now]
+            if not ready:
+                await asyncio.sleep(min(source.retry_at for source in active) - now)
+                continue
+            if segments:
+                # Sources that weren't measured yet are tried first
+                source = min(
+                    ready,
+                    key=lambda source: (
+                        source.rate is not None,
+                        (source.connections + 1) / (source.rate or 1.0),
+                    ),
+                )
+                segment = _Segment(*segments.popleft())
+            else:
+                source = max(ready, key=lambda source: source.rate or 0.0)
+                segment = self._take_over(in_flight, source, now)
+                if segment is None:
+                    return
+
+            source.connections += 1
+            in_flight.add(segment)
+            started = time.monotonic()
+            try:
+                await self._download_segment(transfer, segment, source)
+            except Exception as error:
+                if segment.remaining > 0:
+                    segments.appendleft((segment.position, segment.end))
+                self._source_failed(transfer, source, error)
+                continue
+            finally:
+                source.connections -= 1
+                in_flight.discard(segment)
+            source.observe(segment.position - segment.start, time.monotonic() - started)
+            source.failures = 0
+            self.retry.breaker(host_of(source.url)).record_success()
+
+    @staticmethod
+    def _take_over(
+        in_flight: Set[_Segment], source: _Source, now: float
+    ) -> Optional[_Segment]:
+        """
+        Takes over the second half of the segment in flight that would finish last, when
+        `source` can fetch it sooner than the connection holding it
+        :return: the second half, None when there is nothing worth taking over
+        """
+        candidates = [
+            segment for segment in in_flight if segment.remaining >= 2 * _MIN_STEAL_SIZE
+        ]
+        if not candidates:
+            return None
+        victim = max(
+            candidates,
+            key=lambda segment: segment.remaining / max(segment.rate(now) or 0.0, 1.0),
+        )
+        # Halving the segment only helps when the new half arrives before the old one
+        victim_rate = victim.rate(now)
+        if (
+            source.rate is not None
+            and victim_rate is not None
+            and source.rate <= victim_rate / 2
+        ):
+            return None
+        middle = victim.position + victim.remaining // 2
+        stolen = _Segment(middle, victim.end)
+        victim.end = middle
+        return stolen
+
+    def _source_failed(
+        self, transfer: _FileTransfer, source: _Source, error: Exception
+    ) -> None:
+        """
+        Backs off from a source after a failure, or drops it when it failed too often or
+        can't serve the file
+        """
+        if isinstance(error, RangeNotSupportedError) or not is_retryable(error):
+            source.error = error
+            return
+        self.retry.breaker(host_of(source.url)).record_failure()
+        source.failures += 1
+        if source.failures > self.retry.max_retries:
+            source.error = error
+            return
+        transfer.retried(error)
+        source.retry_at = time.monotonic() + self.retry.backoff(source.failures - 1)
+
+    async def _segment_worker(
+        self, transfer: _FileTransfer, segments: Deque[Tuple[int, int]]
+    ) -> None:
+        """
+        Downloads segments one after the other until none are left, reusing its connection
+        """
+        while segments:
+            start, end = segments.popleft()
+            await self.retry.call_async(
+                transfer.url,
+                lambda: self._download_missing(transfer, start, end),
+                on_retry=transfer.retried,
+            )
+
+    async def _download_missing(
+        self, transfer: _FileTransfer, start: int, end: int
+    ) -> None:
+        """
+        Downloads the bytes of [start, end) that aren't written yet, so that a retried
+        segment keeps what it received before it failed
+        """
+        for missing_start, missing_end in transfer.state.missing_ranges(start, end):
+            await self._download_segment(
+                transfer, _Segment(missing_start, missing_end), transfer.primary
+            )
+
+    async def _download_segment(
+        self, transfer: _FileTransfer, segment: _Segment, source: _Source
+    ) -> None:
+        """
+        Downloads the byte range of `segment` from `source` and writes it at its offset.
+        When the end of the segment moves back while it downloads, the connection is
+        closed once it gets there
+        """
+        start, requested_end = segment.position, segment.end
+        headers = {"Range": f"bytes={start}-{requested_end - 1}"}
+        if_range = source.if_range()
+        if if_range:
+            headers["If-Range"] = if_range
+
+        segment.source = source
+        segment.started = time.monotonic()
+        response = await self.pool.request("GET", source.url, headers)
+        # Bytes are gathered into a buffer reused for every write of the segment, the
+        # bytes before `written` are on disk
+        buffer = memoryview(
+            bytearray(min(self.write_options.buffer_size, requested_end - start))
+        )
+        filled = 0
+        written = position = start
+
+        def flush() -> None:
+            nonlocal filled, written
+            count, filled = filled, 0
+            if count:
+                transfer.writer.write_at(buffer[:count], written)
+                if transfer.hasher is not None:
+                    transfer.hasher.update(written, buffer[:count])
+                written += count
+                transfer.record(start, written)
+
+        try:
+            if response.status == 200:
+                raise RangeNotSupportedError(source.url)
+            if response.status != 206:
+                raise HTTPError(response.status, source.url)
+
+            while position < segment.end:
+                data = await response.read(min(_CHUNK_SIZE, segment.end - position))
+                if position + len(data) > segment.end:
+                    # The rest was taken over by another connection while reading
+                    data = data[: segment.end - position]
+                if self.limiter is not None:
+                    await self.limiter.consume_async(len(data))
+                if filled + len(data) > len(buffer):
+                    flush()
+                if len(data) > len(buffer):
+                    transfer.writer.write_at(data, written)
+                    if transfer.hasher is not None:
+                        transfer.hasher.update(written, data)
+                    written += len(data)
+                else:
+                    buffer[filled : filled + len(data)] = data
+                    filled += len(data)
+                position += len(data)
+                segment.position = position
+                source.bytes += len(data)
+                if transfer.task_progress is not None:
+                    transfer.task_progress.add(len(data))
+                if filled == len(buffer):
+                    flush()
+        except BaseException:
+            response.connection.close()
+            raise
+        finally:
+            try:
+                flush()
+            finally:
+                # A retry or another source asks again for what didn't reach the file
+                segment.position = written
+                transfer.record(start, written, force=True)
+
+        if segment.end < requested_end:
+            # Draining would download the bytes another connection is fetching
+            response.connection.close()
+            return
+        await response.drain()
+        self.pool.release(response.connection)
+
+    async def _retry_whole_file(self, transfer: _FileTransfer) -> None:
+        """
+        Downloads the file from the first byte, starting over on every retry
+        """
+        await self.retry.call_async(
+            transfer.url,
+            lambda: self._download_whole_file(transfer),
+            on_retry=transfer.retried,
+        )
+
+    async def _download_whole_file(self, transfer: _FileTransfer) -> None:
+        """
+        Downloads the file from the first byte, for servers that don't support Range requests
+        """
+        state = transfer.state
+        state.completed = []
+        state.checksums = {}
+        if transfer.hasher is not None:
+            transfer.hasher.reset()
+        response = await self.pool.request("GET", transfer.url)
+        try:
+            if response.status != 200:
+                raise HTTPError(response.status, transfer.url)
+            position = 0
+            with open(
+                state.path, "wb", buffering=self.write_options.buffer_size
+            ) as file:
+                while True:
+                    data = await response.read(_CHUNK_SIZE)
+                    if not data:
+                        break
+                    if self.limiter is not None:
+                        await self.limiter.consume_async(len(data))
+                    file.write(data)
+                    if transfer.hasher is not None:
+                        transfer.hasher.update(position, data)
+                    position += len(data)
+                    if transfer.task_progress is not None:
+                        transfer.task_progress.add(len(data))
+                if self.write_options.fsync != "none":
+                    file.flush()
+                    os.fsync(file.fileno())
+        except BaseException:
+            response.connection.close()
+            raise
+
+        self.pool.release(response.connection)
+        state.size = position
+        transfer.record(0, position, force=True)
+
+    def connection_stats(self) -> PoolStats:
+        pool = self.pool
+        async_stats = pool.stats() if pool is not None else self._closed_pool_stats
+        return DownloadEngine.connection_stats(self) + async_stats
+
+    def close(self) -> None:
+        DownloadEngine.close(self)
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        if self.pool is not None:
+            loop.call_soon_threadsafe(self.pool.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        if self.pool is not None:
+            self._closed_pool_stats = self.pool.stats()
+        self.pool = None
@@ -0,0 +1,189 @@
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+try:
+    from dozent.bandwidth import BandwidthLimiter
+    from dozent.download_state import DownloadState
+    from dozent.file_writer import WriteOptions, check_write_options
+    from dozent.http_pool import HTTPConnectionPool, PoolStats
+    from dozent.integrity import (
+        Checksums,
+        ChecksumMismatchError,
+        StreamingHasher,
+        check,
+    )
+    from dozent.progress import ProgressAggregator
+    from dozent.retry import RetryPolicy
+except ModuleNotFoundError:
+    from bandwidth import BandwidthLimiter
+    from download_state import DownloadState
+    from file_writer import WriteOptions, check_write_options
+    from http_pool import HTTPConnectionPool, PoolStats
+    from integrity import Checksums, ChecksumMismatchError, StreamingHasher, check
+    from progress import ProgressAggregator
+    from retry import RetryPolicy
+
+# Expected checksums of the file at a link, None when they aren't known
+ChecksumLookup = Callable[[str], Optional[Checksums]]
+
+# Other links serving the same file as a link, e.g. mirrors of archive.org
+MirrorLookup = Callable[[str], Sequence[str]]
+
+
+class DownloadEngine:
+    """
+    Transfers single files. The scheduler decides which files are downloaded and how many
+    connections each of them may use, the engine decides how the bytes are fetched.
+    Subclasses implement `_download`
+    """
+
+    name = ""
+
+    def __init__(
+        self,
+        resume: bool = False,
+        limiter: Optional[BandwidthLimiter] = None,
+        http_pool: Optional[HTTPConnectionPool] = None,
+        retry: Optional[RetryPolicy] = None,
+        checksums: Optional[ChecksumLookup] = None,
+        mirrors: Optional[MirrorLookup] = None,
+        write_options: WriteOptions = WriteOptions(),
+    ):
+        """
+        :param resume: continue interrupted downloads and skip complete ones
+        :param limiter: bandwidth limiter shared by every download of the engine
+        :param http_pool: keep-alive connections shared by the blocking requests of every
+        download, a pool owned by the engine is created when none is given
+        :param retry: policy retrying failed requests, with circuit breakers shared by
+        every download of the engine. The default policy is used when None
+        :param checksums: expected checksums of the file at a link. Files whose checksums
+        are known are hashed while they are written and checked once complete
+        :param mirrors: other links the file at a link can be downloaded from, used by
+        engines that fetch byte ranges from several sources at once. The link itself
+        stays the primary source
+        :param write_options: preallocation, write buffer and fsync policy of the files
+        the engine writes itself
+        :raises ValueError: when the write options are invalid
+        """
+        self.resume = resume
+        self.limiter = limiter
+        self._owns_http_pool = http_pool is None
+        self.http_pool = http_pool if http_pool is not None else HTTPConnectionPool()
+        self.retry = retry if retry is not None else RetryPolicy()
+        # Set by `cancel`, running downloads stop at their next read
+        self.cancelled = threading.Event()
+        self.checksums = checksums
+        self.mirrors = mirrors
+        self.write_options = check_write_options(write_options)
+
+    def download(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool = True,
+        connections: int = 1,
+        progress: Optional[ProgressAggregator] = None,
+    ) -> Path:
+        """
+        Downloads file from link into `download_dir`
+        :param link: link that needs to be downloaded
+        :param download_dir: A relative path to the download directory
+        :param verbose: Determines if download status is reported to `progress`
+        :param connections: number of connections that may be used for this file
+        :param progress: aggregator that download progress is reported to
+        :return: path of the downloaded file, or of the directory it was extracted to
+        :raises ChecksumMismatchError: when the file still doesn't match its expected
+        checksums after it was downloaded again
+        """
+        expected = self.checksums(link) if self.checksums is not None else None
+        if expected is None or not expected.algorithms:
+            return self._download(
+                link, download_dir, verbose, connections, progress, None
+            )
+
+        for attempt in range(2):
+            hasher = StreamingHasher(expected.algorithms)
+            path = self._download(
+                link, download_dir, verbose, connections, progress, hasher
+            )
+            try:
+                self._verify(path, expected, hasher)
+                return path
+            except ChecksumMismatchError:
+                if attempt:
+                    raise
+                # The corrupt bytes can be anywhere, the file is fetched again from scratch
+                self._discard(path)
+
+    def _download(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool,
+        connections: int,
+        progress: Optional[ProgressAggregator],
+        hasher: Optional[StreamingHasher],
+    ) -> Path:
+        """
+        Does the work of `download`, passing every byte written to `hasher` when given
+        """
+        raise NotImplementedError
+
+    def _verify(self, path: Path, expected: Checksums, hasher: StreamingHasher) -> None:
+        """
+        Checks a downloaded file, hashing the bytes `hasher` didn't see, e.g. those of an
+        earlier run. When resuming, the digests are kept in the state file, so that a
+        complete file isn't hashed again by the next run
+        """
+        state = DownloadState.load(path) if self.resume else None
+        if (
+            hasher.position == 0
+            and state is not None
+            and state.is_complete
+            and all(name in state.checksums for name in expected.algorithms)
+        ):
+            check(path, expected, state.checksums)
+            return
+
+        digests = hasher.finish(path)
+        check(path, expected, digests)
+        if state is not None:
+            state.checksums = digests
+            state.save()
+
+    @staticmethod
+    def _discard(path: Path) -> None:
+        for discarded in (path, DownloadState.state_path_for(path)):
+            try:
+                os.remove(discarded)
+            except FileNotFoundError:
+                pass
+
+    def cancel(self) -> None:
+        """
+        Stops every running download of the engine, for a graceful shutdown. The bytes they
+        wrote are recorded in their state files, so that the run can be resumed, and they
+        raise `DownloadCancelled`
+        """
+        self.cancelled.set()
+
+    def connection_stats(self) -> PoolStats:
+        """
+        How many connections were opened and reused by the engine so far
+        """
+        return self.http_pool.stats()
+
+    def close(self) -> None:
+        """
+        Releases the resources held by the engine once the run is over
+        """
+        if self._owns_http_pool:
+            self.http_pool.close()
+
+    def __enter__(self) -> "DownloadEngine":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,228 @@
+import shutil
+import threading
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+
+try:
+    from dozent.bandwidth import ThrottledReader
+    from dozent.downloader_tools import DownloaderTools, check_cancelled
+    from dozent.engines.base import DownloadEngine
+    from dozent.http_pool import LengthCheckedReader, PoolStats
+    from dozent.integrity import ChecksumMismatchError, StreamingHasher, check
+    from dozent.progress import ProgressAggregator, TaskProgress
+    from dozent.stream_extract import MemberCallback, extract_tar_stream
+except ModuleNotFoundError:
+    from bandwidth import ThrottledReader
+    from downloader_tools import DownloaderTools, check_cancelled
+    from engines.base import DownloadEngine
+    from http_pool import LengthCheckedReader, PoolStats
+    from integrity import ChecksumMismatchError, StreamingHasher, check
+    from progress import ProgressAggregator, TaskProgress
+    from stream_extract import MemberCallback, extract_tar_stream
+
+_STREAMABLE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2")
+
+_DRAIN_SIZE = 256 * 1024
+
+
+class _CancellableReader:
+    """
+    Wraps a binary stream, raising `DownloadCancelled` on the first read after `cancel`
+    is set
+    """
+
+    def __init__(self, stream: BinaryIO, cancel: threading.Event, link: str):
+        self.stream = stream
+        self.cancel = cancel
+        self.link = link
+
+    def read(self, size: int = -1) -> bytes:
+        check_cancelled(self.cancel, self.link)
+        return self.stream.read(size)
+
+
+class _HashingReader:
+    """
+    Wraps a binary stream, passing every byte read to a `StreamingHasher` and a
+    `TaskProgress`. The first `seen` bytes were already passed on by an interrupted
+    attempt and are only read again
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        hasher: Optional[StreamingHasher],
+        task_progress: Optional[TaskProgress],
+        seen: int = 0,
+    ):
+        self.stream = stream
+        self.hasher = hasher
+        self.task_progress = task_progress
+        self.seen = seen
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        start = self.position
+        self.position += len(data)
+        if self.position > self.seen:
+            new = data[max(self.seen - start, 0) :]
+            if self.hasher is not None:
+                self.hasher.update(max(start, self.seen), new)
+            if self.task_progress is not None:
+                self.task_progress.add(len(new))
+            self.seen = self.position
+        return data
+
+
+class ExtractOnTheFlyEngine(DownloadEngine):
+    """
+    Extracts tar archives while they are downloaded, so the raw archive never lands on disk.
+    The members of `<download_dir>/<name>.tar` end up in `<download_dir>/<name>/`, or are
+    handed to `on_member`. Links that can't be streamed, such as the zip archives whose
+    index sits at the end of the file, are downloaded by `fallback` instead. Archives are
+    hashed as they stream by, one that doesn't match its checksums is extracted again
+    into `<name>/`, while `on_member` consumers get a `ChecksumMismatchError`
+    """
+
+    name = "extract"
+
+    def __init__(
+        self,
+        fallback: DownloadEngine,
+        on_member: Optional[MemberCallback] = None,
+    ):
+        """
+        :param fallback: engine downloading the links that can't be streamed
+        :param on_member: callback receiving the name and content of each member instead of
+        writing it to disk
+        """
+        DownloadEngine.__init__(
+            self,
+            resume=fallback.resume,
+            limiter=fallback.limiter,
+            http_pool=fallback.http_pool,
+            retry=fallback.retry,
+            write_options=fallback.write_options,
+            checksums=fallback.checksums,
+        )
+        self.fallback = fallback
+        self.on_member = on_member
+        self.cancelled = fallback.cancelled
+
+    @staticmethod
+    def is_streamable(link: str) -> bool:
+        return DownloaderTools.get_file_name(link).endswith(_STREAMABLE_SUFFIXES)
+
+    @staticmethod
+    def get_output_dir(link: str, download_dir: str) -> Path:
+        """
+        Directory the members of the archive at `link` are extracted to
+        """
+        name = DownloaderTools.get_file_name(link)
+        for suffix in _STREAMABLE_SUFFIXES:
+            if name.endswith(suffix):
+                name = name[: -len(suffix)]
+                break
+        return Path(download_dir) / name
+
+    def download(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool = True,
+        connections: int = 1,
+        progress: Optional[ProgressAggregator] = None,
+    ) -> Path:
+        if not self.is_streamable(link):
+            return self.fallback.download(
+                link, download_dir, verbose, connections, progress
+            )
+
+        expected = self.checksums(link) if self.checksums is not None else None
+        if expected is None or not expected.algorithms:
+            return self._stream(link, download_dir, verbose, progress, None)
+
+        for attempt in range(2):
+            hasher = StreamingHasher(expected.algorithms)
+            output_dir = self._stream(link, download_dir, verbose, progress, hasher)
+            try:
+                check(output_dir, expected, hasher.hexdigests())
+                return output_dir
+            except ChecksumMismatchError:
+                if attempt or self.on_member is not None:
+                    raise
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+    def _stream(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool,
+        progress: Optional[ProgressAggregator],
+        hasher: Optional[StreamingHasher],
+    ) -> Path:
+        """
+        Extracts the archive at `link` while it is downloaded. A dropped connection is
+        retried, passing over the members that were extracted already
+        """
+        output_dir = self.get_output_dir(link, download_dir)
+        task_progress = None
+        if verbose and progress is not None:
+            task_progress = progress.register(link)
+        extracted: List[str] = []
+        # Bytes hashed and counted so far, a retry reads them again without passing them on
+        seen = 0
+
+        def attempt() -> None:
+            nonlocal seen
+            with self.http_pool.request("GET", link) as response:
+                if task_progress is not None:
+                    task_progress.set_total(
+                        int(response.headers.get("Content-Length") or 0)
+                    )
+                reader = _HashingReader(
+                    ThrottledReader(
+                        _CancellableReader(
+                            LengthCheckedReader(response), self.cancelled, link
+                        ),
+                        self.limiter,
+                        self.cancelled,
+                    ),
+                    hasher,
+                    task_progress,
+                    seen,
+                )
+                try:
+                    extract_tar_stream(
+                        reader,
+                        output_dir=output_dir,
+                        on_member=self.on_member,
+                        extracted=extracted,
+                    )
+                    if hasher is not None:
+                        # The padding after the end of the archive is part of its checksum
+                        while reader.read(_DRAIN_SIZE):
+                            pass
+                finally:
+                    seen = reader.seen
+
+        def on_retry(error: BaseException) -> None:
+            if task_progress is not None:
+                task_progress.retry()
+
+        try:
+            self.retry.call(link, attempt, on_retry=on_retry, cancel=self.cancelled)
+        finally:
+            if task_progress is not None:
+                task_progress.finish()
+        return output_dir
+
+    def connection_stats(self) -> PoolStats:
+        return self.fallback.connection_stats()
+
+    def cancel(self) -> None:
+        self.fallback.cancel()
+
+    def close(self) -> None:
+        self.fallback.close()
@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import Optional
+
+try:
+    from dozent.downloader_tools import DownloaderTools
+    from dozent.engines.base import DownloadEngine
+    from dozent.file_writer import WriteOptions
+    from dozent.integrity import StreamingHasher
+    from dozent.progress import ProgressAggregator
+except ModuleNotFoundError:
+    from downloader_tools import DownloaderTools
+    from engines.base import DownloadEngine
+    from file_writer import WriteOptions
+    from integrity import StreamingHasher
+    from progress import ProgressAggregator
+
+
+class PySmartDLEngine(DownloadEngine):
+    """
+    Downloads every file with PySmartDL, or with `DownloaderTools.download_with_resume` when
+    resuming since PySmartDL can't continue a partial download. The latter is also used with
+    a bandwidth limit, PySmartDL's threads can't be paced by a shared budget, and with write
+    options other than the defaults, PySmartDL doesn't take any. PySmartDL
+    opens its own connections, it is only handed the final url of redirected links, and
+    a failed PySmartDL download is retried from the start. Its writes can't be hashed as
+    they happen, so files it downloads are read once more when they are verified. PySmartDL
+    also writes every segment to a part file and copies them into the final file, while
+    `download_with_resume` writes them in place, see `FileWriter`
+    """
+
+    name = "pysmartdl"
+
+    def _download(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool,
+        connections: int,
+        progress: Optional[ProgressAggregator],
+        hasher: Optional[StreamingHasher],
+    ) -> Path:
+        if (
+            self.resume
+            or self.limiter is not None
+            or self.write_options != WriteOptions()
+        ):
+            return DownloaderTools.download_with_resume(
+                link=link,
+                download_dir=download_dir,
+                verbose=verbose,
+                connections=connections,
+                progress=progress,
+                limiter=self.limiter,
+                pool=self.http_pool,
+                retry=self.retry,
+                cancel=self.cancelled,
+                hasher=hasher,
+                write_options=self.write_options,
+            )
+        return self.retry.call(
+            link,
+            lambda: DownloaderTools.download_with_pysmartdl(
+                link=link,
+                download_dir=download_dir,
+                verbose=verbose,
+                connections=connections,
+                progress=progress,
+                pool=self.http_pool,
+                cancel=self.cancelled,
+            ),
+            cancel=self.cancelled,
+        )
@@ -0,0 +1,121 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+try:
+    from dozent.downloader_tools import DownloaderTools, check_cancelled
+    from dozent.engines.base import DownloadEngine
+    from dozent.engines.extract_engine import ExtractOnTheFlyEngine
+    from dozent.http_pool import PoolStats
+    from dozent.progress import ProgressAggregator
+    from dozent.sampling import MemberSample, RemoteTar
+    from dozent.stream_extract import member_path
+except ModuleNotFoundError:
+    from downloader_tools import DownloaderTools, check_cancelled
+    from engines.base import DownloadEngine
+    from engines.extract_engine import ExtractOnTheFlyEngine
+    from http_pool import PoolStats
+    from progress import ProgressAggregator
+    from sampling import MemberSample, RemoteTar
+    from stream_extract import member_path
+
+
+class SampleEngine(DownloadEngine):
+    """
+    Downloads a sample of the members of tar archives instead of the whole archives. The
+    headers of an archive are walked with small Range requests and only the members
+    selected by `sample` are fetched, into `<download_dir>/<name>/` like
+    `ExtractOnTheFlyEngine`. Archives that aren't uncompressed tars can't be walked and
+    fail. The published checksums cover whole archives, so samples aren't verified
+    """
+
+    name = "sample"
+
+    def __init__(self, fallback: DownloadEngine, sample: MemberSample):
+        """
+        :param fallback: engine whose connections, retry policy and bandwidth limiter are
+        used
+        :param sample: members that are downloaded
+        """
+        DownloadEngine.__init__(
+            self,
+            resume=fallback.resume,
+            limiter=fallback.limiter,
+            http_pool=fallback.http_pool,
+            retry=fallback.retry,
+            write_options=fallback.write_options,
+        )
+        self.fallback = fallback
+        self.sample = sample
+        self.cancelled = fallback.cancelled
+
+    def download(
+        self,
+        link: str,
+        download_dir: str,
+        verbose: bool = True,
+        connections: int = 1,
+        progress: Optional[ProgressAggregator] = None,
+    ) -> Path:
+        """
+        Downloads the selected members of the archive at `link`. With `resume`, members
+        already written are skipped. The members are fetched one after the other over a
+        single connection, since every header is found from the one before it
+        :return: directory the members were written to
+        :raises ValueError: when the link isn't a tar archive
+        :raises RangeNotSupportedError: when the server doesn't answer Range requests
+        """
+        if not DownloaderTools.get_file_name(link).endswith(".tar"):
+            raise ValueError(f"Only the members of tar archives can be sampled: {link}")
+        output_dir = ExtractOnTheFlyEngine.get_output_dir(link, download_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        task_progress = on_bytes = on_retry = None
+        if verbose and progress is not None:
+            task_progress = progress.register(link)
+            on_bytes = task_progress.add
+
+            def on_retry(error: BaseException) -> None:
+                task_progress.retry()
+
+        remote = RemoteTar(
+            link, self.http_pool, self.retry, self.cancelled, self.limiter
+        )
+        selected_size = 0
+        selected = 0
+        try:
+            for member in remote.members():
+                check_cancelled(self.cancelled, link)
+                if not self.sample.selects(member):
+                    continue
+                selected += 1
+                path = member_path(output_dir, member.name)
+                if not (
+                    self.resume
+                    and path.is_file()
+                    and path.stat().st_size == member.size
+                ):
+                    selected_size += member.size
+                    if task_progress is not None:
+                        task_progress.set_total(selected_size)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    # Only complete members ever show up under their final name
+                    partial_path = path.with_name(path.name + ".part")
+                    with open(partial_path, "wb") as file:
+                        remote.fetch(member, file, on_bytes, on_retry)
+                    os.replace(partial_path, path)
+                if self.sample.is_done(selected):
+                    break
+        finally:
+            if task_progress is not None:
+                task_progress.finish()
+        return output_dir
+
+    def connection_stats(self) -> PoolStats:
+        return self.fallback.connection_stats()
+
+    def cancel(self) -> None:
+        self.fallback.cancel()
+
+    def close(self) -> None:
+        self.fallback.close()
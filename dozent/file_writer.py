@@ -0,0 +1,133 @@
+import errno
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple, Union
+
+# When downloaded bytes are forced to disk: never, leaving it to the OS, before every
+# save of the resume state so that it never claims bytes a crash could lose, or once
+# when the file is complete
+FSYNC_POLICIES = ("none", "checkpoint", "end")
+DEFAULT_FSYNC_POLICY = "none"
+
+# Bytes gathered from a connection before they are written with a single call
+DEFAULT_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class WriteOptions(NamedTuple):
+    """
+    How downloads write their files
+    """
+
+    # Reserve the final size of a file on disk before its segments are written, so that
+    # it isn't fragmented and a full disk shows up before the download starts
+    preallocate: bool = True
+    # Bytes gathered per connection before a write
+    buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE
+    fsync: str = DEFAULT_FSYNC_POLICY
+
+
+def check_write_options(options: WriteOptions) -> WriteOptions:
+    """
+    :raises ValueError: when the fsync policy is unknown or the buffer is empty
+    """
+    if options.fsync not in FSYNC_POLICIES:
+        raise ValueError(
+            f"Unknown fsync policy {options.fsync!r}, choose one of "
+            f"{', '.join(FSYNC_POLICIES)}"
+        )
+    if options.buffer_size < 1:
+        raise ValueError("The write buffer must hold at least one byte")
+    return options
+
+
+class FileWriter:
+    """
+    The file of a download, written in place by every segment at its own offset. Writes
+    are positional, so segments on several threads share a single descriptor and no bytes
+    are ever copied from part files into the final file. Existing content is kept, for
+    resumed downloads
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        size: int,
+        options: WriteOptions = WriteOptions(),
+    ):
+        """
+        :param path: path of the file, created when missing
+        :param size: final size of the file, it is grown or shrunk to it
+        :param options: preallocation and fsync policy
+        """
+        self.path = Path(path)
+        self.size = size
+        self.options = options
+        self._lock = threading.Lock()
+        self.fd = os.open(
+            self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666
+        )
+        try:
+            if os.fstat(self.fd).st_size != size:
+                os.ftruncate(self.fd, size)
+            if options.preallocate and size > 0:
+                self._preallocate()
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def _preallocate(self) -> None:
+        if not hasattr(os, "posix_fallocate"):
+            return
+        try:
+            os.posix_fallocate(self.fd, 0, self.size)
+        except OSError as error:
+            # Some file systems can't reserve space, the file then stays sparse. A full
+            # disk is still an error
+            if error.errno == errno.ENOSPC:
+                raise
+
+    def write_at(self, data, offset: int) -> None:
+        """
+        Writes `data`, any bytes-like object, at `offset` without moving a shared file
+        position
+        """
+        view = memoryview(data)
+        if hasattr(os, "pwrite"):
+            while view:
+                written = os.pwrite(self.fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self._lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                while view:
+                    written = os.write(self.fd, view)
+                    view = view[written:]
+
+    def checkpoint(self) -> None:
+        """
+        Called before the resume state records the bytes written so far
+        """
+        if self.options.fsync == "checkpoint":
+            os.fsync(self.fd)
+
+    def close(self, complete: bool = True) -> None:
+        """
+        :param complete: whether the file was downloaded completely, the policies
+        forcing bytes to disk do so then
+        """
+        if self.fd < 0:
+            return
+        try:
+            if complete and self.options.fsync != "none":
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> "FileWriter":
+        return self
+
+    def __exit__(self, exception_type, *args) -> None:
+        self.close(complete=exception_type is None)
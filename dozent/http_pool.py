@@ -0,0 +1,458 @@
+import http.client
+import select
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+from collections import deque
+from contextlib import contextmanager
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+DEFAULT_MAX_IDLE_PER_HOST = 16
+DEFAULT_MAX_IDLE = 64
+
+# Seconds an idle connection is kept, below the keep-alive timeout of most servers
+DEFAULT_IDLE_TIMEOUT = 30.0
+
+_HTTP_TIMEOUT = 30
+_MAX_REDIRECTS = 10
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+_USER_AGENT = "dozent"
+
+# Leftover bodies up to this size are read so that the connection can be reused
+_DRAIN_LIMIT = 64 * 1024
+
+# Errors of a request sent on an idle connection that the server had already closed
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class PoolStats(NamedTuple):
+    opened: int = 0
+    reused: int = 0
+    redirects_followed: int = 0
+    redirects_cached: int = 0
+    evicted: int = 0
+
+    @property
+    def handshakes_saved(self) -> int:
+        """
+        TCP and TLS handshakes avoided by sending requests on kept-alive connections
+        """
+        return self.reused
+
+    def __add__(self, other: "PoolStats") -> "PoolStats":
+        return PoolStats(*(mine + theirs for mine, theirs in zip(self, other)))
+
+    def format(self) -> str:
+        return (
+            f"Connections: {self.opened} opened, {self.reused} reused "
+            f"({self.handshakes_saved} handshake(s) saved), {self.evicted} evicted idle. "
+            f"Redirects: {self.redirects_followed} followed, "
+            f"{self.redirects_cached} skipped from cache"
+        )
+
+
+class _HostKey(NamedTuple):
+    scheme: str
+    host: str
+    port: int
+
+
+def _split_url(url: str) -> Tuple[_HostKey, str]:
+    """
+    :return: the (scheme, host, port) a url is served from and the path to request
+    """
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https"):
+        raise ValueError(f"Unsupported url {url}")
+    port = parts.port or (443 if scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return _HostKey(scheme, parts.hostname, port), path
+
+
+def _is_stale(connection: http.client.HTTPConnection) -> bool:
+    """
+    Whether an idle connection was closed by the server. An idle socket is only readable
+    when it reached EOF or the server sent something unexpected
+    """
+    if connection.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class PooledResponse:
+    """
+    Response read from a pooled connection. Closing it hands the connection back to the
+    pool when the body was read completely, and closes the connection otherwise
+    """
+
+    def __init__(
+        self,
+        pool: "HTTPConnectionPool",
+        connection: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+        url: str,
+    ):
+        self.pool = pool
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.headers = response.headers
+        self._closed = False
+
+    def read(self, size: int = -1) -> bytes:
+        return self.response.read(size if size >= 0 else None)
+
+    def readinto(self, buffer) -> int:
+        """
+        Reads into a writable bytes-like object without allocating
+        :return: the number of bytes read, 0 at the end of the body
+        """
+        return self.response.readinto(buffer)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        response = self.response
+        if not response.isclosed():
+            if response.length is not None and response.length <= _DRAIN_LIMIT:
+                try:
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    self.pool.discard(self.connection)
+                    return
+            else:
+                self.pool.discard(self.connection)
+                return
+        if response.will_close:
+            self.pool.discard(self.connection)
+        else:
+            self.pool.release(self.connection)
+
+    def discard(self) -> None:
+        """
+        Closes the connection without reading the rest of the body
+        """
+        if not self._closed:
+            self._closed = True
+            self.response.close()
+            self.pool.discard(self.connection)
+
+    def __enter__(self) -> "PooledResponse":
+        return self
+
+    def __exit__(self, exception_type, *args) -> None:
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class LengthCheckedReader:
+    """
+    Wraps a response, raising `IncompleteRead` when the connection ends before
+    `Content-Length` bytes were read. Parsers would see a truncated archive otherwise
+    """
+
+    def __init__(self, response: PooledResponse):
+        self.response = response
+        length = response.headers.get("Content-Length")
+        self.length = int(length) if length else None
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.response.read(size)
+        self.position += len(data)
+        if not data and size and self.length and self.position < self.length:
+            raise http.client.IncompleteRead(b"", self.length - self.position)
+        return data
+
+
+class HTTPConnectionPool:
+    """
+    Thread-safe pool of keep-alive HTTP/1.1 connections per host, shared by every worker
+    for the whole run. Idle connections are bounded per host and in total, and evicted
+    after `idle_timeout`. The final url of redirected links is cached, so that later
+    requests for a link go straight to the host that serves it, e.g. the archive.org
+    datanode
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST,
+        max_idle: int = DEFAULT_MAX_IDLE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        timeout: float = _HTTP_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param max_idle_per_host: idle connections kept per host
+        :param max_idle: idle connections kept over all hosts
+        :param idle_timeout: seconds after which an idle connection is closed
+        :param timeout: socket timeout of the connections
+        :param clock: monotonic clock in seconds
+        """
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._clock = clock
+        self._ssl_context = ssl.create_default_context()
+        self._lock = threading.Lock()
+        # Oldest first, with the time each connection became idle
+        self._idle: Dict[_HostKey, Deque[Tuple[float, http.client.HTTPConnection]]] = {}
+        self._idle_count = 0
+        self._keys: Dict[http.client.HTTPConnection, _HostKey] = {}
+        self._redirects: Dict[str, str] = {}
+        self._stats = PoolStats()
+
+    def _count(self, **increments: int) -> None:
+        with self._lock:
+            self._stats = self._stats._replace(
+                **{
+                    name: getattr(self._stats, name) + value
+                    for name, value in increments.items()
+                }
+            )
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            return self._stats
+
+    def _evict_expired(self, now: float) -> None:
+        """
+        Closes the connections that were idle for longer than `idle_timeout`, needs the lock
+        """
+        for key in list(self._idle):
+            idle = self._idle[key]
+            while idle and now - idle[0][0] > self.idle_timeout:
+                _, connection = idle.popleft()
+                self._close(connection)
+                self._idle_count -= 1
+                self._stats = self._stats._replace(evicted=self._stats.evicted + 1)
+            if not idle:
+                del self._idle[key]
+
+    def _evict_oldest(self) -> None:
+        """
+        Closes the connection that has been idle the longest, needs the lock
+        """
+        key = min(self._idle, key=lambda host: self._idle[host][0][0])
+        _, connection = self._idle[key].popleft()
+        if not self._idle[key]:
+            del self._idle[key]
+        self._close(connection)
+        self._idle_count -= 1
+        self._stats = self._stats._replace(evicted=self._stats.evicted + 1)
+
+    def _close(self, connection: http.client.HTTPConnection) -> None:
+        self._keys.pop(connection, None)
+        connection.close()
+
+    def _acquire(self, key: _HostKey) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        :return: an idle connection to the host, or a new one, and whether it was reused
+        """
+        with self._lock:
+            self._evict_expired(self._clock())
+            idle = self._idle.get(key)
+            while idle:
+                _, connection = idle.pop()
+                self._idle_count -= 1
+                if not idle:
+                    del self._idle[key]
+                if not _is_stale(connection):
+                    return connection, True
+                self._close(connection)
+                idle = self._idle.get(key)
+
+        if key.scheme == "https":
+            connection = http.client.HTTPSConnection(
+                key.host, key.port, timeout=self.timeout, context=self._ssl_context
+            )
+        else:
+            connection = http.client.HTTPConnection(
+                key.host, key.port, timeout=self.timeout
+            )
+        with self._lock:
+            self._keys[connection] = key
+        return connection, False
+
+    def release(self, connection: http.client.HTTPConnection) -> None:
+        """
+        Returns a connection whose response was read completely to the pool
+        """
+        with self._lock:
+            key = self._keys.get(connection)
+            if key is None or connection.sock is None:
+                self._close(connection)
+                return
+            now = self._clock()
+            self._evict_expired(now)
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) >= self.max_idle_per_host:
+                self._close(connection)
+                return
+            if self._idle_count >= self.max_idle:
+                self._evict_oldest()
+                idle = self._idle.setdefault(key, deque())
+            idle.append((now, connection))
+            self._idle_count += 1
+
+    def discard(self, connection: http.client.HTTPConnection) -> None:
+        """
+        Closes a connection that can't be reused
+        """
+        with self._lock:
+            self._close(connection)
+
+    def _send(
+        self, method: str, url: str, headers: Dict[str, str]
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Sends a single request. A request on a kept-alive connection that turns out to be
+        closed by the server is sent again on a new connection
+        """
+        key, path = _split_url(url)
+        while True:
+            connection, reused = self._acquire(key)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+            except _STALE_ERRORS:
+                self.discard(connection)
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                self.discard(connection)
+                raise
+            if reused:
+                self._count(reused=1)
+            else:
+                self._count(opened=1)
+            return connection, response
+
+    def request(
+        self, method: str, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> PooledResponse:
+        """
+        Sends a request on a pooled connection, following redirects. Links that were
+        redirected before are requested from their final url right away
+        :return: the response, to be used as a context manager. `response.url` is the url
+        that answered
+        :raises urllib.error.HTTPError: when the server answers with an error status
+        """
+        request_headers = {"User-Agent": _USER_AGENT, "Accept-Encoding": "identity"}
+        request_headers.update(headers or {})
+
+        with self._lock:
+            cached = self._redirects.get(url)
+        if cached is not None:
+            try:
+                response = self._request_once(method, cached, request_headers)
+            except (OSError, http.client.HTTPException):
+                # The host behind the redirect went away, ask the original url again
+                with self._lock:
+                    self._redirects.pop(url, None)
+            else:
+                if response.status < 400:
+                    self._count(redirects_cached=1)
+                    response.url = cached
+                    return response
+                response.close()
+                with self._lock:
+                    self._redirects.pop(url, None)
+
+        target = url
+        for _ in range(_MAX_REDIRECTS + 1):
+            response = self._request_once(method, target, request_headers)
+            location = response.headers.get("Location")
+            if response.status in _REDIRECT_STATUSES and location:
+                response.close()
+                self._count(redirects_followed=1)
+                target = urllib.parse.urljoin(target, location)
+                continue
+
+            if response.status >= 400:
+                response.close()
+                raise urllib.error.HTTPError(
+                    target, response.status, response.response.reason, None, None
+                )
+            if target != url:
+                with self._lock:
+                    self._redirects[url] = target
+            response.url = target
+            return response
+
+        raise ConnectionError(f"Too many redirects for {url}")
+
+    def _request_once(
+        self, method: str, url: str, headers: Dict[str, str]
+    ) -> PooledResponse:
+        connection, response = self._send(method, url, headers)
+        return PooledResponse(self, connection, response, url)
+
+    def resolve(self, url: str) -> str:
+        """
+        Final url of a link after redirects, from the cache or a HEAD request
+        """
+        with self._lock:
+            cached = self._redirects.get(url)
+        if cached is not None:
+            self._count(redirects_cached=1)
+            return cached
+        with self.request("HEAD", url) as response:
+            return response.url
+
+    def close(self) -> None:
+        """
+        Closes every idle connection
+        """
+        with self._lock:
+            for idle in self._idle.values():
+                for _, connection in idle:
+                    self._close(connection)
+            self._idle.clear()
+            self._idle_count = 0
+
+    def __enter__(self) -> "HTTPConnectionPool":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+@contextmanager
+def borrow(pool: Optional[HTTPConnectionPool]) -> Iterator[HTTPConnectionPool]:
+    """
+    `pool` itself, or a new pool that is closed on exit when none is given
+    """
+    if pool is not None:
+        yield pool
+        return
+    with HTTPConnectionPool() as new_pool:
+        yield new_pool
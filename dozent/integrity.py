@@ -0,0 +1,310 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+try:
+    from dozent.download_state import STATE_FILE_SUFFIX
+    from dozent.sharding import CLAIMS_DIRECTORY
+    from dozent.tar_index import INDEX_FILE_SUFFIX
+except ModuleNotFoundError:
+    from download_state import STATE_FILE_SUFFIX
+    from sharding import CLAIMS_DIRECTORY
+    from tar_index import INDEX_FILE_SUFFIX
+
+# Checksums archive.org publishes for every file of an item
+DEFAULT_ALGORITHMS = ("md5", "sha1")
+
+# Out-of-order bytes kept in memory until the hash gets to them, beyond this they are read
+# back from the file, which is usually still in the page cache
+DEFAULT_MAX_BUFFERED = 32 * 1024 * 1024
+
+_READ_SIZE = 1024 * 1024
+_MB = 1024 * 1024
+
+STATUS_OK = "ok"
+STATUS_MISMATCH = "mismatch"
+STATUS_UNKNOWN = "unknown"
+STATUS_ERROR = "error"
+
+
+class Checksums(NamedTuple):
+    """
+    Expected hex digests of a file, None when unknown
+    """
+
+    md5: Optional[str] = None
+    sha1: Optional[str] = None
+
+    @property
+    def algorithms(self) -> Tuple[str, ...]:
+        return tuple(name for name, value in zip(self._fields, self) if value)
+
+    def mismatches(self, digests: Dict[str, str]) -> List[str]:
+        """
+        :param digests: hex digests by algorithm
+        :return: the algorithms whose digest differs from the expected one
+        """
+        return [
+            name
+            for name in self.algorithms
+            if name in digests and digests[name].lower() != getattr(self, name).lower()
+        ]
+
+
+class ChecksumMismatchError(Exception):
+    def __init__(self, path: Path, algorithm: str, expected: str, actual: str):
+        Exception.__init__(
+            self, f"{algorithm} of {path} is {actual}, expected {expected}"
+        )
+        self.path = path
+        self.algorithm = algorithm
+        self.expected = expected
+        self.actual = actual
+
+
+def check(path: Path, expected: Checksums, digests: Dict[str, str]) -> None:
+    """
+    :raises ChecksumMismatchError: when a digest differs from the expected one
+    """
+    for name in expected.mismatches(digests):
+        raise ChecksumMismatchError(path, name, getattr(expected, name), digests[name])
+
+
+class StreamingHasher:
+    """
+    Hashes a file while it is written, so that it doesn't have to be read again once it
+    is complete. Bytes are hashed in file order: those written at the end of the hashed
+    prefix go straight into the hash, those written further ahead by other segments are
+    buffered up to `max_buffered` bytes, and `finish` reads whatever is still missing back
+    from the file. Thread-safe
+    """
+
+    def __init__(
+        self,
+        algorithms: Iterable[str] = DEFAULT_ALGORITHMS,
+        max_buffered: int = DEFAULT_MAX_BUFFERED,
+    ):
+        self._hashes = {name: hashlib.new(name) for name in algorithms}
+        self.max_buffered = max_buffered
+        # Bytes [0, position) are hashed
+        self.position = 0
+        self._pending: Dict[int, bytes] = {}
+        self._buffered = 0
+        # Bytes read back from the file by `finish`
+        self.bytes_reread = 0
+        self._lock = threading.Lock()
+
+    def _feed(self, data) -> None:
+        for hash_object in self._hashes.values():
+            hash_object.update(data)
+        self.position += len(data)
+
+    def _feed_pending(self) -> None:
+        while self.position in self._pending:
+            data = self._pending.pop(self.position)
+            self._buffered -= len(data)
+            self._feed(data)
+
+    def update(self, offset: int, data: bytes) -> None:
+        """
+        Records `data` written at `offset` of the file
+        """
+        if not data:
+            return
+        with self._lock:
+            if offset == self.position:
+                self._feed(data)
+                self._feed_pending()
+            elif (
+                offset > self.position
+                and self._buffered + len(data) <= self.max_buffered
+            ):
+                self._pending[offset] = bytes(data)
+                self._buffered += len(data)
+
+    def reset(self) -> None:
+        """
+        Starts over, e.g. when a file is downloaded again from the first byte
+        """
+        with self._lock:
+            self._hashes = {name: hashlib.new(name) for name in self._hashes}
+            self.position = 0
+            self._pending.clear()
+            self._buffered = 0
+
+    def hexdigests(self) -> Dict[str, str]:
+        """
+        Hex digests by algorithm of the bytes [0, position)
+        """
+        with self._lock:
+            return {
+                name: hash_object.hexdigest()
+                for name, hash_object in self._hashes.items()
+            }
+
+    def finish(self, path: Path, size: Optional[int] = None) -> Dict[str, str]:
+        """
+        Hashes the bytes of the file that weren't seen yet, reading them from `path`
+        :param size: size of the file, its size on disk when None
+        :return: hex digests by algorithm
+        """
+        with self._lock:
+            size = os.path.getsize(path) if size is None else size
+            with open(path, "rb") as file:
+                while self.position < size:
+                    self._feed_pending()
+                    if self.position >= size:
+                        break
+                    following = [
+                        offset for offset in self._pending if offset > self.position
+                    ]
+                    end = min(following + [size])
+                    file.seek(self.position)
+                    data = file.read(min(_READ_SIZE, end - self.position))
+                    if not data:
+                        raise EOFError(f"{path} is shorter than {size} bytes")
+                    self.bytes_reread += len(data)
+                    self._feed(data)
+            self._pending.clear()
+            self._buffered = 0
+        return self.hexdigests()
+
+
+def hash_file(
+    path: Path, algorithms: Iterable[str] = DEFAULT_ALGORITHMS
+) -> Dict[str, str]:
+    """
+    Hashes a whole file in a single pass
+    :return: hex digests by algorithm
+    """
+    hashes = {name: hashlib.new(name) for name in algorithms}
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(_READ_SIZE)
+            if not data:
+                break
+            for hash_object in hashes.values():
+                hash_object.update(data)
+    return {name: hash_object.hexdigest() for name, hash_object in hashes.items()}
+
+
+class VerifyResult(NamedTuple):
+    path: str
+    status: str
+    size: int = 0
+    digests: Dict[str, str] = {}
+    error: Optional[str] = None
+
+
+def verify_file(path: str, expected: Optional[Checksums]) -> VerifyResult:
+    """
+    Hashes a file and compares it with the expected checksums, runs in a worker process
+    :return: the result, with a status of `ok`, `mismatch`, `unknown` when nothing is
+    expected of the file, or `error`
+    """
+    try:
+        size = os.path.getsize(path)
+        digests = hash_file(path)
+    except OSError as error:
+        return VerifyResult(path, STATUS_ERROR, error=str(error))
+    if expected is None or not expected.algorithms:
+        return VerifyResult(path, STATUS_UNKNOWN, size, digests)
+    mismatches = expected.mismatches(digests)
+    if mismatches:
+        return VerifyResult(
+            path,
+            STATUS_MISMATCH,
+            size,
+            digests,
+            f"{mismatches[0]} is {digests[mismatches[0]]}, expected "
+            f"{getattr(expected, mismatches[0])}",
+        )
+    return VerifyResult(path, STATUS_OK, size, digests)
+
+
+class VerifyReport:
+    def __init__(self):
+        self.results: List[VerifyResult] = []
+        self.wall_seconds = 0.0
+
+    def _with_status(self, status: str) -> List[VerifyResult]:
+        return [result for result in self.results if result.status == status]
+
+    @property
+    def ok(self) -> bool:
+        return not self.mismatched and not self.errors
+
+    @property
+    def mismatched(self) -> List[VerifyResult]:
+        return self._with_status(STATUS_MISMATCH)
+
+    @property
+    def unknown(self) -> List[VerifyResult]:
+        return self._with_status(STATUS_UNKNOWN)
+
+    @property
+    def errors(self) -> List[VerifyResult]:
+        return self._with_status(STATUS_ERROR)
+
+    @property
+    def mb_per_second(self) -> float:
+        total = sum(result.size for result in self.results)
+        return total / _MB / self.wall_seconds if self.wall_seconds else 0.0
+
+    def format(self) -> str:
+        lines = [
+            f"Verified {len(self.results)} file(s) in {self.wall_seconds:.1f}s "
+            f"({self.mb_per_second:.1f} MB/s): {len(self._with_status(STATUS_OK))} ok, "
+            f"{len(self.mismatched)} mismatched, {len(self.unknown)} without checksums, "
+            f"{len(self.errors)} unreadable"
+        ]
+        for result in self.mismatched + self.errors:
+            lines.append(f"  {result.status}: {result.path}: {result.error}")
+        return "\n".join(lines)
+
+
+def _files_in(paths: Iterable[Path]) -> List[Path]:
+    files = []
+    for path in map(Path, paths):
+        candidates = sorted(path.rglob("*")) if path.is_dir() else [path]
+        files.extend(
+            candidate
+            for candidate in candidates
+            if not candidate.is_dir()
+            and not candidate.name.endswith(
+                (STATE_FILE_SUFFIX, INDEX_FILE_SUFFIX, ".part", ".tmp")
+            )
+            and CLAIMS_DIRECTORY not in candidate.parts
+        )
+    return files
+
+
+def verify(
+    paths: Iterable[Path],
+    expected_of: Callable[[str], Optional[Checksums]],
+    max_workers: Optional[int] = None,
+) -> VerifyReport:
+    """
+    Checks downloaded files against their expected checksums with a pool of processes
+    :param paths: files, or directories whose files are checked
+    :param expected_of: expected checksums of a file by file name, None when unknown
+    :param max_workers: number of worker processes, defaults to the number of cores
+    """
+    files = _files_in(paths)
+    report = VerifyReport()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count() or 1
+    ) as executor:
+        futures = [
+            executor.submit(verify_file, str(path), expected_of(path.name))
+            for path in files
+        ]
+        for future in futures:
+            report.results.append(future.result())
+    report.wall_seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,385 @@
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    from dozent.progress import ProgressAggregator, TaskProgress
+except ModuleNotFoundError:
+    from progress import ProgressAggregator, TaskProgress
+
+# Final statuses of a file
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+# Stopped by a shutdown before it finished, or before it started
+STATUS_INTERRUPTED = "interrupted"
+# Downloaded by another node sharing the output directory
+STATUS_ELSEWHERE = "elsewhere"
+
+# Length of the windows the throughput percentiles are computed over, in seconds
+_WINDOW_SECONDS = 1.0
+
+# Minimum time between two rewrites of the Prometheus file while bytes come in
+_EXPORT_INTERVAL = 5.0
+
+
+def percentile(values: List[float], share: float) -> Optional[float]:
+    """
+    Nearest-rank percentile, e.g. `share=0.95` for the 95th percentile
+    :return: the percentile, None when there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class FileMetrics:
+    """
+    Timings and throughput of a single file. Times are from a monotonic clock
+    """
+
+    __slots__ = (
+        "link",
+        "queued_at",
+        "started_at",
+        "first_byte_at",
+        "finished_at",
+        "bytes",
+        "retries",
+        "status",
+        "error",
+        "_window_start",
+        "_window_bytes",
+        "_window_rates",
+    )
+
+    def __init__(self, link: str, queued_at: float):
+        self.link = link
+        self.queued_at = queued_at
+        self.started_at: Optional[float] = None
+        self.first_byte_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.bytes = 0
+        self.retries = 0
+        self.status: Optional[str] = None
+        self.error: Optional[str] = None
+        self._window_start = 0.0
+        self._window_bytes = 0
+        self._window_rates: List[float] = []
+
+    def add(self, delta: int, now: float) -> None:
+        """
+        Records `delta` bytes arriving at `now`
+        """
+        if self.first_byte_at is None:
+            self.first_byte_at = self._window_start = now
+        elif now - self._window_start >= _WINDOW_SECONDS:
+            self._window_rates.append(self._window_bytes / (now - self._window_start))
+            self._window_start = now
+            self._window_bytes = 0
+        self.bytes += delta
+        self._window_bytes += delta
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        """
+        Seconds between being queued and getting a worker and connections
+        """
+        if self.started_at is None:
+            return None
+        return self.started_at - self.queued_at
+
+    @property
+    def time_to_first_byte(self) -> Optional[float]:
+        if self.started_at is None or self.first_byte_at is None:
+            return None
+        return self.first_byte_at - self.started_at
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    @property
+    def average_throughput(self) -> Optional[float]:
+        """
+        Bytes per second from the first byte to the end of the download
+        """
+        if self.first_byte_at is None or self.finished_at is None:
+            return None
+        elapsed = self.finished_at - self.first_byte_at
+        return self.bytes / elapsed if elapsed > 0 else None
+
+    @property
+    def p95_throughput(self) -> Optional[float]:
+        """
+        95th percentile of the throughput over one second windows, the average for
+        downloads shorter than a window
+        """
+        return percentile(self._window_rates, 0.95) or self.average_throughput
+
+    def to_dict(self) -> dict:
+        return {
+            "link": self.link,
+            "status": self.status,
+            "error": self.error,
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "queue_wait_seconds": self.queue_wait,
+            "time_to_first_byte_seconds": self.time_to_first_byte,
+            "duration_seconds": self.duration,
+            "average_bytes_per_second": self.average_throughput,
+            "p95_bytes_per_second": self.p95_throughput,
+        }
+
+
+class MetricsRecorder(ProgressAggregator):
+    """
+    Records per-file and run-level metrics of a download run. It is the progress aggregator
+    of the run, so the bytes reported by the engines are timed without extra work on the
+    transfer path. Every finished file is appended to a JSON lines file, followed by a
+    summary line at the end of the run, and a Prometheus textfile-collector file is
+    rewritten as files start and finish
+    """
+
+    def __init__(
+        self,
+        jsonl_path: Optional[Path] = None,
+        prometheus_path: Optional[Path] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param jsonl_path: file every finished file and the run summary are appended to
+        :param prometheus_path: `.prom` file for node_exporter's textfile collector
+        :param clock: monotonic clock in seconds
+        """
+        ProgressAggregator.__init__(self)
+        self.jsonl_path = Path(jsonl_path) if jsonl_path is not None else None
+        self.prometheus_path = (
+            Path(prometheus_path) if prometheus_path is not None else None
+        )
+        self._clock = clock
+        self._metrics_lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self.files: Dict[str, FileMetrics] = {}
+        self.started_at = clock()
+        self.finished_at: Optional[float] = None
+        self._last_export = self.started_at
+
+    def _add(self, task: TaskProgress, delta: int) -> None:
+        ProgressAggregator._add(self, task, delta)
+        now = self._clock()
+        with self._metrics_lock:
+            metrics = self.files.get(task.name)
+            if metrics is not None:
+                metrics.add(delta, now)
+        if self.prometheus_path is not None and now - self._last_export >= (
+            _EXPORT_INTERVAL
+        ):
+            self._last_export = now
+            self.write_prometheus()
+
+    def _retry(self, task: TaskProgress) -> None:
+        self.retried(task.name)
+
+    def queued(self, link: str) -> None:
+        with self._metrics_lock:
+            self.files[link] = FileMetrics(link, self._clock())
+
+    def started(self, link: str) -> None:
+        with self._metrics_lock:
+            self.files[link].started_at = self._clock()
+        self.write_prometheus()
+
+    def retried(self, link: str) -> None:
+        with self._metrics_lock:
+            metrics = self.files.get(link)
+            if metrics is not None:
+                metrics.retries += 1
+
+    def transferred(self, link: str) -> None:
+        """
+        Records the end of the transfer of a file, whose status is only known once it is
+        processed
+        """
+        with self._metrics_lock:
+            self.files[link].finished_at = self._clock()
+
+    def finished(self, link: str, status: str, error: Optional[str] = None) -> None:
+        """
+        Records the final status of a file and exports it. The end of its transfer is
+        stamped now unless `transferred` was called
+        :param status: `STATUS_OK`, `STATUS_FAILED`, `STATUS_SKIPPED`,
+        `STATUS_INTERRUPTED` or `STATUS_ELSEWHERE`
+        """
+        with self._metrics_lock:
+            metrics = self.files[link]
+            if metrics.finished_at is None:
+                metrics.finished_at = self._clock()
+            metrics.status = status
+            metrics.error = error
+            line = metrics.to_dict()
+        self._append_jsonl({"type": "file", **line})
+        self.write_prometheus()
+
+    def summary(self) -> dict:
+        """
+        Run-level aggregates over every file
+        """
+        with self._metrics_lock:
+            files = list(self.files.values())
+            finished_at = self.finished_at or self._clock()
+        statuses: Dict[str, int] = {}
+        for metrics in files:
+            status = metrics.status or "pending"
+            statuses[status] = statuses.get(status, 0) + 1
+        total_bytes = sum(metrics.bytes for metrics in files)
+        elapsed = finished_at - self.started_at
+        waits = [m.queue_wait for m in files if m.queue_wait is not None]
+        first_bytes = [
+            m.time_to_first_byte for m in files if m.time_to_first_byte is not None
+        ]
+        throughputs = [
+            m.average_throughput for m in files if m.average_throughput is not None
+        ]
+        return {
+            "files": len(files),
+            "statuses": statuses,
+            "bytes": total_bytes,
+            "retries": sum(metrics.retries for metrics in files),
+            "duration_seconds": elapsed,
+            "bytes_per_second": total_bytes / elapsed if elapsed > 0 else None,
+            "max_queue_wait_seconds": max(waits, default=None),
+            "p95_time_to_first_byte_seconds": percentile(first_bytes, 0.95),
+            "p95_file_bytes_per_second": percentile(throughputs, 0.95),
+        }
+
+    def _append_jsonl(self, record: dict) -> None:
+        if self.jsonl_path is None:
+            return
+        record = {"timestamp": time.time(), **record}
+        with self._export_lock, open(self.jsonl_path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def format_prometheus(self) -> str:
+        """
+        Metrics in the Prometheus text exposition format
+        """
+        summary = self.summary()
+        snapshot = self.snapshot()
+        with self._metrics_lock:
+            finished = [m for m in self.files.values() if m.status is not None]
+            in_flight = sum(
+                1
+                for m in self.files.values()
+                if m.started_at is not None and m.status is None
+            )
+            queued = sum(1 for m in self.files.values() if m.started_at is None)
+
+        lines = []
+
+        def metric(name: str, kind: str, description: str, samples) -> None:
+            lines.append(f"# HELP dozent_{name} {description}")
+            lines.append(f"# TYPE dozent_{name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ",".join(
+                    f'{key}="{_escape_label(str(label))}"'
+                    for key, label in labels.items()
+                )
+                lines.append(
+                    f"dozent_{name}{{{label_text}}} {value}"
+                    if label_text
+                    else f"dozent_{name} {value}"
+                )
+
+        metric(
+            "files",
+            "gauge",
+            "Files of the run by status",
+            [
+                ({"status": status}, count)
+                for status, count in summary["statuses"].items()
+            ]
+            + [({"status": "queued"}, queued), ({"status": "in_flight"}, in_flight)],
+        )
+        metric(
+            "downloaded_bytes",
+            "counter",
+            "Bytes downloaded in the run",
+            [({}, snapshot.downloaded)],
+        )
+        metric("retries", "counter", "Retried requests", [({}, summary["retries"])])
+        metric(
+            "run_duration_seconds",
+            "gauge",
+            "Seconds since the run started",
+            [({}, round(summary["duration_seconds"], 3))],
+        )
+        metric(
+            "file_duration_seconds",
+            "gauge",
+            "Download time of finished files",
+            [({"link": m.link, "status": m.status}, m.duration) for m in finished],
+        )
+        metric(
+            "file_queue_wait_seconds",
+            "gauge",
+            "Time finished files waited for a worker and connections",
+            [({"link": m.link}, m.queue_wait) for m in finished],
+        )
+        metric(
+            "file_time_to_first_byte_seconds",
+            "gauge",
+            "Time from the start of finished files to their first byte",
+            [({"link": m.link}, m.time_to_first_byte) for m in finished],
+        )
+        metric(
+            "file_bytes_per_second",
+            "gauge",
+            "Throughput of finished files, on average and 95th percentile",
+            [
+                ({"link": m.link, "stat": "average"}, m.average_throughput)
+                for m in finished
+            ]
+            + [({"link": m.link, "stat": "p95"}, m.p95_throughput) for m in finished],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self) -> None:
+        """
+        Rewrites the Prometheus file, atomically so the collector never reads half of it
+        """
+        if self.prometheus_path is None:
+            return
+        text = self.format_prometheus()
+        partial_path = self.prometheus_path.with_name(
+            self.prometheus_path.name + ".part"
+        )
+        with self._export_lock:
+            with open(partial_path, "w") as file:
+                file.write(text)
+            os.replace(partial_path, self.prometheus_path)
+
+    def close(self) -> dict:
+        """
+        Ends the run, appending the summary to the JSON lines file
+        :return: the summary
+        """
+        with self._metrics_lock:
+            self.finished_at = self._clock()
+        summary = self.summary()
+        self._append_jsonl({"type": "run", **summary})
+        self.write_prometheus()
+        return summary
@@ -0,0 +1,61 @@
+import datetime
+import re
+from typing import Callable, List, Optional, Sequence
+
+try:
+    from dozent.downloader_tools import DownloaderTools
+except ModuleNotFoundError:
+    from downloader_tools import DownloaderTools
+
+# Order the archives are started in: as listed, largest first so that a huge archive
+# doesn't start last and hold up the end of the run, or oldest first by the date in their
+# file name
+ORDERS = ("catalog", "largest-first", "date")
+DEFAULT_ORDER = "catalog"
+
+# Dates in archive names, e.g. `twitter_stream_2020_06_01.tar`, `twitter-2018-06-17.tar`
+# or `archiveteam-twitter-stream-2015-08.tar` for a whole month
+_DATE_PATTERN = re.compile(r"(\d{4})[-_](\d{2})(?:[-_](\d{2}))?(?!\d)")
+
+
+def date_of(link: str) -> Optional[datetime.date]:
+    """
+    Date of the archive at `link` from its file name, the first day for a monthly archive
+    :return: the date, None when the name doesn't have one
+    """
+    match = _DATE_PATTERN.search(DownloaderTools.get_file_name(link))
+    if match is None:
+        return None
+    year, month, day = match.groups()
+    try:
+        return datetime.date(int(year), int(month), int(day or 1))
+    except ValueError:
+        return None
+
+
+def order_links(
+    links: Sequence[str],
+    order: str = DEFAULT_ORDER,
+    size_of: Callable[[str], Optional[int]] = lambda link: None,
+) -> List[str]:
+    """
+    Sorts the links in the order their downloads are started. Sorting is stable, and
+    archives of unknown size or date go last in their original order
+    :param order: one of `ORDERS`
+    :param size_of: expected size of the archive at a link, None when unknown. Only
+    called for `largest-first`
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order {order!r}, choose one of {', '.join(ORDERS)}")
+    links = list(links)
+    if order == "largest-first":
+        sizes = {link: size_of(link) for link in links}
+        known = [link for link in links if sizes[link] is not None]
+        known.sort(key=lambda link: sizes[link], reverse=True)
+        return known + [link for link in links if sizes[link] is None]
+    if order == "date":
+        dates = {link: date_of(link) for link in links}
+        known = [link for link in links if dates[link] is not None]
+        known.sort(key=lambda link: dates[link])
+        return known + [link for link in links if dates[link] is None]
+    return links
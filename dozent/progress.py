@@ -0,0 +1,232 @@
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional, TextIO
+
+import humanize
+
+_TWO_DECIMALS = "%.2f"
+
+# Weight given to the latest speed sample, smooths out the displayed speed and ETA
+_SPEED_SMOOTHING = 0.3
+
+
+def _naturalsize(value: float, format: str = "%.1f") -> str:
+    """
+    Human readable binary size, shown as MB rather than MiB
+    """
+    return humanize.naturalsize(value, binary=True, format=format).replace("iB", "B")
+
+
+class ProgressSnapshot(NamedTuple):
+    downloaded: int
+    total: int
+    active_tasks: int
+    finished_tasks: int
+
+
+class TaskProgress:
+    """
+    Handle used by a single download to report its progress. Workers only ever push byte
+    deltas, the running totals are kept by the `ProgressAggregator`
+    """
+
+    __slots__ = ("_aggregator", "name", "downloaded", "total", "finished")
+
+    def __init__(self, aggregator: "ProgressAggregator", name: str, total: int):
+        self._aggregator = aggregator
+        self.name = name
+        self.downloaded = 0
+        self.total = total
+        self.finished = False
+
+    def add(self, delta: int) -> None:
+        """
+        Records `delta` newly downloaded bytes
+        """
+        if delta:
+            self._aggregator._add(self, delta)
+
+    def set_total(self, total: int) -> None:
+        """
+        Updates the expected size of the download, for when it is only known after starting
+        """
+        self._aggregator._set_total(self, total)
+
+    def retry(self) -> None:
+        """
+        Records that a request of the download failed and is sent again
+        """
+        self._aggregator._retry(self)
+
+    def finish(self) -> None:
+        self._aggregator._finish(self)
+
+
+class ProgressAggregator:
+    """
+    Thread-safe aggregator of the progress of every download in a run. Every update is O(1),
+    the totals are maintained incrementally instead of being recomputed over all tasks
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._downloaded = 0
+        self._total = 0
+        self._active = 0
+        self._finished = 0
+
+    def register(self, name: str, total: int = 0) -> TaskProgress:
+        """
+        Registers a new download
+        :param name: unique name of the download, usually its link
+        :param total: expected size of the download in bytes, 0 if unknown
+        :return: handle the download uses to report its progress
+        """
+        task = TaskProgress(self, name, total)
+        with self._lock:
+            self._total += total
+            self._active += 1
+        return task
+
+    def _add(self, task: TaskProgress, delta: int) -> None:
+        with self._lock:
+            task.downloaded += delta
+            self._downloaded += delta
+
+    def _set_total(self, task: TaskProgress, total: int) -> None:
+        with self._lock:
+            self._total += total - task.total
+            task.total = total
+
+    def _retry(self, task: TaskProgress) -> None:
+        # Only counted by aggregators that keep metrics
+        pass
+
+    def _finish(self, task: TaskProgress) -> None:
+        with self._lock:
+            if not task.finished:
+                task.finished = True
+                self._active -= 1
+                self._finished += 1
+
+    def snapshot(self) -> ProgressSnapshot:
+        with self._lock:
+            return ProgressSnapshot(
+                downloaded=self._downloaded,
+                total=self._total,
+                active_tasks=self._active,
+                finished_tasks=self._finished,
+            )
+
+
+class ProgressRenderer(threading.Thread):
+    """
+    Single thread that redraws the aggregated progress at a fixed rate. On a TTY the progress
+    line is redrawn in place, otherwise a full line is written every `non_tty_interval` seconds
+    so that log files stay readable
+    """
+
+    def __init__(
+        self,
+        aggregator: ProgressAggregator,
+        interval: float = 0.5,
+        stream: Optional[TextIO] = None,
+        non_tty_interval: float = 10.0,
+    ):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.aggregator = aggregator
+        self.stream = stream or sys.stdout
+        self.is_tty = bool(getattr(self.stream, "isatty", lambda: False)())
+        self.interval = interval if self.is_tty else max(interval, non_tty_interval)
+
+        self._stop_event = threading.Event()
+        self._write_lock = threading.Lock()
+        self._last_downloaded = 0
+        self._last_time = time.monotonic()
+        self._speed = 0.0
+
+    @staticmethod
+    def _create_progress_bar(percentage: float, size: int) -> str:
+        """
+        Creates a progress bar
+        :param percentage: progress between 0 and 100
+        :param size: total length of progress bar
+        :return: Progress bar as a string
+        """
+        number_of_bars = int(percentage * 0.01 * size)
+        number_of_dashes = size - number_of_bars
+
+        return f"[{'#' * number_of_bars}{'-' * number_of_dashes}]"
+
+    def _update_speed(self, downloaded: int) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            sample = (downloaded - self._last_downloaded) / elapsed
+            self._speed = (
+                _SPEED_SMOOTHING * sample + (1 - _SPEED_SMOOTHING) * self._speed
+            )
+        self._last_downloaded = downloaded
+        self._last_time = now
+
+    def format_line(self, snapshot: ProgressSnapshot) -> str:
+        """
+        Builds the progress line for the given snapshot
+        """
+        percentage = (
+            min(100.0, snapshot.downloaded / snapshot.total * 100)
+            if snapshot.total
+            else 0.0
+        )
+        remaining = max(0, snapshot.total - snapshot.downloaded)
+        eta = int(remaining / self._speed) if self._speed > 0 else 0
+
+        return (
+            f"> {_naturalsize(snapshot.downloaded, format=_TWO_DECIMALS)} / "
+            f"{_naturalsize(snapshot.total, format=_TWO_DECIMALS)} "
+            f"@ {_naturalsize(self._speed)}/s "
+            f"{self._create_progress_bar(percentage, size=20)} "
+            f"[ {percentage:.2f}% ] "
+            f"{humanize.precisedelta(eta)} left "
+            f"({snapshot.active_tasks} active, {snapshot.finished_tasks} done)"
+        )
+
+    def render(self) -> None:
+        snapshot = self.aggregator.snapshot()
+        self._update_speed(snapshot.downloaded)
+        line = self.format_line(snapshot)
+        with self._write_lock:
+            if self.is_tty:
+                self.stream.write(f"{line}    \r")
+            else:
+                self.stream.write(f"{line}\n")
+            self.stream.flush()
+
+    def write_line(self, message: str) -> None:
+        """
+        Prints a message without getting mixed up with the progress line
+        """
+        with self._write_lock:
+            if self.is_tty:
+                self.stream.write("\r\033[K")
+            self.stream.write(f"{message}\n")
+            self.stream.flush()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.render()
+
+    def stop(self) -> None:
+        """
+        Stops the renderer after drawing the final state
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.render()
+        if self.is_tty:
+            with self._write_lock:
+                self.stream.write("\n")
+                self.stream.flush()
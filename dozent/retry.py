@@ -0,0 +1,280 @@
+import asyncio
+import http.client
+import random
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+try:
+    from dozent.async_http import HTTPError as AsyncHTTPError
+except ModuleNotFoundError:
+    from async_http import HTTPError as AsyncHTTPError
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+# Consecutive failures after which requests to a host are held back
+DEFAULT_FAILURE_THRESHOLD = 5
+
+# Seconds a tripped host is left alone before a single trial request is let through
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# How often callers waiting for a trial request look at the breaker again, in seconds
+_TRIAL_POLL_INTERVAL = 0.5
+
+# Server errors worth asking again for, archive.org answers 503 when it is overloaded
+_RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+# Network errors, unlike local ones such as a full disk
+_RETRYABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+    asyncio.IncompleteReadError,
+    http.client.HTTPException,
+    ssl.SSLError,
+    socket.gaierror,
+    urllib.error.URLError,
+)
+
+# Name resolution failures that asking again won't fix, unlike EAI_AGAIN. An unknown host,
+# or no network at all, would otherwise be retried for minutes
+_FINAL_RESOLUTION_ERRORS = tuple(
+    getattr(socket, name)
+    for name in ("EAI_NONAME", "EAI_NODATA", "EAI_FAIL", "EAI_SERVICE")
+    if hasattr(socket, name)
+)
+
+T = TypeVar("T")
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed request may succeed when it is sent again: connection resets,
+    timeouts, truncated bodies and server errors. Client errors such as 404, unknown hosts
+    and local errors such as a full disk are final
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in _RETRYABLE_STATUSES
+    if isinstance(error, AsyncHTTPError):
+        return error.status in _RETRYABLE_STATUSES
+    if isinstance(error, urllib.error.URLError) and isinstance(
+        error.reason, BaseException
+    ):
+        # urllib wraps the error of the connection
+        return is_retryable(error.reason)
+    if isinstance(error, socket.gaierror):
+        return error.errno not in _FINAL_RESOLUTION_ERRORS
+    return isinstance(error, _RETRYABLE_ERRORS)
+
+
+def host_of(link: str) -> str:
+    return urllib.parse.urlsplit(link).netloc
+
+
+def _sleep(seconds: float, cancel: Optional[threading.Event]) -> bool:
+    """
+    Sleeps, waking up early when `cancel` is set
+    :return: whether `cancel` is set
+    """
+    if cancel is None:
+        time.sleep(seconds)
+        return False
+    return cancel.wait(seconds)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host after `failure_threshold` consecutive failures. Once
+    `reset_timeout` passed, a single trial request is let through: its success closes the
+    breaker again, its failure keeps it open for another `reset_timeout`
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.opened_at is not None
+
+    def wait_time(self) -> float:
+        """
+        :return: 0 when a request may be sent now, otherwise seconds to wait before asking
+        again
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset_timeout - self._clock()
+            if remaining > 0:
+                return remaining
+            if self._trial_in_flight:
+                return _TRIAL_POLL_INTERVAL
+            self._trial_in_flight = True
+            return 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                if self.opened_at is None:
+                    self.times_opened += 1
+                self.opened_at = self._clock()
+                self._trial_in_flight = False
+
+
+class RetryPolicy:
+    """
+    Retries failed requests with jittered exponential backoff, the delay before retry `n`
+    is drawn uniformly from [0, min(max_delay, base_delay * 2**n)]. Requests to a host go
+    through a `CircuitBreaker` shared by every download of the host, so that a struggling
+    server isn't hammered by all the workers at once
+    """
+
+    def __init__(
+        self,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+        uniform: Callable[[float, float], float] = random.uniform,
+    ):
+        """
+        :param max_retries: retries of a request before its error is raised, 0 disables
+        retrying
+        :param base_delay: backoff before the first retry at most, in seconds
+        :param max_delay: cap of the backoff, in seconds
+        :param failure_threshold: consecutive failures that trip the breaker of a host
+        :param reset_timeout: seconds before a tripped host gets a trial request
+        :param clock: monotonic clock in seconds
+        :param uniform: source of the jitter
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._uniform = uniform
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout, self._clock
+                )
+            return breaker
+
+    def backoff(self, retry: int) -> float:
+        """
+        Seconds to wait before retry number `retry`, counting from 0
+        """
+        return self._uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+    def call(
+        self,
+        link: str,
+        attempt: Callable[[], T],
+        on_retry: Optional[Callable[[BaseException], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> T:
+        """
+        Calls `attempt` until it succeeds or fails with an error that isn't retried
+        :param link: link the attempt requests, its host picks the circuit breaker
+        :param on_retry: called with the error before every retry
+        :param cancel: event ending the waits early once set, the last error is raised
+        instead of retrying
+        """
+        breaker = self.breaker(host_of(link))
+        retry = 0
+        while True:
+            wait = breaker.wait_time()
+            while wait > 0 and not _sleep(wait, cancel):
+                wait = breaker.wait_time()
+            try:
+                result = attempt()
+            except Exception as error:
+                if not is_retryable(error):
+                    # Not a sign of a struggling host, e.g. a 404 or a full disk
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if retry >= self.max_retries:
+                    raise
+                if on_retry is not None:
+                    on_retry(error)
+                if _sleep(self.backoff(retry), cancel):
+                    raise
+                retry += 1
+                continue
+            breaker.record_success()
+            return result
+
+    async def call_async(
+        self,
+        link: str,
+        attempt: Callable[[], Awaitable[T]],
+        on_retry: Optional[Callable[[BaseException], None]] = None,
+    ) -> T:
+        """
+        Like `call`, for coroutines. Waits without blocking the event loop
+        """
+        breaker = self.breaker(host_of(link))
+        retry = 0
+        while True:
+            wait = breaker.wait_time()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = breaker.wait_time()
+            try:
+                result = await attempt()
+            except Exception as error:
+                if not is_retryable(error):
+                    # Not a sign of a struggling host, e.g. a 404 or a full disk
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if retry >= self.max_retries:
+                    raise
+                if on_retry is not None:
+                    on_retry(error)
+                await asyncio.sleep(self.backoff(retry))
+                retry += 1
+                continue
+            breaker.record_success()
+            return result
+
+
+# Policy of callers that don't retry, errors are raised right away
+NO_RETRY = RetryPolicy(max_retries=0, failure_threshold=2**31)
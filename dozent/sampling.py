@@ -0,0 +1,292 @@
+import fnmatch
+import http.client
+import re
+import tarfile
+import threading
+from typing import BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+try:
+    from dozent.bandwidth import BandwidthLimiter
+    from dozent.downloader_tools import RangeNotSupportedError, check_cancelled
+    from dozent.http_pool import HTTPConnectionPool, PooledResponse
+    from dozent.retry import NO_RETRY, RetryPolicy
+    from dozent.tar_index import TarMember, minute_of
+except ModuleNotFoundError:
+    from bandwidth import BandwidthLimiter
+    from downloader_tools import RangeNotSupportedError, check_cancelled
+    from http_pool import HTTPConnectionPool, PooledResponse
+    from retry import NO_RETRY, RetryPolicy
+    from tar_index import TarMember, minute_of
+
+# Bytes asked for with every header. A header is 512 bytes, the rest covers the long
+# names and pax records that sit right after some headers, and small members
+_HEADER_READ_SIZE = 4096
+
+_COPY_SIZE = 256 * 1024
+
+_SAMPLE_KEYS = ("first", "every", "glob")
+
+# Splits `every=6h,first=60,glob=*/00/*` on the commas that start a new key, so that a
+# glob may hold commas
+_SAMPLE_SEPARATOR = re.compile(r",(?=(?:%s)=)" % "|".join(_SAMPLE_KEYS))
+
+_CONTENT_RANGE_PATTERN = re.compile(r"bytes \d+-\d+/(\d+)")
+
+
+class MemberSample(NamedTuple):
+    """
+    Members of an archive kept by a sampling run. A member is selected when it matches
+    every criterion that is set
+    """
+
+    # Number of selected members after which the rest of the archive is left alone
+    first: Optional[int] = None
+    # Keeps the hours of the day that are a multiple of it, e.g. 6 for 00, 06, 12 and 18
+    every_hours: Optional[int] = None
+    # fnmatch pattern of the member names, e.g. `*/00/*.json.bz2`
+    pattern: Optional[str] = None
+
+    def selects(self, member: TarMember) -> bool:
+        if self.every_hours is not None and (
+            member.minute is None or member.minute.hour % self.every_hours
+        ):
+            return False
+        if self.pattern is not None and not fnmatch.fnmatchcase(
+            member.name, self.pattern
+        ):
+            return False
+        return True
+
+    def is_done(self, selected: int) -> bool:
+        """
+        Whether the walk can stop after `selected` members were selected
+        """
+        return self.first is not None and selected >= self.first
+
+
+def parse_sample(text: str) -> MemberSample:
+    """
+    Parses a sample given as comma separated criteria: `first=N` for the first N members,
+    `every=Kh` for every K-th hour of the day and `glob=PATTERN` for the member names,
+    e.g. `every=6h,first=120`
+    """
+    values: Dict[str, str] = {}
+    for part in _SAMPLE_SEPARATOR.split(text.strip()):
+        key, separator, value = part.partition("=")
+        if not separator or key not in _SAMPLE_KEYS or not value:
+            raise ValueError(
+                f"Invalid sample {text!r}, expected first=N, every=Kh or glob=PATTERN "
+                "separated by commas"
+            )
+        values[key] = value
+    try:
+        first = int(values["first"]) if "first" in values else None
+        every_hours = int(values["every"].rstrip("h")) if "every" in values else None
+    except ValueError:
+        raise ValueError(f"Invalid sample {text!r}, first and every take a number")
+    if (first is not None and first < 1) or (
+        every_hours is not None and not 1 <= every_hours <= 24
+    ):
+        raise ValueError(
+            f"Invalid sample {text!r}, first must be at least 1 and every between 1h "
+            "and 24h"
+        )
+    return MemberSample(first, every_hours, values.get("glob"))
+
+
+def _padded(size: int) -> int:
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def _pax_records(data: bytes) -> Dict[str, str]:
+    """
+    Records of a pax extended header, `<length> <key>=<value>\\n` one after the other
+    """
+    records = {}
+    position = 0
+    while position < len(data) and data[position] != 0:
+        length_text = data[position:].split(b" ", 1)[0]
+        length = int(length_text)
+        record = data[position + len(length_text) + 1 : position + length - 1]
+        key, _, value = record.partition(b"=")
+        records[key.decode("utf-8", "surrogateescape")] = value.decode(
+            "utf-8", "surrogateescape"
+        )
+        position += length
+    return records
+
+
+class RemoteTar:
+    """
+    Uncompressed tar archive read over HTTP with Range requests, jumping from one 512 byte
+    header to the next over the data of the members. Only the members that are fetched
+    are transferred, a few KB per member otherwise
+    """
+
+    def __init__(
+        self,
+        link: str,
+        pool: HTTPConnectionPool,
+        retry: RetryPolicy = NO_RETRY,
+        cancel: Optional[threading.Event] = None,
+        limiter: Optional[BandwidthLimiter] = None,
+    ):
+        """
+        :param link: link of the archive
+        :param pool: connections the requests are sent on
+        :param retry: policy retrying failed requests
+        :param cancel: event stopping the reads once set, with `DownloadCancelled`
+        :param limiter: bandwidth limiter the bytes read are counted against
+        """
+        self.link = link
+        self.pool = pool
+        self.retry = retry
+        self.cancel = cancel
+        self.limiter = limiter
+        # Size of the archive, known after the first request
+        self.size: Optional[int] = None
+        # Bytes of the archive already read, and their offset
+        self._buffer_start = 0
+        self._buffer = b""
+        # Requests sent so far
+        self.requests = 0
+
+    def _request(self, start: int, end: int) -> PooledResponse:
+        """
+        Asks for the bytes from `start` up to and including `end`
+        :raises RangeNotSupportedError: when the server sends the whole archive
+        """
+        check_cancelled(self.cancel, self.link)
+        self.requests += 1
+        response = self.pool.request(
+            "GET", self.link, headers={"Range": f"bytes={start}-{end}"}
+        )
+        if response.status != 206:
+            response.discard()
+            raise RangeNotSupportedError(self.link)
+        match = _CONTENT_RANGE_PATTERN.fullmatch(
+            response.headers.get("Content-Range", "")
+        )
+        if match is not None:
+            self.size = int(match.group(1))
+        return response
+
+    def _read_exactly(self, response: PooledResponse, size: int) -> bytes:
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = response.read(min(remaining, _COPY_SIZE))
+            if not chunk:
+                raise http.client.IncompleteRead(b"".join(chunks), remaining)
+            if self.limiter is not None:
+                self.limiter.consume(len(chunk), self.cancel)
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def _read(self, offset: int, size: int) -> bytes:
+        """
+        Bytes of the archive at `offset`, fewer at its end. Reads at least
+        `_HEADER_READ_SIZE` bytes when they aren't in the buffer
+        """
+        buffer_end = self._buffer_start + len(self._buffer)
+        if self._buffer_start <= offset and offset + size <= buffer_end:
+            start = offset - self._buffer_start
+            return self._buffer[start : start + size]
+        if self.size is not None and offset >= self.size:
+            return b""
+
+        def attempt() -> bytes:
+            end = offset + max(size, _HEADER_READ_SIZE)
+            if self.size is not None:
+                end = min(end, self.size)
+            with self._request(offset, end - 1) as response:
+                length = int(response.headers.get("Content-Length") or end - offset)
+                return self._read_exactly(response, length)
+
+        self._buffer_start = offset
+        self._buffer = self.retry.call(self.link, attempt, cancel=self.cancel)
+        return self._buffer[:size]
+
+    def members(self) -> Iterator[TarMember]:
+        """
+        Regular files of the archive in archive order, read from their headers only
+        :raises tarfile.HeaderError: when a header is corrupt
+        """
+        offset = 0
+        long_name: Optional[str] = None
+        pax: Dict[str, str] = {}
+        while True:
+            block = self._read(offset, tarfile.BLOCKSIZE)
+            if len(block) < tarfile.BLOCKSIZE:
+                # Truncated archive, or one without its end-of-archive blocks
+                return
+            try:
+                info = tarfile.TarInfo.frombuf(
+                    block, tarfile.ENCODING, "surrogateescape"
+                )
+            except tarfile.EOFHeaderError:
+                return
+            data_offset = offset + tarfile.BLOCKSIZE
+            size = info.size
+            if info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE):
+                data = self._read(data_offset, size)
+                if info.type == tarfile.GNUTYPE_LONGNAME:
+                    long_name = tarfile.nts(data, tarfile.ENCODING, "surrogateescape")
+                else:
+                    pax = _pax_records(data)
+                offset = data_offset + _padded(size)
+                continue
+            if info.type in (tarfile.GNUTYPE_LONGLINK, tarfile.XGLTYPE):
+                offset = data_offset + _padded(size)
+                continue
+
+            name = pax.get("path", long_name or info.name)
+            if "size" in pax:
+                size = int(pax["size"])
+            long_name, pax = None, {}
+            if info.isreg():
+                yield TarMember(name, data_offset, size, minute_of(name))
+            offset = data_offset + _padded(size)
+
+    def fetch(
+        self,
+        member: TarMember,
+        output: BinaryIO,
+        on_bytes: Optional[Callable[[int], None]] = None,
+        on_retry: Optional[Callable[[BaseException], None]] = None,
+    ) -> None:
+        """
+        Writes the data of a member to `output`. The header after it is read with the
+        same request, so that the walk goes on without another round trip
+        :param on_bytes: called with the number of bytes of every write
+        :param on_retry: called with the error before a failed request is sent again,
+        the member is then written again from its start
+        """
+        end = member.offset + _padded(member.size) + _HEADER_READ_SIZE
+        if self.size is not None:
+            end = min(end, self.size)
+
+        def attempt() -> Tuple[int, bytes]:
+            output.seek(0)
+            output.truncate()
+            with self._request(member.offset, end - 1) as response:
+                remaining = member.size
+                while remaining > 0:
+                    check_cancelled(self.cancel, self.link)
+                    chunk = self._read_exactly(response, min(remaining, _COPY_SIZE))
+                    output.write(chunk)
+                    if on_bytes is not None:
+                        on_bytes(len(chunk))
+                    remaining -= len(chunk)
+                length = int(
+                    response.headers.get("Content-Length") or end - member.offset
+                )
+                return (
+                    member.offset + member.size,
+                    self._read_exactly(response, length - member.size),
+                )
+
+        self._buffer_start, self._buffer = self.retry.call(
+            self.link, attempt, on_retry=on_retry, cancel=self.cancel
+        )
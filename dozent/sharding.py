@@ -0,0 +1,219 @@
+import json
+import os
+import socket
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, TypeVar
+
+# Directory of the output directory holding the claims of every node
+CLAIMS_DIRECTORY = ".dozent-claims"
+
+# Seconds without a heartbeat after which the claim of a node is considered dead
+DEFAULT_CLAIM_TTL = 300.0
+
+_CLAIM_SUFFIX = ".claim"
+_DONE_SUFFIX = ".done"
+
+T = TypeVar("T")
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """
+    Parses a shard given as `i/N`, counting from 0
+    :return: the index of the shard and the number of shards
+    """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {text!r}, expected i/N such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {text!r}, i must be between 0 and N - 1")
+    return index, count
+
+
+def shard_links(links: Sequence[T], index: int, count: int) -> List[T]:
+    """
+    The links of shard `index` out of `count`, dealt round-robin so that every shard gets
+    the same number of archives of every period. Every node must be given the same links
+    """
+    return list(links[index::count])
+
+
+def node_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkClaims:
+    """
+    Lets several nodes share the links of a run through a directory they all see, e.g. on
+    NFS. A node claims a link by creating `<name>.claim` with O_EXCL, which succeeds for a
+    single node, and turns it into `<name>.done` once the file is downloaded. Claims are
+    kept alive by a heartbeat touching them every `ttl / 4` seconds, a claim that wasn't
+    touched for `ttl` seconds belongs to a dead node and is taken over. Ages are measured
+    against the mtime of a file the node touches itself, so clock skew between the nodes
+    and the file server doesn't matter
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        ttl: float = DEFAULT_CLAIM_TTL,
+        node: Optional[str] = None,
+    ):
+        """
+        :param directory: directory shared by every node, created when missing
+        :param ttl: seconds without a heartbeat after which a claim is taken over
+        :param node: name of this node in its claims, defaults to the host name and pid
+        """
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.node = node or node_id()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._held: Dict[str, Path] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _name(link: str) -> str:
+        return link.rstrip("/").rsplit("/", 1)[-1]
+
+    def _claim_path(self, link: str) -> Path:
+        return self.directory / (self._name(link) + _CLAIM_SUFFIX)
+
+    def _done_path(self, link: str) -> Path:
+        return self.directory / (self._name(link) + _DONE_SUFFIX)
+
+    def _now(self) -> float:
+        """
+        Current time of the file server
+        """
+        clock = self.directory / f".clock-{self.node}"
+        clock.touch()
+        return clock.stat().st_mtime
+
+    def is_done(self, link: str) -> bool:
+        return self._done_path(link).exists()
+
+    def holder(self, link: str) -> Optional[str]:
+        """
+        :return: node holding the claim of `link`, None when it isn't claimed
+        """
+        try:
+            return json.loads(self._claim_path(link).read_text())["node"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def claim(self, link: str) -> bool:
+        """
+        Claims `link` for this node, taking over a claim whose node is dead
+        :return: whether this node may download `link`, False when another node holds it
+        or it is done
+        """
+        if self.is_done(link):
+            return False
+        path = self._claim_path(link)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._break_if_stale(path):
+                    return False
+                continue
+            with os.fdopen(fd, "w") as file:
+                json.dump({"node": self.node, "link": link}, file)
+            with self._lock:
+                self._held[link] = path
+            # The link may have been finished by the node whose claim was just removed
+            if self.is_done(link):
+                self.release(link)
+                return False
+            return True
+        return False
+
+    def _break_if_stale(self, path: Path) -> bool:
+        """
+        Removes the claim at `path` when its node stopped touching it
+        :return: whether the claim is gone
+        """
+        try:
+            age = self._now() - path.stat().st_mtime
+        except FileNotFoundError:
+            return True
+        if age < self.ttl:
+            return False
+        # Renaming is atomic, a single node gets to break a stale claim
+        stale = path.with_name(f"{path.name}.stale-{self.node}")
+        try:
+            os.rename(path, stale)
+        except FileNotFoundError:
+            return True
+        try:
+            if self._now() - stale.stat().st_mtime < self.ttl:
+                # Another node broke the stale claim and made a new one since the stat,
+                # it is put back unless yet another node claimed the link meanwhile
+                try:
+                    os.link(stale, path)
+                except FileExistsError:
+                    pass
+                return False
+            return True
+        finally:
+            os.remove(stale)
+
+    def complete(self, link: str) -> None:
+        """
+        Marks `link` as downloaded, no node claims it again
+        """
+        with self._lock:
+            path = self._held.pop(link, None)
+        if path is None:
+            self._done_path(link).touch()
+            return
+        try:
+            os.replace(path, self._done_path(link))
+        except FileNotFoundError:
+            # The claim was taken over while this node wasn't heard of
+            self._done_path(link).touch()
+
+    def release(self, link: str) -> None:
+        """
+        Gives up the claim of `link`, e.g. after a failure, so that another node may try
+        """
+        with self._lock:
+            path = self._held.pop(link, None)
+        if path is not None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.ttl / 4):
+            with self._lock:
+                paths = list(self._held.values())
+            for path in paths:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+
+    def __enter__(self) -> "WorkClaims":
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        with self._lock:
+            links = list(self._held)
+        for link in links:
+            self.release(link)
+        try:
+            os.remove(self.directory / f".clock-{self.node}")
+        except FileNotFoundError:
+            pass
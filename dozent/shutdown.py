@@ -0,0 +1,41 @@
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+_SIGNALS = tuple(
+    getattr(signal, name) for name in ("SIGINT", "SIGTERM") if hasattr(signal, name)
+)
+
+
+@contextmanager
+def graceful_shutdown(on_signal: Callable[[], None]) -> Iterator[None]:
+    """
+    Calls `on_signal` on the first SIGINT or SIGTERM received inside the block, instead
+    of ending the process, so that running downloads can record their progress. A second
+    signal gets the handlers that were in place before, e.g. a KeyboardInterrupt for
+    SIGINT. The previous handlers are restored on exit, and nothing is installed outside
+    of the main thread, where Python doesn't deliver signals
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    previous = {signum: signal.getsignal(signum) for signum in _SIGNALS}
+
+    def restore() -> None:
+        for signum, handler in previous.items():
+            # None for handlers that weren't installed from Python
+            if handler is not None:
+                signal.signal(signum, handler)
+
+    def handler(signum, frame) -> None:
+        restore()
+        on_signal()
+
+    for signum in _SIGNALS:
+        signal.signal(signum, handler)
+    try:
+        yield
+    finally:
+        restore()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tarfile
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional
+
+try:
+    from dozent.progress import TaskProgress
+except ModuleNotFoundError:
+    from progress import TaskProgress
+
+# Read size used when parsing a tar stream, much larger than tarfile's default of 10 KB
+_STREAM_BUFFER_SIZE = 1024 * 1024
+
+# Called with the name of a member and a file object its content can be read from
+MemberCallback = Callable[[str, BinaryIO], None]
+
+
+class ProgressReader:
+    """
+    Wraps a binary stream and reports every read to a `TaskProgress`
+    """
+
+    def __init__(self, stream: BinaryIO, task_progress: Optional[TaskProgress]):
+        self.stream = stream
+        self.task_progress = task_progress
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        if self.task_progress is not None:
+            self.task_progress.add(len(data))
+        return data
+
+
+def member_path(output_dir: Path, name: str) -> Path:
+    """
+    Path a tar member is extracted to, refusing names that would escape `output_dir`
+    """
+    output_dir = Path(output_dir).resolve()
+    path = (output_dir / name).resolve()
+    if output_dir != path and output_dir not in path.parents:
+        raise ValueError(f"Refusing to extract {name!r} outside of {output_dir}")
+    return path
+
+
+def extract_tar_stream(
+    stream: BinaryIO,
+    output_dir: Optional[Path] = None,
+    on_member: Optional[MemberCallback] = None,
+    extracted: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Extracts a tar archive while it is being read, without ever storing the archive itself.
+    Every regular member is either written below `output_dir` as soon as it is complete, or
+    handed to `on_member`
+    :param stream: binary stream of the tar archive, e.g. an HTTP response
+    :param output_dir: directory the members are written to
+    :param on_member: callback receiving the name and content of each member instead of
+    writing it to disk. The content has to be consumed before the callback returns
+    :param extracted: names of the members an interrupted call already extracted. As many
+    members are passed over, and the names of the others are appended to it
+    :return: names of the extracted members, in archive order
+    """
+    if output_dir is None and on_member is None:
+        raise ValueError("Either output_dir or on_member is needed")
+
+    names = extracted if extracted is not None else []
+    skip = len(names)
+    with tarfile.open(
+        fileobj=stream, mode="r|*", bufsize=_STREAM_BUFFER_SIZE
+    ) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            if skip:
+                skip -= 1
+                continue
+            content = archive.extractfile(member)
+
+            if on_member is not None:
+                on_member(member.name, content)
+            else:
+                path = member_path(output_dir, member.name)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Only complete members ever show up under their final name
+                partial_path = path.with_name(path.name + ".part")
+                with open(partial_path, "wb") as file:
+                    shutil.copyfileobj(content, file, _STREAM_BUFFER_SIZE)
+                os.replace(partial_path, path)
+
+            names.append(member.name)
+    return names
@@ -0,0 +1,194 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+try:
+    from dozent.download_scheduler import DownloadResults
+    from dozent.download_state import DownloadState
+    from dozent.downloader_tools import DownloaderTools
+    from dozent.http_pool import HTTPConnectionPool, borrow
+except ModuleNotFoundError:
+    from download_scheduler import DownloadResults
+    from download_state import DownloadState
+    from downloader_tools import DownloaderTools
+    from http_pool import HTTPConnectionPool, borrow
+
+# Conditional requests sent at the same time
+DEFAULT_MAX_CHECKS = 16
+
+# How a local file compares with the remote one, with the marker shown by `format`
+SYNC_MISSING = "missing"
+SYNC_INCOMPLETE = "incomplete"
+SYNC_CHANGED = "changed"
+SYNC_UNCHECKED = "unchecked"
+SYNC_UNCHANGED = "unchanged"
+
+_MARKERS = {
+    SYNC_MISSING: "+",
+    SYNC_INCOMPLETE: ">",
+    SYNC_CHANGED: "~",
+    SYNC_UNCHECKED: "?",
+    SYNC_UNCHANGED: "=",
+}
+
+
+class SyncEntry(NamedTuple):
+    link: str
+    path: Path
+    status: str
+    reason: str = ""
+
+    @property
+    def needs_download(self) -> bool:
+        return self.status != SYNC_UNCHANGED
+
+
+class SyncPlan:
+    """
+    How every local file compares with the remote one, in the order of the links
+    """
+
+    def __init__(self, entries: List[SyncEntry], wall_seconds: float = 0.0):
+        self.entries = entries
+        self.wall_seconds = wall_seconds
+
+    def with_status(self, status: str) -> List[SyncEntry]:
+        return [entry for entry in self.entries if entry.status == status]
+
+    @property
+    def to_download(self) -> List[str]:
+        """
+        Links of the files that are missing, incomplete, changed or couldn't be checked
+        """
+        return [entry.link for entry in self.entries if entry.needs_download]
+
+    def format(self) -> str:
+        """
+        Diff of the local files against the remote ones, one line per file that needs to
+        be downloaded
+        """
+        lines = [
+            f"{_MARKERS[entry.status]} {entry.path.name}"
+            + (f" ({entry.reason})" if entry.reason else "")
+            for entry in self.entries
+            if entry.needs_download
+        ]
+        lines.append(
+            ", ".join(
+                f"{len(self.with_status(status))} {status}" for status in _MARKERS
+            )
+            + f", checked in {self.wall_seconds:.1f}s"
+        )
+        return "\n".join(lines)
+
+
+class SyncReport:
+    """
+    Plan of a sync and outcome of the files it downloaded
+    """
+
+    def __init__(self, plan: SyncPlan, results: DownloadResults):
+        self.plan = plan
+        self.results = results
+
+    @property
+    def ok(self) -> bool:
+        return self.results.ok
+
+    def format(self) -> str:
+        if not self.plan.to_download:
+            return f"Everything is up to date ({len(self.plan.entries)} file(s))"
+        return self.results.format()
+
+
+def _conditional_headers(path: Path, state: Optional[DownloadState]) -> Dict[str, str]:
+    """
+    Headers asking the server to answer 304 when the remote file is the local one: the
+    validators of the state when there is one, the modification time of the file
+    otherwise
+    """
+    if state is not None and (state.etag or state.last_modified):
+        headers = {}
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+        return headers
+    return {"If-Modified-Since": formatdate(os.path.getmtime(path), usegmt=True)}
+
+
+def check_file(
+    link: str,
+    download_dir: Path,
+    pool: Optional[HTTPConnectionPool] = None,
+    expected_size: Optional[int] = None,
+) -> SyncEntry:
+    """
+    Compares the local copy of `link` with the remote file. Only the files that are on
+    disk and complete are asked for with a conditional HEAD request. A file downloaded
+    without a state gets one from the answer, so that the next sync sends its ETag
+    :param expected_size: size of the remote file from the catalog, None when unknown
+    """
+    path = Path(download_dir) / DownloaderTools.get_file_name(link)
+    if not path.exists():
+        return SyncEntry(link, path, SYNC_MISSING)
+
+    state = DownloadState.load(path)
+    if state is not None:
+        if state.url != link:
+            return SyncEntry(link, path, SYNC_CHANGED, "downloaded from another link")
+        if not state.is_complete:
+            done = state.completed_bytes * 100 // max(1, state.size)
+            return SyncEntry(link, path, SYNC_INCOMPLETE, f"{done}% downloaded")
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        return SyncEntry(
+            link,
+            path,
+            SYNC_CHANGED,
+            f"{size} bytes, {expected_size} in the catalog",
+        )
+
+    try:
+        with borrow(pool) as pool, pool.request(
+            "HEAD", link, _conditional_headers(path, state)
+        ) as response:
+            status = response.status
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except OSError as error:
+        return SyncEntry(link, path, SYNC_UNCHECKED, repr(error))
+
+    if status != 304:
+        return SyncEntry(link, path, SYNC_CHANGED, "changed upstream")
+    if state is None:
+        DownloadState(
+            path, link, size, etag, last_modified, completed=[(0, size)]
+        ).save()
+    return SyncEntry(link, path, SYNC_UNCHANGED)
+
+
+def plan_sync(
+    links: Iterable[str],
+    download_dir: Path,
+    pool: Optional[HTTPConnectionPool] = None,
+    size_of: Callable[[str], Optional[int]] = lambda link: None,
+    max_checks: int = DEFAULT_MAX_CHECKS,
+) -> SyncPlan:
+    """
+    Compares the local copies of `links` with the remote files, sending the conditional
+    requests `max_checks` at a time over `pool`
+    :param size_of: size of the remote file at a link from the catalog, None when unknown
+    """
+    links = list(links)
+    started = time.perf_counter()
+    with borrow(pool) as pool, ThreadPoolExecutor(max(1, max_checks)) as executor:
+        entries = list(
+            executor.map(
+                lambda link: check_file(link, download_dir, pool, size_of(link)), links
+            )
+        )
+    return SyncPlan(entries, time.perf_counter() - started)
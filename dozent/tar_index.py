@@ -0,0 +1,327 @@
+import datetime
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+try:
+    from dozent.columnar import open_member
+except ModuleNotFoundError:
+    from columnar import open_member
+
+INDEX_FILE_SUFFIX = ".dozent-index"
+
+_FORMAT_VERSION = 1
+
+# Minutes as stored in an index, the same text as `isoformat` gives
+_MINUTE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# Members of the stream archives are named by the minute they hold, e.g.
+# `2020/06/01/13/05.json.bz2`, sometimes under a directory
+_MINUTE_PATTERN = re.compile(r"(\d{4})/(\d{2})/(\d{2})/(\d{2})/(\d{2})\.[^/]*$")
+
+
+def minute_of(name: str) -> Optional[datetime.datetime]:
+    """
+    Minute a member holds the tweets of, from its name
+    :return: the start of the minute, None when the name doesn't tell
+    """
+    match = _MINUTE_PATTERN.search(name)
+    if match is None:
+        return None
+    try:
+        return datetime.datetime(*map(int, match.groups()))
+    except ValueError:
+        return None
+
+
+class TarMember(NamedTuple):
+    """
+    Location of a regular file in an uncompressed tar archive
+    """
+
+    name: str
+    offset: int
+    size: int
+    minute: Optional[datetime.datetime] = None
+
+
+class _MemberReader(io.RawIOBase):
+    """
+    Reads the bytes of a single member by seeking in the archive, so that nothing before
+    or after it is read
+    """
+
+    def __init__(self, index: "TarIndex", member: TarMember):
+        self._index = index
+        self._start = member.offset
+        self._size = member.size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        remaining = self._size - self._position
+        if remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:remaining]
+        count = self._index._read_at(self._start + self._position, view)
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._position
+
+
+class TarIndex:
+    """
+    Sidecar index of an uncompressed tar archive, stored next to it as
+    `<archive>.dozent-index`. Maps every regular file of the archive to the offset and size
+    of its data and to the minute it holds, so that a single member can be read without
+    scanning the archive up to it. The members are read through a single handle of the
+    archive, closed with `close` or by using the index as a context manager
+    """
+
+    def __init__(
+        self,
+        archive: Path,
+        members: List[TarMember],
+        archive_size: int,
+        archive_mtime_ns: int,
+    ):
+        """
+        :param archive: path of the indexed archive
+        :param members: regular files of the archive in archive order
+        :param archive_size: size of the archive when it was indexed
+        :param archive_mtime_ns: modification time of the archive when it was indexed, an
+        index whose archive changed since is stale
+        """
+        self.archive = Path(archive)
+        self.members = members
+        self.archive_size = archive_size
+        self.archive_mtime_ns = archive_mtime_ns
+        self._by_name: Dict[str, TarMember] = {
+            member.name: member for member in members
+        }
+        self._file: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def index_path_for(archive: Path) -> Path:
+        archive = Path(archive)
+        return archive.with_name(archive.name + INDEX_FILE_SUFFIX)
+
+    @property
+    def index_path(self) -> Path:
+        return self.index_path_for(self.archive)
+
+    @classmethod
+    def build(cls, archive: Path) -> "TarIndex":
+        """
+        Indexes an archive reading only its headers: the data of every member is seeked
+        over, so a 2.5 GB archive is indexed with a few MB of reads
+        :raises tarfile.ReadError: when the archive isn't an uncompressed tar, or is
+        truncated
+        """
+        archive = Path(archive)
+        stat = archive.stat()
+        members = []
+        with tarfile.open(archive, mode="r:") as tar:
+            for member in tar:
+                if member.isfile():
+                    members.append(
+                        TarMember(
+                            member.name,
+                            member.offset_data,
+                            member.size,
+                            minute_of(member.name),
+                        )
+                    )
+        return cls(archive, members, stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, archive: Path) -> Optional["TarIndex"]:
+        """
+        Loads the index stored next to `archive`
+        :return: the index, or None when there is none, it can't be read or the archive
+        changed since it was built
+        """
+        archive = Path(archive)
+        try:
+            with open(cls.index_path_for(archive)) as file:
+                data = json.load(file)
+            if data["version"] != _FORMAT_VERSION:
+                return None
+            stat = archive.stat()
+            if (stat.st_size, stat.st_mtime_ns) != (data["size"], data["mtime_ns"]):
+                return None
+            members = [
+                TarMember(
+                    name,
+                    offset,
+                    size,
+                    (
+                        datetime.datetime.strptime(minute, _MINUTE_FORMAT)
+                        if minute
+                        else None
+                    ),
+                )
+                for name, offset, size, minute in data["members"]
+            ]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return cls(archive, members, data["size"], data["mtime_ns"])
+
+    @classmethod
+    def for_archive(cls, archive: Path, rebuild: bool = False) -> "TarIndex":
+        """
+        Loads the index of `archive`, building and saving it when it is missing or stale
+        :param rebuild: build it even when a fresh one is stored
+        """
+        index = None if rebuild else cls.load(archive)
+        if index is None:
+            index = cls.build(archive)
+            index.save()
+        return index
+
+    def save(self) -> None:
+        """
+        Writes the index atomically, so that a reader never sees a partial one
+        """
+        data = {
+            "version": _FORMAT_VERSION,
+            "size": self.archive_size,
+            "mtime_ns": self.archive_mtime_ns,
+            "members": [
+                [
+                    member.name,
+                    member.offset,
+                    member.size,
+                    member.minute.strftime(_MINUTE_FORMAT) if member.minute else None,
+                ]
+                for member in self.members
+            ],
+        }
+        temp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(temp_path, "w") as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(temp_path, self.index_path)
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __iter__(self) -> Iterator[TarMember]:
+        return iter(self.members)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def member(self, name: str) -> TarMember:
+        """
+        :raises KeyError: when the archive has no regular file of that name
+        """
+        return self._by_name[name]
+
+    def between(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> List[TarMember]:
+        """
+        Members holding the minutes from `start` up to, but not including, `end`, in
+        archive order. Members whose name doesn't tell a minute are left out
+        """
+        return [
+            member
+            for member in self.members
+            if member.minute is not None and start <= member.minute < end
+        ]
+
+    def hour(self, hour: datetime.datetime) -> List[TarMember]:
+        """
+        Members holding the minutes of the hour `hour` is in
+        """
+        start = hour.replace(minute=0, second=0, microsecond=0)
+        return self.between(start, start + datetime.timedelta(hours=1))
+
+    def _read_at(self, offset: int, buffer: memoryview) -> int:
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.archive, "rb")
+            self._file.seek(offset)
+            return self._file.readinto(buffer)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "TarIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def open(self, member: Union[str, TarMember]) -> BinaryIO:
+        """
+        Opens the raw bytes of a member, e.g. the compressed `.json.bz2`, without reading
+        the rest of the archive
+        """
+        if isinstance(member, str):
+            member = self.member(member)
+        return io.BufferedReader(_MemberReader(self, member))
+
+    def open_tweets(self, member: Union[str, TarMember]) -> BinaryIO:
+        """
+        Opens the JSON lines of a member, decompressed on the fly
+        :raises ValueError: when the member doesn't hold tweets
+        """
+        if isinstance(member, str):
+            member = self.member(member)
+        lines = open_member(member.name, self.open(member))
+        if lines is None:
+            raise ValueError(f"{member.name} doesn't hold JSON lines")
+        return lines
+
+
+def index_archive(path: Path) -> Optional[TarIndex]:
+    """
+    Builds the index of a downloaded archive unless a fresh one is stored. Used as a
+    post-download hook, paths that aren't tar archives are left alone
+    :return: the index, None for paths that aren't tar archives
+    """
+    path = Path(path)
+    if not path.name.endswith(".tar") or not path.is_file():
+        return None
+    return TarIndex.for_archive(path)
+
+
+def index_paths(paths: Iterable[Path], rebuild: bool = False) -> List[TarIndex]:
+    """
+    Indexes the tar archives among `paths`, and in the directories among them
+    :param rebuild: build the indexes even when fresh ones are stored
+    """
+    indexes = []
+    for path in map(Path, paths):
+        candidates = sorted(path.rglob("*.tar")) if path.is_dir() else [path]
+        for candidate in candidates:
+            if candidate.is_file():
+                indexes.append(TarIndex.for_archive(candidate, rebuild=rebuild))
+    return indexes
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import queue
+import tarfile
+import threading
+from typing import (
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+
+try:
+    from dozent.bandwidth import BandwidthLimiter, ThrottledReader
+    from dozent.columnar import open_member
+    from dozent.dedup import IdTransaction, SeenIds
+    from dozent.engines.extract_engine import ExtractOnTheFlyEngine
+    from dozent.http_pool import HTTPConnectionPool, LengthCheckedReader, borrow
+    from dozent.retry import NO_RETRY, RetryPolicy, is_retryable
+except ModuleNotFoundError:
+    from bandwidth import BandwidthLimiter, ThrottledReader
+    from columnar import open_member
+    from dedup import IdTransaction, SeenIds
+    from engines.extract_engine import ExtractOnTheFlyEngine
+    from http_pool import HTTPConnectionPool, LengthCheckedReader, borrow
+    from retry import NO_RETRY, RetryPolicy, is_retryable
+
+# Tweets handed from the reading thread to the consumer at once
+DEFAULT_BATCH_SIZE = 256
+
+# Batches read ahead of the consumer, the reading thread blocks once they are all full
+DEFAULT_MAX_BUFFERED_BATCHES = 16
+
+# Read size used when parsing a tar stream
+_STREAM_BUFFER_SIZE = 1024 * 1024
+
+# How often a thread blocked on the buffer checks whether the other side left
+_POLL_TIMEOUT = 0.5
+
+# Keeps a tweet when it returns True
+Predicate = Callable[[dict], bool]
+
+_MISSING = object()
+
+
+class _Done:
+    """
+    Put on the buffer once every archive was read, with the error that ended the reading
+    """
+
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+class _ConsumerGone(Exception):
+    pass
+
+
+def project(tweet: dict, fields: Sequence[str]) -> dict:
+    """
+    Keeps the fields of a tweet given as dotted paths such as `user.id`, missing ones are
+    None
+    :return: flat dictionary by field path
+    """
+    projected = {}
+    for field in fields:
+        value = tweet
+        for key in field.split("."):
+            value = value.get(key, _MISSING) if isinstance(value, dict) else _MISSING
+            if value is _MISSING:
+                break
+        projected[field] = None if value is _MISSING else value
+    return projected
+
+
+def iter_records(stream: BinaryIO) -> Iterator[dict]:
+    """
+    Parses the tweets of a tar archive while it is read, decompressing its `.json.bz2` and
+    `.json.gz` members on the fly. Other records of the stream, e.g. deletions, and
+    malformed lines are skipped
+    :param stream: binary stream of the archive, e.g. an HTTP response
+    """
+    with tarfile.open(
+        fileobj=stream, mode="r|*", bufsize=_STREAM_BUFFER_SIZE
+    ) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            lines = open_member(member.name, archive.extractfile(member))
+            if lines is None:
+                continue
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    tweet = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(tweet, dict) and "created_at" in tweet:
+                    yield tweet
+
+
+class TweetStream:
+    """
+    Iterates over the tweets of archives streamed over HTTP, without writing anything to
+    disk. A thread reads the archives one after the other and hands the tweets over in
+    batches through a buffer of `max_buffered_batches`: once it is full the thread stops
+    reading from the connection, so a slow consumer slows the download down instead of
+    growing memory. An archive whose connection fails is requested again, skipping the
+    records that were already read. With `seen`, tweets whose id was already seen are
+    left out, and the ids of an archive are recorded once it was read completely
+    """
+
+    def __init__(
+        self,
+        links: Iterable[str],
+        fields: Optional[Sequence[str]] = None,
+        predicate: Optional[Predicate] = None,
+        pool: Optional[HTTPConnectionPool] = None,
+        retry: Optional[RetryPolicy] = None,
+        limiter: Optional[BandwidthLimiter] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_buffered_batches: int = DEFAULT_MAX_BUFFERED_BATCHES,
+        seen: Optional[SeenIds] = None,
+    ):
+        """
+        :param links: links of tar archives
+        :param fields: dotted paths of the fields every tweet is projected on, whole tweets
+        are yielded when None
+        :param predicate: called with every whole tweet, those it returns False for are
+        left out
+        :param pool: connection pool the archives are requested with, a new one is used
+        when None
+        :param retry: policy retrying failed requests, failures are raised when None
+        :param limiter: bandwidth limiter the archives are read through
+        :param batch_size: tweets handed over at once
+        :param max_buffered_batches: batches read ahead of the consumer
+        :param seen: ids of the tweets already consumed, see `dozent.dedup`. The tweets
+        of an archive the stream stops in are yielded again by the next run
+        :raises ValueError: for links of archives that can't be streamed, such as zips
+        """
+        self.links = list(links)
+        not_streamable = [
+            link for link in self.links if not ExtractOnTheFlyEngine.is_streamable(link)
+        ]
+        if not_streamable:
+            raise ValueError(
+                f"Only tar archives can be streamed, not {', '.join(not_streamable)}"
+            )
+        self.fields = tuple(fields) if fields is not None else None
+        self.predicate = predicate
+        self.pool = pool
+        self.retry = retry if retry is not None else NO_RETRY
+        self.limiter = limiter
+        self.batch_size = max(1, batch_size)
+        self.seen = seen
+        # Tweets left out because their id was seen
+        self.duplicates = 0
+        self._buffer = queue.Queue(maxsize=max(1, max_buffered_batches))
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _put(self, item) -> None:
+        while True:
+            if self._stopped.is_set():
+                raise _ConsumerGone()
+            try:
+                self._buffer.put(item, timeout=_POLL_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+    def _hand_over(
+        self, batch: List[dict], transaction: Optional[IdTransaction]
+    ) -> None:
+        if transaction is not None:
+            count = len(batch)
+            batch = transaction.new_tweets(batch)
+            self.duplicates += count - len(batch)
+        if self.fields is not None:
+            batch = [project(tweet, self.fields) for tweet in batch]
+        if batch:
+            self._put(batch)
+
+    def _read_archive(self, link: str, pool: HTTPConnectionPool) -> None:
+        transaction = self.seen.transaction() if self.seen is not None else None
+        try:
+            self._read_records(link, pool, transaction)
+        except BaseException:
+            if transaction is not None:
+                transaction.abort()
+            raise
+        if transaction is not None:
+            transaction.commit()
+
+    def _read_records(
+        self,
+        link: str,
+        pool: HTTPConnectionPool,
+        transaction: Optional[IdTransaction],
+    ) -> None:
+        batch: List[dict] = []
+        # Records read from the archive so far, skipped by a retry
+        read = 0
+        retries = 0
+        while True:
+            try:
+                with pool.request("GET", link) as response:
+                    records = iter_records(
+                        ThrottledReader(
+                            LengthCheckedReader(response), self.limiter, self._stopped
+                        )
+                    )
+                    for position, tweet in enumerate(records):
+                        if position < read:
+                            continue
+                        read += 1
+                        if self.predicate is not None and not self.predicate(tweet):
+                            continue
+                        batch.append(tweet)
+                        if len(batch) >= self.batch_size:
+                            self._hand_over(batch, transaction)
+                            batch = []
+                break
+            except Exception as error:
+                if not is_retryable(error) or retries >= self.retry.max_retries:
+                    raise
+                if self._stopped.wait(self.retry.backoff(retries)):
+                    raise _ConsumerGone()
+                retries += 1
+        if batch:
+            self._hand_over(batch, transaction)
+
+    def _run(self) -> None:
+        try:
+            with borrow(self.pool) as pool:
+                for link in self.links:
+                    self._read_archive(link, pool)
+        except _ConsumerGone:
+            return
+        except BaseException as error:
+            self._finish(error)
+            return
+        self._finish(None)
+
+    def _finish(self, error: Optional[BaseException]) -> None:
+        try:
+            self._put(_Done(error))
+        except _ConsumerGone:
+            pass
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            raise RuntimeError("A TweetStream can only be iterated once")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Stops reading, the connection of the current archive is dropped
+        """
+        self._stopped.set()
+
+    def _next_batch(self) -> Optional[List[dict]]:
+        """
+        Waits for the next batch
+        :return: the batch, None once every archive was read or the stream was closed
+        """
+        while True:
+            try:
+                item = self._buffer.get(timeout=_POLL_TIMEOUT)
+                break
+            except queue.Empty:
+                if self._stopped.is_set():
+                    return None
+        if isinstance(item, _Done):
+            if item.error is not None:
+                raise item.error
+            return None
+        return item
+
+    def __iter__(self) -> Iterator[dict]:
+        self._start()
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                yield from batch
+        finally:
+            self.close()
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        """
+        Like iterating synchronously, waiting for the batches without blocking the event
+        loop
+        """
+        self._start()
+        # The loop running this coroutine, get_running_loop needs Python 3.7
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, self._next_batch)
+                if batch is None:
+                    return
+                for tweet in batch:
+                    yield tweet
+        finally:
+            self.close()
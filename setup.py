@@ -8,7 +8,7 @@ with open(path.join(this_directory, 'README.md'), encoding='utf-8') as f:
 
 setup(
   name = 'dozent',
-  packages = ['dozent'],
+  packages = ['dozent', 'dozent.engines'],
   version = '1.0.2',
   license='GNU-3',
   description = 'Dozent is a powerful downloader that is used to download a ton of twitter data from the internet archive.',
@@ -0,0 +1,140 @@
+import datetime
+import os
+import threading
+import time
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.bandwidth import (
+    BandwidthLimiter,
+    BandwidthSchedule,
+    TokenBucket,
+    parse_rate,
+)
+from dozent.download_scheduler import DownloadScheduler
+from dozent.engines import get_engine
+
+TEST_DIR = Path("test_bandwidth_dir")
+_MB = 1024 * 1024
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BandwidthTestCase(unittest.TestCase):
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("200M"), 200 * _MB)
+        self.assertEqual(parse_rate("1.5k"), 1536)
+        self.assertEqual(parse_rate("4096"), 4096)
+        self.assertIsNone(parse_rate("unlimited"))
+        self.assertIsNone(parse_rate("0"))
+        with self.assertRaises(ValueError):
+            parse_rate("10X")
+        with self.assertRaises(ValueError):
+            parse_rate("fastM")
+
+    def test_schedule(self):
+        schedule = BandwidthSchedule.parse("08:00=50M,20:00=500M")
+        at = lambda hour: datetime.datetime(2020, 6, 1, hour, 30)
+
+        self.assertEqual(schedule.rate_at(at(7)), 500 * _MB)
+        self.assertEqual(schedule.rate_at(at(8)), 50 * _MB)
+        self.assertEqual(schedule.rate_at(at(19)), 50 * _MB)
+        self.assertEqual(schedule.rate_at(at(23)), 500 * _MB)
+        self.assertEqual(BandwidthSchedule.parse("1M").rate_at(at(12)), _MB)
+
+    def test_token_bucket_goes_into_debt(self):
+        clock = _FakeClock()
+        bucket = TokenBucket(1000, clock=clock)
+
+        self.assertEqual(bucket.reserve(0), 0.0)
+        self.assertAlmostEqual(bucket.reserve(500), 0.5)
+        # The next caller waits for the debt of the previous one too
+        self.assertAlmostEqual(bucket.reserve(500), 1.0)
+        clock.now = 1.0
+        self.assertAlmostEqual(bucket.reserve(100), 0.1)
+        # Idle time only builds up a small burst
+        clock.now = 100.0
+        self.assertEqual(bucket.reserve(100), 0.0)
+        self.assertGreater(bucket.reserve(100), 0.0)
+
+        bucket.rate = None
+        self.assertEqual(bucket.reserve(10 * _MB), 0.0)
+
+    def test_cancel_ends_the_wait(self):
+        limiter = BandwidthLimiter(BandwidthSchedule([(datetime.time(0), 50 * 1024)]))
+        cancel = threading.Event()
+        threading.Timer(0.1, cancel.set).start()
+        started = time.monotonic()
+        # A 1 MB read at 50K/s would wait for about 20 seconds
+        limiter.consume(_MB, cancel)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_control_file_changes_the_rate(self):
+        TEST_DIR.mkdir()
+        control_file = TEST_DIR / "bandwidth"
+        clock = _FakeClock()
+        limiter = BandwidthLimiter(
+            BandwidthSchedule.parse("1M"), control_file=control_file, clock=clock
+        )
+        limiter.reserve(0)
+        self.assertEqual(limiter.rate, _MB)
+
+        control_file.write_text("2M\n")
+        limiter.reserve(0)
+        # Only looked at once a second
+        self.assertEqual(limiter.rate, _MB)
+        clock.now = 1.0
+        limiter.reserve(0)
+        self.assertEqual(limiter.rate, 2 * _MB)
+
+        control_file.write_text("garbage")
+        os.utime(control_file, (0, 0))
+        clock.now = 2.0
+        limiter.reserve(0)
+        self.assertEqual(limiter.rate, 2 * _MB)
+
+    def _timed_download(self, engine_name: str, rate: int, **engine_options) -> float:
+        files = {f"archive_{index}.tar": os.urandom(_MB) for index in range(3)}
+        limiter = BandwidthLimiter(BandwidthSchedule([(datetime.time(0), rate)]))
+        engine = get_engine(engine_name, limiter=limiter, **engine_options)
+        TEST_DIR.mkdir(exist_ok=True)
+
+        with LocalHTTPServer(files) as server, engine:
+            scheduler = DownloadScheduler(
+                download_dir=TEST_DIR,
+                max_concurrent_files=3,
+                max_connections=6,
+                verbose=False,
+                download_function=engine.download,
+            )
+            started = time.perf_counter()
+            scheduler.run([server.url(name) for name in files])
+            elapsed = time.perf_counter() - started
+
+        for name, content in files.items():
+            self.assertEqual((TEST_DIR / name).read_bytes(), content)
+        return elapsed
+
+    def test_aggregate_rate_asyncio_engine(self):
+        elapsed = self._timed_download("asyncio", rate=2 * _MB)
+        # 3 MB at 2 MB/s, less the initial burst
+        self.assertAlmostEqual(elapsed, 1.5, delta=0.15)
+
+    def test_aggregate_rate_pysmartdl_engine(self):
+        elapsed = self._timed_download("pysmartdl", rate=2 * _MB)
+        self.assertAlmostEqual(elapsed, 1.5, delta=0.15)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_suite import (
+    archive_dates,
+    archive_name,
+    compare,
+    run_scenario,
+)
+from benchmarks.local_http_server import LocalHTTPServer, LocalHTTPServerProcess
+
+CONTENT = b"x" * 64 * 1024
+
+
+def _result(engine="asyncio", mb_per_second=10.0, status="ok"):
+    return {
+        "engine": engine,
+        "max_concurrent_files": 4,
+        "max_connections": 16,
+        "mb_per_second": mb_per_second,
+        "status": status,
+    }
+
+
+class LocalHTTPServerTestCase(unittest.TestCase):
+    def test_latency(self):
+        with LocalHTTPServer({"a.tar": CONTENT}, latency=0.2) as server:
+            started = time.monotonic()
+            urllib.request.urlopen(server.url("a.tar")).read()
+            self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_injected_failures(self):
+        with LocalHTTPServer({"a.tar": CONTENT}, fail_rate=0.5, seed=1) as server:
+            statuses = []
+            for _ in range(40):
+                try:
+                    with urllib.request.urlopen(server.url("a.tar")) as response:
+                        statuses.append(response.status)
+                except urllib.error.HTTPError as error:
+                    statuses.append(error.code)
+
+        self.assertGreater(statuses.count(503), 5)
+        self.assertGreater(statuses.count(200), 5)
+
+
+class BenchSuiteTestCase(unittest.TestCase):
+    def test_archive_dates(self):
+        dates = archive_dates(3)
+        self.assertEqual(len(dates), 3)
+        self.assertEqual((dates[-1] - dates[0]).days, 2)
+        self.assertEqual(archive_name(dates[0]), "twitter_stream_2020_06_28.tar")
+
+    def test_run_scenario(self):
+        dates = archive_dates(3)
+        files = {archive_name(day): CONTENT for day in dates}
+        with LocalHTTPServerProcess(files) as server:
+            result = run_scenario(
+                server.url(""),
+                dates,
+                {"engine": "asyncio", "max_concurrent_files": 2, "max_connections": 4},
+            )
+
+        self.assertEqual(result["status"], "ok", result)
+        self.assertEqual(result["bytes"], 3 * len(CONTENT))
+        for key in ("seconds", "mb_per_second", "cpu_seconds", "peak_threads"):
+            self.assertGreater(result[key], 0)
+
+    def test_compare(self):
+        baseline = [_result(), _result(engine="pysmartdl")]
+        self.assertEqual(compare([_result(mb_per_second=9.5)], baseline), [])
+
+        regressions = compare(
+            [
+                _result(mb_per_second=5),
+                _result(engine="pysmartdl", status="failed"),
+            ],
+            baseline,
+        )
+        self.assertEqual(len(regressions), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
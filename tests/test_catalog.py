@@ -0,0 +1,207 @@
+import datetime
+import json
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from dozent.catalog import (
+    Catalog,
+    FileMetadata,
+    TWITTER_ARCHIVE_STREAM_LINKS_PATH,
+    date_range_of,
+    item_identifier,
+    mirror_link,
+)
+from dozent.integrity import Checksums
+
+TEST_DIR = Path("test_catalog_dir")
+
+
+def _date_link(year, month, day="NaN"):
+    name = f"{year}-{month}" if day == "NaN" else f"{year}_{month}_{day}"
+    return {
+        "day": day,
+        "month": month,
+        "year": year,
+        "link": f"https://archive.org/download/archiveteam-twitter-stream-{year}-{month}/"
+        f"twitter_stream_{name}.tar",
+    }
+
+
+class CatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.catalog = Catalog(
+            [
+                _date_link("2017", "07", "02"),
+                _date_link("2017", "06"),
+                _date_link("2017", "07", "01"),
+                _date_link("2017", "07", "31"),
+                _date_link("2017", "08", "01"),
+            ]
+        )
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def _days(self, entries):
+        return [(entry.start.isoformat(), entry.end.isoformat()) for entry in entries]
+
+    def test_date_range_of_monthly_entry(self):
+        self.assertEqual(
+            date_range_of(_date_link("2020", "02")),
+            (datetime.date(2020, 2, 1), datetime.date(2020, 2, 29)),
+        )
+
+    def test_entries_are_sorted(self):
+        starts = [entry.start for entry in self.catalog.entries]
+        self.assertEqual(starts, sorted(starts))
+
+    def test_between(self):
+        entries = self.catalog.between(
+            datetime.date(2017, 7, 1), datetime.date(2017, 7, 2)
+        )
+        self.assertEqual(
+            self._days(entries),
+            [("2017-07-01", "2017-07-01"), ("2017-07-02", "2017-07-02")],
+        )
+        self.assertEqual(
+            self.catalog.between(datetime.date(2017, 9, 1), datetime.date(2017, 9, 30)),
+            [],
+        )
+
+    def test_between_includes_monthly_entries_overlapping_the_range(self):
+        entries = self.catalog.between(
+            datetime.date(2017, 6, 15), datetime.date(2017, 7, 1)
+        )
+        self.assertEqual(
+            self._days(entries),
+            [("2017-06-01", "2017-06-30"), ("2017-07-01", "2017-07-01")],
+        )
+
+    def test_full_catalog(self):
+        catalog = Catalog.load(TWITTER_ARCHIVE_STREAM_LINKS_PATH, None)
+        self.assertEqual(len(catalog), 811)
+        self.assertEqual(catalog.first_day, datetime.date(2011, 9, 1))
+        self.assertEqual(catalog.last_day, datetime.date(2020, 6, 30))
+        self.assertIsNone(Catalog([]).first_day)
+        entries = catalog.between(
+            datetime.date(2011, 9, 20), datetime.date(2011, 9, 20)
+        )
+        self.assertEqual(len(entries), 1)
+        self.assertTrue(entries[0].link.endswith("twitter-json-scrape-2011-09.zip"))
+
+    def test_metadata_cache(self):
+        cache_path = TEST_DIR / "metadata.json"
+        links = [entry.link for entry in self.catalog.entries]
+        requested = []
+
+        def fetch(identifier):
+            requested.append(identifier)
+            return {
+                "twitter_stream_2017_07_01.tar": FileMetadata(100, "a" * 32),
+                "twitter_stream_2017_07_02.tar": FileMetadata(200, "b" * 32),
+            }
+
+        self.assertEqual(self.catalog.total_size(links), (0, 5))
+        self.catalog.metadata_cache_path = cache_path
+        self.assertEqual(self.catalog.refresh_metadata(links, fetch=fetch), 2)
+        self.assertEqual(
+            sorted(requested),
+            [
+                "archiveteam-twitter-stream-2017-06",
+                "archiveteam-twitter-stream-2017-07",
+                "archiveteam-twitter-stream-2017-08",
+            ],
+        )
+        self.assertEqual(self.catalog.total_size(links), (300, 3))
+
+        cached = Catalog(
+            [entry.date_link for entry in self.catalog.entries], cache_path
+        )
+        self.assertEqual(cached.metadata(links[1]), FileMetadata(100, "a" * 32))
+        self.assertIsNone(cached.metadata(links[0]))
+
+    def test_expected_checksums(self):
+        links = [entry.link for entry in self.catalog.entries]
+
+        def fetch(identifier):
+            return {
+                "twitter_stream_2017_07_01.tar": FileMetadata(100, "a" * 32, "c" * 40),
+                "twitter_stream_2017_07_02.tar": FileMetadata(200, None, None),
+            }
+
+        self.catalog.refresh_metadata(links, fetch=fetch)
+        self.assertEqual(
+            self.catalog.expected_checksums(links[1]), Checksums("a" * 32, "c" * 40)
+        )
+        self.assertEqual(
+            self.catalog.expected_checksums_of_name("twitter_stream_2017_07_01.tar"),
+            Checksums("a" * 32, "c" * 40),
+        )
+        self.assertIsNone(self.catalog.expected_checksums(links[2]))
+        self.assertIsNone(self.catalog.expected_checksums(links[0]))
+        self.assertIsNone(self.catalog.expected_checksums("https://host/other.tar"))
+        self.assertIsNone(self.catalog.expected_checksums_of_name("other.tar"))
+
+    def test_version_1_metadata_cache(self):
+        cache_path = TEST_DIR / "metadata.json"
+        TEST_DIR.mkdir()
+        link = self.catalog.entries[1].link
+        cache_path.write_text(
+            json.dumps({"version": 1, "files": {link: [100, "a" * 32]}})
+        )
+        cached = Catalog(
+            [entry.date_link for entry in self.catalog.entries], cache_path
+        )
+        self.assertEqual(cached.metadata(link), FileMetadata(100, "a" * 32, None))
+
+    def test_item_identifier(self):
+        self.assertEqual(
+            item_identifier(
+                "https://archive.org/download/archiveteam-twitter-stream-2020-06/"
+                "twitter_stream_2020_06_30.tar"
+            ),
+            "archiveteam-twitter-stream-2020-06",
+        )
+
+    def test_mirror_link(self):
+        link = (
+            "https://archive.org/download/archiveteam-twitter-stream-2020-06/"
+            "twitter_stream_2020_06_30.tar"
+        )
+        self.assertEqual(
+            mirror_link("https://cache.example.com/twitter/", link),
+            "https://cache.example.com/twitter/archiveteam-twitter-stream-2020-06/"
+            "twitter_stream_2020_06_30.tar",
+        )
+        self.assertEqual(
+            mirror_link("http://127.0.0.1:8000", "http://127.0.0.1:9000/file.tar"),
+            "http://127.0.0.1:8000/file.tar",
+        )
+
+    def test_mirrors(self):
+        date_link = _date_link("2017", "07", "01")
+        link = date_link["link"]
+        listed = "https://listed.example.com/twitter_stream_2017_07_01.tar"
+        catalog = Catalog([dict(date_link, mirrors=[listed, link])])
+        self.assertEqual(
+            catalog.mirrors(
+                link, ["https://cache.example.com", "https://archive.org/download"]
+            ),
+            [
+                listed,
+                "https://cache.example.com/archiveteam-twitter-stream-2017-07/"
+                "twitter_stream_2017_07_01.tar",
+            ],
+        )
+        # Links missing from the catalog only get the given mirrors
+        self.assertEqual(
+            self.catalog.mirrors(
+                "http://127.0.0.1:9000/file.tar", ["http://127.0.0.1:8000"]
+            ),
+            ["http://127.0.0.1:8000/file.tar"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import bz2
+import io
+import json
+import tarfile
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+import numpy as np
+
+from dozent.columnar import (
+    ColumnarTable,
+    ColumnarWriter,
+    ingest_path,
+    parse_field,
+    parse_twitter_timestamp,
+    table_name,
+)
+from dozent.dedup import SeenIds
+from tests import CommonTestSetup
+
+TEST_DIR = Path("test_columnar_dir")
+DATA_PATH, _ = CommonTestSetup.set_data_dir_path()
+SAMPLE_FILE = DATA_PATH / "test_sample_files.json.bz2"
+
+
+def _read_tweets(path: Path):
+    with bz2.open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return [record for record in records if "created_at" in record]
+
+
+class ColumnarTestCase(unittest.TestCase):
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_parse_twitter_timestamp(self):
+        self.assertEqual(
+            parse_twitter_timestamp("Mon Jun 01 15:14:00 +0000 2020"), 1591024440
+        )
+        self.assertEqual(
+            parse_twitter_timestamp("Mon Jun 01 17:14:00 +0200 2020"), 1591024440
+        )
+
+    def test_parse_field(self):
+        self.assertEqual(parse_field("user.id"), ("user.id", "int64"))
+        self.assertEqual(parse_field("user.name"), ("user.name", "string"))
+        self.assertEqual(
+            parse_field("quoted_status.created_at"),
+            ("quoted_status.created_at", "timestamp"),
+        )
+        self.assertEqual(parse_field("place.id:string"), ("place.id", "string"))
+        with self.assertRaises(ValueError):
+            parse_field("id:uint128")
+
+    def test_table_name(self):
+        self.assertEqual(
+            table_name(Path("twitter_stream_2020_05_13.tar")),
+            "twitter_stream_2020_05_13",
+        )
+        self.assertEqual(table_name(Path("a/00.json.bz2")), "00")
+
+    def test_ingest_sample_file(self):
+        tweets = _read_tweets(SAMPLE_FILE)
+        table = ColumnarTable(ingest_path(SAMPLE_FILE, TEST_DIR))
+
+        self.assertEqual(len(table), len(tweets))
+        self.assertGreater(table.skipped, 0)
+        self.assertIsInstance(table["id"], np.memmap)
+        self.assertEqual(table["id"].tolist(), [tweet["id"] for tweet in tweets])
+        self.assertEqual(
+            table["user.id"].tolist(), [tweet["user"]["id"] for tweet in tweets]
+        )
+        self.assertEqual(list(table["text"]), [tweet["text"] for tweet in tweets])
+        self.assertEqual(table["lang"][-1], tweets[-1]["lang"])
+        self.assertEqual(
+            table["created_at"][0], np.datetime64("2020-06-01T15:14:00", "s")
+        )
+        self.assertIsNone(table.valid("id"))
+        self.assertFalse(Path(str(table.path) + ".part").exists())
+
+    def test_missing_values(self):
+        with ColumnarWriter(
+            TEST_DIR / "table",
+            fields=["id", "retweeted_status.id", "user.verified", "text"],
+            batch_size=2,
+        ) as writer:
+            writer.add_lines(
+                [
+                    b'{"created_at": "Mon Jun 01 15:14:00 +0000 2020", "id": 1, "text": "a"}',
+                    b"",
+                    b"not json",
+                    b'{"delete": {"status": {"id": 3}}}',
+                    b'{"created_at": "Mon Jun 01 15:14:01 +0000 2020", "id": 2, '
+                    b'"retweeted_status": {"id": 1}, "user": {"verified": true}}',
+                ]
+            )
+
+        table = ColumnarTable(TEST_DIR / "table")
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.skipped, 2)
+        self.assertEqual(table["retweeted_status.id"].tolist(), [0, 1])
+        self.assertEqual(table.valid("retweeted_status.id").tolist(), [False, True])
+        self.assertEqual(table["user.verified"].tolist(), [False, True])
+        self.assertEqual(table["text"][:], ["a", ""])
+        self.assertEqual(table.valid("text").tolist(), [True, False])
+
+    def test_ingest_tar_archive(self):
+        tweets = _read_tweets(SAMPLE_FILE)
+        TEST_DIR.mkdir()
+        archive_path = TEST_DIR / "twitter_stream_2020_06_01.tar"
+        with tarfile.open(archive_path, "w") as archive:
+            for name in ("2020/06/01/15/14.json.bz2",):
+                info = tarfile.TarInfo(name)
+                info.size = SAMPLE_FILE.stat().st_size
+                with open(SAMPLE_FILE, "rb") as content:
+                    archive.addfile(info, content)
+            info = tarfile.TarInfo("README")
+            archive.addfile(info, io.BytesIO())
+
+        table = ColumnarTable(ingest_path(archive_path, TEST_DIR / "columnar"))
+
+        self.assertEqual(table.path.name, "twitter_stream_2020_06_01")
+        self.assertEqual(len(table), len(tweets))
+        self.assertEqual(table["id"][0], tweets[0]["id"])
+
+    def test_duplicates_across_files(self):
+        tweets = _read_tweets(SAMPLE_FILE)
+        unique = len({tweet["id"] for tweet in tweets})
+        half = len(tweets) // 2
+        TEST_DIR.mkdir()
+        # A monthly file holding the second half again, and the first tweet twice
+        overlapping = TEST_DIR / "overlapping.json"
+        overlapping.write_text(
+            "\n".join(json.dumps(tweet) for tweet in tweets[half:] + tweets[:1])
+        )
+
+        with SeenIds(TEST_DIR / "seen") as seen:
+            first = ColumnarTable(
+                ingest_path(SAMPLE_FILE, TEST_DIR / "columnar", seen=seen)
+            )
+            second = ColumnarTable(
+                ingest_path(overlapping, TEST_DIR / "columnar", seen=seen)
+            )
+        # The sample file itself holds a tweet twice
+        self.assertEqual(len(first), unique)
+        self.assertEqual(first.duplicates, len(tweets) - unique)
+        self.assertEqual(
+            first["id"].tolist(), list(dict.fromkeys(first["id"].tolist()))
+        )
+        self.assertEqual(len(second), 0)
+        self.assertEqual(second.duplicates, len(tweets) - half + 1)
+
+        # A failed ingest records no ids
+        with SeenIds(TEST_DIR / "other") as seen:
+            with self.assertRaises(RuntimeError):
+                with ColumnarWriter(TEST_DIR / "failed", seen=seen) as writer:
+                    writer.add_lines(overlapping.read_bytes().splitlines())
+                    raise RuntimeError()
+            table = ColumnarTable(ingest_path(overlapping, TEST_DIR, seen=seen))
+        self.assertEqual(
+            len(table), len({tweet["id"] for tweet in tweets[half:] + tweets[:1]})
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
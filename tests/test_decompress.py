@@ -0,0 +1,97 @@
+import bz2
+import gzip
+import io
+import tarfile
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from dozent.decompress import ParallelDecompressor, decompress, find_jobs
+
+TEST_DIR = Path("test_decompress_dir")
+
+
+def _add_member(archive: tarfile.TarFile, name: str, content: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    archive.addfile(info, io.BytesIO(content))
+
+
+class DecompressTestCase(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = TEST_DIR / "input"
+        self.output_dir = TEST_DIR / "output"
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+
+        self.contents = {
+            f"2020/01/0{day}/{hour:02}.json": (
+                f'{{"day": {day}, "hour": {hour}}}\n' * 5000
+            ).encode()
+            for day in (1, 2)
+            for hour in range(3)
+        }
+        self.archive = self.input_dir / "twitter-stream-2020-01.tar"
+        with tarfile.open(self.archive, "w") as archive:
+            for name, content in self.contents.items():
+                compress = bz2.compress if name.endswith("00.json") else gzip.compress
+                suffix = ".bz2" if compress is bz2.compress else ".gz"
+                _add_member(archive, name + suffix, compress(content))
+            _add_member(archive, "README.txt", b"not compressed")
+
+        self.single = self.input_dir / "single.json.bz2"
+        self.single.write_bytes(bz2.compress(b"single file\n" * 1000))
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_find_jobs(self):
+        jobs = find_jobs(self.archive, self.output_dir)
+
+        self.assertEqual(len(jobs), len(self.contents))
+        self.assertEqual({job.kind for job in jobs}, {"bz2", "gz"})
+        archive_dir = (self.output_dir / "twitter-stream-2020-01").resolve()
+        self.assertEqual(
+            {Path(job.output) for job in jobs},
+            {archive_dir / name for name in self.contents},
+        )
+        self.assertEqual(find_jobs(self.input_dir / "missing.txt", self.output_dir), [])
+
+    def test_decompress_directory(self):
+        report = decompress([self.input_dir], self.output_dir, max_workers=2)
+
+        self.assertEqual(report.jobs, len(self.contents) + 1)
+        self.assertEqual(report.failed, [])
+        for name, content in self.contents.items():
+            path = self.output_dir / "twitter-stream-2020-01" / name
+            self.assertEqual(path.read_bytes(), content)
+        self.assertEqual(
+            (self.output_dir / "single.json").read_bytes(), b"single file\n" * 1000
+        )
+        self.assertEqual(list(self.output_dir.rglob("*.part")), [])
+
+        self.assertLessEqual(len(report.workers), 2)
+        self.assertEqual(
+            report.bytes_out, sum(map(len, self.contents.values())) + 12 * 1000
+        )
+        self.assertIn(f"Decompressed {report.jobs} stream(s)", report.format())
+
+    def test_corrupt_stream_is_reported(self):
+        broken = self.input_dir / "broken.json.gz"
+        broken.write_bytes(b"definitely not gzip")
+
+        with ParallelDecompressor(
+            self.output_dir, max_workers=1, max_in_flight=1
+        ) as decompressor:
+            self.assertEqual(decompressor.submit(broken), 1)
+            self.assertEqual(decompressor.submit(self.single), 1)
+
+        report = decompressor.report
+        self.assertEqual(report.jobs, 1)
+        self.assertEqual(len(report.failed), 1)
+        self.assertTrue(report.failed[0][0].endswith("broken.json"))
+        self.assertFalse((self.output_dir / "broken.json").exists())
+        self.assertEqual(list(self.output_dir.rglob("*.part")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
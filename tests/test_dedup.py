@@ -0,0 +1,124 @@
+import threading
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+import numpy as np
+
+from dozent.dedup import SeenIds, tweet_id
+
+TEST_DIR = Path("test_dedup_dir")
+
+IDS = np.random.default_rng(7).integers(0, 2**64 - 1, 50_000, dtype=np.uint64)
+
+
+class SeenIdsTestCase(unittest.TestCase):
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_tweet_id(self):
+        self.assertEqual(tweet_id({"id": 1266012004385386496}), 1266012004385386496)
+        self.assertEqual(
+            tweet_id({"id_str": "1266012004385386496"}), 1266012004385386496
+        )
+        self.assertIsNone(tweet_id({"id": True}))
+        self.assertIsNone(tweet_id({"id": -1}))
+        self.assertIsNone(tweet_id({"text": "no id"}))
+
+    def test_claim(self):
+        with SeenIds(TEST_DIR) as seen:
+            with seen.transaction() as transaction:
+                self.assertEqual(
+                    transaction.claim([5, 3, 5, 9, 3]).tolist(),
+                    [True, True, False, True, False],
+                )
+                self.assertEqual(transaction.claim([9, 10]).tolist(), [False, True])
+                # Claimed ids are seen by every transaction before they are committed
+                with seen.transaction() as other:
+                    self.assertEqual(other.claim([10, 11]).tolist(), [False, True])
+                self.assertEqual(transaction.duplicates, 3)
+            self.assertEqual(len(seen), 5)
+            self.assertIn(11, seen)
+            self.assertNotIn(12, seen)
+
+    def test_ids_persist_across_runs(self):
+        with SeenIds(TEST_DIR) as seen:
+            for part in np.array_split(IDS[:40_000], 8):
+                with seen.transaction() as transaction:
+                    self.assertTrue(transaction.claim(part).all())
+
+        with SeenIds(TEST_DIR) as seen:
+            self.assertEqual(len(seen), 40_000)
+            with seen.transaction() as transaction:
+                new = transaction.claim(IDS)
+            self.assertFalse(new[:40_000].any())
+            self.assertTrue(new[40_000:].all())
+            # Runs of similar sizes are merged
+            self.assertLessEqual(len(list(TEST_DIR.glob("*.ids"))), 4)
+
+    def test_aborted_ids_are_forgotten(self):
+        with SeenIds(TEST_DIR) as seen:
+            with self.assertRaises(RuntimeError):
+                with seen.transaction() as transaction:
+                    transaction.claim(IDS[:100])
+                    raise RuntimeError()
+            self.assertEqual(len(seen), 0)
+            self.assertFalse(seen.contains(IDS[:100]).any())
+            # Open transactions are aborted too
+            seen.transaction().claim(IDS[100:200])
+        with SeenIds(TEST_DIR) as seen:
+            self.assertFalse(seen.contains(IDS[:200]).any())
+
+    def test_index_grows_past_its_capacity(self):
+        with SeenIds(TEST_DIR, capacity=1000) as seen:
+            for part in np.array_split(IDS, 10):
+                with seen.transaction() as transaction:
+                    transaction.claim(part)
+            self.assertGreaterEqual(seen.capacity, len(IDS))
+            self.assertTrue(seen.contains(IDS).all())
+        self.assertEqual(len(list(TEST_DIR.glob("*.bloom"))), 1)
+        with SeenIds(TEST_DIR) as seen:
+            self.assertGreaterEqual(seen.capacity, len(IDS))
+            self.assertTrue(seen.contains(IDS).all())
+
+    def test_files_left_by_a_crash_are_removed(self):
+        with SeenIds(TEST_DIR) as seen:
+            with seen.transaction() as transaction:
+                transaction.claim(IDS[:10])
+        (TEST_DIR / "1000.ids").write_bytes(IDS[10:20].tobytes())
+        with SeenIds(TEST_DIR) as seen:
+            self.assertFalse((TEST_DIR / "1000.ids").exists())
+            self.assertEqual(
+                seen.contains(IDS[:20]).tolist(), [True] * 10 + [False] * 10
+            )
+
+    def test_concurrent_transactions(self):
+        parts = np.array_split(IDS, 8)
+        claimed = []
+
+        def claim(part) -> None:
+            with seen.transaction() as transaction:
+                # Every id is claimed by two threads, and kept by one of them
+                for batch in np.array_split(np.concatenate((part, IDS[:1000])), 10):
+                    claimed.append(batch[transaction.claim(batch)])
+
+        with SeenIds(TEST_DIR) as seen:
+            threads = [threading.Thread(target=claim, args=(part,)) for part in parts]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(seen), len(IDS))
+        claimed = np.concatenate(claimed)
+        self.assertEqual(len(claimed), len(IDS))
+        self.assertEqual(set(claimed.tolist()), set(IDS.tolist()))
+
+    def test_invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            SeenIds(TEST_DIR, capacity=0)
+        with self.assertRaises(ValueError):
+            SeenIds(TEST_DIR, false_positive_rate=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
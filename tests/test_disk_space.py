@@ -0,0 +1,167 @@
+import os
+import threading
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from dozent.disk_space import DiskSpacePlanner, InsufficientSpaceError, parse_size
+from dozent.download_scheduler import DownloadScheduler
+
+TEST_DIR = Path("test_disk_space_dir")
+LINKS = [f"http://localhost/archive_{index}.tar" for index in range(4)]
+SIZES = dict(zip(LINKS, (400, 300, 200, None)))
+
+
+class _FakeVolume:
+    """
+    Volume of `capacity` bytes holding the files of `TEST_DIR`
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+
+    def __call__(self) -> int:
+        used = sum(path.stat().st_size for path in TEST_DIR.iterdir())
+        return self.capacity - used
+
+
+class DiskSpacePlannerTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def _planner(self, capacity: int, min_free_space: int = 100) -> DiskSpacePlanner:
+        return DiskSpacePlanner(
+            TEST_DIR,
+            min_free_space=min_free_space,
+            size_of=SIZES.get,
+            free_space=_FakeVolume(capacity),
+        )
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("20G"), 20 * 1024**3)
+        self.assertEqual(parse_size("1.5k"), 1536)
+        self.assertEqual(parse_size("100"), 100)
+        with self.assertRaises(ValueError):
+            parse_size("20P")
+
+    def test_plan_fits(self):
+        plan = self._planner(capacity=1000).plan(LINKS)
+
+        self.assertEqual(plan.links, LINKS)
+        self.assertEqual(plan.total_size, 900)
+        self.assertEqual(plan.unknown_sizes, 1)
+        self.assertEqual(plan.available, 900)
+
+    def test_plan_refuse(self):
+        with self.assertRaises(InsufficientSpaceError):
+            self._planner(capacity=800).plan(LINKS, policy="refuse")
+
+    def test_plan_trim(self):
+        plan = self._planner(capacity=800).plan(LINKS, policy="trim")
+
+        self.assertEqual(plan.links, LINKS[:2])
+        self.assertEqual(plan.dropped, LINKS[2:])
+
+    def test_plan_wait_and_unknown_policy(self):
+        planner = self._planner(capacity=800)
+        self.assertEqual(planner.plan(LINKS, policy="wait").links, LINKS)
+        with self.assertRaises(ValueError):
+            planner.plan(LINKS, policy="hope")
+
+    def test_plan_counts_partial_files(self):
+        (TEST_DIR / "archive_0.tar").write_bytes(b"x" * 400)
+        plan = self._planner(capacity=1300).plan(LINKS)
+
+        self.assertEqual(plan.total_size, 500)
+
+    def test_reserve_waits_for_release(self):
+        planner = self._planner(capacity=700)
+        planner.reserve(LINKS[0])
+        started = threading.Event()
+        messages = []
+
+        def reserve():
+            planner.reserve(LINKS[1], on_wait=messages.append)
+            started.set()
+
+        thread = threading.Thread(target=reserve)
+        thread.start()
+        self.assertFalse(started.wait(0.2))
+        self.assertEqual(len(messages), 1)
+
+        planner.release(LINKS[0])
+        self.assertTrue(started.wait(1))
+        thread.join()
+
+    def test_reserve_counts_written_bytes(self):
+        planner = self._planner(capacity=700)
+        planner.reserve(LINKS[0])
+        # Written bytes show up in the free space instead of the reservation
+        (TEST_DIR / "archive_0.tar").write_bytes(b"x" * 400)
+        self.assertEqual(planner.available(), 200)
+
+    def test_reserve_raises_when_nothing_can_free_space(self):
+        with self.assertRaises(InsufficientSpaceError):
+            self._planner(capacity=300).reserve(LINKS[0])
+
+    def test_scheduler_gates_files_until_consumer_frees_space(self):
+        volume = _FakeVolume(capacity=600)
+        planner = DiskSpacePlanner(
+            TEST_DIR, min_free_space=100, size_of=SIZES.get, free_space=volume
+        )
+        lock = threading.Lock()
+        in_flight = []
+        peak_used = []
+
+        def download(link, download_dir, verbose, connections, progress):
+            path = Path(download_dir) / link.rsplit("/", 1)[1]
+            with lock:
+                in_flight.append(link)
+                peak_used.append(volume.capacity - volume())
+            path.write_bytes(b"x" * (SIZES[link] or 10))
+            with lock:
+                in_flight.remove(link)
+            return path
+
+        scheduler = DownloadScheduler(
+            download_dir=TEST_DIR,
+            max_concurrent_files=4,
+            max_connections=4,
+            verbose=False,
+            download_function=download,
+            # Consumer that removes every archive once it was processed
+            post_download=os.remove,
+            space_planner=planner,
+        )
+        scheduler.run(LINKS)
+
+        self.assertEqual(scheduler.skipped, [])
+        self.assertEqual(list(TEST_DIR.iterdir()), [])
+        self.assertLessEqual(max(peak_used), 500)
+
+    def test_scheduler_skips_files_that_never_fit(self):
+        planner = self._planner(capacity=450)
+        downloaded = []
+
+        def download(link, download_dir, verbose, connections, progress):
+            downloaded.append(link)
+
+        scheduler = DownloadScheduler(
+            download_dir=TEST_DIR,
+            max_concurrent_files=1,
+            max_connections=1,
+            verbose=False,
+            download_function=download,
+            space_planner=planner,
+        )
+        scheduler.run(LINKS)
+
+        self.assertEqual(scheduler.skipped, [LINKS[0]])
+        self.assertEqual(downloaded, LINKS[1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import threading
+import time
+import unittest
+
+from dozent.download_scheduler import ConnectionBudget, DownloadScheduler
+from dozent.downloader_tools import DownloadCancelled
+
+
+class ConnectionBudgetTestCase(unittest.TestCase):
+    def test_acquire_grants_at_most_available(self):
+        budget = ConnectionBudget(max_connections=5)
+
+        self.assertEqual(budget.acquire(3), 3)
+        self.assertEqual(budget.acquire(3), 2)
+        self.assertEqual(budget.in_use, 5)
+
+        budget.release(5)
+        self.assertEqual(budget.in_use, 0)
+
+    def test_acquire_blocks_until_release(self):
+        budget = ConnectionBudget(max_connections=1)
+        budget.acquire(1)
+        acquired = threading.Event()
+
+        def waiter():
+            budget.acquire(1)
+            acquired.set()
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+
+        budget.release(1)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_invalid_budget(self):
+        with self.assertRaises(ValueError):
+            ConnectionBudget(max_connections=0)
+
+
+class DownloadSchedulerTestCase(unittest.TestCase):
+    def test_limits_are_respected(self):
+        lock = threading.Lock()
+        state = {"files": 0, "connections": 0, "max_files": 0, "max_connections": 0}
+        downloaded = []
+
+        def fake_download(link, download_dir, verbose, connections, progress):
+            with lock:
+                state["files"] += 1
+                state["connections"] += connections
+                state["max_files"] = max(state["max_files"], state["files"])
+                state["max_connections"] = max(
+                    state["max_connections"], state["connections"]
+                )
+            time.sleep(0.01)
+            with lock:
+                state["files"] -= 1
+                state["connections"] -= connections
+                downloaded.append(link)
+
+        scheduler = DownloadScheduler(
+            download_dir="unused",
+            max_concurrent_files=3,
+            max_connections=7,
+            verbose=False,
+            download_function=fake_download,
+        )
+        links = [f"link-{i}" for i in range(20)]
+        scheduler.run(links)
+
+        self.assertEqual(sorted(downloaded), sorted(links))
+        self.assertLessEqual(state["max_files"], 3)
+        self.assertLessEqual(state["max_connections"], 7)
+        self.assertEqual(scheduler.connections_per_file, 2)
+        self.assertEqual(scheduler.queue_depth, 0)
+        self.assertEqual(scheduler.in_flight, 0)
+
+    def test_queue_depth_is_reported(self):
+        release = threading.Event()
+        depths = []
+
+        def fake_download(link, download_dir, verbose, connections, progress):
+            release.wait(1)
+
+        scheduler = DownloadScheduler(
+            download_dir="unused",
+            max_concurrent_files=1,
+            max_connections=1,
+            verbose=False,
+            download_function=fake_download,
+        )
+        runner = threading.Thread(target=scheduler.run, args=(["a", "b", "c"],))
+        runner.start()
+        time.sleep(0.1)
+        depths.append(scheduler.queue_depth)
+        release.set()
+        runner.join()
+
+        self.assertEqual(depths, [2])
+        self.assertEqual(scheduler.queue_depth, 0)
+
+    def test_failures_are_isolated(self):
+        processed = []
+
+        def fake_download(link, download_dir, verbose, connections, progress):
+            if link == "bad":
+                raise ConnectionError("reset")
+            return f"{link}.tar"
+
+        def post_download(path):
+            if path.name == "broken.tar":
+                raise ValueError("not a tar archive")
+            processed.append(path.name)
+
+        scheduler = DownloadScheduler(
+            download_dir="unused",
+            max_concurrent_files=2,
+            max_connections=2,
+            verbose=False,
+            download_function=fake_download,
+            post_download=post_download,
+        )
+        results = scheduler.run(["a", "bad", "b", "broken", "c"])
+
+        self.assertEqual(
+            sorted(outcome.link for outcome in results.succeeded), ["a", "b", "c"]
+        )
+        self.assertEqual(sorted(processed), ["a.tar", "b.tar", "c.tar"])
+        failed = {outcome.link: outcome.error for outcome in results.failed}
+        self.assertIsInstance(failed["bad"], ConnectionError)
+        self.assertIsInstance(failed["broken"], ValueError)
+        self.assertFalse(results.ok)
+        self.assertFalse(results.interrupted)
+        self.assertIn("3 file(s) downloaded, 2 failed", results.format())
+
+    def test_shutdown_drains_in_flight_files(self):
+        started = threading.Event()
+        cancel = threading.Event()
+
+        def fake_download(link, download_dir, verbose, connections, progress):
+            started.set()
+            if not cancel.wait(5):
+                return link
+            raise DownloadCancelled(link)
+
+        scheduler = DownloadScheduler(
+            download_dir="unused",
+            max_concurrent_files=1,
+            max_connections=1,
+            verbose=False,
+            download_function=fake_download,
+        )
+        runner = threading.Thread(target=scheduler.run, args=(["a", "b", "c"],))
+        runner.start()
+        self.assertTrue(started.wait(1))
+        scheduler.shutdown()
+        cancel.set()
+        runner.join(5)
+
+        self.assertFalse(runner.is_alive())
+        results = scheduler.results
+        self.assertTrue(results.interrupted)
+        self.assertEqual(
+            [outcome.link for outcome in results.not_finished], ["a", "b", "c"]
+        )
+        self.assertEqual(results.failed, [])
+        self.assertEqual(scheduler.queue_depth, 0)
+        self.assertEqual(scheduler.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
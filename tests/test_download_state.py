@@ -0,0 +1,114 @@
+import os
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from dozent.download_state import DownloadState, merge_ranges
+from dozent.downloader_tools import DownloaderTools
+from benchmarks.local_http_server import LocalHTTPServer
+
+TEST_DIR = Path("test_download_state_dir")
+CONTENT = os.urandom(3 * 1024 * 1024 + 123)
+
+
+class DownloadStateTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_merge_ranges(self):
+        self.assertEqual(
+            merge_ranges([(10, 20), (0, 5), (5, 8), (15, 30), (40, 40)]),
+            [(0, 8), (10, 30)],
+        )
+
+    def test_missing_ranges(self):
+        state = DownloadState(TEST_DIR / "file", "url", 100, completed=[(10, 20)])
+        state.add_range(50, 60)
+        self.assertEqual(state.missing_ranges(), [(0, 10), (20, 50), (60, 100)])
+        self.assertEqual(state.completed_bytes, 20)
+        self.assertEqual(state.missing_ranges(15, 55), [(20, 50)])
+        self.assertEqual(state.missing_ranges(0, 5), [(0, 5)])
+        self.assertEqual(state.missing_ranges(12, 18), [])
+
+    def test_save_and_load(self):
+        state = DownloadState(
+            TEST_DIR / "file", "url", 100, etag='"abc"', completed=[(0, 10)]
+        )
+        state.save()
+        loaded = DownloadState.load(TEST_DIR / "file")
+
+        self.assertEqual(loaded.completed, [(0, 10)])
+        self.assertTrue(loaded.matches("url", 100, '"abc"', None))
+        self.assertFalse(loaded.matches("url", 100, '"def"', None))
+        self.assertFalse(loaded.matches("url", 101, '"abc"', None))
+        self.assertIsNone(DownloadState.load(TEST_DIR / "missing"))
+
+
+class DownloadWithResumeTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_resumes_after_dropped_connection(self):
+        with LocalHTTPServer(
+            {"archive.tar": CONTENT},
+            drop_first_requests=1,
+            drop_after_bytes=1024 * 1024,
+        ) as server:
+            link = server.url("archive.tar")
+
+            with self.assertRaises(Exception):
+                DownloaderTools.download_with_resume(link, str(TEST_DIR), verbose=False)
+
+            state = DownloadState.load(TEST_DIR / "archive.tar")
+            self.assertEqual(state.completed, [(0, 1024 * 1024)])
+
+            DownloaderTools.download_with_resume(link, str(TEST_DIR), verbose=False)
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+        ranges = [item["range"] for item in server.requests if item["method"] == "GET"]
+        self.assertEqual(
+            ranges,
+            [f"bytes=0-{len(CONTENT) - 1}", f"bytes={1024 * 1024}-{len(CONTENT) - 1}"],
+        )
+
+    def test_complete_file_is_skipped(self):
+        with LocalHTTPServer({"archive.tar": CONTENT}) as server:
+            link = server.url("archive.tar")
+            DownloaderTools.download_with_resume(
+                link, str(TEST_DIR), verbose=False, connections=4
+            )
+            DownloaderTools.download_with_resume(link, str(TEST_DIR), verbose=False)
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+        methods = [item["method"] for item in server.requests]
+        # Four segments the first time, a single HEAD the second time
+        self.assertEqual(methods.count("GET"), 4)
+        self.assertEqual(methods[-1], "HEAD")
+
+    def test_changed_file_is_downloaded_again(self):
+        files = {"archive.tar": CONTENT}
+        with LocalHTTPServer(files) as server:
+            link = server.url("archive.tar")
+            DownloaderTools.download_with_resume(link, str(TEST_DIR), verbose=False)
+            files["archive.tar"] = CONTENT[::-1]
+            DownloaderTools.download_with_resume(link, str(TEST_DIR), verbose=False)
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT[::-1])
+
+    def test_server_without_range_support(self):
+        with LocalHTTPServer({"archive.tar": CONTENT}, support_ranges=False) as server:
+            DownloaderTools.download_with_resume(
+                server.url("archive.tar"), str(TEST_DIR), verbose=False, connections=3
+            )
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
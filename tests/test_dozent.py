@@ -32,6 +32,20 @@ class DozentTestCase(unittest.TestCase):
                                                          end_date=dozent.LAST_DAY_OF_SUPPORT))
         self.assertTrue(len_of_links >= 12 * (2017 - 2020))
 
+    def test_dozent_get_date_links_outside_of_support(self):
+        with self.assertRaises(RuntimeError):
+            dozent_obj.get_links_for_days(start_date=date(year=2011, month=8, day=31),
+                                          end_date=dozent.LAST_DAY_OF_SUPPORT)
+        with self.assertRaises(RuntimeError):
+            dozent_obj.get_links_for_days(start_date=dozent.FIRST_DAY_OF_SUPPORT,
+                                          end_date=date(year=2020, month=7, day=1))
+
+    def test_dozent_get_date_links_of_monthly_archives(self):
+        date_links = dozent_obj.get_links_for_days(start_date=date(year=2011, month=9, day=1),
+                                                   end_date=date(year=2017, month=5, day=31))
+        self.assertTrue(len(date_links) >= 12 * (2017 - 2012))
+        self.assertTrue(all(date_link['day'] == 'NaN' for date_link in date_links))
+
     def test_make_date_from_date_link_day_when_is_defined(self):
         date_dict = {
             "day": "03",
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.download_state import DownloadState
+from dozent.downloader_tools import DownloadCancelled
+from dozent.engines import AsyncioEngine, PySmartDLEngine, get_engine
+from dozent.progress import ProgressAggregator
+from dozent.retry import RetryPolicy
+
+TEST_DIR = Path("test_engines_dir")
+CONTENT = os.urandom(2 * 1024 * 1024 + 7)
+
+
+class EnginesTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_get_engine(self):
+        self.assertIsInstance(get_engine("asyncio"), AsyncioEngine)
+        self.assertIsInstance(get_engine("pysmartdl", resume=True), PySmartDLEngine)
+        with self.assertRaises(ValueError):
+            get_engine("curl")
+
+    def test_pysmartdl_engine(self):
+        with LocalHTTPServer(
+            {"archive.tar": CONTENT}
+        ) as server, PySmartDLEngine() as engine:
+            engine.download(server.url("archive.tar"), str(TEST_DIR), verbose=False)
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+
+
+class AsyncioEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_downloads_segments_over_few_connections(self):
+        progress = ProgressAggregator()
+        files = {f"archive_{index}.tar": CONTENT[index:] for index in range(3)}
+
+        with LocalHTTPServer(files) as server, AsyncioEngine(
+            segments_per_file=8
+        ) as engine:
+            threads = [
+                threading.Thread(
+                    target=engine.download,
+                    args=(server.url(name), str(TEST_DIR), True, 2, progress),
+                )
+                for name in files
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            opened = engine.pool.connections_opened
+
+        for name, content in files.items():
+            self.assertEqual((TEST_DIR / name).read_bytes(), content)
+        ranges = [item["range"] for item in server.requests if item["method"] == "GET"]
+        self.assertEqual(len(ranges), 3 * 8)
+        # Two sockets per file, shared with the HEAD requests
+        self.assertLessEqual(opened, 3 * 2)
+        self.assertEqual(progress.snapshot().downloaded, sum(map(len, files.values())))
+        self.assertFalse(
+            DownloadState.state_path_for(TEST_DIR / "archive_0.tar").exists()
+        )
+
+    def test_follows_redirects(self):
+        with LocalHTTPServer(
+            {"datanode/archive.tar": CONTENT},
+            redirects={"archive.tar": "datanode/archive.tar"},
+        ) as server, AsyncioEngine() as engine:
+            engine.download(server.url("archive.tar"), str(TEST_DIR), verbose=False)
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+
+    def test_resumes_after_dropped_connection(self):
+        with LocalHTTPServer(
+            {"archive.tar": CONTENT}, drop_first_requests=1, drop_after_bytes=100000
+        ) as server, AsyncioEngine(
+            resume=True, segments_per_file=1, retry=RetryPolicy(max_retries=0)
+        ) as engine:
+            link = server.url("archive.tar")
+            with self.assertRaises(Exception):
+                engine.download(link, str(TEST_DIR), verbose=False)
+            self.assertEqual(
+                DownloadState.load(TEST_DIR / "archive.tar").completed, [(0, 100000)]
+            )
+            engine.download(link, str(TEST_DIR), verbose=False)
+            engine.download(link, str(TEST_DIR), verbose=False)
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+        ranges = [item["range"] for item in server.requests if item["method"] == "GET"]
+        self.assertEqual(ranges[-1], f"bytes=100000-{len(CONTENT) - 1}")
+        self.assertEqual(server.requests[-1]["method"], "HEAD")
+
+    def test_cancel_keeps_progress(self):
+        for engine_class in (AsyncioEngine, PySmartDLEngine):
+            with self.subTest(engine=engine_class.name):
+                rmtree(TEST_DIR, ignore_errors=True)
+                TEST_DIR.mkdir()
+                server = LocalHTTPServer(
+                    {"archive.tar": CONTENT}, bandwidth=1024 * 1024
+                )
+                with server, engine_class(resume=True) as engine:
+                    link = server.url("archive.tar")
+                    errors = []
+
+                    def download():
+                        try:
+                            engine.download(link, str(TEST_DIR), verbose=False)
+                        except DownloadCancelled as error:
+                            errors.append(error)
+
+                    thread = threading.Thread(target=download)
+                    thread.start()
+                    time.sleep(0.5)
+                    engine.cancel()
+                    thread.join(5)
+
+                    self.assertFalse(thread.is_alive())
+                    self.assertEqual(len(errors), 1)
+                    state = DownloadState.load(TEST_DIR / "archive.tar")
+                    self.assertGreater(state.completed_bytes, 0)
+                    self.assertLess(state.completed_bytes, len(CONTENT))
+
+                    with engine_class(resume=True) as resumed:
+                        resumed.download(link, str(TEST_DIR), verbose=False)
+                self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+
+    def test_server_without_range_support(self):
+        with LocalHTTPServer(
+            {"archive.tar": CONTENT}, support_ranges=False
+        ) as server, AsyncioEngine() as engine:
+            engine.download(
+                server.url("archive.tar"), str(TEST_DIR), verbose=False, connections=4
+            )
+
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), CONTENT)
+
+
+def _requested_bytes(server) -> int:
+    total = 0
+    for request in server.requests:
+        if request["method"] == "GET" and request["range"]:
+            start, end = request["range"][len("bytes=") :].split("-")
+            total += int(end) + 1 - int(start)
+    return total
+
+
+class MultiSourceTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def download(self, primary, mirrors, content=CONTENT, **options):
+        link = primary.url("archive.tar")
+        with AsyncioEngine(
+            mirrors=lambda _: [mirror.url("archive.tar") for mirror in mirrors],
+            **options,
+        ) as engine:
+            engine.download(link, str(TEST_DIR), verbose=False, connections=2)
+        self.assertEqual((TEST_DIR / "archive.tar").read_bytes(), content)
+
+    def test_fast_sources_get_more_of_the_file(self):
+        content = os.urandom(8 * 1024 * 1024)
+        files = {"archive.tar": content}
+        with LocalHTTPServer(files, bandwidth=256 * 1024) as primary, LocalHTTPServer(
+            files, bandwidth=4 * 1024 * 1024
+        ) as fast, LocalHTTPServer(files, bandwidth=4 * 1024 * 1024) as other_fast:
+            self.download(primary, [fast, other_fast], content, segments_per_file=4)
+
+        for server in (primary, fast, other_fast):
+            self.assertGreater(_requested_bytes(server), 0)
+        self.assertLess(_requested_bytes(primary), _requested_bytes(fast))
+        self.assertLess(_requested_bytes(primary), _requested_bytes(other_fast))
+
+    def test_slow_source_does_not_hold_up_the_end(self):
+        files = {"archive.tar": CONTENT}
+        with LocalHTTPServer(files, bandwidth=128 * 1024) as primary, LocalHTTPServer(
+            files
+        ) as fast:
+            started = time.monotonic()
+            self.download(primary, [fast], segments_per_file=1)
+            elapsed = time.monotonic() - started
+
+        # The primary alone would need 8s for its half of the file
+        self.assertLess(elapsed, 6)
+        first = primary.requests[1]["range"]
+        first_end = int(first[len("bytes=") :].split("-")[1])
+        taken_over = [
+            request
+            for request in fast.requests
+            if request["method"] == "GET"
+            and int(request["range"][len("bytes=") :].split("-")[0]) < first_end
+        ]
+        self.assertTrue(taken_over)
+
+    def test_failing_mirror_is_dropped(self):
+        files = {"archive.tar": CONTENT}
+        with LocalHTTPServer(files) as primary, LocalHTTPServer(
+            files, fail_rate=1.0
+        ) as failing:
+            self.download(
+                primary, [failing], retry=RetryPolicy(max_retries=2, base_delay=0.001)
+            )
+        gets = [request for request in failing.requests if request["method"] == "GET"]
+        # Dropped after 3 failures in a row, the other connection may have been asking
+        # at the same time
+        self.assertIn(len(gets), (3, 4))
+
+    def test_mirrors_without_the_file_are_ignored(self):
+        with LocalHTTPServer({"archive.tar": CONTENT}) as primary, LocalHTTPServer(
+            {"archive.tar": CONTENT[1:]}
+        ) as other_size, LocalHTTPServer({}) as missing:
+            self.download(primary, [other_size, missing])
+        for server in (other_size, missing):
+            self.assertEqual(
+                [request["method"] for request in server.requests], ["HEAD"]
+            )
+
+    def test_falls_back_to_the_whole_file_without_range_support(self):
+        files = {"archive.tar": CONTENT}
+        with LocalHTTPServer(files, support_ranges=False) as primary, LocalHTTPServer(
+            files, support_ranges=False
+        ) as mirror:
+            self.download(primary, [mirror])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import threading
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.download_state import DownloadState
+from dozent.downloader_tools import DownloaderTools
+from dozent.engines import AsyncioEngine, PySmartDLEngine
+from dozent.file_writer import FileWriter, WriteOptions
+from dozent.retry import RetryPolicy
+
+TEST_DIR = Path("test_file_writer_dir")
+PATH = TEST_DIR / "archive.tar"
+CONTENT = os.urandom(3 * 1024 * 1024 + 11)
+
+
+class FileWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_segments_are_written_in_place_from_threads(self):
+        size = len(CONTENT)
+        bounds = [0, size // 3, size // 2, size]
+        with FileWriter(PATH, size) as writer:
+            threads = [
+                threading.Thread(
+                    target=writer.write_at, args=(CONTENT[start:end], start)
+                )
+                for start, end in zip(bounds, bounds[1:])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(PATH.read_bytes(), CONTENT)
+
+    def test_existing_content_is_kept(self):
+        PATH.write_bytes(CONTENT[:1000])
+        with FileWriter(PATH, 2000) as writer:
+            writer.write_at(CONTENT[1000:2000], 1000)
+        self.assertEqual(PATH.read_bytes(), CONTENT[:2000])
+
+    @unittest.skipUnless(hasattr(os, "posix_fallocate"), "no posix_fallocate")
+    def test_preallocation(self):
+        with FileWriter(PATH, len(CONTENT)):
+            pass
+        self.assertEqual(PATH.stat().st_size, len(CONTENT))
+        if hasattr(os.stat_result, "st_blocks"):
+            self.assertGreaterEqual(PATH.stat().st_blocks * 512, len(CONTENT))
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            AsyncioEngine(write_options=WriteOptions(fsync="always"))
+        with self.assertRaises(ValueError):
+            AsyncioEngine(write_options=WriteOptions(buffer_size=0))
+
+
+class WritePathTestCase(unittest.TestCase):
+    """
+    Both of Dozent's writers, with buffers smaller and larger than the reads from the
+    socket, and a connection dropped in the middle of a buffer
+    """
+
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def _download(self, writer: str, options: WriteOptions, server) -> None:
+        link = server.url("archive.tar")
+        retry = RetryPolicy(base_delay=0.001)
+        if writer == "asyncio":
+            with AsyncioEngine(
+                resume=True, retry=retry, write_options=options
+            ) as engine:
+                engine.download(link, str(TEST_DIR), verbose=False, connections=4)
+        else:
+            DownloaderTools.download_with_resume(
+                link,
+                str(TEST_DIR),
+                verbose=False,
+                connections=4,
+                retry=retry,
+                write_options=options,
+            )
+
+    def test_write_paths(self):
+        for writer in ("asyncio", "threads"):
+            for options in (
+                WriteOptions(buffer_size=1000),
+                WriteOptions(buffer_size=4 * 1024 * 1024, fsync="checkpoint"),
+                WriteOptions(preallocate=False, fsync="end"),
+            ):
+                with self.subTest(writer=writer, options=options):
+                    with LocalHTTPServer(
+                        {"archive.tar": CONTENT},
+                        drop_first_requests=2,
+                        drop_after_bytes=300000,
+                    ) as server:
+                        self._download(writer, options, server)
+                    self.assertEqual(PATH.read_bytes(), CONTENT)
+                    self.assertTrue(DownloadState.load(PATH).is_complete)
+                    rmtree(TEST_DIR)
+                    TEST_DIR.mkdir()
+
+    def test_pysmartdl_engine_with_write_options(self):
+        # PySmartDL doesn't take write options, the engine writes the file itself instead
+        with LocalHTTPServer({"archive.tar": CONTENT}) as server:
+            with PySmartDLEngine(write_options=WriteOptions(fsync="end")) as engine:
+                engine.download(server.url("archive.tar"), str(TEST_DIR), verbose=False)
+        self.assertEqual(PATH.read_bytes(), CONTENT)
+        self.assertTrue(DownloadState.load(PATH).is_complete)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import unittest
+import urllib.error
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.downloader_tools import DownloaderTools
+from dozent.http_pool import HTTPConnectionPool, PoolStats
+
+TEST_DIR = Path("test_http_pool_dir")
+CONTENT = os.urandom(1024 * 1024 + 11)
+
+
+class HTTPConnectionPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_reuses_connections(self):
+        with LocalHTTPServer(
+            {"a.tar": CONTENT}
+        ) as server, HTTPConnectionPool() as pool:
+            for _ in range(5):
+                with pool.request("GET", server.url("a.tar")) as response:
+                    self.assertEqual(response.read(), CONTENT)
+            stats = pool.stats()
+
+        self.assertEqual(stats.opened, 1)
+        self.assertEqual(stats.reused, 4)
+        self.assertEqual(stats.handshakes_saved, 4)
+
+    def test_unread_body_closes_connection(self):
+        with LocalHTTPServer(
+            {"a.tar": CONTENT}
+        ) as server, HTTPConnectionPool() as pool:
+            with pool.request("GET", server.url("a.tar")) as response:
+                response.read(100)
+            with pool.request("GET", server.url("a.tar")) as response:
+                self.assertEqual(response.read(), CONTENT)
+            stats = pool.stats()
+
+        self.assertEqual(stats.opened, 2)
+        self.assertEqual(stats.reused, 0)
+
+    def test_caches_redirects(self):
+        with LocalHTTPServer(
+            {"datanode/a.tar": CONTENT}, redirects={"a.tar": "datanode/a.tar"}
+        ) as server, HTTPConnectionPool() as pool:
+            link = server.url("a.tar")
+            self.assertEqual(pool.resolve(link), server.url("datanode/a.tar"))
+            with pool.request("GET", link, {"Range": "bytes=0-9"}) as response:
+                self.assertEqual(response.status, 206)
+                self.assertEqual(response.read(), CONTENT[:10])
+            stats = pool.stats()
+
+        paths = [item["path"] for item in server.requests]
+        self.assertEqual(paths, ["/a.tar", "/datanode/a.tar", "/datanode/a.tar"])
+        self.assertEqual(stats.redirects_followed, 1)
+        self.assertEqual(stats.redirects_cached, 1)
+
+    def test_error_status_raises(self):
+        with LocalHTTPServer({}) as server, HTTPConnectionPool() as pool:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                pool.request("HEAD", server.url("missing.tar"))
+            # The connection stays usable after the error
+            with self.assertRaises(urllib.error.HTTPError):
+                pool.request("HEAD", server.url("missing.tar"))
+            stats = pool.stats()
+
+        self.assertEqual(context.exception.code, 404)
+        self.assertEqual(stats.opened, 1)
+
+    def test_evicts_idle_connections(self):
+        now = [0.0]
+        with LocalHTTPServer({"a.tar": b"x"}) as server, HTTPConnectionPool(
+            idle_timeout=10, clock=lambda: now[0]
+        ) as pool:
+            pool.resolve(server.url("a.tar"))
+            now[0] = 11
+            pool.resolve(server.url("a.tar"))
+            stats = pool.stats()
+
+        self.assertEqual(stats.opened, 2)
+        self.assertEqual(stats.evicted, 1)
+
+    def test_bounds_idle_connections(self):
+        with LocalHTTPServer({"a.tar": b"x"}) as server, HTTPConnectionPool(
+            max_idle_per_host=2
+        ) as pool:
+            responses = [pool.request("GET", server.url("a.tar")) for _ in range(4)]
+            for response in responses:
+                response.read()
+                response.close()
+            idle = sum(len(connections) for connections in pool._idle.values())
+
+        self.assertEqual(idle, 2)
+
+    def test_download_with_resume_shares_pool(self):
+        files = {f"archive_{index}.tar": CONTENT[index:] for index in range(3)}
+        with LocalHTTPServer(files) as server, HTTPConnectionPool() as pool:
+            for name in files:
+                DownloaderTools.download_with_resume(
+                    server.url(name),
+                    str(TEST_DIR),
+                    verbose=False,
+                    connections=4,
+                    pool=pool,
+                )
+            stats = pool.stats()
+
+        for name, content in files.items():
+            self.assertEqual((TEST_DIR / name).read_bytes(), content)
+        # One HEAD and four segments per file, over at most four sockets
+        self.assertLessEqual(stats.opened, 4)
+        self.assertEqual(stats.opened + stats.reused, 3 * 5)
+
+    def test_stats_add_up(self):
+        self.assertEqual(
+            PoolStats(opened=1, reused=2) + PoolStats(opened=3, evicted=1),
+            PoolStats(opened=4, reused=2, evicted=1),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
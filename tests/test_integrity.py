@@ -0,0 +1,219 @@
+import hashlib
+import os
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.download_state import DownloadState
+from dozent.engines import (
+    AsyncioEngine,
+    DownloadEngine,
+    ExtractOnTheFlyEngine,
+    PySmartDLEngine,
+)
+from dozent.integrity import (
+    STATUS_ERROR,
+    STATUS_MISMATCH,
+    STATUS_OK,
+    STATUS_UNKNOWN,
+    Checksums,
+    ChecksumMismatchError,
+    StreamingHasher,
+    hash_file,
+    verify,
+)
+from tests import CommonTestSetup
+
+TEST_DIR = Path("test_integrity_dir")
+CONTENT = os.urandom(2 * 1024 * 1024 + 11)
+CORRUPT = CONTENT[:1000] + b"x" + CONTENT[1001:]
+_, PATH_PREFIX = CommonTestSetup.set_data_dir_path()
+TAR_FIXTURE = PATH_PREFIX / "tests/compressed_test_files/test_tar_file.tar"
+
+
+def checksums_of(content: bytes) -> Checksums:
+    return Checksums(
+        hashlib.md5(content).hexdigest(), hashlib.sha1(content).hexdigest()
+    )
+
+
+def expected_digests(content: bytes):
+    return dict(checksums_of(content)._asdict())
+
+
+class StreamingHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+        self.path = TEST_DIR / "a.tar"
+        self.path.write_bytes(CONTENT)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def segments(self, size):
+        return [
+            (offset, CONTENT[offset : offset + size])
+            for offset in range(0, len(CONTENT), size)
+        ]
+
+    def test_in_order_bytes_are_not_read_again(self):
+        hasher = StreamingHasher()
+        for offset, data in self.segments(65536):
+            hasher.update(offset, data)
+        self.assertEqual(hasher.finish(self.path), expected_digests(CONTENT))
+        self.assertEqual(hasher.bytes_reread, 0)
+
+    def test_out_of_order_bytes_are_buffered(self):
+        hasher = StreamingHasher()
+        for offset, data in reversed(self.segments(65536)):
+            hasher.update(offset, data)
+        self.assertEqual(hasher.position, len(CONTENT))
+        self.assertEqual(hasher.finish(self.path), expected_digests(CONTENT))
+        self.assertEqual(hasher.bytes_reread, 0)
+
+    def test_bytes_beyond_the_buffer_are_read_back(self):
+        hasher = StreamingHasher(max_buffered=100000)
+        segments = self.segments(65536)
+        for offset, data in segments[1:] + segments[:1]:
+            hasher.update(offset, data)
+        self.assertEqual(hasher.finish(self.path), expected_digests(CONTENT))
+        self.assertGreater(hasher.bytes_reread, 0)
+        self.assertLess(hasher.bytes_reread, len(CONTENT))
+
+    def test_reset(self):
+        hasher = StreamingHasher(("md5",))
+        hasher.update(0, b"garbage")
+        hasher.reset()
+        hasher.update(0, CONTENT)
+        self.assertEqual(hasher.hexdigests(), {"md5": hashlib.md5(CONTENT).hexdigest()})
+
+    def test_mismatches(self):
+        expected = Checksums(md5="A" * 32)
+        self.assertEqual(expected.algorithms, ("md5",))
+        self.assertEqual(expected.mismatches({"md5": "a" * 32, "sha1": "b"}), [])
+        self.assertEqual(expected.mismatches({"md5": "b" * 32}), ["md5"])
+
+
+class VerifiedDownloadTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_engines_verify_downloads(self):
+        for engine_class, options in (
+            (AsyncioEngine, {"segments_per_file": 4}),
+            (PySmartDLEngine, {}),
+        ):
+            with self.subTest(engine=engine_class.name):
+                with LocalHTTPServer({"a.tar": CONTENT}) as server, engine_class(
+                    checksums=lambda link: checksums_of(CONTENT), **options
+                ) as engine:
+                    engine.download(
+                        server.url("a.tar"), str(TEST_DIR), verbose=False, connections=4
+                    )
+                self.assertEqual((TEST_DIR / "a.tar").read_bytes(), CONTENT)
+                os.remove(TEST_DIR / "a.tar")
+
+    def test_mismatch_downloads_again(self):
+        with LocalHTTPServer({"a.tar": CORRUPT}) as server, AsyncioEngine(
+            checksums=lambda link: checksums_of(CONTENT)
+        ) as engine:
+            discarded = []
+
+            def discard(path):
+                discarded.append(path)
+                server.files["a.tar"] = CONTENT
+                DownloadEngine._discard(path)
+
+            engine._discard = discard
+            engine.download(server.url("a.tar"), str(TEST_DIR), verbose=False)
+
+        self.assertEqual(discarded, [TEST_DIR / "a.tar"])
+        self.assertEqual((TEST_DIR / "a.tar").read_bytes(), CONTENT)
+
+    def test_persistent_mismatch_is_raised(self):
+        with LocalHTTPServer({"a.tar": CORRUPT}) as server, AsyncioEngine(
+            segments_per_file=1, checksums=lambda link: checksums_of(CONTENT)
+        ) as engine:
+            with self.assertRaises(ChecksumMismatchError):
+                engine.download(server.url("a.tar"), str(TEST_DIR), verbose=False)
+        self.assertEqual(
+            len([item for item in server.requests if item["method"] == "GET"]), 2
+        )
+
+    def test_resumed_downloads_keep_their_checksums(self):
+        with LocalHTTPServer({"a.tar": CONTENT}) as server, AsyncioEngine(
+            resume=True,
+            segments_per_file=1,
+            checksums=lambda link: checksums_of(CONTENT),
+        ) as engine:
+            engine.download(server.url("a.tar"), str(TEST_DIR), verbose=False)
+            state = DownloadState.load(TEST_DIR / "a.tar")
+            self.assertEqual(state.checksums, expected_digests(CONTENT))
+
+            # A complete file is checked against the digests of the state file
+            engine.download(server.url("a.tar"), str(TEST_DIR), verbose=False)
+        self.assertEqual(
+            len([item for item in server.requests if item["method"] == "GET"]), 1
+        )
+
+    def test_extract_engine_verifies_the_archive(self):
+        content = TAR_FIXTURE.read_bytes()
+        with LocalHTTPServer({"a.tar": content}) as server, ExtractOnTheFlyEngine(
+            AsyncioEngine(checksums=lambda link: checksums_of(CORRUPT))
+        ) as engine:
+            with self.assertRaises(ChecksumMismatchError):
+                engine.download(server.url("a.tar"), str(TEST_DIR), verbose=False)
+
+        with LocalHTTPServer({"a.tar": content}) as server, ExtractOnTheFlyEngine(
+            AsyncioEngine(checksums=lambda link: checksums_of(content))
+        ) as engine:
+            output_dir = engine.download(
+                server.url("a.tar"), str(TEST_DIR), verbose=False
+            )
+        self.assertTrue(any(output_dir.iterdir()))
+
+
+class VerifyTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_verify(self):
+        (TEST_DIR / "ok.tar").write_bytes(CONTENT)
+        (TEST_DIR / "corrupt.tar").write_bytes(CORRUPT)
+        (TEST_DIR / "unknown.tar").write_bytes(b"unknown")
+        (TEST_DIR / "ok.tar.dozent-state").write_text("{}")
+        expected = {
+            "ok.tar": checksums_of(CONTENT),
+            "corrupt.tar": checksums_of(CONTENT),
+        }
+
+        report = verify(
+            [TEST_DIR, TEST_DIR / "missing.tar"], expected.get, max_workers=2
+        )
+        statuses = {Path(result.path).name: result.status for result in report.results}
+        self.assertEqual(
+            statuses,
+            {
+                "corrupt.tar": STATUS_MISMATCH,
+                "ok.tar": STATUS_OK,
+                "unknown.tar": STATUS_UNKNOWN,
+                "missing.tar": STATUS_ERROR,
+            },
+        )
+        self.assertFalse(report.ok)
+        self.assertIn("1 mismatched", report.format())
+
+    def test_hash_file(self):
+        (TEST_DIR / "a.tar").write_bytes(CONTENT)
+        self.assertEqual(hash_file(TEST_DIR / "a.tar"), expected_digests(CONTENT))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import subprocess
+import sys
+import unittest
+
+from tests import CommonTestSetup
+
+_, PATH_PREFIX = CommonTestSetup.set_data_dir_path()
+
+
+def run_dozent(*arguments: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-m", "dozent", *arguments],
+        cwd=str(PATH_PREFIX),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        timeout=60,
+    )
+
+
+class CommandLineTestCase(unittest.TestCase):
+    def test_dry_run_rejects_options_it_would_ignore(self):
+        for arguments in (
+            ["--sample", "first=1"],
+            ["--extract-on-the-fly"],
+            ["--decompress-dir", "decompressed"],
+            ["--columnar-fields", "id"],
+            ["--index"],
+            ["--no-verify"],
+            ["--mirror", "https://mirror.example"],
+            ["--shard", "0/2"],
+            ["--claim-ttl", "5"],
+        ):
+            with self.subTest(arguments=arguments):
+                process = run_dozent("--dry-run", *arguments)
+                self.assertEqual(process.returncode, 2)
+                self.assertIn(f"error: {arguments[0]} needs -s/-e", process.stderr)
+
+    def test_sync_rejects_options_it_would_ignore(self):
+        for arguments in (
+            ["--extract-on-the-fly"],
+            ["--columnar-dir", "columnar"],
+            ["--claim"],
+        ):
+            with self.subTest(arguments=arguments):
+                process = run_dozent(
+                    "-s", "2020-06-01", "-e", "2020-06-02", *arguments, "sync"
+                )
+                self.assertEqual(process.returncode, 2)
+                self.assertIn(
+                    f"error: {arguments[0]} isn't supported by sync", process.stderr
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
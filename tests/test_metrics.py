@@ -0,0 +1,154 @@
+import json
+import os
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.download_scheduler import DownloadScheduler
+from dozent.engines import AsyncioEngine
+from dozent.metrics import FileMetrics, MetricsRecorder, percentile
+
+TEST_DIR = Path("test_metrics_dir")
+CONTENT = os.urandom(512 * 1024)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 0.95))
+        self.assertEqual(percentile([3, 1, 2], 0.5), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 0.95), 95)
+
+    def test_file_metrics(self):
+        metrics = FileMetrics("link", queued_at=1.0)
+        metrics.started_at = 3.0
+        # 100 bytes per second for 3 seconds, then 400 bytes per second
+        for second in range(5):
+            rate = 100 if second < 3 else 400
+            for tick in range(10):
+                metrics.add(rate // 10, 3.5 + second + tick / 10)
+        metrics.finished_at = 8.5
+
+        self.assertEqual(metrics.queue_wait, 2.0)
+        self.assertEqual(metrics.time_to_first_byte, 0.5)
+        self.assertEqual(metrics.duration, 5.5)
+        self.assertEqual(metrics.bytes, 1100)
+        self.assertAlmostEqual(metrics.average_throughput, 220)
+        self.assertAlmostEqual(metrics.p95_throughput, 400)
+
+    def test_exports_as_the_run_progresses(self):
+        clock = _Clock()
+        jsonl_path = TEST_DIR / "metrics.jsonl"
+        prometheus_path = TEST_DIR / "dozent.prom"
+        recorder = MetricsRecorder(jsonl_path, prometheus_path, clock=clock)
+
+        def download(link, download_dir, verbose, connections, progress):
+            self.assertTrue(verbose)
+            task = progress.register(link, total=2000)
+            clock.now += 1
+            task.add(1000)
+            if link == "bad":
+                task.retry()
+                raise ConnectionError("reset")
+            clock.now += 1
+            task.add(1000)
+            task.finish()
+
+        scheduler = DownloadScheduler(
+            download_dir=TEST_DIR,
+            max_concurrent_files=1,
+            max_connections=1,
+            verbose=False,
+            download_function=download,
+            metrics=recorder,
+        )
+        results = scheduler.run(["good", "bad"])
+        summary = recorder.close()
+        self.assertEqual([outcome.link for outcome in results.failed], ["bad"])
+
+        lines = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+        self.assertEqual([line["type"] for line in lines], ["file", "file", "run"])
+        good, bad, run = lines
+        self.assertEqual(good["status"], "ok")
+        self.assertEqual(good["bytes"], 2000)
+        self.assertEqual(good["time_to_first_byte_seconds"], 1.0)
+        self.assertEqual(good["duration_seconds"], 2.0)
+        self.assertEqual(bad["status"], "failed")
+        self.assertEqual(bad["retries"], 1)
+        self.assertIn("reset", bad["error"])
+        self.assertEqual(run["statuses"], {"ok": 1, "failed": 1})
+        self.assertEqual(summary["bytes"], 3000)
+
+        prometheus = prometheus_path.read_text()
+        self.assertIn('dozent_files{status="ok"} 1', prometheus)
+        self.assertIn("dozent_downloaded_bytes 3000", prometheus)
+        self.assertIn(
+            'dozent_file_duration_seconds{link="good",status="ok"} 2.0', prometheus
+        )
+
+    def test_failed_processing_is_exported(self):
+        clock = _Clock()
+        jsonl_path = TEST_DIR / "metrics.jsonl"
+        recorder = MetricsRecorder(jsonl_path, clock=clock)
+
+        def download(link, download_dir, verbose, connections, progress):
+            clock.now += 2
+            return f"{link}.tar"
+
+        def post_download(path):
+            clock.now += 10
+            raise ValueError("not a tar archive")
+
+        results = DownloadScheduler(
+            download_dir=TEST_DIR,
+            max_concurrent_files=1,
+            max_connections=1,
+            verbose=False,
+            download_function=download,
+            post_download=post_download,
+            metrics=recorder,
+        ).run(["broken"])
+        recorder.close()
+
+        self.assertEqual([outcome.link for outcome in results.failed], ["broken"])
+        line = json.loads(jsonl_path.read_text().splitlines()[0])
+        self.assertEqual(line["status"], "failed")
+        self.assertIn("not a tar archive", line["error"])
+        # Processing isn't part of the transfer time
+        self.assertEqual(line["duration_seconds"], 2.0)
+
+    def test_counts_bytes_of_a_quiet_run(self):
+        recorder = MetricsRecorder()
+        files = {f"archive_{index}.tar": CONTENT for index in range(2)}
+        with LocalHTTPServer(files) as server, AsyncioEngine() as engine:
+            DownloadScheduler(
+                download_dir=TEST_DIR,
+                max_concurrent_files=2,
+                max_connections=4,
+                verbose=False,
+                download_function=engine.download,
+                metrics=recorder,
+            ).run([server.url(name) for name in files])
+        summary = recorder.close()
+
+        self.assertEqual(summary["statuses"], {"ok": 2})
+        self.assertEqual(summary["bytes"], 2 * len(CONTENT))
+        self.assertIsNotNone(summary["p95_time_to_first_byte_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+from dozent.ordering import date_of, order_links
+
+LINKS = [
+    "https://archive.org/download/archiveteam-twitter-stream-2018-06/twitter-2018-06-17.tar",
+    "https://archive.org/download/archiveteam-twitter-stream-2015-08/archiveteam-twitter-stream-2015-08.tar",
+    "https://archive.org/download/archiveteam-twitter-stream-2020-05/twitter_stream_2020_05_15.tar",
+    "https://archive.org/download/archiveteam-twitter-json-2011/twitter-json-scrape-2011-09.zip",
+    "https://example.com/download/undated.tar",
+]
+
+
+class OrderingTestCase(unittest.TestCase):
+    def test_date_of(self):
+        self.assertEqual(
+            [date_of(link) for link in LINKS],
+            [
+                datetime.date(2018, 6, 17),
+                datetime.date(2015, 8, 1),
+                datetime.date(2020, 5, 15),
+                datetime.date(2011, 9, 1),
+                None,
+            ],
+        )
+
+    def test_catalog_order_is_kept(self):
+        self.assertEqual(order_links(LINKS, "catalog"), LINKS)
+
+    def test_largest_first(self):
+        sizes = {LINKS[0]: 2, LINKS[1]: 60, LINKS[2]: 2, LINKS[4]: 3}
+        self.assertEqual(
+            order_links(LINKS, "largest-first", sizes.get),
+            # Equal sizes keep their order, unknown sizes go last
+            [LINKS[1], LINKS[4], LINKS[0], LINKS[2], LINKS[3]],
+        )
+
+    def test_date(self):
+        self.assertEqual(
+            order_links(LINKS, "date"),
+            [LINKS[3], LINKS[1], LINKS[0], LINKS[2], LINKS[4]],
+        )
+
+    def test_unknown_order(self):
+        with self.assertRaises(ValueError):
+            order_links(LINKS, "smallest-first")
+
+
+if __name__ == "__main__":
+    unittest.main()
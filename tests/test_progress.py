@@ -0,0 +1,85 @@
+import io
+import threading
+import unittest
+
+from dozent.progress import ProgressAggregator, ProgressRenderer
+
+
+class ProgressAggregatorTestCase(unittest.TestCase):
+    def test_totals_are_incremental(self):
+        aggregator = ProgressAggregator()
+        first = aggregator.register("first", total=100)
+        second = aggregator.register("second")
+        second.set_total(50)
+
+        first.add(40)
+        second.add(10)
+        second.add(40)
+        second.finish()
+
+        snapshot = aggregator.snapshot()
+        self.assertEqual(snapshot.downloaded, 90)
+        self.assertEqual(snapshot.total, 150)
+        self.assertEqual(snapshot.active_tasks, 1)
+        self.assertEqual(snapshot.finished_tasks, 1)
+
+    def test_concurrent_updates(self):
+        aggregator = ProgressAggregator()
+        tasks = [aggregator.register(f"task-{i}", total=1000) for i in range(500)]
+
+        def worker(task):
+            for _ in range(100):
+                task.add(10)
+            task.finish()
+
+        threads = [threading.Thread(target=worker, args=(task,)) for task in tasks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        snapshot = aggregator.snapshot()
+        self.assertEqual(snapshot.downloaded, 500 * 1000)
+        self.assertEqual(snapshot.total, 500 * 1000)
+        self.assertEqual(snapshot.finished_tasks, 500)
+        self.assertEqual(snapshot.active_tasks, 0)
+
+    def test_finish_is_idempotent(self):
+        aggregator = ProgressAggregator()
+        task = aggregator.register("task")
+        task.finish()
+        task.finish()
+        self.assertEqual(aggregator.snapshot().finished_tasks, 1)
+
+
+class ProgressRendererTestCase(unittest.TestCase):
+    def test_renders_lines_when_not_a_tty(self):
+        aggregator = ProgressAggregator()
+        aggregator.register("task", total=2048).add(1024)
+        stream = io.StringIO()
+
+        renderer = ProgressRenderer(aggregator, stream=stream)
+        renderer.write_line("hello")
+        renderer.render()
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], "hello")
+        self.assertIn("1.00 KB / 2.00 KB", lines[1])
+        self.assertIn("[ 50.00% ]", lines[1])
+        self.assertNotIn("\r", stream.getvalue())
+
+    def test_stop_renders_final_state(self):
+        aggregator = ProgressAggregator()
+        task = aggregator.register("task", total=10)
+        stream = io.StringIO()
+        renderer = ProgressRenderer(aggregator, interval=0.01, stream=stream)
+        renderer.start()
+        task.add(10)
+        task.finish()
+        renderer.stop()
+
+        self.assertIn("[ 100.00% ]", stream.getvalue().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import os
+import socket
+import unittest
+import urllib.error
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.async_http import HTTPError
+from dozent.downloader_tools import DownloaderTools
+from dozent.engines import AsyncioEngine
+from dozent.progress import ProgressAggregator
+from dozent.retry import CircuitBreaker, RetryPolicy, is_retryable
+
+TEST_DIR = Path("test_retry_dir")
+CONTENT = os.urandom(2 * 1024 * 1024 + 5)
+
+
+def fast_policy(**options) -> RetryPolicy:
+    options.setdefault("max_retries", 10)
+    return RetryPolicy(base_delay=0.001, max_delay=0.01, reset_timeout=0.01, **options)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(ConnectionResetError()))
+        self.assertTrue(is_retryable(TimeoutError()))
+        self.assertTrue(is_retryable(HTTPError(503, "http://host/a.tar")))
+        self.assertTrue(
+            is_retryable(urllib.error.HTTPError("http://host", 502, "", None, None))
+        )
+        self.assertFalse(
+            is_retryable(urllib.error.HTTPError("http://host", 404, "", None, None))
+        )
+        self.assertFalse(is_retryable(HTTPError(403, "http://host/a.tar")))
+        self.assertFalse(is_retryable(OSError(28, "No space left on device")))
+
+    def test_unknown_hosts_are_not_retried(self):
+        unknown = socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        self.assertFalse(is_retryable(unknown))
+        self.assertFalse(is_retryable(urllib.error.URLError(unknown)))
+        self.assertTrue(
+            is_retryable(socket.gaierror(socket.EAI_AGAIN, "Temporary failure"))
+        )
+        self.assertTrue(is_retryable(urllib.error.URLError(ConnectionRefusedError())))
+
+        attempts = []
+
+        def resolve():
+            attempts.append(None)
+            raise unknown
+
+        with self.assertRaises(socket.gaierror):
+            fast_policy().call("http://unknown.invalid/a.tar", resolve)
+        self.assertEqual(len(attempts), 1)
+
+    def test_backoff_is_capped_and_jittered(self):
+        policy = RetryPolicy(base_delay=1, max_delay=10, uniform=lambda low, high: high)
+        self.assertEqual(
+            [policy.backoff(retry) for retry in range(6)], [1, 2, 4, 8, 10, 10]
+        )
+        policy = RetryPolicy(uniform=lambda low, high: low)
+        self.assertEqual(policy.backoff(3), 0)
+
+    def test_retries_until_success(self):
+        calls = []
+        retried = []
+
+        def attempt():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionResetError()
+            return "done"
+
+        result = fast_policy().call("http://host/a.tar", attempt, retried.append)
+        self.assertEqual(result, "done")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(retried), 2)
+
+    def test_gives_up(self):
+        calls = []
+
+        def attempt():
+            calls.append(1)
+            raise ConnectionResetError()
+
+        with self.assertRaises(ConnectionResetError):
+            fast_policy(max_retries=2).call("http://host/a.tar", attempt)
+        self.assertEqual(len(calls), 3)
+
+    def test_final_errors_are_not_retried(self):
+        calls = []
+
+        def attempt():
+            calls.append(1)
+            raise HTTPError(404, "http://host/a.tar")
+
+        with self.assertRaises(HTTPError):
+            fast_policy().call("http://host/a.tar", attempt)
+        self.assertEqual(len(calls), 1)
+
+    def test_circuit_breaker(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock)
+        for _ in range(3):
+            self.assertEqual(breaker.wait_time(), 0)
+            breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertEqual(breaker.wait_time(), 10)
+
+        clock.now = 10
+        # A single trial request goes through, the others keep waiting
+        self.assertEqual(breaker.wait_time(), 0)
+        self.assertGreater(breaker.wait_time(), 0)
+        breaker.record_failure()
+        self.assertEqual(breaker.wait_time(), 10)
+
+        clock.now = 20
+        self.assertEqual(breaker.wait_time(), 0)
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertEqual(breaker.wait_time(), 0)
+        self.assertEqual(breaker.times_opened, 1)
+
+    def test_breakers_are_per_host(self):
+        policy = RetryPolicy()
+        self.assertIs(policy.breaker("a.org"), policy.breaker("a.org"))
+        self.assertIsNot(policy.breaker("a.org"), policy.breaker("b.org"))
+
+
+class SegmentRetryTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def get_ranges(self, server: LocalHTTPServer):
+        return [item["range"] for item in server.requests if item["method"] == "GET"]
+
+    def test_download_with_resume_keeps_written_bytes(self):
+        progress = ProgressAggregator()
+        with LocalHTTPServer(
+            {"a.tar": CONTENT}, drop_first_requests=1, drop_after_bytes=100000
+        ) as server:
+            DownloaderTools.download_with_resume(
+                server.url("a.tar"),
+                str(TEST_DIR),
+                progress=progress,
+                retry=fast_policy(),
+            )
+
+        self.assertEqual((TEST_DIR / "a.tar").read_bytes(), CONTENT)
+        self.assertEqual(
+            self.get_ranges(server),
+            [f"bytes=0-{len(CONTENT) - 1}", f"bytes=100000-{len(CONTENT) - 1}"],
+        )
+        self.assertEqual(progress.snapshot().downloaded, len(CONTENT))
+
+    def test_download_with_resume_on_failing_server(self):
+        with LocalHTTPServer({"a.tar": CONTENT}, fail_rate=0.3, seed=3) as server:
+            DownloaderTools.download_with_resume(
+                server.url("a.tar"), str(TEST_DIR), connections=4, retry=fast_policy()
+            )
+
+        self.assertEqual((TEST_DIR / "a.tar").read_bytes(), CONTENT)
+
+    def test_without_retries_errors_are_raised(self):
+        with LocalHTTPServer({"a.tar": CONTENT}, fail_rate=1) as server:
+            with self.assertRaises(urllib.error.HTTPError):
+                DownloaderTools.download_with_resume(server.url("a.tar"), str(TEST_DIR))
+
+    def test_asyncio_engine_keeps_written_bytes(self):
+        with LocalHTTPServer(
+            {"a.tar": CONTENT}, drop_first_requests=1, drop_after_bytes=100000
+        ) as server, AsyncioEngine(segments_per_file=1, retry=fast_policy()) as engine:
+            engine.download(server.url("a.tar"), str(TEST_DIR), verbose=False)
+
+        self.assertEqual((TEST_DIR / "a.tar").read_bytes(), CONTENT)
+        self.assertEqual(
+            self.get_ranges(server),
+            [f"bytes=0-{len(CONTENT) - 1}", f"bytes=100000-{len(CONTENT) - 1}"],
+        )
+
+    def test_asyncio_engine_on_failing_server(self):
+        with LocalHTTPServer(
+            {"a.tar": CONTENT}, fail_rate=0.3, seed=5
+        ) as server, AsyncioEngine(retry=fast_policy()) as engine:
+            engine.download(
+                server.url("a.tar"), str(TEST_DIR), verbose=False, connections=4
+            )
+
+        self.assertEqual((TEST_DIR / "a.tar").read_bytes(), CONTENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import io
+import os
+import tarfile
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.downloader_tools import RangeNotSupportedError
+from dozent.engines import AsyncioEngine, SampleEngine
+from dozent.http_pool import HTTPConnectionPool
+from dozent.retry import RetryPolicy
+from dozent.sampling import MemberSample, RemoteTar, parse_sample
+
+TEST_DIR = Path("test_sampling_dir")
+
+MEMBERS = {
+    f"2020/06/01/{hour:02d}/{minute:02d}.json.bz2": os.urandom(100_000 + hour * 100)
+    for hour in range(24)
+    for minute in (0, 30)
+}
+LONG_NAME = "archiveteam/" + "x" * 120 + "/2020/06/01/12/45.json.bz2"
+
+
+def _archive(members, format=tarfile.GNU_FORMAT) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=format) as archive:
+        directory = tarfile.TarInfo("2020/06/01")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+ARCHIVE = _archive(MEMBERS)
+
+
+def _transferred(server) -> int:
+    total = 0
+    for request in server.requests:
+        start, end = request["range"][len("bytes=") :].split("-")
+        total += int(end) - int(start) + 1
+    return total
+
+
+class SampleSpecTestCase(unittest.TestCase):
+    def test_parse_sample(self):
+        self.assertEqual(parse_sample("first=10"), MemberSample(first=10))
+        self.assertEqual(parse_sample("every=6h,first=120"), MemberSample(120, 6, None))
+        self.assertEqual(
+            parse_sample("glob=*/{00,12}/*,every=12"),
+            MemberSample(None, 12, "*/{00,12}/*"),
+        )
+        for text in ("first=0", "every=25h", "every=often", "last=3", "glob="):
+            with self.assertRaises(ValueError):
+                parse_sample(text)
+
+
+class RemoteTarTestCase(unittest.TestCase):
+    def _walk(self, content: bytes):
+        with LocalHTTPServer({"archive.tar": content}) as server:
+            with HTTPConnectionPool() as pool:
+                remote = RemoteTar(server.url("archive.tar"), pool)
+                return list(remote.members()), remote
+
+    def test_members_match_tarfile(self):
+        members = dict(list(MEMBERS.items())[:6])
+        members[LONG_NAME] = b"long"
+        for format in (tarfile.GNU_FORMAT, tarfile.PAX_FORMAT):
+            content = _archive(members, format)
+            walked, remote = self._walk(content)
+            with tarfile.open(fileobj=io.BytesIO(content)) as archive:
+                expected = [
+                    (info.name, info.offset_data, info.size)
+                    for info in archive
+                    if info.isfile()
+                ]
+            self.assertEqual(
+                [(member.name, member.offset, member.size) for member in walked],
+                expected,
+            )
+            self.assertEqual(walked[-1].minute.hour, 12)
+            self.assertEqual(remote.size, len(content))
+
+    def test_empty_archive(self):
+        walked, _ = self._walk(_archive({}))
+        self.assertEqual(walked, [])
+
+
+class SampleEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def _sample(self, sample, server, **options):
+        with SampleEngine(AsyncioEngine(**options), sample) as engine:
+            return engine.download(
+                server.url("twitter_stream_2020_06_01.tar"), str(TEST_DIR)
+            )
+
+    def _written(self, output_dir: Path):
+        return {
+            path.relative_to(output_dir).as_posix(): path.read_bytes()
+            for path in output_dir.rglob("*")
+            if path.is_file()
+        }
+
+    def test_only_selected_members_are_transferred(self):
+        with LocalHTTPServer({"twitter_stream_2020_06_01.tar": ARCHIVE}) as server:
+            output_dir = self._sample(MemberSample(every_hours=6), server)
+            transferred = _transferred(server)
+
+        self.assertEqual(output_dir, TEST_DIR / "twitter_stream_2020_06_01")
+        expected = {
+            name: data
+            for name, data in MEMBERS.items()
+            if name.split("/")[3] in ("00", "06", "12", "18")
+        }
+        self.assertEqual(self._written(output_dir), expected)
+        # The selected members, and a few KB per header otherwise
+        self.assertLess(
+            transferred, sum(map(len, expected.values())) + len(MEMBERS) * 8192
+        )
+        self.assertLess(transferred, len(ARCHIVE) / 3)
+
+    def test_first_members_stop_the_walk(self):
+        with LocalHTTPServer({"twitter_stream_2020_06_01.tar": ARCHIVE}) as server:
+            output_dir = self._sample(
+                MemberSample(first=2, pattern="*/30.json.bz2"), server
+            )
+            requests = len(server.requests)
+
+        self.assertEqual(
+            sorted(self._written(output_dir)),
+            ["2020/06/01/00/30.json.bz2", "2020/06/01/01/30.json.bz2"],
+        )
+        # Two header reads, and the selected members bring the header after them along
+        self.assertLessEqual(requests, 5)
+
+    def test_resume_skips_written_members(self):
+        sample = MemberSample(first=3)
+        with LocalHTTPServer({"twitter_stream_2020_06_01.tar": ARCHIVE}) as server:
+            self._sample(sample, server)
+            first_run = _transferred(server)
+            server.requests.clear()
+            self._sample(sample, server, resume=True)
+            second_run = _transferred(server)
+        self.assertLess(second_run, first_run / 4)
+
+    def test_dropped_connection_is_retried(self):
+        with LocalHTTPServer(
+            {"twitter_stream_2020_06_01.tar": ARCHIVE},
+            drop_first_requests=2,
+            drop_after_bytes=1000,
+        ) as server:
+            output_dir = self._sample(
+                MemberSample(first=1),
+                server,
+                retry=RetryPolicy(base_delay=0.001),
+            )
+        name = next(iter(MEMBERS))
+        self.assertEqual(self._written(output_dir), {name: MEMBERS[name]})
+
+    def test_server_without_range_support(self):
+        with LocalHTTPServer(
+            {"twitter_stream_2020_06_01.tar": ARCHIVE}, support_ranges=False
+        ) as server:
+            with self.assertRaises(RangeNotSupportedError):
+                self._sample(MemberSample(first=1), server)
+
+    def test_only_tar_archives(self):
+        with LocalHTTPServer({"twitter_stream_2020_06_01.zip": b"zip"}) as server:
+            with SampleEngine(AsyncioEngine(), MemberSample(first=1)) as engine:
+                with self.assertRaises(ValueError):
+                    engine.download(
+                        server.url("twitter_stream_2020_06_01.zip"), str(TEST_DIR)
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
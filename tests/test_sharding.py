@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.download_scheduler import DownloadScheduler
+from dozent.engines import AsyncioEngine
+from dozent.metrics import STATUS_ELSEWHERE, STATUS_FAILED, STATUS_OK
+from dozent.sharding import CLAIMS_DIRECTORY, WorkClaims, parse_shard, shard_links
+
+TEST_DIR = Path("test_sharding_dir")
+CLAIMS_DIR = TEST_DIR / CLAIMS_DIRECTORY
+FILES = {f"f{index}.tar": os.urandom(200000 + index) for index in range(12)}
+
+
+def _age(path: Path, seconds: float) -> None:
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def _run_node(links, node):
+    """
+    Runs one node of a shared download, in its own process
+    """
+    with AsyncioEngine(resume=True, segments_per_file=1) as engine, WorkClaims(
+        CLAIMS_DIR, ttl=60, node=node
+    ) as claims:
+        scheduler = DownloadScheduler(
+            download_dir=TEST_DIR,
+            max_concurrent_files=2,
+            verbose=False,
+            download_function=engine.download,
+            claims=claims,
+            claim_poll_interval=0.05,
+        )
+        results = scheduler.run(links)
+    return [(outcome.link, outcome.status) for outcome in results.outcomes]
+
+
+class ShardTestCase(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("0/4"), (0, 4))
+        self.assertEqual(parse_shard("3/4"), (3, 4))
+        for invalid in ("4/4", "-1/4", "1/0", "1", "a/b"):
+            with self.assertRaises(ValueError):
+                parse_shard(invalid)
+
+    def test_shards_partition_the_links(self):
+        links = [f"link{index}" for index in range(10)]
+        shards = [shard_links(links, index, 3) for index in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(links))
+        self.assertEqual([len(shard) for shard in shards], [4, 3, 3])
+
+
+class WorkClaimsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.first = WorkClaims(CLAIMS_DIR, ttl=60, node="first")
+        self.second = WorkClaims(CLAIMS_DIR, ttl=60, node="second")
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_a_link_is_claimed_once(self):
+        self.assertTrue(self.first.claim("http://host/a.tar"))
+        self.assertFalse(self.second.claim("http://host/a.tar"))
+        self.assertEqual(self.second.holder("http://host/a.tar"), "first")
+
+        self.first.release("http://host/a.tar")
+        self.assertIsNone(self.second.holder("http://host/a.tar"))
+        self.assertTrue(self.second.claim("http://host/a.tar"))
+
+    def test_done_links_are_not_claimed_again(self):
+        self.assertTrue(self.first.claim("http://host/a.tar"))
+        self.first.complete("http://host/a.tar")
+        self.assertTrue(self.second.is_done("http://host/a.tar"))
+        self.assertFalse(self.second.claim("http://host/a.tar"))
+        self.assertFalse(self.first.claim("http://host/a.tar"))
+
+    def test_stale_claims_are_taken_over(self):
+        self.assertTrue(self.first.claim("http://host/a.tar"))
+        _age(CLAIMS_DIR / "a.tar.claim", 30)
+        self.assertFalse(self.second.claim("http://host/a.tar"))
+        _age(CLAIMS_DIR / "a.tar.claim", 120)
+        self.assertTrue(self.second.claim("http://host/a.tar"))
+        self.assertEqual(self.first.holder("http://host/a.tar"), "second")
+        self.assertEqual(
+            sorted(path.name for path in CLAIMS_DIR.glob("a.tar*")), ["a.tar.claim"]
+        )
+
+    def test_heartbeat_keeps_claims_alive(self):
+        claims = WorkClaims(CLAIMS_DIR, ttl=0.2, node="beating")
+        with claims:
+            self.assertTrue(claims.claim("http://host/a.tar"))
+            time.sleep(0.5)
+            self.assertFalse(self.second.claim("http://host/a.tar"))
+        # Claims still held on exit are released
+        self.assertIsNone(self.second.holder("http://host/a.tar"))
+
+
+class ClaimedSchedulerTestCase(unittest.TestCase):
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def scheduler(self, download_function, claims):
+        return DownloadScheduler(
+            download_dir=TEST_DIR,
+            verbose=False,
+            download_function=download_function,
+            claims=claims,
+            claim_poll_interval=0.01,
+        )
+
+    def test_waits_for_links_of_other_nodes(self):
+        other = WorkClaims(CLAIMS_DIR, ttl=60, node="other")
+        claims = WorkClaims(CLAIMS_DIR, ttl=60, node="self")
+        other.claim("http://host/a.tar")
+        downloaded = []
+
+        def fake_download(link, download_dir, verbose, connections, progress):
+            downloaded.append(link)
+
+        threading.Timer(0.1, other.complete, ["http://host/a.tar"]).start()
+        results = self.scheduler(fake_download, claims).run(
+            ["http://host/a.tar", "http://host/b.tar"]
+        )
+
+        self.assertEqual(downloaded, ["http://host/b.tar"])
+        self.assertEqual(
+            [outcome.link for outcome in results.elsewhere], ["http://host/a.tar"]
+        )
+        self.assertTrue(results.ok)
+        self.assertTrue(claims.is_done("http://host/b.tar"))
+
+    def test_takes_over_links_of_dead_nodes(self):
+        WorkClaims(CLAIMS_DIR, ttl=60, node="dead").claim("http://host/a.tar")
+        _age(CLAIMS_DIR / "a.tar.claim", 120)
+        downloaded = []
+
+        def fake_download(link, download_dir, verbose, connections, progress):
+            downloaded.append(link)
+
+        claims = WorkClaims(CLAIMS_DIR, ttl=60, node="self")
+        results = self.scheduler(fake_download, claims).run(["http://host/a.tar"])
+        self.assertEqual(downloaded, ["http://host/a.tar"])
+        self.assertEqual(len(results.succeeded), 1)
+
+    def test_failed_links_are_released(self):
+        def failing_download(link, download_dir, verbose, connections, progress):
+            raise ConnectionResetError()
+
+        claims = WorkClaims(CLAIMS_DIR, ttl=60, node="self")
+        results = self.scheduler(failing_download, claims).run(["http://host/a.tar"])
+        self.assertEqual(results.outcomes[0].status, STATUS_FAILED)
+        self.assertIsNone(claims.holder("http://host/a.tar"))
+        self.assertFalse(claims.is_done("http://host/a.tar"))
+
+    def test_nodes_in_separate_processes(self):
+        TEST_DIR.mkdir(exist_ok=True)
+        with LocalHTTPServer(FILES) as server, ProcessPoolExecutor(
+            max_workers=3, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            links = [server.url(name) for name in FILES]
+            futures = [
+                executor.submit(_run_node, links, f"node{index}") for index in range(3)
+            ]
+            outcomes = [future.result(timeout=120) for future in futures]
+
+        gets = [item["path"] for item in server.requests if item["method"] == "GET"]
+        self.assertEqual(sorted(gets), sorted(f"/{name}" for name in FILES))
+        for name, content in FILES.items():
+            self.assertEqual((TEST_DIR / name).read_bytes(), content)
+        for node_outcomes in outcomes:
+            self.assertEqual(sorted(link for link, _ in node_outcomes), sorted(links))
+            self.assertTrue(
+                all(
+                    status in (STATUS_OK, STATUS_ELSEWHERE)
+                    for _, status in node_outcomes
+                )
+            )
+        downloaded = [
+            link for node in outcomes for link, status in node if status == STATUS_OK
+        ]
+        self.assertEqual(sorted(downloaded), sorted(links))
+
+
+if __name__ == "__main__":
+    unittest.main()
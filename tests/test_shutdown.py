@@ -0,0 +1,55 @@
+import os
+import signal
+import threading
+import unittest
+
+from dozent.shutdown import graceful_shutdown
+
+
+class GracefulShutdownTestCase(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.previous = signal.signal(signal.SIGTERM, self.record)
+
+    def tearDown(self) -> None:
+        signal.signal(signal.SIGTERM, self.previous)
+
+    def record(self, signum, frame):
+        self.received.append(signum)
+
+    def test_first_signal_calls_back(self):
+        calls = []
+        with graceful_shutdown(lambda: calls.append(1)):
+            os.kill(os.getpid(), signal.SIGTERM)
+            self.assertEqual(calls, [1])
+            self.assertEqual(self.received, [])
+            # The second signal gets the previous handler
+            os.kill(os.getpid(), signal.SIGTERM)
+            self.assertEqual(self.received, [signal.SIGTERM])
+        self.assertEqual(calls, [1])
+
+    def test_previous_handlers_are_restored(self):
+        with graceful_shutdown(lambda: None):
+            self.assertIsNot(signal.getsignal(signal.SIGTERM), self.record)
+        self.assertEqual(signal.getsignal(signal.SIGTERM), self.record)
+
+    def test_nothing_is_installed_outside_the_main_thread(self):
+        handlers = []
+
+        def run():
+            with graceful_shutdown(lambda: None):
+                handlers.append(signal.getsignal(signal.SIGTERM))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(handlers, [self.record])
+
+    def test_import_installs_nothing(self):
+        import dozent  # noqa: F401
+
+        self.assertEqual(threading.Thread.__init__.__qualname__, "Thread.__init__")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import io
+import tarfile
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.engines import DownloadEngine, ExtractOnTheFlyEngine
+from dozent.progress import ProgressAggregator
+from dozent.retry import RetryPolicy
+from dozent.stream_extract import extract_tar_stream, member_path
+from tests import CommonTestSetup
+
+TEST_DIR = Path("test_stream_extract_dir")
+_, PATH_PREFIX = CommonTestSetup.set_data_dir_path()
+TAR_FIXTURE = PATH_PREFIX / "tests/compressed_test_files/test_tar_file.tar"
+
+
+class _RecordingEngine(DownloadEngine):
+    def __init__(self):
+        DownloadEngine.__init__(self)
+        self.links = []
+
+    def download(self, link, download_dir, verbose=True, connections=1, progress=None):
+        self.links.append(link)
+
+
+class StreamExtractTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+        with tarfile.open(TAR_FIXTURE) as archive:
+            self.members = {
+                member.name: archive.extractfile(member).read()
+                for member in archive
+                if member.isfile()
+            }
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_extract_tar_stream_to_disk(self):
+        with open(TAR_FIXTURE, "rb") as stream:
+            names = extract_tar_stream(stream, output_dir=TEST_DIR)
+
+        self.assertEqual(set(names), set(self.members))
+        for name, content in self.members.items():
+            self.assertEqual((TEST_DIR / name).read_bytes(), content)
+        self.assertEqual(list(TEST_DIR.glob("*.part")), [])
+
+    def test_extract_tar_stream_to_callback(self):
+        received = {}
+
+        def on_member(name, content):
+            received[name] = content.read()
+
+        with open(TAR_FIXTURE, "rb") as stream:
+            extract_tar_stream(stream, on_member=on_member)
+
+        self.assertEqual(received, self.members)
+        self.assertEqual(list(TEST_DIR.iterdir()), [])
+
+    def test_refuses_members_outside_output_dir(self):
+        with self.assertRaises(ValueError):
+            member_path(TEST_DIR, "../escaped.txt")
+
+        archive_bytes = io.BytesIO()
+        with tarfile.open(fileobj=archive_bytes, mode="w") as archive:
+            info = tarfile.TarInfo("../escaped.txt")
+            info.size = 1
+            archive.addfile(info, io.BytesIO(b"x"))
+        archive_bytes.seek(0)
+        with self.assertRaises(ValueError):
+            extract_tar_stream(archive_bytes, output_dir=TEST_DIR)
+
+    def test_engine_never_stores_the_archive(self):
+        fallback = _RecordingEngine()
+        progress = ProgressAggregator()
+        with LocalHTTPServer(
+            {"twitter_stream_2020_06_01.tar": TAR_FIXTURE.read_bytes()}
+        ) as server:
+            with ExtractOnTheFlyEngine(fallback) as engine:
+                engine.download(
+                    server.url("twitter_stream_2020_06_01.tar"),
+                    str(TEST_DIR),
+                    progress=progress,
+                )
+                engine.download(server.url("monthly.zip"), str(TEST_DIR))
+
+        output_dir = TEST_DIR / "twitter_stream_2020_06_01"
+        for name, content in self.members.items():
+            self.assertEqual((output_dir / name).read_bytes(), content)
+        self.assertFalse((TEST_DIR / "twitter_stream_2020_06_01.tar").exists())
+        self.assertEqual(fallback.links, [server.url("monthly.zip")])
+        self.assertEqual(progress.snapshot().downloaded, TAR_FIXTURE.stat().st_size)
+
+    def test_engine_retries_a_dropped_connection(self):
+        received = []
+
+        def on_member(name, content):
+            received.append((name, content.read()))
+
+        # Dropped in the middle of the second member
+        with LocalHTTPServer(
+            {"twitter_stream_2020_06_01.tar": TAR_FIXTURE.read_bytes()},
+            drop_first_requests=1,
+            drop_after_bytes=3500,
+        ) as server:
+            fallback = _RecordingEngine()
+            fallback.retry = RetryPolicy(base_delay=0.001)
+            progress = ProgressAggregator()
+            with ExtractOnTheFlyEngine(fallback, on_member=on_member) as engine:
+                engine.download(
+                    server.url("twitter_stream_2020_06_01.tar"),
+                    str(TEST_DIR),
+                    progress=progress,
+                )
+            self.assertEqual(len(server.requests), 2)
+
+        # The member extracted before the drop isn't handed over again
+        self.assertEqual(received, sorted(self.members.items()))
+        self.assertEqual(progress.snapshot().downloaded, TAR_FIXTURE.stat().st_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
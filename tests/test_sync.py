@@ -0,0 +1,130 @@
+import os
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.download_state import DownloadState
+from dozent.engines import AsyncioEngine
+from dozent.sync import (
+    SYNC_CHANGED,
+    SYNC_INCOMPLETE,
+    SYNC_MISSING,
+    SYNC_UNCHANGED,
+    SYNC_UNCHECKED,
+    plan_sync,
+)
+
+TEST_DIR = Path("test_sync_dir")
+
+
+class SyncTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+        self.files = {f"f{index}.tar": os.urandom(50000 + index) for index in range(8)}
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def download(self, server, names):
+        with AsyncioEngine(resume=True) as engine:
+            for name in names:
+                engine.download(server.url(name), str(TEST_DIR), verbose=False)
+
+    def statuses(self, plan):
+        return {entry.path.name: entry.status for entry in plan.entries}
+
+    def test_plan(self):
+        with LocalHTTPServer(self.files) as server:
+            links = [server.url(name) for name in self.files]
+            self.assertEqual(
+                set(self.statuses(plan_sync(links, TEST_DIR)).values()), {SYNC_MISSING}
+            )
+
+            self.download(server, self.files)
+            plan = plan_sync(links, TEST_DIR)
+            self.assertEqual(plan.to_download, [])
+            self.assertEqual(
+                set(self.statuses(plan).values()), {SYNC_UNCHANGED}, plan.format()
+            )
+            conditional = [
+                item
+                for item in server.requests[-len(links) :]
+                if item["method"] == "HEAD" and item["conditional"]
+            ]
+            self.assertEqual(len(conditional), len(links))
+
+            server.files["f1.tar"] = os.urandom(50001)
+            os.remove(TEST_DIR / "f2.tar")
+            state = DownloadState.load(TEST_DIR / "f3.tar")
+            state.completed = [(0, 100)]
+            state.save()
+            plan = plan_sync(
+                links + [server.url("missing-upstream.tar")],
+                TEST_DIR,
+                size_of=lambda link: 1 if link.endswith("f4.tar") else None,
+            )
+
+        self.assertEqual(
+            self.statuses(plan),
+            {
+                "f0.tar": SYNC_UNCHANGED,
+                "f1.tar": SYNC_CHANGED,
+                "f2.tar": SYNC_MISSING,
+                "f3.tar": SYNC_INCOMPLETE,
+                "f4.tar": SYNC_CHANGED,
+                "f5.tar": SYNC_UNCHANGED,
+                "f6.tar": SYNC_UNCHANGED,
+                "f7.tar": SYNC_UNCHANGED,
+                "missing-upstream.tar": SYNC_MISSING,
+            },
+        )
+        self.assertEqual(
+            [link.rsplit("/", 1)[-1] for link in plan.to_download],
+            ["f1.tar", "f2.tar", "f3.tar", "f4.tar", "missing-upstream.tar"],
+        )
+        lines = plan.format().splitlines()
+        self.assertIn("~ f1.tar (changed upstream)", lines)
+        self.assertIn("+ f2.tar", lines)
+        self.assertTrue(lines[-1].startswith("2 missing, 1 incomplete, 2 changed"))
+
+    def test_files_without_state_are_checked_by_date(self):
+        content = self.files["f0.tar"]
+        (TEST_DIR / "f0.tar").write_bytes(content)
+        with LocalHTTPServer({"f0.tar": content}) as server:
+            link = server.url("f0.tar")
+            plan = plan_sync([link], TEST_DIR)
+            self.assertEqual(plan.entries[0].status, SYNC_UNCHANGED)
+
+            # The answer gave the file a state, the next sync sends its ETag
+            state = DownloadState.load(TEST_DIR / "f0.tar")
+            self.assertTrue(state.is_complete)
+            self.assertIsNotNone(state.etag)
+            server.files["f0.tar"] = b"new content"
+            self.assertEqual(
+                plan_sync([link], TEST_DIR).entries[0].status, SYNC_CHANGED
+            )
+
+    def test_unreachable_files_are_unchecked(self):
+        (TEST_DIR / "a.tar").write_bytes(b"content")
+        with LocalHTTPServer({}) as server:
+            link = server.url("a.tar")
+        plan = plan_sync([link], TEST_DIR)
+        self.assertEqual(plan.entries[0].status, SYNC_UNCHECKED)
+
+    def test_changed_files_are_downloaded_again(self):
+        with LocalHTTPServer(self.files) as server:
+            self.download(server, ["f0.tar"])
+            server.files["f0.tar"] = os.urandom(60000)
+            plan = plan_sync([server.url("f0.tar")], TEST_DIR)
+            self.download(
+                server, [link.rsplit("/", 1)[-1] for link in plan.to_download]
+            )
+            self.assertEqual((TEST_DIR / "f0.tar").read_bytes(), server.files["f0.tar"])
+            self.assertEqual(
+                plan_sync([server.url("f0.tar")], TEST_DIR).to_download, []
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import bz2
+import datetime
+import io
+import json
+import os
+import tarfile
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from dozent.integrity import _files_in
+from dozent.tar_index import (
+    INDEX_FILE_SUFFIX,
+    TarIndex,
+    index_archive,
+    index_paths,
+    minute_of,
+)
+
+TEST_DIR = Path("test_tar_index_dir")
+ARCHIVE = TEST_DIR / "twitter_stream_2020_06_01.tar"
+
+
+def _minute_content(hour: int, minute: int) -> bytes:
+    lines = [
+        json.dumps({"id": hour * 100 + minute, "created_at": "x", "index": index})
+        for index in range(50)
+    ]
+    return bz2.compress("\n".join(lines).encode())
+
+
+MEMBERS = {
+    f"2020/06/01/{hour:02d}/{minute:02d}.json.bz2": _minute_content(hour, minute)
+    for hour in range(3)
+    for minute in range(0, 60, 15)
+}
+
+
+def _write_archive(path: Path, members) -> None:
+    with tarfile.open(path, mode="w") as archive:
+        directory = tarfile.TarInfo("2020/06/01")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+        readme = tarfile.TarInfo("README.txt")
+        readme.size = 5
+        archive.addfile(readme, io.BytesIO(b"hello"))
+
+
+class TarIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        TEST_DIR.mkdir(exist_ok=True)
+        _write_archive(ARCHIVE, MEMBERS)
+
+    def tearDown(self) -> None:
+        rmtree(TEST_DIR, ignore_errors=True)
+
+    def test_minute_of(self):
+        self.assertEqual(
+            minute_of("2020/06/01/13/05.json.bz2"), datetime.datetime(2020, 6, 1, 13, 5)
+        )
+        self.assertEqual(
+            minute_of("archiveteam/2011/09/27/00/59.json.bz2"),
+            datetime.datetime(2011, 9, 27, 0, 59),
+        )
+        self.assertIsNone(minute_of("README.txt"))
+        self.assertIsNone(minute_of("2020/13/01/00/00.json.bz2"))
+
+    def test_members_are_read_without_the_rest(self):
+        with TarIndex.build(ARCHIVE) as index:
+            self.assertEqual(
+                [member.name for member in index], list(MEMBERS) + ["README.txt"]
+            )
+            self.assertNotIn("2020/06/01", index)
+            for name, content in MEMBERS.items():
+                with index.open(name) as member:
+                    self.assertEqual(member.read(), content)
+            with index.open("README.txt") as member:
+                member.seek(2)
+                self.assertEqual(member.read(2), b"ll")
+                self.assertEqual(member.read(), b"o")
+                self.assertEqual(member.read(), b"")
+
+    def test_open_tweets(self):
+        with TarIndex.build(ARCHIVE) as index:
+            with index.open_tweets("2020/06/01/01/30.json.bz2") as lines:
+                tweets = [json.loads(line) for line in lines]
+            self.assertEqual(len(tweets), 50)
+            self.assertEqual(tweets[0]["id"], 130)
+            with self.assertRaises(ValueError):
+                index.open_tweets("README.txt")
+            with self.assertRaises(KeyError):
+                index.open("2020/06/01/05/00.json.bz2")
+
+    def test_time_buckets(self):
+        index = TarIndex.build(ARCHIVE)
+        self.assertEqual(
+            [
+                member.name
+                for member in index.hour(datetime.datetime(2020, 6, 1, 1, 40))
+            ],
+            [f"2020/06/01/01/{minute:02d}.json.bz2" for minute in range(0, 60, 15)],
+        )
+        self.assertEqual(
+            [
+                member.name
+                for member in index.between(
+                    datetime.datetime(2020, 6, 1, 0, 30),
+                    datetime.datetime(2020, 6, 1, 1, 15),
+                )
+            ],
+            [
+                "2020/06/01/00/30.json.bz2",
+                "2020/06/01/00/45.json.bz2",
+                "2020/06/01/01/00.json.bz2",
+            ],
+        )
+
+    def test_saved_index_is_reused_until_the_archive_changes(self):
+        built = TarIndex.for_archive(ARCHIVE)
+        self.assertTrue(TarIndex.index_path_for(ARCHIVE).exists())
+        loaded = TarIndex.load(ARCHIVE)
+        self.assertEqual(loaded.members, built.members)
+
+        members = dict(MEMBERS)
+        members["2020/06/01/03/00.json.bz2"] = _minute_content(3, 0)
+        _write_archive(ARCHIVE, members)
+        os.utime(ARCHIVE, ns=(built.archive_mtime_ns + 10**9,) * 2)
+        self.assertIsNone(TarIndex.load(ARCHIVE))
+        self.assertIn("2020/06/01/03/00.json.bz2", TarIndex.for_archive(ARCHIVE))
+        self.assertIsNotNone(TarIndex.load(ARCHIVE))
+
+    def test_unreadable_index(self):
+        TarIndex.index_path_for(ARCHIVE).write_text("{")
+        self.assertIsNone(TarIndex.load(ARCHIVE))
+
+    def test_index_paths(self):
+        other = TEST_DIR / "day" / "twitter_stream_2020_06_02.tar"
+        other.parent.mkdir()
+        _write_archive(other, {"2020/06/02/00/00.json.bz2": _minute_content(0, 0)})
+        indexes = index_paths([TEST_DIR])
+        self.assertEqual(sorted(len(index) for index in indexes), [2, len(MEMBERS) + 1])
+        # Indexes are not mistaken for downloaded files
+        self.assertEqual(sorted(_files_in([TEST_DIR])), sorted([ARCHIVE, other]))
+
+    def test_index_archive_hook(self):
+        self.assertIsNone(index_archive(TEST_DIR / "a.json.bz2"))
+        self.assertEqual(len(index_archive(ARCHIVE)), len(MEMBERS) + 1)
+        self.assertTrue((TEST_DIR / (ARCHIVE.name + INDEX_FILE_SUFFIX)).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import asyncio
+import bz2
+import gzip
+import http.client
+import io
+import json
+import os
+import tarfile
+import unittest
+from pathlib import Path
+from shutil import rmtree
+
+from benchmarks.local_http_server import LocalHTTPServer
+from dozent.dedup import SeenIds
+from dozent.retry import RetryPolicy
+from dozent.tweet_stream import TweetStream, iter_records, project
+from tests import CommonTestSetup
+
+DATA_PATH, _ = CommonTestSetup.set_data_dir_path()
+SAMPLE_FILE = DATA_PATH / "test_sample_files.json.bz2"
+
+
+def _read_tweets():
+    with bz2.open(SAMPLE_FILE) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return [record for record in records if "created_at" in record]
+
+
+def _archive(members) -> bytes:
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode="w") as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return content.getvalue()
+
+
+def _generated(start: int, count: int) -> bytes:
+    lines = [
+        json.dumps(
+            {
+                "id": index,
+                "created_at": "x",
+                "text": os.urandom(16).hex(),
+                "user": {"id": index % 7},
+            }
+        )
+        for index in range(start, start + count)
+    ]
+    lines.append(json.dumps({"delete": {"status": {"id": 1}}}))
+    lines.append("not json")
+    return gzip.compress("\n".join(lines).encode())
+
+
+TWEETS = _read_tweets()
+ARCHIVES = {
+    "twitter_stream_2020_06_01.tar": _archive(
+        [("2020/06/01/00/00.json.bz2", SAMPLE_FILE.read_bytes()), ("README", b"")]
+    ),
+    "twitter_stream_2020_06_02.tar": _archive(
+        [
+            ("2020/06/02/00/00.json.gz", _generated(0, 2000)),
+            ("2020/06/02/00/01.json.gz", _generated(2000, 2000)),
+        ]
+    ),
+}
+
+
+class TweetStreamTestCase(unittest.TestCase):
+    def test_project(self):
+        tweet = {"id": 1, "user": {"id": 2, "name": "a"}, "entities": None}
+        self.assertEqual(
+            project(tweet, ["id", "user.id", "user.lang", "entities.urls"]),
+            {"id": 1, "user.id": 2, "user.lang": None, "entities.urls": None},
+        )
+
+    def test_iter_records(self):
+        records = list(
+            iter_records(io.BytesIO(ARCHIVES["twitter_stream_2020_06_01.tar"]))
+        )
+        self.assertEqual(records, TWEETS)
+
+    def test_streams_archives_in_order(self):
+        with LocalHTTPServer(ARCHIVES) as server:
+            links = [server.url(name) for name in ARCHIVES]
+            tweets = list(TweetStream(links, fields=["id", "user.id"], batch_size=100))
+
+        self.assertEqual(len(tweets), len(TWEETS) + 4000)
+        self.assertEqual(
+            tweets[0], {"id": TWEETS[0]["id"], "user.id": TWEETS[0]["user"]["id"]}
+        )
+        self.assertEqual(
+            [tweet["id"] for tweet in tweets[len(TWEETS) :]], list(range(4000))
+        )
+
+    def test_predicate(self):
+        with LocalHTTPServer(ARCHIVES) as server:
+            stream = TweetStream(
+                [server.url("twitter_stream_2020_06_02.tar")],
+                predicate=lambda tweet: tweet["user"]["id"] == 3,
+            )
+            tweets = list(stream)
+        self.assertEqual(len(tweets), len(range(3, 4000, 7)))
+        self.assertEqual(tweets[0]["user"], {"id": 3})
+
+    def test_dropped_connection_continues_where_it_stopped(self):
+        with LocalHTTPServer(
+            ARCHIVES, drop_first_requests=1, drop_after_bytes=30000
+        ) as server:
+            stream = TweetStream(
+                [server.url("twitter_stream_2020_06_02.tar")],
+                fields=["id"],
+                retry=RetryPolicy(base_delay=0.001),
+            )
+            ids = [tweet["id"] for tweet in stream]
+        self.assertEqual(ids, list(range(4000)))
+
+    def test_dropped_connection_without_retries(self):
+        with LocalHTTPServer(
+            ARCHIVES, drop_first_requests=1, drop_after_bytes=30000
+        ) as server:
+            stream = TweetStream([server.url("twitter_stream_2020_06_02.tar")])
+            with self.assertRaises(http.client.IncompleteRead):
+                list(stream)
+
+    def test_consumer_stopping_early(self):
+        with LocalHTTPServer(ARCHIVES) as server:
+            stream = TweetStream(
+                [server.url(name) for name in ARCHIVES],
+                batch_size=10,
+                max_buffered_batches=2,
+            )
+            iterator = iter(stream)
+            first = next(iterator)
+            # The reading thread is held back by the full buffer
+            self.assertTrue(stream._thread.is_alive())
+            iterator.close()
+            stream._thread.join(timeout=5)
+            self.assertFalse(stream._thread.is_alive())
+        self.assertEqual(first, TWEETS[0])
+
+    def test_async_iteration(self):
+        async def collect(links):
+            ids = []
+            async for tweet in TweetStream(links, fields=["id"]):
+                ids.append(tweet["id"])
+            return ids
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with LocalHTTPServer(ARCHIVES) as server:
+            ids = loop.run_until_complete(
+                collect([server.url("twitter_stream_2020_06_02.tar")])
+            )
+        self.assertEqual(ids, list(range(4000)))
+
+    def test_duplicates_are_left_out(self):
+        seen_dir = Path("test_tweet_stream_seen")
+        self.addCleanup(rmtree, seen_dir, ignore_errors=True)
+        archives = {
+            "twitter_stream_2020_06_02.tar": ARCHIVES["twitter_stream_2020_06_02.tar"],
+            # Overlaps the second half of the archive above
+            "twitter_stream_2020_06_03.tar": _archive(
+                [("2020/06/03/00/00.json.gz", _generated(3000, 2000))]
+            ),
+        }
+        links = list(archives)
+        with LocalHTTPServer(archives) as server:
+            with SeenIds(seen_dir) as seen:
+                stream = TweetStream(
+                    [server.url(name) for name in links], fields=["id"], seen=seen
+                )
+                ids = [tweet["id"] for tweet in stream]
+            self.assertEqual(ids, list(range(5000)))
+            self.assertEqual(stream.duplicates, 1000)
+
+            # Another run skips the tweets already consumed
+            with SeenIds(seen_dir) as seen:
+                stream = TweetStream([server.url(links[1])], seen=seen)
+                self.assertEqual(list(stream), [])
+
+    def test_errors_are_raised_to_the_consumer(self):
+        with LocalHTTPServer(ARCHIVES) as server:
+            stream = TweetStream([server.url("twitter_stream_2020_06_03.tar")])
+            with self.assertRaises(OSError):
+                list(stream)
+
+    def test_only_tar_archives(self):
+        with self.assertRaises(ValueError):
+            TweetStream(
+                ["https://archive.org/download/a/twitter-json-scrape-2011-09.zip"]
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()